@@ -0,0 +1,120 @@
+# bench_json.py
+"""
+Compara a serialização padrão do FastAPI (asdict + validação e dump
+no response_model Pydantic + JSONResponse) com o caminho rápido
+(serializadores diretos + JSONRapidoResponse) para uma NF-e sintética
+com muitos itens.
+
+Uso:
+    python bench_json.py            # 2000 itens
+    python bench_json.py 5000       # outro tamanho
+"""
+import sys
+import time
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from sefaz_api.json_rapido import JSONRapidoResponse, orjson
+from sefaz_service.core.documento_nfe import ler_nfe
+from sefaz_service.sped import doc_sped_to_dict, xml_to_doc
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+
+
+class DocSpedResponse(BaseModel):
+    data: Dict[str, Any]
+
+
+class ItensResponse(BaseModel):
+    ide: Optional[Dict[str, Any]]
+    itens: Optional[List[Dict[str, Any]]]
+
+
+def gerar_nfe(qtd_itens: int) -> bytes:
+    """NF-e (nfeProc) sintética com `qtd_itens` itens de det."""
+    det = []
+    for n in range(1, qtd_itens + 1):
+        det.append(
+            f'<det nItem="{n}"><prod><cProd>{n:06d}</cProd><cEAN>SEM GTIN</cEAN>'
+            f"<xProd>PRODUTO DE TESTE NUMERO {n}</xProd><NCM>22030000</NCM>"
+            f"<CFOP>5102</CFOP><uCom>UN</uCom><qCom>2.0000</qCom>"
+            f"<vUnCom>10.5000000000</vUnCom><vProd>21.00</vProd>"
+            f"<cEANTrib>SEM GTIN</cEANTrib><uTrib>UN</uTrib><qTrib>2.0000</qTrib>"
+            f"<vUnTrib>10.5000000000</vUnTrib><indTot>1</indTot></prod>"
+            f"<imposto><ICMS><ICMSSN102><orig>0</orig><CSOSN>102</CSOSN></ICMSSN102></ICMS>"
+            f"<PIS><PISOutr><CST>49</CST><vBC>0.00</vBC><pPIS>0.00</pPIS><vPIS>0.00</vPIS></PISOutr></PIS>"
+            f"<COFINS><COFINSOutr><CST>49</CST><vBC>0.00</vBC><pCOFINS>0.00</pCOFINS>"
+            f"<vCOFINS>0.00</vCOFINS></COFINSOutr></COFINS></imposto></det>"
+        )
+    chave = "12251212345678000199550010000000011000000010"
+    return (
+        f'<nfeProc xmlns="{NFE_NS}" versao="4.00"><NFe><infNFe Id="NFe{chave}" versao="4.00">'
+        f"<ide><cUF>12</cUF><natOp>VENDA</natOp><mod>55</mod><serie>1</serie><nNF>1</nNF>"
+        f"<dhEmi>2025-12-01T10:00:00-05:00</dhEmi><tpNF>1</tpNF><tpAmb>2</tpAmb></ide>"
+        f"<emit><CNPJ>12345678000199</CNPJ><xNome>EMITENTE</xNome></emit>"
+        f"{''.join(det)}"
+        f"<total><ICMSTot><vProd>{21 * qtd_itens:.2f}</vProd><vNF>{21 * qtd_itens:.2f}</vNF></ICMSTot></total>"
+        f"</infNFe></NFe></nfeProc>"
+    ).encode("utf-8")
+
+
+def cronometrar(nome: str, func, repeticoes: int) -> float:
+    func()  # aquecimento
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        corpo = func()
+    media = (time.perf_counter() - inicio) / repeticoes * 1000
+    print(f"  {nome:<10} {media:8.2f} ms   ({len(corpo) / 1024:.0f} KiB)")
+    return media
+
+
+def main():
+    qtd = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    repeticoes = 20
+
+    nfe = ler_nfe(gerar_nfe(qtd))
+    doc = xml_to_doc(nfe)
+    itens = [
+        {"nItem": it.nItem, **it.prod, "ICMS": it.icms, "PIS": it.pis, "COFINS": it.cofins}
+        for it in nfe.itens
+    ]
+
+    print(f"NF-e com {qtd} itens, média de {repeticoes} execuções")
+    print(f"JSONRapidoResponse usando {'orjson' if orjson else 'json (stdlib)'}\n")
+
+    print("DocSped (/nfe/xmltodoc, /sped/xmltodoc):")
+    padrao = cronometrar(
+        "padrão",
+        lambda: JSONResponse(
+            DocSpedResponse.model_validate({"data": asdict(doc)}).model_dump(mode="json")
+        ).body,
+        repeticoes,
+    )
+    rapido = cronometrar(
+        "rápido",
+        lambda: JSONRapidoResponse({"data": doc_sped_to_dict(doc)}).body,
+        repeticoes,
+    )
+    print(f"  ganho      {padrao / rapido:8.1f}x\n")
+
+    print("Itens (/nfe/xmlinfo, /nfe/analise):")
+    padrao = cronometrar(
+        "padrão",
+        lambda: JSONResponse(
+            ItensResponse.model_validate({"ide": nfe.ide, "itens": itens}).model_dump(mode="json")
+        ).body,
+        repeticoes,
+    )
+    rapido = cronometrar(
+        "rápido",
+        lambda: JSONRapidoResponse({"ide": nfe.ide, "itens": itens}).body,
+        repeticoes,
+    )
+    print(f"  ganho      {padrao / rapido:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
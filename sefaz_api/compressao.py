@@ -0,0 +1,264 @@
+# sefaz_api/compressao.py
+from __future__ import annotations
+
+import os
+import zlib
+from typing import Iterator, List, Optional, Tuple
+
+from fastapi import HTTPException
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # brotli é opcional: sem ele a API negocia apenas gzip
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+_MB = 1024 * 1024
+
+# Respostas menores que isso vão sem compressão (SEFAZ_COMPRESSAO_MIN_BYTES).
+COMPRESSAO_MIN_BYTES = int(os.getenv("SEFAZ_COMPRESSAO_MIN_BYTES", "1024"))
+GZIP_NIVEL = int(os.getenv("SEFAZ_GZIP_NIVEL", "6"))
+BROTLI_QUALIDADE = int(os.getenv("SEFAZ_BROTLI_QUALIDADE", "4"))
+
+# Tamanho máximo de um corpo gzip depois de descompactado (SEFAZ_GZIP_MAX_MB).
+GZIP_MAX_BYTES = int(float(os.getenv("SEFAZ_GZIP_MAX_MB", "32")) * _MB)
+
+# Bloco usado para entregar PDFs e outros binários em streaming.
+BLOCO_STREAM = 64 * 1024
+
+_TIPOS_COMPRESSIVEIS = (
+    "application/json",
+    "application/x-ndjson",
+    "application/xml",
+    "text/",
+)
+
+
+def em_blocos(dados: bytes, tamanho: int = BLOCO_STREAM) -> Iterator[bytes]:
+    """
+    Fatia `dados` em blocos de `tamanho` bytes para StreamingResponse
+    (iterar um BytesIO entrega linha a linha, o que num PDF vira
+    milhares de pedaços pequenos).
+    """
+    visao = memoryview(dados)
+    for inicio in range(0, len(visao), tamanho):
+        yield bytes(visao[inicio:inicio + tamanho])
+
+
+def negociar_codificacao(accept_encoding: str) -> Optional[str]:
+    """
+    Escolhe a codificação da resposta a partir do Accept-Encoding:
+    "br" (se o módulo brotli estiver instalado), depois "gzip"; None
+    quando o cliente não aceita nenhuma das duas.
+    """
+    aceitas: dict = {}
+    for item in accept_encoding.lower().split(","):
+        nome, _, params = item.strip().partition(";")
+        nome = nome.strip()
+        if not nome:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        aceitas[nome] = q
+
+    curinga = aceitas.get("*", 0.0)
+    candidatas: List[Tuple[float, str]] = []
+    if brotli is not None:
+        candidatas.append((aceitas.get("br", curinga), "br"))
+    candidatas.append((aceitas.get("gzip", aceitas.get("x-gzip", curinga)), "gzip"))
+
+    melhor = max(candidatas, key=lambda c: c[0])  # empate: ordem da lista
+    return melhor[1] if melhor[0] > 0 else None
+
+
+class _Compressor:
+    """Compressor incremental com a mesma interface para gzip e brotli."""
+
+    def __init__(self, codificacao: str) -> None:
+        self.codificacao = codificacao
+        if codificacao == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALIDADE)
+        else:
+            self._gz = zlib.compressobj(GZIP_NIVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def parcial(self, dados: bytes) -> bytes:
+        """Compacta `dados` e descarrega, para o cliente receber já."""
+        if self.codificacao == "br":
+            return self._br.process(dados) + self._br.flush()
+        return self._gz.compress(dados) + self._gz.flush(zlib.Z_SYNC_FLUSH)
+
+    def final(self, dados: bytes = b"") -> bytes:
+        if self.codificacao == "br":
+            return self._br.process(dados) + self._br.finish()
+        return self._gz.compress(dados) + self._gz.flush(zlib.Z_FINISH)
+
+
+def _receive_gzip(receive: Receive, limite: int) -> Receive:
+    """
+    Envolve o `receive` do ASGI descompactando o corpo gzip em
+    streaming. Passar de `limite` bytes descompactados resulta em 413
+    (proteção contra gzip bomb); gzip inválido ou truncado, em 400.
+    """
+    descompactador = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    total = 0
+
+    async def receber() -> Message:
+        nonlocal total
+        mensagem = await receive()
+        if mensagem["type"] != "http.request":
+            return mensagem
+
+        mais = mensagem.get("more_body", False)
+        try:
+            # max_length: nunca descompacta mais que 1 byte além do limite
+            corpo = descompactador.decompress(mensagem.get("body", b""), limite - total + 1)
+            if not mais and not descompactador.unconsumed_tail:
+                corpo += descompactador.flush()
+        except zlib.error as e:
+            raise HTTPException(status_code=400, detail=f"Corpo gzip inválido: {e}")
+
+        total += len(corpo)
+        if total > limite or descompactador.unconsumed_tail:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Corpo descompactado excede o limite de {limite} bytes",
+            )
+        if not mais and not descompactador.eof:
+            raise HTTPException(status_code=400, detail="Corpo gzip truncado")
+
+        return {**mensagem, "body": corpo}
+
+    return receber
+
+
+class _EnvioCompactado:
+    """
+    `send` do ASGI que compacta o corpo da resposta.
+
+    Resposta de corpo único: compacta se tiver ao menos `minimo` bytes.
+    Resposta em streaming (NDJSON dos lotes): compacta
+    bloco a bloco, com flush a cada bloco para não segurar as linhas.
+    """
+
+    def __init__(self, send: Send, codificacao: str, minimo: int) -> None:
+        self.send = send
+        self.codificacao = codificacao
+        self.minimo = minimo
+        self.inicio: Optional[Message] = None
+        self.compressor: Optional[_Compressor] = None
+        self.repassar = False
+
+    async def __call__(self, mensagem: Message) -> None:
+        tipo = mensagem["type"]
+
+        if tipo == "http.response.start":
+            self.inicio = mensagem
+            headers = Headers(raw=mensagem["headers"])
+            tipo_conteudo = headers.get("content-type", "")
+            self.repassar = (
+                "content-encoding" in headers
+                or mensagem["status"] in (204, 304)
+                or not tipo_conteudo.startswith(_TIPOS_COMPRESSIVEIS)
+            )
+            if not self.repassar:
+                MutableHeaders(raw=mensagem["headers"]).add_vary_header("Accept-Encoding")
+            return
+
+        if tipo != "http.response.body":
+            # ex.: http.response.pathsend do FileResponse: vai sem compressão
+            if self.inicio is not None:
+                inicio, self.inicio = self.inicio, None
+                self.repassar = True
+                await self.send(inicio)
+            await self.send(mensagem)
+            return
+
+        corpo = mensagem.get("body", b"")
+        mais = mensagem.get("more_body", False)
+
+        if self.inicio is not None:
+            inicio, self.inicio = self.inicio, None
+            if self.repassar or (not mais and len(corpo) < self.minimo):
+                self.repassar = True
+                await self.send(inicio)
+                await self.send(mensagem)
+                return
+
+            headers = MutableHeaders(raw=inicio["headers"])
+            headers["Content-Encoding"] = self.codificacao
+            self.compressor = _Compressor(self.codificacao)
+            if mais:
+                del headers["Content-Length"]
+                corpo = self.compressor.parcial(corpo)
+            else:
+                corpo = self.compressor.final(corpo)
+                headers["Content-Length"] = str(len(corpo))
+            await self.send(inicio)
+            await self.send({"type": tipo, "body": corpo, "more_body": mais})
+            return
+
+        if self.repassar:
+            await self.send(mensagem)
+            return
+
+        corpo = self.compressor.parcial(corpo) if mais else self.compressor.final(corpo)
+        await self.send({"type": tipo, "body": corpo, "more_body": mais})
+
+
+class CompressaoMiddleware:
+    """
+    Compressão HTTP da API:
+
+    - aceita corpo com `Content-Encoding: gzip` (descompactado em
+      streaming antes de chegar às rotas, com limite SEFAZ_GZIP_MAX_MB);
+    - negocia br/gzip pelo Accept-Encoding para JSON, XML, HTML e NDJSON
+      a partir de SEFAZ_COMPRESSAO_MIN_BYTES (PDF já vem compactado e
+      passa direto).
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimo: int = COMPRESSAO_MIN_BYTES,
+        limite_entrada: int = GZIP_MAX_BYTES,
+    ) -> None:
+        self.app = app
+        self.minimo = minimo
+        self.limite_entrada = limite_entrada
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+
+        codificacao_corpo = headers.get("content-encoding", "").strip().lower()
+        if codificacao_corpo and codificacao_corpo != "identity":
+            if codificacao_corpo not in ("gzip", "x-gzip"):
+                resposta = JSONResponse(
+                    {"detail": f"Content-Encoding não suportado: {codificacao_corpo}"},
+                    status_code=415,
+                )
+                await resposta(scope, receive, send)
+                return
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, v)
+                for k, v in scope["headers"]
+                if k not in (b"content-encoding", b"content-length")
+            ]
+            receive = _receive_gzip(receive, self.limite_entrada)
+
+        codificacao = negociar_codificacao(headers.get("accept-encoding", ""))
+        if codificacao is not None:
+            send = _EnvioCompactado(send, codificacao, self.minimo)
+
+        await self.app(scope, receive, send)
@@ -0,0 +1,56 @@
+# sefaz_api/corpo_xml.py
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+from fastapi import HTTPException, Request
+
+from sefaz_service.core.parser_xml import XML_MAX_BYTES
+
+# requestBody para o OpenAPI das rotas que recebem XML puro via
+# Depends(ler_corpo_xml) (sem Body(...) o FastAPI não documenta o corpo).
+OPENAPI_CORPO_XML: Dict[str, Any] = {
+    "requestBody": {
+        "required": True,
+        "description": "XML bruto da NF-e/NFC-e (<nfeProc>, <NFe> ou <infNFe>).",
+        "content": {
+            "application/xml": {
+                "schema": {"type": "string", "format": "binary"},
+            }
+        },
+    }
+}
+
+
+async def ler_corpo_xml(request: Request) -> bytes:
+    """
+    Lê o corpo da requisição como bytes, sem decodificar para str, e
+    entrega direto ao lxml.
+
+    O corpo é lido em streaming e interrompido assim que passa de
+    SEFAZ_XML_MAX_MB (413). Corpo vazio resulta em 400.
+    """
+    limite = XML_MAX_BYTES
+
+    tamanho = request.headers.get("content-length")
+    if tamanho and tamanho.isdigit() and int(tamanho) > limite:
+        raise HTTPException(
+            status_code=413,
+            detail=f"XML excede o limite de {limite} bytes",
+        )
+
+    partes: List[bytes] = []
+    total = 0
+    async for parte in request.stream():
+        total += len(parte)
+        if total > limite:
+            raise HTTPException(
+                status_code=413,
+                detail=f"XML excede o limite de {limite} bytes",
+            )
+        partes.append(parte)
+
+    corpo = partes[0] if len(partes) == 1 else b"".join(partes)
+    if not corpo.strip():
+        raise HTTPException(status_code=400, detail="XML vazio ou não informado")
+    return corpo
@@ -0,0 +1,40 @@
+# sefaz_api/json_rapido.py
+from __future__ import annotations
+
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:  # orjson é opcional: sem ele usa o json da biblioteca padrão
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def dumps_rapido(conteudo: Any) -> bytes:
+    """
+    Serializa para JSON (bytes UTF-8) com orjson, se instalado, ou com o
+    json padrão em modo compacto. Aceita apenas tipos nativos (dict,
+    list, str, int, float, bool, None).
+    """
+    if orjson is not None:
+        return orjson.dumps(conteudo)
+    return json.dumps(
+        conteudo, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class JSONRapidoResponse(Response):
+    """
+    Resposta JSON para rotas com payloads grandes (itens, DocSped).
+
+    A rota devolve JSONRapidoResponse(dict) já montado com tipos nativos:
+    o FastAPI não passa o conteúdo por jsonable_encoder nem revalida no
+    response_model (que continua servindo só para o OpenAPI).
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps_rapido(content)
@@ -4,18 +4,17 @@ from __future__ import annotations
 from dotenv import load_dotenv
 load_dotenv()
 
-import io
+import json
 from fastapi.responses import StreamingResponse
 
 
 import os
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from typing import Any, Dict, List, Optional
 
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.responses import FileResponse, HTMLResponse, Response
 from pydantic import BaseModel, Field
-from lxml import etree
 
 from sefaz_service.core.nfe_envio import sefaz_nfe_envio
 from sefaz_service.core.nfe_inutilizacao import (
@@ -23,12 +22,23 @@ from sefaz_service.core.nfe_inutilizacao import (
     enviar_inutilizacao,
 )
 from sefaz_service.core.nfe_evento import (
+    EventoPendente,
     EventoRequest,
     sefaz_enviar_evento,
+    sefaz_enviar_eventos_lote,
 )
 from sefaz_service.core.nfe_status import sefaz_nfe_status
-from sefaz_service.core.nfe_consulta import sefaz_nfe_consulta  # consulta por chave
-from sefaz_service.core.nfe_gtin import sefaz_consulta_gtin, GtinResult
+from sefaz_service.core.nfe_consulta import (  # consulta por chave
+    sefaz_nfe_consulta,
+    sefaz_nfe_consulta_lote,
+    uf_modelo_da_chave,
+)
+from sefaz_service.core.nfe_gtin import (
+    sefaz_consulta_gtin,
+    sefaz_consulta_gtin_lote,
+    GtinResult,
+)
+from sefaz_service.core.documento_nfe import DocumentoNFe, documentos_cache, ler_nfe_cache
 from sefaz_service.danfe.danfe_html import (
     gerar_danfe_html_automatico,
     gerar_danfe_pdf_automatico,
@@ -40,9 +50,46 @@ from sefaz_service.sped import xml_to_doc, doc_sped_to_dict
 
 from sefaz_service.nfe.email_nfe import router as email_nfe_router
 from sefaz_api import nfe_schema_router
+from sefaz_api.compressao import CompressaoMiddleware, em_blocos
+from sefaz_api.corpo_xml import OPENAPI_CORPO_XML, ler_corpo_xml
+from sefaz_api.json_rapido import JSONRapidoResponse
+from sefaz_api.metricas_http import MetricasMiddleware
+from sefaz_api.perfil_http import PerfilMiddleware
+from sefaz_api.rastreamento_http import RastreamentoMiddleware
 from sefaz_service.core.cte_status import sefaz_cte_status, CTeStatusResult
 
 from sefaz_service.routers import mdfe_router
+from sefaz_service.routers.perfil import RotaPerfilavel, router as perfil_router
+from sefaz_service.routers.retorno import OpcoesRetorno, aplicar_retorno, opcoes_retorno
+from sefaz_service.core.cache import CacheTTL
+from sefaz_service.core.metricas import registro
+from sefaz_service.core.rate_limit import limitador
+from sefaz_service.core.repositorio import RepositorioDocumentos
+from sefaz_service.nfe.manifestacao import sefaz_manifestar_destinatario
+from sefaz_service.nfe.numeracao import (
+    executar_plano_inutilizacao,
+    faixas_inutilizadas_do_repositorio,
+    numeros_emitidos_do_repositorio,
+    planejar_inutilizacao,
+    salvar_inutilizacao,
+)
+from sefaz_service.nfe.cadastro import (
+    CadastroConsulta,
+    sefaz_consulta_cadastro,
+    sefaz_consulta_cadastro_lote,
+)
+from sefaz_service.nfe.distribuicao import (
+    AgendadorDistribuicao,
+    DistribuicaoConfig,
+    EstadoNSUStore,
+)
+from sefaz_service.nfe.recibo import AgendadorRecibos
+from sefaz_service.nfe.outbox import (
+    NFeOutbox,
+    enfileirar_autorizacao,
+    enfileirar_evento,
+    enfileirar_inutilizacao,
+)
 
 # -------------------------------------------------------------------
 # METADADOS DE TAGS (GRUPOS NO SWAGGER)
@@ -81,6 +128,10 @@ tags_metadata = [
         "name": "MDFe - SEFAZ",
         "description": "Serviços de MDF-e: Status do serviço e consulta de MDF-e.",
     },
+    {
+        "name": "Admin",
+        "description": "Perfis de requisição (SEFAZ_PERFIL_TOKEN no cabeçalho X-Perfil).",
+    },
 ]
 
 
@@ -94,26 +145,53 @@ PFX_PASSWORD = os.getenv("SEFAZ_PFX_PASSWORD", "senha_do_certificado")
 # Namespace NFe
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
 
-
-def _q(tag: str) -> str:
-    """Monta o nome qualificado com o namespace da NFe."""
-    return f"{{{NFE_NS}}}{tag}"
+# Cache persistente de consultas (cadastro, GTIN...)
+CACHE_DB = os.getenv("SEFAZ_CACHE_DB", "sefaz_cache.db")
+
+# Repositório local de documentos (procEventoNFe, docs da distribuição...)
+DOCS_DIR = os.getenv("SEFAZ_DOCS_DIR", "sefaz_docs")
+
+# Fila persistente de envios (outbox)
+OUTBOX_DB = os.getenv("SEFAZ_OUTBOX_DB", "sefaz_outbox.db")
+OUTBOX_WORKERS = int(os.getenv("SEFAZ_OUTBOX_WORKERS", "4"))
+OUTBOX_MAX_POR_UF = int(os.getenv("SEFAZ_OUTBOX_MAX_POR_UF", "2"))
+# Chave Fernet das senhas de certificado gravadas na fila; sem ela os jobs
+# com certificado enviado pelo cliente não sobrevivem a um reinício.
+OUTBOX_CHAVE = os.getenv("SEFAZ_OUTBOX_CHAVE", "")
+
+# Distribuição DF-e em segundo plano com o certificado do servidor:
+# SEFAZ_DFE_CNPJS="CNPJ:UF,CNPJ:UF" (vazio = desligada)
+DFE_CNPJS = os.getenv("SEFAZ_DFE_CNPJS", "").strip()
+DFE_DB = os.getenv("SEFAZ_DFE_DB", "sefaz_dfe.db")
+DFE_AMBIENTE = os.getenv("SEFAZ_DFE_AMBIENTE", "1")
+DFE_INTERVALO = float(os.getenv("SEFAZ_DFE_INTERVALO", "300"))
+
+_IDE_CAMPOS = (
+    "cUF", "cNF", "natOp", "mod", "serie", "nNF", "dhEmi", "tpNF",
+    "idDest", "finNFe", "indFinal", "indPres", "tpAmb",
+)
+_ENDER_CAMPOS = (
+    "xLgr", "nro", "xCpl", "xBairro", "cMun", "xMun", "UF", "CEP",
+    "cPais", "xPais", "fone",
+)
+_TOTAIS_CAMPOS = (
+    "vProd", "vNF", "vDesc", "vICMS", "vICMSDeson", "vST", "vFrete",
+    "vSeg", "vOutro", "vTotTrib", "vPIS", "vCOFINS",
+)
+_PROD_CAMPOS = (
+    "cProd", "cEAN", "xProd", "NCM", "CEST", "CFOP", "uCom", "qCom",
+    "vUnCom", "vProd", "cEANTrib", "uTrib", "qTrib", "vUnTrib", "vDesc",
+    "indTot",
+)
 
 
-def _parse_xml_root(xml: str) -> etree._Element:
-    """Parse robusto do XML bruto, retornando o root."""
-    try:
-        parser = etree.XMLParser(remove_blank_text=False, recover=True)
-        root = etree.fromstring(xml.encode("utf-8"), parser=parser)
-        return root
-    except Exception as exc:
-        raise ValueError(f"XML inválido: {exc}")
+def _parse_xml_doc(xml: bytes) -> DocumentoNFe:
+    """Parse robusto (recover) do XML bruto, já como DocumentoNFe (com cache)."""
+    return ler_nfe_cache(xml, recover=True)
 
 
-def _text(child: Optional[etree._Element]) -> Optional[str]:
-    if child is not None and child.text is not None:
-        return child.text.strip()
-    return None
+def _selecionar(campos: Dict[str, str], nomes) -> Dict[str, Optional[str]]:
+    return {n: campos.get(n) for n in nomes}
 
 
 @dataclass
@@ -125,253 +203,49 @@ class XmlInfoResult:
     itens: Optional[List[Dict[str, Any]]]
 
 
-def _extract_xml_info_from_root(root: etree._Element) -> XmlInfoResult:
+def _xml_info_dict(info: XmlInfoResult) -> Dict[str, Any]:
+    """XmlInfoResult → dict para JSON, sem asdict nem revalidação Pydantic."""
+    return {
+        "ide": info.ide,
+        "emit": info.emit,
+        "dest": info.dest,
+        "totais": info.totais,
+        "itens": info.itens,
+    }
+
+
+def _extract_xml_info(doc: DocumentoNFe) -> XmlInfoResult:
     """
-    Extrai um resumo da NFe diretamente do XML:
+    Extrai um resumo da NFe:
     ide, emit, dest, totais, itens.
     Funciona para <nfeProc> ou apenas <NFe>/<infNFe>.
     """
-    # Tenta achar infNFe em qualquer profundidade
-    inf_nfe = root.find(f".//{_q('infNFe')}")
-    if inf_nfe is None:
-        raise ValueError("Não foi encontrado o nó <infNFe> no XML.")
-
     # --- IDE ---
-    ide_el = inf_nfe.find(_q("ide"))
-    ide: Optional[Dict[str, Any]] = None
-    if ide_el is not None:
-        ide = {
-            "cUF": _text(ide_el.find(_q("cUF"))),
-            "cNF": _text(ide_el.find(_q("cNF"))),
-            "natOp": _text(ide_el.find(_q("natOp"))),
-            "mod": _text(ide_el.find(_q("mod"))),
-            "serie": _text(ide_el.find(_q("serie"))),
-            "nNF": _text(ide_el.find(_q("nNF"))),
-            "dhEmi": _text(ide_el.find(_q("dhEmi"))),
-            "tpNF": _text(ide_el.find(_q("tpNF"))),
-            "idDest": _text(ide_el.find(_q("idDest"))),
-            "finNFe": _text(ide_el.find(_q("finNFe"))),
-            "indFinal": _text(ide_el.find(_q("indFinal"))),
-            "indPres": _text(ide_el.find(_q("indPres"))),
-            "tpAmb": _text(ide_el.find(_q("tpAmb"))),
-        }
+    ide = _selecionar(doc.ide, _IDE_CAMPOS) if doc.ide else None
 
     # --- EMITENTE ---
-    emit_el = inf_nfe.find(_q("emit"))
     emit: Optional[Dict[str, Any]] = None
-    if emit_el is not None:
-        ender_emit_el = emit_el.find(_q("enderEmit"))
-        emit = {
-            "CNPJ": _text(emit_el.find(_q("CNPJ"))),
-            "CPF": _text(emit_el.find(_q("CPF"))),
-            "xNome": _text(emit_el.find(_q("xNome"))),
-            "xFant": _text(emit_el.find(_q("xFant"))),
-            "IE": _text(emit_el.find(_q("IE"))),
-            "CRT": _text(emit_el.find(_q("CRT"))),
-            "enderEmit": None,
-        }
-        if ender_emit_el is not None:
-            emit["enderEmit"] = {
-                "xLgr": _text(ender_emit_el.find(_q("xLgr"))),
-                "nro": _text(ender_emit_el.find(_q("nro"))),
-                "xCpl": _text(ender_emit_el.find(_q("xCpl"))),
-                "xBairro": _text(ender_emit_el.find(_q("xBairro"))),
-                "cMun": _text(ender_emit_el.find(_q("cMun"))),
-                "xMun": _text(ender_emit_el.find(_q("xMun"))),
-                "UF": _text(ender_emit_el.find(_q("UF"))),
-                "CEP": _text(ender_emit_el.find(_q("CEP"))),
-                "cPais": _text(ender_emit_el.find(_q("cPais"))),
-                "xPais": _text(ender_emit_el.find(_q("xPais"))),
-                "fone": _text(ender_emit_el.find(_q("fone"))),
-            }
+    if doc.emit or doc.ender_emit:
+        emit = _selecionar(doc.emit, ("CNPJ", "CPF", "xNome", "xFant", "IE", "CRT"))
+        emit["enderEmit"] = _selecionar(doc.ender_emit, _ENDER_CAMPOS) if doc.ender_emit else None
 
     # --- DESTINATÁRIO ---
-    dest_el = inf_nfe.find(_q("dest"))
     dest: Optional[Dict[str, Any]] = None
-    if dest_el is not None:
-        ender_dest_el = dest_el.find(_q("enderDest"))
-        dest = {
-            "CNPJ": _text(dest_el.find(_q("CNPJ"))),
-            "CPF": _text(dest_el.find(_q("CPF"))),
-            "xNome": _text(dest_el.find(_q("xNome"))),
-            "IE": _text(dest_el.find(_q("IE"))),
-            "indIEDest": _text(dest_el.find(_q("indIEDest"))),
-            "email": _text(dest_el.find(_q("email"))),
-            "enderDest": None,
-        }
-        if ender_dest_el is not None:
-            dest["enderDest"] = {
-                "xLgr": _text(ender_dest_el.find(_q("xLgr"))),
-                "nro": _text(ender_dest_el.find(_q("nro"))),
-                "xCpl": _text(ender_dest_el.find(_q("xCpl"))),
-                "xBairro": _text(ender_dest_el.find(_q("xBairro"))),
-                "cMun": _text(ender_dest_el.find(_q("cMun"))),
-                "xMun": _text(ender_dest_el.find(_q("xMun"))),
-                "UF": _text(ender_dest_el.find(_q("UF"))),
-                "CEP": _text(ender_dest_el.find(_q("CEP"))),
-                "cPais": _text(ender_dest_el.find(_q("cPais"))),
-                "xPais": _text(ender_dest_el.find(_q("xPais"))),
-                "fone": _text(ender_dest_el.find(_q("fone"))),
-            }
+    if doc.dest or doc.ender_dest:
+        dest = _selecionar(doc.dest, ("CNPJ", "CPF", "xNome", "IE", "indIEDest", "email"))
+        dest["enderDest"] = _selecionar(doc.ender_dest, _ENDER_CAMPOS) if doc.ender_dest else None
 
     # --- TOTAIS ---
-    totais: Dict[str, Any] = {
-        "vProd": "0.00",
-        "vNF": "0.00",
-        "vDesc": "0.00",
-        "vICMS": "0.00",
-        "vICMSDeson": "0.00",
-        "vST": "0.00",
-        "vFrete": "0.00",
-        "vSeg": "0.00",
-        "vOutro": "0.00",
-        "vTotTrib": "0.00",
-        "vPIS": "0.00",
-        "vCOFINS": "0.00",
-    }
-    total_el = inf_nfe.find(_q("total"))
-    if total_el is not None:
-        icmstot_el = total_el.find(_q("ICMSTot"))
-        if icmstot_el is not None:
-            for campo in [
-                "vProd",
-                "vNF",
-                "vDesc",
-                "vICMS",
-                "vICMSDeson",
-                "vST",
-                "vFrete",
-                "vSeg",
-                "vOutro",
-                "vTotTrib",
-                "vPIS",
-                "vCOFINS",
-            ]:
-                v = _text(icmstot_el.find(_q(campo)))
-                if v is not None:
-                    totais[campo] = v
+    totais: Dict[str, Any] = {c: doc.icms_tot.get(c, "0.00") for c in _TOTAIS_CAMPOS}
 
     # --- ITENS ---
     itens_list: List[Dict[str, Any]] = []
-    for det_el in inf_nfe.findall(_q("det")):
-        n_item = det_el.get("nItem")
-        prod_el = det_el.find(_q("prod"))
-        imposto_el = det_el.find(_q("imposto"))
-
-        item: Dict[str, Any] = {
-            "nItem": int(n_item) if n_item and n_item.isdigit() else None,
-        }
-
-        # PROD
-        if prod_el is not None:
-            item.update(
-                {
-                    "cProd": _text(prod_el.find(_q("cProd"))),
-                    "cEAN": _text(prod_el.find(_q("cEAN"))),
-                    "xProd": _text(prod_el.find(_q("xProd"))),
-                    "NCM": _text(prod_el.find(_q("NCM"))),
-                    "CEST": _text(prod_el.find(_q("CEST"))),
-                    "CFOP": _text(prod_el.find(_q("CFOP"))),
-                    "uCom": _text(prod_el.find(_q("uCom"))),
-                    "qCom": _text(prod_el.find(_q("qCom"))),
-                    "vUnCom": _text(prod_el.find(_q("vUnCom"))),
-                    "vProd": _text(prod_el.find(_q("vProd"))),
-                    "cEANTrib": _text(prod_el.find(_q("cEANTrib"))),
-                    "uTrib": _text(prod_el.find(_q("uTrib"))),
-                    "qTrib": _text(prod_el.find(_q("qTrib"))),
-                    "vUnTrib": _text(prod_el.find(_q("vUnTrib"))),
-                    "vDesc": _text(prod_el.find(_q("vDesc"))),
-                    "indTot": _text(prod_el.find(_q("indTot"))),
-                }
-            )
-        else:
-            item.update(
-                {
-                    "cProd": None,
-                    "cEAN": None,
-                    "xProd": None,
-                    "NCM": None,
-                    "CEST": None,
-                    "CFOP": None,
-                    "uCom": None,
-                    "qCom": None,
-                    "vUnCom": None,
-                    "vProd": None,
-                    "cEANTrib": None,
-                    "uTrib": None,
-                    "qTrib": None,
-                    "vUnTrib": None,
-                    "vDesc": None,
-                    "indTot": None,
-                }
-            )
-
-        # IMPOSTOS
-        icms_data: Dict[str, Any] = {
-            "orig": None,
-            "CST": None,
-            "CSOSN": None,
-            "modBC": None,
-            "vBC": None,
-            "pICMS": None,
-            "vICMS": None,
-        }
-        pis_data: Dict[str, Any] = {"CST": None, "vBC": None, "pPIS": None, "vPIS": None}
-        cofins_data: Dict[str, Any] = {
-            "CST": None,
-            "vBC": None,
-            "pCOFINS": None,
-            "vCOFINS": None,
-        }
-
-        if imposto_el is not None:
-            # ICMS (pega o primeiro ICMS* que encontrar)
-            icms_el = imposto_el.find(_q("ICMS"))
-            if icms_el is not None:
-                icms_any = None
-                for child in icms_el:
-                    if child.tag.startswith(_q("ICMS")):
-                        icms_any = child
-                        break
-                if icms_any is not None:
-                    icms_data["orig"] = _text(icms_any.find(_q("orig")))
-                    icms_data["CST"] = _text(icms_any.find(_q("CST")))
-                    icms_data["CSOSN"] = _text(icms_any.find(_q("CSOSN")))
-                    icms_data["modBC"] = _text(icms_any.find(_q("modBC")))
-                    icms_data["vBC"] = _text(icms_any.find(_q("vBC")))
-                    icms_data["pICMS"] = _text(icms_any.find(_q("pICMS")))
-                    icms_data["vICMS"] = _text(icms_any.find(_q("vICMS")))
-
-            # PIS
-            pis_el = imposto_el.find(_q("PIS"))
-            if pis_el is not None:
-                pis_any = None
-                for child in pis_el:
-                    pis_any = child
-                    break
-                if pis_any is not None:
-                    pis_data["CST"] = _text(pis_any.find(_q("CST")))
-                    pis_data["vBC"] = _text(pis_any.find(_q("vBC")))
-                    pis_data["pPIS"] = _text(pis_any.find(_q("pPIS")))
-                    pis_data["vPIS"] = _text(pis_any.find(_q("vPIS")))
-
-            # COFINS
-            cofins_el = imposto_el.find(_q("COFINS"))
-            if cofins_el is not None:
-                cof_any = None
-                for child in cofins_el:
-                    cof_any = child
-                    break
-                if cof_any is not None:
-                    cofins_data["CST"] = _text(cof_any.find(_q("CST")))
-                    cofins_data["vBC"] = _text(cof_any.find(_q("vBC")))
-                    cofins_data["pCOFINS"] = _text(cof_any.find(_q("pCOFINS")))
-                    cofins_data["vCOFINS"] = _text(cof_any.find(_q("vCOFINS")))
-
-        item["ICMS"] = icms_data
-        item["PIS"] = pis_data
-        item["COFINS"] = cofins_data
-
+    for it in doc.itens:
+        item: Dict[str, Any] = {"nItem": it.nItem}
+        item.update(_selecionar(it.prod, _PROD_CAMPOS))
+        item["ICMS"] = _selecionar(it.icms, ("orig", "CST", "CSOSN", "modBC", "vBC", "pICMS", "vICMS"))
+        item["PIS"] = _selecionar(it.pis, ("CST", "vBC", "pPIS", "vPIS"))
+        item["COFINS"] = _selecionar(it.cofins, ("CST", "vBC", "pCOFINS", "vCOFINS"))
         itens_list.append(item)
 
     return XmlInfoResult(
@@ -394,6 +268,23 @@ app = FastAPI(
     openapi_tags=tags_metadata,
 )
 
+# rotas perfiláveis (PerfilMiddleware); os APIRouter usam a mesma classe
+app.router.route_class = RotaPerfilavel
+
+# latência por rota/status para GET /metrics; este e o de rastreamento
+# ficam por dentro da compressão para ver o scope com a rota mesmo
+# quando o corpo vem em gzip
+app.add_middleware(MetricasMiddleware)
+
+# perfil (cProfile) sob demanda: X-Perfil com SEFAZ_PERFIL_TOKEN ou SEFAZ_PERFIL_TAXA
+app.add_middleware(PerfilMiddleware)
+
+# X-Request-ID e span raiz (SEFAZ_TRACE_EXPORTADOR=console|arquivo liga os spans)
+app.add_middleware(RastreamentoMiddleware)
+
+# gzip na entrada (Content-Encoding) e br/gzip na saída (Accept-Encoding)
+app.add_middleware(CompressaoMiddleware)
+
 # Rotas de envio de e-mail de NFe
 app.include_router(
     email_nfe_router,
@@ -409,6 +300,115 @@ app.include_router(nfe_schema_router.router)
 app.include_router(mdfe_router.router, prefix="/mdfe", tags=["MDFe - SEFAZ"])
 
 
+app.include_router(perfil_router)
+
+
+cadastro_cache = CacheTTL(CACHE_DB, tabela="cadastro")
+gtin_cache = CacheTTL(CACHE_DB, tabela="gtin")
+consulta_cache = CacheTTL(CACHE_DB, tabela="consulta")
+repositorio = RepositorioDocumentos(DOCS_DIR)
+
+# usado por ?retorno=referencia (sefaz_service.routers.retorno)
+app.state.repositorio = repositorio
+
+# consulta em segundo plano os recibos dos lotes assíncronos (envio_sinc=False)
+agendador_recibos = AgendadorRecibos()
+
+outbox = NFeOutbox(
+    db_path=OUTBOX_DB,
+    workers=OUTBOX_WORKERS,
+    max_por_uf=OUTBOX_MAX_POR_UF,
+    # o certificado do servidor vai para a fila só como referência
+    certificados={"padrao": (PFX_PATH, PFX_PASSWORD)},
+    chave_cifra=OUTBOX_CHAVE,
+    recibos=agendador_recibos,
+    repositorio=repositorio,
+)
+
+
+
+def _configs_distribuicao() -> List[DistribuicaoConfig]:
+    """Interessados de SEFAZ_DFE_CNPJS ("CNPJ:UF,...")."""
+    configs: List[DistribuicaoConfig] = []
+    for item in filter(None, (p.strip() for p in DFE_CNPJS.split(","))):
+        cnpj, _, uf = item.partition(":")
+        if not cnpj.strip() or not uf.strip():
+            raise ValueError(f"SEFAZ_DFE_CNPJS inválido em {item!r} (use CNPJ:UF)")
+        configs.append(
+            DistribuicaoConfig(
+                cnpj=cnpj.strip(),
+                uf=uf.strip().upper(),
+                pfx_path=PFX_PATH,
+                pfx_password=PFX_PASSWORD,
+                ambiente=DFE_AMBIENTE,
+            )
+        )
+    return configs
+
+
+# baixa em segundo plano os documentos dos CNPJs de SEFAZ_DFE_CNPJS
+agendador_distribuicao: Optional[AgendadorDistribuicao] = None
+if DFE_CNPJS:
+    agendador_distribuicao = AgendadorDistribuicao(
+        repositorio=repositorio,
+        estado_store=EstadoNSUStore(DFE_DB),
+        intervalo=DFE_INTERVALO,
+    )
+    for _config in _configs_distribuicao():
+        agendador_distribuicao.adicionar(_config)
+
+
+def _metricas_caches() -> Dict[str, Dict[str, Any]]:
+    return {
+        "documentos": documentos_cache.metricas(),
+        "cadastro": cadastro_cache.metricas(),
+        "gtin": gtin_cache.metricas(),
+        "consulta": consulta_cache.metricas(),
+    }
+
+
+registro.coletor(
+    "sefaz_cache_acertos_total",
+    "counter",
+    "Leituras de cache que encontraram entrada válida",
+    lambda: [({"cache": nome}, m["acertos"]) for nome, m in _metricas_caches().items()],
+)
+registro.coletor(
+    "sefaz_cache_faltas_total",
+    "counter",
+    "Leituras de cache sem entrada válida",
+    lambda: [({"cache": nome}, m["faltas"]) for nome, m in _metricas_caches().items()],
+)
+registro.coletor(
+    "sefaz_cache_taxa_acerto",
+    "gauge",
+    "Acertos / (acertos + faltas) desde o início do processo",
+    lambda: [({"cache": nome}, m["taxa_acerto"]) for nome, m in _metricas_caches().items()],
+)
+registro.coletor(
+    "sefaz_cache_documentos_bytes",
+    "gauge",
+    "Bytes estimados ocupados pelo cache de documentos NF-e",
+    lambda: [({}, documentos_cache.metricas()["bytes"])],
+)
+
+
+@app.on_event("startup")
+def _iniciar_outbox() -> None:
+    agendador_recibos.iniciar()
+    outbox.iniciar()
+    if agendador_distribuicao is not None:
+        agendador_distribuicao.iniciar()
+
+
+@app.on_event("shutdown")
+def _parar_outbox() -> None:
+    if agendador_distribuicao is not None:
+        agendador_distribuicao.parar()
+    outbox.parar()
+    agendador_recibos.parar()
+
+
 # -------------------------------------------------------------------
 # MODELOS Pydantic PARA REQUESTS/RESPONSES
 # -------------------------------------------------------------------
@@ -422,14 +422,25 @@ class NFeAutorizarComCertRequest(BaseModel):
         description="Caminho completo do arquivo .pfx no servidor (ex.: C:\\Certificados\\cert.pfx)",
     )
     senha: str = Field(..., description="Senha do certificado PFX")
+    envio_sinc: bool = Field(
+        True,
+        description="False = lote assíncrono: a SEFAZ devolve um recibo (nRec), "
+        "consultado em segundo plano; resultado em GET /nfe/recibos/{nRec}",
+    )
 
 
 class NFeEnvioResponse(BaseModel):
-    status: int | None
-    motivo: str | None
-    xml_assinado: str
-    xml_envi_nfe: str
-    xml_retorno: str
+    status: int | None = None
+    motivo: str | None = None
+    nProt: str | None = None
+    nRec: str | None = None
+    xml_assinado: str | None = None
+    xml_envi_nfe: str | None = None
+    xml_retorno: str | None = None
+    xml_nfe_proc: str | None = None
+    documentos: Dict[str, str] | None = Field(
+        None, description="retorno=referencia: id no repositório de cada XML"
+    )
 
 
 class InutilizacaoAPIRequest(BaseModel):
@@ -446,11 +457,52 @@ class InutilizacaoAPIRequest(BaseModel):
 
 
 class InutilizacaoAPIResponse(BaseModel):
-    cStat: str | None
-    xMotivo: str | None
-    nProt: str | None
-    dhRecbto: str | None
-    xml_retorno: str | None
+    cStat: str | None = None
+    xMotivo: str | None = None
+    nProt: str | None = None
+    dhRecbto: str | None = None
+    xml_retorno: str | None = None
+    xml_proc: str | None = Field(None, description="procInutNFe, se homologada (102)")
+    documentos: Dict[str, str] | None = Field(
+        None, description="retorno=referencia: id no repositório de cada XML"
+    )
+
+
+class InutilizacaoPlanoRequest(BaseModel):
+    uf: str = Field(..., description="Sigla da UF, ex.: AC")
+    tpAmb: str = Field("2", description="1=Produção, 2=Homologação")
+    CNPJ: str = Field(..., description="CNPJ do emitente (com ou sem máscara)")
+    mod: str = Field("55", description="Modelo da NFe: 55 ou 65")
+    serie: str = Field(..., description="Série da NFe, ex.: 1")
+    ano: str = Field(..., description="Ano com 2 dígitos, ex.: 25")
+    numeros: Optional[List[int]] = Field(
+        None,
+        description="Números já emitidos; se omitido, são lidos das chaves do repositório local",
+    )
+    nNFIni: Optional[int] = Field(None, description="Início do trecho analisado (padrão: menor emitido)")
+    nNFFin: Optional[int] = Field(None, description="Fim do trecho analisado (padrão: maior emitido)")
+    max_por_faixa: Optional[int] = Field(None, ge=1, description="Tamanho máximo de cada faixa")
+    xJust: str = Field(..., min_length=15, max_length=255, description="Justificativa da inutilização")
+    dry_run: bool = Field(True, description="True = só relatório, nada é enviado à SEFAZ")
+
+
+class InutilizacaoFaixaItem(BaseModel):
+    nNFIni: int
+    nNFFin: int
+    quantidade: int
+    enviado: bool
+    cStat: str | None = None
+    xMotivo: str | None = None
+    nProt: str | None = None
+
+
+class InutilizacaoPlanoResponse(BaseModel):
+    emitidos: int
+    faixa_ini: int | None
+    faixa_fim: int | None
+    total_inutilizar: int
+    dry_run: bool
+    faixas: List[InutilizacaoFaixaItem]
 
 
 class CancelamentoRequest(BaseModel):
@@ -495,14 +547,17 @@ class CartaCorrecaoRequest(BaseModel):
 
 
 class EventoAPIResponse(BaseModel):
-    cStat_lote: int | None
-    xMotivo_lote: str | None
-    cStat_evento: int | None
-    xMotivo_evento: str | None
-    nProt_evento: str | None
-    xml_envio: str
-    xml_assinado: str
-    xml_retorno: str
+    cStat_lote: int | None = None
+    xMotivo_lote: str | None = None
+    cStat_evento: int | None = None
+    xMotivo_evento: str | None = None
+    nProt_evento: str | None = None
+    xml_envio: str | None = None
+    xml_assinado: str | None = None
+    xml_retorno: str | None = None
+    documentos: Dict[str, str] | None = Field(
+        None, description="retorno=referencia: id no repositório de cada XML"
+    )
 
 
 class NFeStatusRequest(BaseModel):
@@ -538,6 +593,16 @@ class NFeConsultaChaveResponse(BaseModel):
     motivo: str | None
     xml_envio: str
     xml_retorno: str
+    cache: bool = Field(False, description="True se a resposta veio do cache local")
+
+
+class NFeConsultaLoteRequest(BaseModel):
+    ambiente: str = Field("2", description="1=Producao, 2=Homologacao")
+    chaves: List[str] = Field(..., description="Chaves de acesso (44 dígitos); UF e modelo saem da chave")
+    certificado: str = Field(..., description="Caminho completo do arquivo .pfx no servidor")
+    senha: str = Field(..., description="Senha do certificado PFX")
+    max_por_uf: int = Field(4, ge=1, le=16, description="Consultas simultâneas por UF")
+    incluir_xml: bool = Field(False, description="Inclui xml_retorno em cada linha")
 
 
 class NFeGTINRequest(BaseModel):
@@ -551,6 +616,145 @@ class NFeGTINResponse(BaseModel):
     motivo: str | None
     xml_envio: str
     xml_retorno: str
+    cache: bool = False
+
+
+class NFeGTINLoteRequest(BaseModel):
+    gtins: List[str] = Field(..., description="Lista de GTINs a consultar")
+    certificado: str
+    senha: str
+    max_concorrencia: int = Field(4, ge=1, le=16, description="Consultas simultâneas à SVRS")
+    incluir_xml: bool = Field(False, description="Inclui xml_retorno em cada linha")
+
+
+class NFeCadastroRequest(BaseModel):
+    uf: str = Field(..., description="Sigla da UF do contribuinte, ex.: SP")
+    tipo: str = Field("CNPJ", description="CNPJ, CPF ou IE")
+    documento: str = Field(..., description="Número do CNPJ, CPF ou IE")
+    ambiente: str = Field("1", description="1=Producao, 2=Homologacao")
+    certificado: str = Field(
+        ...,
+        description="Caminho completo do arquivo .pfx no servidor (ex.: C:\\Certificados\\cert.pfx)",
+    )
+    senha: str = Field(..., description="Senha do certificado PFX")
+
+
+class NFeCadastroResponse(BaseModel):
+    status: int | None
+    motivo: str | None
+    contribuintes: List[Dict[str, Any]]
+    cache: bool
+    xml_envio: str
+    xml_retorno: str
+
+
+class NFeCadastroItem(BaseModel):
+    uf: str
+    tipo: str = "CNPJ"
+    documento: str
+
+
+class NFeCadastroLoteRequest(BaseModel):
+    consultas: List[NFeCadastroItem]
+    ambiente: str = Field("1", description="1=Producao, 2=Homologacao")
+    max_por_uf: int = Field(2, ge=1, le=10, description="Consultas simultâneas por UF")
+    certificado: str
+    senha: str
+
+
+class NFeCadastroLoteResponse(BaseModel):
+    resultados: List[NFeCadastroResponse]
+
+
+# --------- MODELOS DA FILA ASSÍNCRONA (OUTBOX) ---------
+
+
+class EventoAsyncRequest(BaseModel):
+    uf: str = Field(..., description="Sigla da UF, ex.: AC")
+    cOrgao: str = Field(..., description="Código da UF, ex.: 12 para AC")
+    tpAmb: str = Field("2", description="1=Produção, 2=Homologação")
+    CNPJ: str = Field(..., description="CNPJ do emitente")
+    chNFe: str = Field(..., description="Chave completa da NFe (44 dígitos)")
+    tpEvento: str = Field(..., description="110110, 110111 ou 110112")
+    nSeqEvento: int = Field(1, description="Número sequencial do evento")
+    xJust: Optional[str] = Field(None, description="Justificativa (cancelamentos)")
+    nProt: Optional[str] = Field(None, description="Protocolo de autorização (cancelamentos)")
+    chNFeRef: Optional[str] = Field(None, description="Chave substituta (110112)")
+    xCorrecao: Optional[str] = Field(None, description="Texto da CC-e (110110)")
+
+
+class EventoLoteRequest(BaseModel):
+    eventos: List[EventoAsyncRequest] = Field(
+        ...,
+        description="Eventos a enviar; são agrupados por UF/cOrgao/ambiente em lotes de até 20",
+    )
+
+
+class EventoLoteResponse(BaseModel):
+    resultados: List[EventoAPIResponse]
+
+
+class ManifestacaoRequest(BaseModel):
+    tpAmb: str = Field("1", description="1=Produção, 2=Homologação")
+    CNPJ: str = Field(..., description="CNPJ do destinatário (autor da manifestação)")
+    tpEvento: str = Field(
+        ...,
+        description="210200=Confirmação, 210210=Ciência, 210220=Desconhecimento, 210240=Operação não Realizada",
+    )
+    chaves: List[str] = Field(..., description="Chaves de acesso das NF-e recebidas")
+    xJust: Optional[str] = Field(None, description="Justificativa (obrigatória no 210240)")
+    nSeqEvento: int = Field(1, description="Número sequencial do evento")
+
+
+class ManifestacaoItem(BaseModel):
+    chave: str
+    cStat_lote: int | None
+    xMotivo_lote: str | None
+    cStat: int | None
+    xMotivo: str | None
+    nProt: str | None
+    documento_id: str | None = Field(None, description="Id do procEventoNFe no repositório local")
+
+
+class ManifestacaoResponse(BaseModel):
+    tpEvento: str
+    resultados: List[ManifestacaoItem]
+
+
+class JobEnfileiradoResponse(BaseModel):
+    job_id: str
+    status: str
+
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    tipo: str
+    uf: str
+    status: str
+    tentativas: int
+    erro: Optional[str]
+    resultado: Optional[Dict[str, Any]]
+    criado_em: float
+    atualizado_em: float
+    proxima_tentativa: float
+
+
+class ReciboAutorizacao(BaseModel):
+    status: int | None = None
+    motivo: str | None = None
+    xml_nfe_proc: str | None = None
+
+
+class ReciboStatusResponse(BaseModel):
+    nRec: str
+    status: str = Field(..., description="pendente ou concluido")
+    cStat: int | None = None
+    xMotivo: str | None = None
+    erro: str | None = None
+    xml_retorno: str | None = None
+    autorizacoes: Dict[str, ReciboAutorizacao] = Field(
+        default_factory=dict, description="Chave de acesso -> protocolo/nfeProc"
+    )
 
 
 # --------- MODELOS PARA XML BRUTO / RESUMO / ANÁLISE ---------
@@ -665,13 +869,19 @@ class CTeConsultaChaveResponse(BaseModel):
 @app.post(
     "/nfe/enviar",
     response_model=NFeEnvioResponse,
+    response_model_exclude_unset=True,
     summary="Enviar NFe (autorização)",
     tags=["NFe - SEFAZ"],
 )
-def enviar_nfe(payload: NFeAutorizarComCertRequest):
+def enviar_nfe(
+    payload: NFeAutorizarComCertRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Envia uma NFe para a SEFAZ usando
     certificado e senha enviados na requisição.
+
+    ?retorno=minimo devolve só status, motivo, nProt e o nfeProc.
     """
     try:
         result = sefaz_nfe_envio(
@@ -680,6 +890,7 @@ def enviar_nfe(payload: NFeAutorizarComCertRequest):
             pfx_path=payload.certificado,
             pfx_password=payload.senha,
             ambiente=payload.ambiente,
+            envio_sinc=payload.envio_sinc,
         )
     except Exception as e:
         raise HTTPException(
@@ -687,22 +898,46 @@ def enviar_nfe(payload: NFeAutorizarComCertRequest):
             detail=f"Erro ao enviar NFe com certificado informado: {e}",
         )
 
-    return NFeEnvioResponse(
-        status=result.status,
-        motivo=result.motivo,
-        xml_assinado=result.xml_assinado,
-        xml_envi_nfe=result.xml_envi_nfe,
-        xml_retorno=result.xml_retorno,
+    # lote assíncrono: o protocolo chega pelo recibo, consultado em segundo plano
+    agendador_recibos.registrar_envio(
+        result,
+        uf=payload.uf,
+        ambiente=payload.ambiente,
+        pfx_path=payload.certificado,
+        pfx_password=payload.senha,
     )
 
+    # a chave só vai para o repositório se a numeração foi usada (há protocolo)
+    dados = aplicar_retorno(
+        {
+            "status": result.status,
+            "motivo": result.motivo,
+            "nProt": result.nProt,
+            "nRec": result.nRec,
+            "xml_assinado": result.xml_assinado,
+            "xml_envi_nfe": result.xml_envi_nfe,
+            "xml_retorno": result.xml_retorno,
+            "xml_nfe_proc": result.xml_nfe_proc,
+        },
+        opcoes,
+        tipo="nfe_envio",
+        finais=("xml_nfe_proc",),
+        chave=result.chNFe if result.nProt else None,
+    )
+    return NFeEnvioResponse(**dados)
+
 
 @app.post(
     "/nfe/inutilizar",
     response_model=InutilizacaoAPIResponse,
+    response_model_exclude_unset=True,
     summary="Inutilizar numeração de NFe",
     tags=["NFe - SEFAZ"],
 )
-def inutilizar_numeracao(payload: InutilizacaoAPIRequest):
+def inutilizar_numeracao(
+    payload: InutilizacaoAPIRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Inutilização de numeração de NFe (NFeInutilizacao4).
     """
@@ -728,22 +963,126 @@ def inutilizar_numeracao(payload: InutilizacaoAPIRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao inutilizar: {e}")
 
-    return InutilizacaoAPIResponse(
-        cStat=resp.cStat,
-        xMotivo=resp.xMotivo,
-        nProt=resp.nProt,
-        dhRecbto=resp.dhRecbto,
-        xml_retorno=resp.raw_xml,
+    # faixa homologada entra no repositório e sai dos próximos planos
+    salvar_inutilizacao(repositorio, resp)
+
+    dados = aplicar_retorno(
+        {
+            "cStat": resp.cStat,
+            "xMotivo": resp.xMotivo,
+            "nProt": resp.nProt,
+            "dhRecbto": resp.dhRecbto,
+            "xml_retorno": resp.raw_xml,
+            "xml_proc": resp.xml_proc,
+        },
+        opcoes,
+        tipo="nfe_inutilizacao",
+        finais=("xml_proc",),
+        cnpj=payload.CNPJ,
+    )
+    return InutilizacaoAPIResponse(**dados)
+
+
+@app.post(
+    "/nfe/inutilizar/planejar",
+    response_model=InutilizacaoPlanoResponse,
+    summary="Detectar lacunas na numeração e inutilizá-las em lote",
+    tags=["NFe - SEFAZ"],
+)
+def planejar_inutilizacao_numeracao(payload: InutilizacaoPlanoRequest):
+    """
+    Calcula as lacunas da numeração de (CNPJ, modelo, série, ano) a partir
+    dos números informados ou das chaves gravadas no repositório, junta em
+    faixas mínimas e, se dry_run=false, envia as inutilizações em paralelo.
+    """
+    try:
+        if payload.numeros is not None:
+            emitidos = payload.numeros
+        else:
+            emitidos = numeros_emitidos_do_repositorio(
+                repositorio, payload.CNPJ, payload.mod, payload.serie, payload.ano
+            )
+
+        plano = planejar_inutilizacao(
+            emitidos,
+            payload.CNPJ,
+            payload.mod,
+            payload.serie,
+            payload.ano,
+            inutilizados=faixas_inutilizadas_do_repositorio(
+                repositorio, payload.CNPJ, payload.mod, payload.serie, payload.ano
+            ),
+            inicio=payload.nNFIni,
+            fim=payload.nNFFin,
+            max_por_faixa=payload.max_por_faixa,
+        )
+
+        resultados = executar_plano_inutilizacao(
+            plano,
+            uf=payload.uf,
+            ambiente=payload.tpAmb,
+            xJust=payload.xJust,
+            pfx_path=PFX_PATH,
+            pfx_password=PFX_PASSWORD,
+            dry_run=payload.dry_run,
+            repositorio=repositorio,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao planejar inutilizacao: {e}")
+
+    return InutilizacaoPlanoResponse(
+        emitidos=plano.emitidos,
+        faixa_ini=plano.faixa_ini,
+        faixa_fim=plano.faixa_fim,
+        total_inutilizar=plano.total_inutilizar,
+        dry_run=payload.dry_run,
+        faixas=[
+            InutilizacaoFaixaItem(
+                nNFIni=r.faixa.nNFIni,
+                nNFFin=r.faixa.nNFFin,
+                quantidade=r.faixa.quantidade,
+                enviado=r.enviado,
+                cStat=r.cStat,
+                xMotivo=r.xMotivo,
+                nProt=r.nProt,
+            )
+            for r in resultados
+        ],
+    )
+
+
+def _retorno_evento(res, payload, opcoes: OpcoesRetorno) -> Dict[str, Any]:
+    return aplicar_retorno(
+        {
+            "cStat_lote": res.cStat_lote,
+            "xMotivo_lote": res.xMotivo_lote,
+            "cStat_evento": res.cStat_evento,
+            "xMotivo_evento": res.xMotivo_evento,
+            "nProt_evento": res.nProt_evento,
+            "xml_envio": res.xml_envio,
+            "xml_assinado": res.xml_assinado,
+            "xml_retorno": res.xml_retorno,
+        },
+        opcoes,
+        tipo="nfe_evento",
+        chave=payload.chNFe,
+        cnpj=payload.CNPJ,
     )
 
 
 @app.post(
     "/nfe/evento/cancelar",
     response_model=EventoAPIResponse,
+    response_model_exclude_unset=True,
     summary="Cancelar NFe (evento 110111)",
     tags=["NFe - Eventos"],
 )
-def cancelar_nfe(payload: CancelamentoRequest):
+def cancelar_nfe(
+    payload: CancelamentoRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Envia evento de CANCELAMENTO (110111).
     """
@@ -769,25 +1108,20 @@ def cancelar_nfe(payload: CancelamentoRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar evento de cancelamento: {e}")
 
-    return EventoAPIResponse(
-        cStat_lote=res.cStat_lote,
-        xMotivo_lote=res.xMotivo_lote,
-        cStat_evento=res.cStat_evento,
-        xMotivo_evento=res.xMotivo_evento,
-        nProt_evento=res.nProt_evento,
-        xml_envio=res.xml_envio,
-        xml_assinado=res.xml_assinado,
-        xml_retorno=res.xml_retorno,
-    )
+    return EventoAPIResponse(**_retorno_evento(res, payload, opcoes))
 
 
 @app.post(
     "/nfe/evento/cancelar-substituicao",
     response_model=EventoAPIResponse,
+    response_model_exclude_unset=True,
     summary="Cancelar NFe por substituição (evento 110112)",
     tags=["NFe - Eventos"],
 )
-def cancelar_nfe_por_substituicao(payload: CancelamentoSubstRequest):
+def cancelar_nfe_por_substituicao(
+    payload: CancelamentoSubstRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Envia evento de CANCELAMENTO POR SUBSTITUIÇÃO (110112).
     """
@@ -816,25 +1150,20 @@ def cancelar_nfe_por_substituicao(payload: CancelamentoSubstRequest):
             detail=f"Erro ao enviar evento de cancelamento por substituicao: {e}",
         )
 
-    return EventoAPIResponse(
-        cStat_lote=res.cStat_lote,
-        xMotivo_lote=res.xMotivo_lote,
-        cStat_evento=res.cStat_evento,
-        xMotivo_evento=res.xMotivo_evento,
-        nProt_evento=res.nProt_evento,
-        xml_envio=res.xml_envio,
-        xml_assinado=res.xml_assinado,
-        xml_retorno=res.xml_retorno,
-    )
+    return EventoAPIResponse(**_retorno_evento(res, payload, opcoes))
 
 
 @app.post(
     "/nfe/evento/carta-correcao",
     response_model=EventoAPIResponse,
+    response_model_exclude_unset=True,
     summary="Enviar Carta de Correcao (evento 110110)",
     tags=["NFe - Eventos"],
 )
-def enviar_carta_correcao(payload: CartaCorrecaoRequest):
+def enviar_carta_correcao(
+    payload: CartaCorrecaoRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Envia uma Carta de Correcao Eletronica (CC-e) para a NFe informada (evento 110110).
     """
@@ -864,18 +1193,363 @@ def enviar_carta_correcao(payload: CartaCorrecaoRequest):
             detail=f"Erro ao enviar carta de correcao: {e}",
         )
 
-    return EventoAPIResponse(
-        cStat_lote=res.cStat_lote,
-        xMotivo_lote=res.xMotivo_lote,
-        cStat_evento=res.cStat_evento,
-        xMotivo_evento=res.xMotivo_evento,
-        nProt_evento=res.nProt_evento,
-        xml_envio=res.xml_envio,
-        xml_assinado=res.xml_assinado,
-        xml_retorno=res.xml_retorno,
+    return EventoAPIResponse(**_retorno_evento(res, payload, opcoes))
+
+
+# -------------------------------------------------------------------
+# FILA ASSÍNCRONA (OUTBOX): ENFILEIRA E DEVOLVE O ID DO JOB
+# -------------------------------------------------------------------
+
+@app.post(
+    "/nfe/enviar/async",
+    response_model=JobEnfileiradoResponse,
+    summary="Enfileirar envio de NFe (autorização assíncrona)",
+    tags=["NFe - SEFAZ"],
+)
+def enviar_nfe_async(payload: NFeAutorizarComCertRequest):
+    """
+    Grava a NFe na fila persistente e retorna o id do job.
+    O protocolo é obtido depois em GET /nfe/jobs/{job_id}.
+    """
+    try:
+        job_id = enfileirar_autorizacao(
+            outbox,
+            xml_nfe=payload.xml_nfe,
+            uf=payload.uf,
+            pfx_path=payload.certificado,
+            pfx_password=payload.senha,
+            ambiente=payload.ambiente,
+            envio_sinc=payload.envio_sinc,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar NFe: {e}")
+
+    return JobEnfileiradoResponse(job_id=job_id, status="pendente")
+
+
+@app.post(
+    "/nfe/evento/lote",
+    response_model=EventoLoteResponse,
+    summary="Enviar vários eventos de NFe em lotes de até 20 por envEvento",
+    tags=["NFe - Eventos"],
+)
+def enviar_eventos_lote(payload: EventoLoteRequest):
+    """
+    Envia cancelamentos, cancelamentos por substituição e CC-e em lote.
+
+    Os eventos são agrupados por UF, cOrgao e ambiente, assinados em
+    paralelo e enviados em envEvento com até 20 eventos. Os resultados
+    voltam na mesma ordem da lista enviada, cada um com o seu retEvento.
+    """
+    pendentes = [
+        EventoPendente(
+            req=EventoRequest(
+                tpAmb=ev.tpAmb,
+                cOrgao=ev.cOrgao,
+                CNPJ=ev.CNPJ,
+                chNFe=ev.chNFe,
+                tpEvento=ev.tpEvento,
+                nSeqEvento=ev.nSeqEvento,
+                xJust=ev.xJust,
+                nProt=ev.nProt,
+                chNFeRef=ev.chNFeRef,
+                xCorrecao=ev.xCorrecao,
+            ),
+            uf=ev.uf,
+            pfx_path=PFX_PATH,
+            pfx_password=PFX_PASSWORD,
+        )
+        for ev in payload.eventos
+    ]
+
+    try:
+        resultados = sefaz_enviar_eventos_lote(pendentes)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enviar lote de eventos: {e}")
+
+    return EventoLoteResponse(
+        resultados=[
+            EventoAPIResponse(
+                cStat_lote=res.cStat_lote,
+                xMotivo_lote=res.xMotivo_lote,
+                cStat_evento=res.cStat_evento,
+                xMotivo_evento=res.xMotivo_evento,
+                nProt_evento=res.nProt_evento,
+                xml_envio=res.xml_envio,
+                xml_assinado=res.xml_assinado,
+                xml_retorno=res.xml_retorno,
+            )
+            for res in resultados
+        ]
+    )
+
+
+@app.post(
+    "/nfe/manifestacao",
+    response_model=ManifestacaoResponse,
+    summary="Manifestação do destinatário em lote (210200, 210210, 210220, 210240)",
+    tags=["NFe - Eventos"],
+)
+def manifestar_destinatario(payload: ManifestacaoRequest):
+    """
+    Manifesta uma lista de chaves no Ambiente Nacional, em lotes de 20
+    eventos. Os eventos registrados (135/136) ficam gravados como
+    procEventoNFe no repositório local.
+    """
+    try:
+        resultados = sefaz_manifestar_destinatario(
+            payload.chaves,
+            tp_evento=payload.tpEvento,
+            cnpj=payload.CNPJ,
+            pfx_path=PFX_PATH,
+            pfx_password=PFX_PASSWORD,
+            ambiente=payload.tpAmb,
+            xJust=payload.xJust,
+            nSeqEvento=payload.nSeqEvento,
+            repositorio=repositorio,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enviar manifestação: {e}")
+
+    return ManifestacaoResponse(
+        tpEvento=payload.tpEvento,
+        resultados=[
+            ManifestacaoItem(
+                chave=r.chave,
+                cStat_lote=r.cStat_lote,
+                xMotivo_lote=r.xMotivo_lote,
+                cStat=r.cStat,
+                xMotivo=r.xMotivo,
+                nProt=r.nProt,
+                documento_id=r.documento_id,
+            )
+            for r in resultados
+        ],
+    )
+
+
+@app.post(
+    "/nfe/evento/async",
+    response_model=JobEnfileiradoResponse,
+    summary="Enfileirar evento de NFe (110110, 110111, 110112)",
+    tags=["NFe - Eventos"],
+)
+def enviar_evento_async(payload: EventoAsyncRequest):
+    """
+    Grava o evento na fila persistente e retorna o id do job.
+    """
+    req = EventoRequest(
+        tpAmb=payload.tpAmb,
+        cOrgao=payload.cOrgao,
+        CNPJ=payload.CNPJ,
+        chNFe=payload.chNFe,
+        tpEvento=payload.tpEvento,
+        nSeqEvento=payload.nSeqEvento,
+        xJust=payload.xJust,
+        nProt=payload.nProt,
+        chNFeRef=payload.chNFeRef,
+        xCorrecao=payload.xCorrecao,
+    )
+
+    try:
+        job_id = enfileirar_evento(
+            outbox,
+            req=req,
+            uf=payload.uf,
+            pfx_path=PFX_PATH,
+            pfx_password=PFX_PASSWORD,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar evento: {e}")
+
+    return JobEnfileiradoResponse(job_id=job_id, status="pendente")
+
+
+@app.post(
+    "/nfe/inutilizar/async",
+    response_model=JobEnfileiradoResponse,
+    summary="Enfileirar inutilização de numeração de NFe",
+    tags=["NFe - SEFAZ"],
+)
+def inutilizar_numeracao_async(payload: InutilizacaoAPIRequest):
+    """
+    Grava a inutilização na fila persistente e retorna o id do job.
+    """
+    req = InutilizacaoRequest(
+        cUF=payload.cUF,
+        tpAmb=payload.tpAmb,
+        ano=payload.ano,
+        CNPJ=payload.CNPJ,
+        mod=payload.mod,
+        serie=payload.serie,
+        nNFIni=payload.nNFIni,
+        nNFFin=payload.nNFFin,
+        xJust=payload.xJust,
+    )
+
+    try:
+        job_id = enfileirar_inutilizacao(
+            outbox,
+            req=req,
+            uf_sigla=payload.uf,
+            certificado=PFX_PATH,
+            senha=PFX_PASSWORD,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao enfileirar inutilizacao: {e}")
+
+    return JobEnfileiradoResponse(job_id=job_id, status="pendente")
+
+
+@app.get(
+    "/nfe/jobs/{job_id}",
+    response_model=JobStatusResponse,
+    summary="Consultar situação de um job da fila",
+    tags=["NFe - SEFAZ"],
+)
+def consultar_job(job_id: str, aguardar: float = 0.0):
+    """
+    Retorna a situação do job. Com ?aguardar=N (segundos, máx. 60) a
+    chamada fica em espera até o job terminar ou o tempo acabar.
+    """
+    if aguardar > 0:
+        job = outbox.aguardar(job_id, timeout=min(aguardar, 60.0))
+    else:
+        job = outbox.consultar(job_id)
+
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job nao encontrado")
+
+    return JobStatusResponse(
+        job_id=job.id,
+        tipo=job.tipo,
+        uf=job.uf,
+        status=job.status,
+        tentativas=job.tentativas,
+        erro=job.erro,
+        resultado=job.resultado,
+        criado_em=job.criado_em,
+        atualizado_em=job.atualizado_em,
+        proxima_tentativa=job.proxima_tentativa,
+    )
+
+
+@app.get(
+    "/nfe/recibos/{n_rec}",
+    response_model=ReciboStatusResponse,
+    summary="Consultar resultado de um lote assíncrono pelo recibo (nRec)",
+    tags=["NFe - SEFAZ"],
+)
+def consultar_recibo(n_rec: str):
+    """
+    Situação do recibo devolvido por POST /nfe/enviar (ou por um job da
+    fila) com envio_sinc=false. O recibo é consultado em segundo plano;
+    o resultado fica disponível por um tempo depois de concluído.
+    """
+    if n_rec in agendador_recibos.pendentes():
+        return ReciboStatusResponse(nRec=n_rec, status="pendente")
+    res = agendador_recibos.resultado(n_rec)
+    if res is None:
+        raise HTTPException(status_code=404, detail="Recibo nao encontrado")
+
+    return ReciboStatusResponse(
+        nRec=res.n_rec,
+        status="concluido",
+        cStat=res.cStat,
+        xMotivo=res.xMotivo,
+        erro=res.erro,
+        xml_retorno=res.xml_retorno or None,
+        autorizacoes={
+            chave: ReciboAutorizacao(
+                status=aut.status,
+                motivo=aut.motivo,
+                xml_nfe_proc=aut.xml_nfe_proc,
+            )
+            for chave, aut in res.autorizacoes.items()
+        },
     )
 
 
+@app.get(
+    "/nfe/distribuicao",
+    summary="Última sincronização da Distribuição DF-e por CNPJ",
+    tags=["NFe - SEFAZ"],
+)
+def status_distribuicao() -> List[Dict[str, Any]]:
+    """
+    Resultado da última rodada de cada CNPJ de SEFAZ_DFE_CNPJS: consultas
+    feitas, cursor (ultNSU/maxNSU), cStat, bloqueio de 1 hora e ids dos
+    documentos gravados no repositório (GET /documentos/{doc_id}).
+    """
+    if agendador_distribuicao is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Distribuicao DF-e desligada (defina SEFAZ_DFE_CNPJS)",
+        )
+    return [asdict(r) for r in agendador_distribuicao.ultimos_resultados().values()]
+
+
+@app.get(
+    "/sefaz/limites",
+    summary="Métricas do limitador de requisições à SEFAZ",
+    tags=["NFe - SEFAZ"],
+)
+def metricas_limites() -> List[Dict[str, Any]]:
+    """
+    Um item por (endpoint, CNPJ, serviço): taxa atual e configurada,
+    pausa por 656 em curso e tempos de espera na fila (total, médio, máximo).
+    """
+    return limitador.metricas()
+
+
+@app.get(
+    "/metrics",
+    summary="Métricas no formato Prometheus",
+    tags=["NFe - Utilitários"],
+    response_class=Response,
+)
+def metricas_prometheus() -> Response:
+    """
+    Latência por etapa das chamadas à SEFAZ (assinatura, envelope,
+    fila_limite, conexao, http, parse, proc, total) por serviço, UF,
+    ambiente e modelo; cStat devolvidos; acertos dos caches; conexões
+    dos pools mTLS; requisições em andamento e latência das rotas da API.
+    """
+    return Response(
+        registro.exportar(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get(
+    "/nfe/cache/documentos",
+    summary="Métricas do cache de XMLs de NF-e já lidos",
+    tags=["NFe - Utilitários"],
+)
+def metricas_cache_documentos() -> Dict[str, Any]:
+    """
+    Ocupação (itens, bytes estimados, limite) e acertos/faltas/descartes
+    do cache de documentos compartilhado por xmlinfo, analise, xmltodoc,
+    DANFE e e-mail.
+    """
+    return documentos_cache.metricas()
+
+
+@app.get(
+    "/documentos/{doc_id}",
+    summary="Baixar documento do repositório local (ids de retorno=referencia)",
+    tags=["NFe - Utilitários"],
+)
+def baixar_documento(doc_id: str):
+    doc = repositorio.obter(doc_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"Documento não encontrado: {doc_id}")
+    media_type = "application/pdf" if doc.caminho.endswith(".pdf") else "application/xml"
+    return FileResponse(doc.caminho, media_type=media_type)
+
+
 @app.post(
     "/nfe/status",
     response_model=NFeStatusResponse,
@@ -925,6 +1599,7 @@ def consultar_nfe_por_chave(payload: NFeConsultaChaveRequest):
             pfx_path=payload.certificado,
             pfx_password=payload.senha,
             ambiente=payload.ambiente,
+            cache=consulta_cache,
         )
     except Exception as e:
         raise HTTPException(
@@ -937,9 +1612,51 @@ def consultar_nfe_por_chave(payload: NFeConsultaChaveRequest):
         motivo=res.xMotivo,
         xml_envio=res.xml_envio,
         xml_retorno=res.xml_retorno,
+        cache=res.cache,
     )
 
 
+@app.post(
+    "/nfe/consulta/lote",
+    summary="Consultar várias NFe por CHAVE (NDJSON, resultados à medida que terminam)",
+    tags=["NFe - SEFAZ"],
+)
+def consultar_nfe_por_chave_lote(payload: NFeConsultaLoteRequest):
+    """
+    Consulta a situação de uma lista de chaves, com concorrência limitada
+    por UF e conexões reaproveitadas.
+
+    A resposta é NDJSON (um JSON por linha), enviada à medida que cada
+    consulta termina: {"chave", "uf", "modelo", "status", "motivo", "cache"[, "xml_retorno"]}.
+    """
+    def _linhas():
+        for res in sefaz_nfe_consulta_lote(
+            payload.chaves,
+            pfx_path=payload.certificado,
+            pfx_password=payload.senha,
+            ambiente=payload.ambiente,
+            cache=consulta_cache,
+            max_por_uf=payload.max_por_uf,
+        ):
+            try:
+                uf, modelo = uf_modelo_da_chave(res.chave)
+            except ValueError:
+                uf, modelo = None, None
+            linha: Dict[str, Any] = {
+                "chave": res.chave,
+                "uf": uf,
+                "modelo": modelo,
+                "status": res.cStat,
+                "motivo": res.xMotivo,
+                "cache": res.cache,
+            }
+            if payload.incluir_xml:
+                linha["xml_retorno"] = res.xml_retorno
+            yield json.dumps(linha, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_linhas(), media_type="application/x-ndjson")
+
+
 @app.post(
     "/nfe/gtin",
     response_model=NFeGTINResponse,
@@ -952,6 +1669,7 @@ def consultar_gtin(payload: NFeGTINRequest):
             gtin=payload.gtin,
             pfx_path=payload.certificado,
             pfx_password=payload.senha,
+            cache=gtin_cache,
         )
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao consultar GTIN: {e}")
@@ -961,6 +1679,119 @@ def consultar_gtin(payload: NFeGTINRequest):
         motivo=resp.motivo,
         xml_envio=resp.xml_envio,
         xml_retorno=resp.xml_retorno,
+        cache=resp.cache,
+    )
+
+
+@app.post(
+    "/nfe/gtin/lote",
+    summary="Consultar vários GTINs (NDJSON, resultados à medida que terminam)",
+    tags=["NFe - SEFAZ"],
+)
+def consultar_gtin_lote(payload: NFeGTINLoteRequest):
+    """
+    Consulta uma lista de GTINs com concorrência e taxa limitadas.
+
+    A resposta é NDJSON (um JSON por linha), enviada à medida que cada
+    consulta termina: {"gtin", "status", "motivo", "cache"[, "xml_retorno"]}.
+    """
+    def _linhas():
+        for res in sefaz_consulta_gtin_lote(
+            payload.gtins,
+            pfx_path=payload.certificado,
+            pfx_password=payload.senha,
+            cache=gtin_cache,
+            max_concorrencia=payload.max_concorrencia,
+        ):
+            linha: Dict[str, Any] = {
+                "gtin": res.gtin,
+                "status": res.status,
+                "motivo": res.motivo,
+                "cache": res.cache,
+            }
+            if payload.incluir_xml:
+                linha["xml_retorno"] = res.xml_retorno
+            yield json.dumps(linha, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_linhas(), media_type="application/x-ndjson")
+
+
+@app.post(
+    "/nfe/cadastro",
+    response_model=NFeCadastroResponse,
+    summary="Consultar cadastro de contribuinte (CadConsultaCadastro4)",
+    tags=["NFe - SEFAZ"],
+)
+def consultar_cadastro(payload: NFeCadastroRequest):
+    """
+    Consulta IE/situação cadastral por CNPJ, CPF ou IE.
+    Respostas ficam em cache local (ver campo `cache`).
+    """
+    try:
+        res = sefaz_consulta_cadastro(
+            uf=payload.uf,
+            tipo=payload.tipo,
+            documento=payload.documento,
+            pfx_path=payload.certificado,
+            pfx_password=payload.senha,
+            ambiente=payload.ambiente,
+            cache=cadastro_cache,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar cadastro: {e}")
+
+    return NFeCadastroResponse(
+        status=res.cStat,
+        motivo=res.xMotivo,
+        contribuintes=res.contribuintes,
+        cache=res.cache,
+        xml_envio=res.xml_envio,
+        xml_retorno=res.xml_retorno,
+    )
+
+
+@app.post(
+    "/nfe/cadastro/lote",
+    response_model=NFeCadastroLoteResponse,
+    summary="Consultar cadastro de vários contribuintes",
+    tags=["NFe - SEFAZ"],
+)
+def consultar_cadastro_lote(payload: NFeCadastroLoteRequest):
+    """
+    Consulta em lote: usa o cache, elimina repetidos e limita as
+    consultas simultâneas por UF.
+    """
+    try:
+        resultados = sefaz_consulta_cadastro_lote(
+            consultas=[
+                CadastroConsulta(uf=c.uf, tipo=c.tipo, documento=c.documento)
+                for c in payload.consultas
+            ],
+            pfx_path=payload.certificado,
+            pfx_password=payload.senha,
+            ambiente=payload.ambiente,
+            cache=cadastro_cache,
+            max_por_uf=payload.max_por_uf,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro ao consultar cadastro em lote: {e}")
+
+    return NFeCadastroLoteResponse(
+        resultados=[
+            NFeCadastroResponse(
+                status=r.cStat,
+                motivo=r.xMotivo,
+                contribuintes=r.contribuintes,
+                cache=r.cache,
+                xml_envio=r.xml_envio,
+                xml_retorno=r.xml_retorno,
+            )
+            for r in resultados
+        ]
     )
 
 
@@ -971,23 +1802,20 @@ def consultar_gtin(payload: NFeGTINRequest):
 @app.post(
     "/nfe/xmltodoc",
     response_model=XmlToDocResponse,
+    response_class=JSONRapidoResponse,
     summary="Converter XML de NFe em DocSped (JSON cru)",
     tags=["NFe - Utilitários"],
+    openapi_extra=OPENAPI_CORPO_XML,
 )
 def nfe_xml_to_doc(
-    xml_body: str = Body(
-        ...,
-        media_type="application/xml",
-        description="XML bruto da NFe (pode ser <nfeProc> ou apenas <NFe>/<infNFe>).",
-    )
+    xml_body: bytes = Depends(ler_corpo_xml),
 ):
     """
     Converte o XML bruto em DocSped (estrutura genérica), retornando o dict completo.
     """
     try:
-        doc = xml_to_doc(xml_body)
-        data = doc_sped_to_dict(doc)
-        return XmlToDocResponse(data=data)
+        doc = xml_to_doc(ler_nfe_cache(xml_body))
+        return JSONRapidoResponse({"data": doc_sped_to_dict(doc)})
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -997,15 +1825,13 @@ def nfe_xml_to_doc(
 @app.post(
     "/nfe/xmlinfo",
     response_model=XmlInfoResponse,
+    response_class=JSONRapidoResponse,
     summary="Extrair informações resumidas da NFe (ide, emit, dest, totais, itens)",
     tags=["NFe - Utilitários"],
+    openapi_extra=OPENAPI_CORPO_XML,
 )
 def nfe_xml_info(
-    xml_body: str = Body(
-        ...,
-        media_type="application/xml",
-        description="XML bruto da NFe (pode ser <nfeProc> ou apenas <NFe>/<infNFe>).",
-    )
+    xml_body: bytes = Depends(ler_corpo_xml),
 ):
     """
     Lê o XML bruto da NFe e devolve um resumo com:
@@ -1016,15 +1842,8 @@ def nfe_xml_info(
       - itens (com ICMS / PIS / COFINS básicos)
     """
     try:
-        root = _parse_xml_root(xml_body)
-        info = _extract_xml_info_from_root(root)
-        return XmlInfoResponse(
-            ide=info.ide,
-            emit=info.emit,
-            dest=info.dest,
-            totais=info.totais,
-            itens=info.itens,
-        )
+        info = _extract_xml_info(_parse_xml_doc(xml_body))
+        return JSONRapidoResponse(_xml_info_dict(info))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -1034,15 +1853,13 @@ def nfe_xml_info(
 @app.post(
     "/nfe/analise",
     response_model=NFeAnaliseResponse,
+    response_class=JSONRapidoResponse,
     summary="Analisar tributação da NFe (ICMS, PIS/COFINS) a partir do XML bruto",
     tags=["NFe - Utilitários"],
+    openapi_extra=OPENAPI_CORPO_XML,
 )
 def nfe_analise(
-    xml_body: str = Body(
-        ...,
-        media_type="application/xml",
-        description="XML bruto da NFe (pode ser <nfeProc> ou apenas <NFe>/<infNFe>).",
-    )
+    xml_body: bytes = Depends(ler_corpo_xml),
 ):
     """
     Faz uma análise básica da NFe:
@@ -1051,8 +1868,7 @@ def nfe_analise(
       - Retorna também o resumo de /nfe/xmlinfo.
     """
     try:
-        root = _parse_xml_root(xml_body)
-        info = _extract_xml_info_from_root(root)
+        info = _extract_xml_info(_parse_xml_doc(xml_body))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -1195,18 +2011,14 @@ def nfe_analise(
 
     ok = True
 
-    return NFeAnaliseResponse(
-        ok=ok,
-        mensagens=mensagens,
-        icms=analise_icms,
-        pis_cofins=analise_pis_cof,
-        resumo=XmlInfoResponse(
-            ide=info.ide,
-            emit=info.emit,
-            dest=info.dest,
-            totais=info.totais,
-            itens=info.itens,
-        ),
+    return JSONRapidoResponse(
+        {
+            "ok": ok,
+            "mensagens": mensagens,
+            "icms": analise_icms.model_dump(),
+            "pis_cofins": analise_pis_cof.model_dump(),
+            "resumo": _xml_info_dict(info),
+        }
     )
 
 
@@ -1215,9 +2027,10 @@ def nfe_analise(
     response_class=HTMLResponse,
     summary="Gerar DANFE (NF-e ou NFC-e) em HTML a partir do XML bruto",
     tags=["NFe - DANFE"],
+    openapi_extra=OPENAPI_CORPO_XML,
 )
 def gerar_danfe_html_route(
-    xml: str = Body(..., media_type="application/xml"),
+    xml: bytes = Depends(ler_corpo_xml),
 ):
     """
     Recebe o XML bruto da NF-e ou NFC-e e devolve o DANFE em HTML.
@@ -1228,7 +2041,7 @@ def gerar_danfe_html_route(
     - Envie o corpo da requisição como XML puro (Content-Type: application/xml).
     """
     try:
-        html = gerar_danfe_html_automatico(xml)
+        html = gerar_danfe_html_automatico(ler_nfe_cache(xml))
         return HTMLResponse(content=html)
     except ValueError as e:
         # erro típico de XML inválido
@@ -1245,9 +2058,10 @@ def gerar_danfe_html_route(
     response_class=StreamingResponse,
     summary="Gerar DANFE (NF-e ou NFC-e) em PDF a partir do XML bruto",
     tags=["NFe - DANFE"],
+    openapi_extra=OPENAPI_CORPO_XML,
 )
 def gerar_danfe_pdf_route(
-    xml: str = Body(..., media_type="application/xml"),
+    xml: bytes = Depends(ler_corpo_xml),
 ):
     """
     Recebe o XML bruto da NF-e ou NFC-e e devolve o DANFE em PDF.
@@ -1257,7 +2071,7 @@ def gerar_danfe_pdf_route(
     - O XML pode ser <nfeProc> completo ou somente <NFe>/<infNFe>.
     """
     try:
-        pdf_bytes = gerar_danfe_pdf_automatico(xml)
+        pdf_bytes = gerar_danfe_pdf_automatico(ler_nfe_cache(xml))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -1267,7 +2081,7 @@ def gerar_danfe_pdf_route(
         )
 
     return StreamingResponse(
-        io.BytesIO(pdf_bytes),
+        em_blocos(pdf_bytes),
         media_type="application/pdf",
         headers={"Content-Disposition": 'attachment; filename="danfe.pdf"'},
     )
@@ -0,0 +1,60 @@
+# sefaz_api/metricas_http.py
+from __future__ import annotations
+
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from sefaz_service.core.metricas import registro
+
+requisicoes_api = registro.histograma(
+    "sefaz_api_requisicao_segundos",
+    "Duração das requisições HTTP da API",
+    ("metodo", "rota", "status"),
+)
+requisicoes_api_em_andamento = registro.gauge(
+    "sefaz_api_requisicoes_em_andamento",
+    "Requisições HTTP da API em andamento",
+)
+
+# Rótulo das requisições que não casaram com nenhuma rota (404): usar o
+# path cru criaria uma série por URL inventada por scanners.
+ROTA_DESCONHECIDA = "<sem rota>"
+
+
+class MetricasMiddleware:
+    """
+    Mede cada requisição HTTP: histograma por método, rota (o template,
+    ex.: /documentos/{doc_id}) e status, e gauge das que estão em curso.
+    O tempo vai até o último bloco do corpo, então inclui streaming.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = "500"
+
+        async def enviar(mensagem: Message) -> None:
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = str(mensagem["status"])
+            await send(mensagem)
+
+        inicio = time.perf_counter()
+        requisicoes_api_em_andamento.inc()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            requisicoes_api_em_andamento.dec()
+            rota = getattr(scope.get("route"), "path", ROTA_DESCONHECIDA)
+            requisicoes_api.observar(
+                time.perf_counter() - inicio,
+                metodo=scope["method"],
+                rota=rota,
+                status=status,
+            )
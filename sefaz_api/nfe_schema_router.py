@@ -1,14 +1,17 @@
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 
+from sefaz_api.corpo_xml import OPENAPI_CORPO_XML, ler_corpo_xml
+from sefaz_service.routers.perfil import RotaPerfilavel
 from sefaz_service.validation import validate_xml, XMLValidationError
 
 
 router = APIRouter(
     prefix="/nfe",
     tags=["NFe - Validação"],
+    route_class=RotaPerfilavel,
 )
 
 
@@ -31,11 +34,31 @@ async def validar_schema(payload: XMLValidationRequest):
             detail="Campo 'xml' vazio."
         )
 
+    return _validar(payload.xml.encode("utf-8"), payload.tipo)
+
+
+@router.post(
+    "/validar-schema/xml",
+    response_model=XMLValidationResponse,
+    openapi_extra=OPENAPI_CORPO_XML,
+)
+async def validar_schema_xml(
+    tipo: str = "nfe",
+    xml: bytes = Depends(ler_corpo_xml),
+):
+    """
+    Mesma validação de /validar-schema, recebendo o XML puro no corpo
+    (Content-Type: application/xml) e o tipo na query (?tipo=nfe).
+    """
+    return _validar(xml, tipo)
+
+
+def _validar(xml: bytes, tipo: str) -> XMLValidationResponse:
     try:
-        valido, erros = validate_xml(payload.xml.encode("utf-8"), payload.tipo)
+        valido, erros = validate_xml(xml, tipo)
     except XMLValidationError as e:
         raise HTTPException(400, str(e))
     except FileNotFoundError as e:
         raise HTTPException(500, f"Erro interno: {e}")
 
-    return XMLValidationResponse(valido=valido, erros=erros, tipo=payload.tipo)
+    return XMLValidationResponse(valido=valido, erros=erros, tipo=tipo)
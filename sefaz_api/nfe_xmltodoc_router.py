@@ -1,14 +1,19 @@
 # sefaz_api/nfe_xmltodoc_router.py
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 
+from sefaz_api.corpo_xml import OPENAPI_CORPO_XML, ler_corpo_xml
+from sefaz_api.json_rapido import JSONRapidoResponse
+from sefaz_service.core.documento_nfe import ler_nfe_cache
+from sefaz_service.routers.perfil import RotaPerfilavel
 from sefaz_service.sped import xml_to_doc, doc_sped_to_dict
 
 router = APIRouter(
     prefix="/nfe",
     tags=["NFe XMLToDoc"],
+    route_class=RotaPerfilavel,
 )
 
 
@@ -22,6 +27,7 @@ class XmlToDocRequest(BaseModel):
 @router.post(
     "/xmltodoc",
     summary="Converter XML (enviado como string JSON) para objeto DocSped",
+    response_class=JSONRapidoResponse,
 )
 def nfe_xmltodoc(payload: XmlToDocRequest):
     """
@@ -34,8 +40,8 @@ def nfe_xmltodoc(payload: XmlToDocRequest):
     (necessário escapar aspas internas com \\")
     """
     try:
-        doc = xml_to_doc(payload.xml)
-        return doc_sped_to_dict(doc)
+        doc = xml_to_doc(ler_nfe_cache(payload.xml))
+        return JSONRapidoResponse(doc_sped_to_dict(doc))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -46,16 +52,11 @@ def nfe_xmltodoc(payload: XmlToDocRequest):
 @router.post(
     "/xmltodoc_raw",
     summary="Converter XML bruto para DocSped (enviar XML puro)",
+    response_class=JSONRapidoResponse,
+    openapi_extra=OPENAPI_CORPO_XML,
 )
 async def nfe_xmltodoc_raw(
-    xml: str = Body(
-        ...,
-        media_type="application/xml",
-        description=(
-            "XML completo da NFe/CTe/MDF-e **puro**, sem JSON. "
-            "Exemplo: <?xml version=\"1.0\" encoding=\"UTF-8\"?><nfeProc>...</nfeProc>"
-        ),
-    ),
+    xml: bytes = Depends(ler_corpo_xml),
 ):
     """
     Versão mais prática: recebe **XML puro** no corpo da requisição.
@@ -67,17 +68,8 @@ async def nfe_xmltodoc_raw(
              --data-binary @nota.xml
     """
     try:
-        if not xml or not xml.strip():
-            raise HTTPException(
-                status_code=400,
-                detail="XML vazio ou não informado",
-            )
-
-        doc = xml_to_doc(xml)
-        return doc_sped_to_dict(doc)
-    except HTTPException:
-        # Repassa erros de validação
-        raise
+        doc = xml_to_doc(ler_nfe_cache(xml))
+        return JSONRapidoResponse(doc_sped_to_dict(doc))
     except Exception as e:
         raise HTTPException(
             status_code=500,
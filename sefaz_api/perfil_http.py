@@ -0,0 +1,90 @@
+# sefaz_api/perfil_http.py
+from __future__ import annotations
+
+import random
+import time
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from sefaz_service.core.rastreamento import id_requisicao
+from sefaz_service.routers.perfil import (
+    CABECALHO_PERFIL,
+    PERFIL_MIN_MS,
+    PERFIL_TAXA,
+    InfoPerfil,
+    perfil_habilitado,
+    perfilar_requisicao,
+    salvar_perfil,
+    token_valido,
+)
+
+
+class PerfilMiddleware:
+    """
+    Decide se a requisição será perfilada (X-Perfil com o token de
+    administração ou sorteio por SEFAZ_PERFIL_TAXA) e grava o perfil
+    coletado pela rota. A resposta traz o id em X-Perfil-Id; com outro
+    perfil em andamento, X-Perfil-Id: ocupado.
+
+    Perfis sorteados de rotas mais rápidas que SEFAZ_PERFIL_MIN_MS são
+    descartados; os pedidos pelo cabeçalho são sempre gravados. O perfil é
+    gravado depois do último bloco do corpo, então inclui streaming.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self.habilitado = perfil_habilitado()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not self.habilitado or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        explicito = token_valido(Headers(scope=scope).get(CABECALHO_PERFIL))
+        if not explicito and not (PERFIL_TAXA > 0 and random.random() < PERFIL_TAXA):
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        inicio = time.perf_counter()
+
+        def manter() -> bool:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            return explicito or duracao_ms >= PERFIL_MIN_MS
+
+        with perfilar_requisicao() as sessao:
+
+            async def enviar(mensagem: Message) -> None:
+                nonlocal status
+                if mensagem["type"] == "http.response.start":
+                    status = mensagem["status"]
+                    # a rota já terminou quando a resposta começa (o corpo
+                    # em streaming ainda não: o tempo só cresce até o fim)
+                    if sessao.medindo and manter():
+                        MutableHeaders(raw=mensagem["headers"])["X-Perfil-Id"] = sessao.id
+                    elif sessao.ocupado:
+                        MutableHeaders(raw=mensagem["headers"])["X-Perfil-Id"] = "ocupado"
+                await send(mensagem)
+
+            try:
+                await self.app(scope, receive, enviar)
+            finally:
+                # corpo em streaming interrompido (cliente desconectou) ou
+                # rota que levantou exceção: o perfil fecha aqui
+                sessao.encerrar()
+                duracao_ms = (time.perf_counter() - inicio) * 1000
+                if sessao.stats is not None and manter():
+                    salvar_perfil(
+                        sessao,
+                        InfoPerfil(
+                            id=sessao.id,
+                            metodo=scope["method"],
+                            caminho=scope["path"],
+                            rota=getattr(scope.get("route"), "path", None),
+                            status=status,
+                            duracao_ms=round(duracao_ms, 3),
+                            criado_em=time.time(),
+                            id_requisicao=id_requisicao(),
+                        ),
+                    )
@@ -0,0 +1,61 @@
+# sefaz_api/rastreamento_http.py
+from __future__ import annotations
+
+import re
+import uuid
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from sefaz_service.core.rastreamento import com_id_requisicao, span_requisicao
+
+CABECALHO_ID = "X-Request-ID"
+
+# Ids aceitos do cliente; qualquer outra coisa é trocada por um uuid novo
+_RE_ID_REQUISICAO = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+class RastreamentoMiddleware:
+    """
+    Id de requisição e span raiz de cada chamada HTTP.
+
+    O id vem do cabeçalho X-Request-ID (ou é gerado), volta na resposta
+    e fica no contexto: todos os spans da emissão (assinatura, montagem,
+    transporte, parse, DANFE) o levam em `sefaz.request_id`. Com o
+    rastreamento ligado, o span raiz continua o trace do cliente quando
+    vier `traceparent`.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        id_requisicao = headers.get(CABECALHO_ID, "")
+        if not _RE_ID_REQUISICAO.match(id_requisicao):
+            id_requisicao = uuid.uuid4().hex
+
+        metodo = scope["method"]
+
+        with com_id_requisicao(id_requisicao), span_requisicao(
+            metodo, headers, **{"http.request.method": metodo, "url.path": scope["path"]}
+        ) as raiz:
+
+            async def enviar(mensagem: Message) -> None:
+                if mensagem["type"] == "http.response.start":
+                    MutableHeaders(raw=mensagem["headers"])[CABECALHO_ID] = id_requisicao
+                    if raiz is not None and raiz.is_recording():
+                        raiz.set_attribute("http.response.status_code", mensagem["status"])
+                await send(mensagem)
+
+            try:
+                await self.app(scope, receive, enviar)
+            finally:
+                rota = getattr(scope.get("route"), "path", None)
+                if raiz is not None and rota and raiz.is_recording():
+                    raiz.update_name(f"{metodo} {rota}")
+                    raiz.set_attribute("http.route", rota)
@@ -3,11 +3,15 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from sefaz_api.json_rapido import JSONRapidoResponse
+from sefaz_service.core.documento_nfe import ler_nfe_cache
+from sefaz_service.routers.perfil import RotaPerfilavel
 from sefaz_service.sped import xml_to_doc, doc_sped_to_dict
 
 router = APIRouter(
     prefix="/sped",
     tags=["SPED"],
+    route_class=RotaPerfilavel,
 )
 
 
@@ -19,14 +23,18 @@ class XmlToDocResponse(BaseModel):
     data: dict  # DocSped convertido para dict
 
 
-@router.post("/xmltodoc", response_model=XmlToDocResponse)
+@router.post(
+    "/xmltodoc",
+    response_model=XmlToDocResponse,
+    response_class=JSONRapidoResponse,
+)
 def convert_xml_to_doc(payload: XmlToDocRequest):
     """
     Recebe XML (NFe, por enquanto) e devolve a estrutura DocSped em JSON.
     """
     try:
-        doc = xml_to_doc(payload.xml)
-        return XmlToDocResponse(data=doc_sped_to_dict(doc))
+        doc = xml_to_doc(ler_nfe_cache(payload.xml))
+        return JSONRapidoResponse({"data": doc_sped_to_dict(doc)})
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
     except Exception as exc:
@@ -16,6 +16,9 @@ from cryptography.hazmat.primitives.serialization import (
 from lxml import etree
 import xmlsec
 
+from .metricas import etapa
+from .parser_xml import ler_xml
+
 # Namespace da NFe (mantido por compatibilidade, se precisar)
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
 
@@ -73,14 +76,23 @@ def _assinar_xml_generico(
     - Localiza a tag informada (ex.: "infNFe" ou "infMDFe") via local-name().
     - Usa xmlsec com RSA-SHA1 + C14N (como SEFAZ espera).
     """
+    return _assinar_arvore(xml, tag_inf, pfx_path, pfx_password)[0]
+
+
+def _assinar_arvore(
+    xml: str,
+    tag_inf: str,
+    pfx_path: str,
+    pfx_password: str,
+) -> Tuple[str, etree._Element]:
+    """Como _assinar_xml_generico, devolvendo também o root já assinado."""
 
     # 0) Remover caracteres de edição básicos no XML antes de assinar
     xml = xml.replace("\r", "").replace("\t", "").replace("\n", "")
     xml = xml.lstrip("\ufeff")
 
     # 1) Parse do XML
-    parser = etree.XMLParser(remove_blank_text=True)
-    root = etree.fromstring(xml.encode("utf-8"), parser=parser)
+    root = ler_xml(xml, "compacto")
 
     # Se vier <nfeProc>, pegar apenas <NFe>
     if root.tag.endswith("nfeProc") and tag_inf == "infNFe":
@@ -184,7 +196,7 @@ def _assinar_xml_generico(
     )
     xml_str = xml_bytes.decode("utf-8")
 
-    return xml_str
+    return xml_str, root
 
 
 # --------------------------------------------------------
@@ -194,19 +206,31 @@ def assinar_nfe_xml(xml: str, pfx_path: str, pfx_password: str) -> str:
     """
     Assina uma NFe (modelo 55 ou 65).
     """
-    return _assinar_xml_generico(xml, "infNFe", pfx_path, pfx_password)
+    with etapa("assinatura", "assinar_nfe_xml"):
+        return _assinar_xml_generico(xml, "infNFe", pfx_path, pfx_password)
+
+
+def assinar_nfe(xml: str, pfx_path: str, pfx_password: str) -> Tuple[str, etree._Element]:
+    """
+    Como assinar_nfe_xml, devolvendo também o <NFe> assinado já em
+    árvore, para quem ainda vai montar o nfeProc sem refazer o parse.
+    """
+    with etapa("assinatura", "assinar_nfe_xml"):
+        return _assinar_arvore(xml, "infNFe", pfx_path, pfx_password)
 
 
 def assinar_mdfe_xml(xml: str, pfx_path: str, pfx_password: str) -> str:
     """
     Assina um MDFe (modelo 58).
     """
-    return _assinar_xml_generico(xml, "infMDFe", pfx_path, pfx_password)
+    with etapa("assinatura", "assinar_mdfe_xml"):
+        return _assinar_xml_generico(xml, "infMDFe", pfx_path, pfx_password)
 
 
 def assinar_mdfe_evento_xml(xml: str, pfx_path: str, pfx_password: str) -> str:
     """
     Assina um EVENTO de MDFe (ex.: cancelamento - infEvento).
     """
-    return _assinar_xml_generico(xml, "infEvento", pfx_path, pfx_password)
+    with etapa("assinatura", "assinar_mdfe_evento_xml"):
+        return _assinar_xml_generico(xml, "infEvento", pfx_path, pfx_password)
 
@@ -3,6 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Optional
 
+from .envelope import montar_envelope_corpo
 from .enums import Ambiente, Projeto
 from .soap_client import SoapClient
 
@@ -31,14 +32,7 @@ class SefazBaseService:
     @staticmethod
     def build_soap_envelope(body_xml: str) -> str:
         """Monta Envelope SOAP 1.2 com o XML no Body."""
-        return f"""<?xml version="1.0" encoding="utf-8"?>
-<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                 xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-                 xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Body>
-    {body_xml}
-  </soap12:Body>
-</soap12:Envelope>"""
+        return montar_envelope_corpo(body_xml).decode("utf-8")
 
     def enviar_soap(self, xml_corpo: str, *, url: Optional[str] = None,
                     action: Optional[str] = None, timeout: int = 30) -> str:
@@ -0,0 +1,250 @@
+# sefaz_service/core/cache.py
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple, TypeVar
+
+_RE_NOME_TABELA = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+T = TypeVar("T")
+
+
+class CacheTTL:
+    """
+    Cache persistente chave → valor (JSON) com prazo de validade, em SQLite.
+
+    Cada serviço usa sua própria tabela no mesmo arquivo, por exemplo:
+
+        cache = CacheTTL("sefaz_cache.db", tabela="cadastro")
+        cache.set(("SP", "CNPJ", "123..."), {"cStat": 111}, ttl=86400)
+        cache.get(("SP", "CNPJ", "123..."))
+
+    A chave pode ser str ou tupla (os itens são unidos com "|").
+    ttl=None grava sem expiração. cache.metricas() traz acertos e faltas
+    desde o início do processo.
+    """
+
+    def __init__(self, db_path: str = "sefaz_cache.db", tabela: str = "cache") -> None:
+        if not _RE_NOME_TABELA.match(tabela):
+            raise ValueError(f"Nome de tabela inválido: {tabela!r}")
+        self.db_path = db_path
+        self.tabela = tabela
+        self._lock = threading.Lock()
+        self._lock_metricas = threading.Lock()
+        self._acertos = 0
+        self._faltas = 0
+        with self._conectar() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {tabela} ("
+                " chave TEXT PRIMARY KEY,"
+                " valor TEXT NOT NULL,"
+                " expira_em REAL,"
+                " gravado_em REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _chave(chave: Any) -> str:
+        if isinstance(chave, (tuple, list)):
+            return "|".join(str(c) for c in chave)
+        return str(chave)
+
+    def get_com_idade(self, chave: Any) -> Tuple[Optional[Any], Optional[float]]:
+        """
+        Retorna (valor, segundos desde a gravação), ou (None, None) se não
+        houver entrada válida.
+        """
+        agora = time.time()
+        with self._conectar() as conn:
+            row = conn.execute(
+                f"SELECT valor, expira_em, gravado_em FROM {self.tabela} WHERE chave = ?",
+                (self._chave(chave),),
+            ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= agora):
+            with self._lock_metricas:
+                self._faltas += 1
+            return None, None
+        with self._lock_metricas:
+            self._acertos += 1
+        valor, _, gravado_em = row
+        return json.loads(valor), agora - gravado_em
+
+    def get(self, chave: Any) -> Optional[Any]:
+        valor, _ = self.get_com_idade(chave)
+        return valor
+
+    def set(self, chave: Any, valor: Any, ttl: Optional[float]) -> None:
+        agora = time.time()
+        expira_em = None if ttl is None else agora + ttl
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.tabela} (chave, valor, expira_em, gravado_em)"
+                " VALUES (?, ?, ?, ?)",
+                (self._chave(chave), json.dumps(valor, ensure_ascii=False), expira_em, agora),
+            )
+
+    def remover(self, chave: Any) -> None:
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                f"DELETE FROM {self.tabela} WHERE chave = ?", (self._chave(chave),)
+            )
+
+    def limpar_expirados(self) -> int:
+        """
+        Remove as entradas vencidas. Retorna quantas foram removidas.
+        """
+        with self._lock, self._conectar() as conn:
+            cur = conn.execute(
+                f"DELETE FROM {self.tabela} WHERE expira_em IS NOT NULL AND expira_em <= ?",
+                (time.time(),),
+            )
+            return cur.rowcount
+
+    def metricas(self) -> Dict[str, Any]:
+        with self._lock_metricas:
+            consultas = self._acertos + self._faltas
+            return {
+                "acertos": self._acertos,
+                "faltas": self._faltas,
+                "taxa_acerto": self._acertos / consultas if consultas else 0.0,
+            }
+
+
+class CacheLRU:
+    """
+    Cache em memória, limitado por orçamento de bytes, que descarta as
+    entradas usadas há mais tempo (LRU).
+
+    Cada entrada tem um peso (bytes estimados) informado por quem grava;
+    uma entrada mais pesada que o orçamento inteiro não é guardada.
+
+        docs = CacheLRU(limite_bytes=64 * 1024 * 1024)
+        docs.set(sha, documento, peso=len(xml) * 8)
+        docs.get(sha)
+        docs.metricas()  # acertos, faltas, descartes, ocupação
+    """
+
+    def __init__(self, limite_bytes: int) -> None:
+        if limite_bytes < 0:
+            raise ValueError("limite_bytes não pode ser negativo")
+        self.limite_bytes = limite_bytes
+        self._itens: "OrderedDict[Hashable, Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self._acertos = 0
+        self._faltas = 0
+        self._descartes = 0
+        self._lock = threading.Lock()
+
+    def get(self, chave: Hashable) -> Optional[Any]:
+        return self.get_qualquer(chave)
+
+    def get_qualquer(self, *chaves: Hashable) -> Optional[Any]:
+        """
+        Valor da primeira chave presente. Conta como uma única leitura
+        (um acerto ou uma falta), por mais chaves que sejam tentadas.
+        """
+        with self._lock:
+            for chave in chaves:
+                item = self._itens.get(chave)
+                if item is not None:
+                    self._itens.move_to_end(chave)
+                    self._acertos += 1
+                    return item[0]
+            self._faltas += 1
+            return None
+
+    def set(self, chave: Hashable, valor: Any, peso: int) -> None:
+        with self._lock:
+            antigo = self._itens.pop(chave, None)
+            if antigo is not None:
+                self._bytes -= antigo[1]
+            if peso > self.limite_bytes:
+                return
+            self._itens[chave] = (valor, peso)
+            self._bytes += peso
+            while self._bytes > self.limite_bytes:
+                _, (_, peso_velho) = self._itens.popitem(last=False)
+                self._bytes -= peso_velho
+                self._descartes += 1
+
+    def limpar(self) -> None:
+        with self._lock:
+            self._itens.clear()
+            self._bytes = 0
+
+    def metricas(self) -> Dict[str, Any]:
+        with self._lock:
+            consultas = self._acertos + self._faltas
+            return {
+                "itens": len(self._itens),
+                "bytes": self._bytes,
+                "limite_bytes": self.limite_bytes,
+                "acertos": self._acertos,
+                "faltas": self._faltas,
+                "descartes": self._descartes,
+                "taxa_acerto": self._acertos / consultas if consultas else 0.0,
+            }
+
+
+class _Voo:
+    def __init__(self) -> None:
+        self.pronto = threading.Event()
+        self.resultado: Any = None
+        self.erro: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Junta chamadas simultâneas com a mesma chave: a primeira executa a
+    função e as demais esperam e recebem o mesmo resultado (ou a mesma
+    exceção). Terminada a chamada, a chave é liberada.
+
+        voos = SingleFlight()
+        res = voos.executar(("2", chave), lambda: consultar(chave))
+    """
+
+    def __init__(self) -> None:
+        self._voos: Dict[Hashable, _Voo] = {}
+        self._lock = threading.Lock()
+
+    def executar(self, chave: Hashable, func: Callable[[], T]) -> Tuple[T, bool]:
+        """
+        Retorna (resultado, compartilhado); compartilhado=True quando o
+        resultado veio de uma chamada já em andamento.
+        """
+        with self._lock:
+            voo = self._voos.get(chave)
+            lider = voo is None
+            if lider:
+                voo = self._voos[chave] = _Voo()
+
+        if not lider:
+            voo.pronto.wait()
+            if voo.erro is not None:
+                raise voo.erro
+            return voo.resultado, True
+
+        try:
+            voo.resultado = func()
+            return voo.resultado, False
+        except BaseException as e:
+            voo.erro = e
+            raise
+        finally:
+            with self._lock:
+                self._voos.pop(chave, None)
+            voo.pronto.set()
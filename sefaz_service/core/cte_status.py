@@ -4,8 +4,10 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Optional
 
-from lxml import etree
-from requests_pkcs12 import post  # pacote requests-pkcs12
+from sefaz_service.core.envelope import montar_envelope_soap
+from sefaz_service.core.metricas import instrumentar
+from sefaz_service.core.rate_limit import post_pkcs12
+from sefaz_service.core.resposta import ler_resposta
 
 # Namespace do CT-e (XML de dados)
 CTE_NS = "http://www.portalfiscal.inf.br/cte"
@@ -130,6 +132,7 @@ def _montar_xml_cons_stat_serv_cte(tp_amb: str, uf: str, versao: str) -> str:
 # ---------------------------------------------------------------------------
 # Função principal chamada pela API
 # ---------------------------------------------------------------------------
+@instrumentar("CTeStatusServico", modelo="57")
 def sefaz_cte_status(
     uf: str,
     pfx_path: str,
@@ -158,25 +161,15 @@ def sefaz_cte_status(
     soap_action = f"{wsdl_ns}/cteStatusServicoCT"
 
     # Envelope SOAP 1.2 com cteDadosMsg (padrão CT-e)
-    envelope = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                 xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-                 xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Body>
-    <cteStatusServicoCT xmlns="{wsdl_ns}">
-      <cteDadosMsg xmlns="{wsdl_ns}">
-        {xml_envio}
-      </cteDadosMsg>
-    </cteStatusServicoCT>
-  </soap12:Body>
-</soap12:Envelope>
-"""
+    envelope = montar_envelope_soap(
+        xml_envio, wsdl_ns, prefixo="cte", operacao="cteStatusServicoCT"
+    )
 
     url = _resolver_url_cte_status(uf=uf, ambiente=ambiente, versao=versao)
 
-    resp = post(
+    resp = post_pkcs12(
         url,
-        data=envelope.encode("utf-8"),
+        data=envelope,
         pkcs12_filename=pfx_path,
         pkcs12_password=pfx_password,
         headers={
@@ -190,29 +183,13 @@ def sefaz_cte_status(
         verify=False,  # igual você já usou para NFe/GTIN
     )
 
-    xml_retorno = resp.text
-
     # Extrai cStat/xMotivo de dentro do XML (namespace do CT-e)
-    status_int: Optional[int] = None
-    motivo_str: Optional[str] = None
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-        ns = {"cte": CTE_NS}
-
-        cstat_el = root.find(".//cte:cStat", namespaces=ns)
-        xmot_el = root.find(".//cte:xMotivo", namespaces=ns)
-
-        if cstat_el is not None and cstat_el.text:
-            try:
-                status_int = int(cstat_el.text.strip())
-            except ValueError:
-                status_int = None
-
-        if xmot_el is not None and xmot_el.text:
-            motivo_str = xmot_el.text.strip()
-    except Exception:
-        if resp.status_code != 200 and not motivo_str:
-            motivo_str = f"HTTP {resp.status_code} - {resp.reason}"
+    ret = ler_resposta(resp.content, "retConsStatServCTe")
+    xml_retorno = ret.xml_bruto
+    status_int: Optional[int] = ret.cStat
+    motivo_str: Optional[str] = ret.xMotivo
+    if ret.payload is None and resp.status_code != 200:
+        motivo_str = f"HTTP {resp.status_code} - {resp.reason}"
 
     return CTeStatusResult(
         status=status_int,
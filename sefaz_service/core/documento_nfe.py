@@ -0,0 +1,396 @@
+# sefaz_service/core/documento_nfe.py
+from __future__ import annotations
+
+import hashlib
+import os
+from functools import cached_property
+from typing import Dict, Iterator, List, Optional, Sequence, Union, overload
+
+from lxml import etree
+
+from .cache import CacheLRU, SingleFlight
+from .parser_xml import ler_xml
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+NSMAP = {"nfe": NFE_NS}
+
+_TAG_NFE = f"{{{NFE_NS}}}NFe"
+
+
+# ----------------------------------------------------------------------
+# HELPERS
+# ----------------------------------------------------------------------
+
+
+def _nome_local(tag: str) -> str:
+    return tag.rpartition("}")[2]
+
+
+def _campos(el: Optional[etree._Element]) -> Dict[str, str]:
+    """
+    Texto (com strip) dos filhos folha de `el`, pelo nome local da tag.
+    Uma única passada pelos filhos, no lugar de um find por campo.
+    Em tags repetidas vale a primeira; tags sem texto ficam de fora.
+    """
+    campos: Dict[str, str] = {}
+    if el is None:
+        return campos
+    for filho in el:
+        if not isinstance(filho.tag, str) or len(filho):
+            continue
+        nome = _nome_local(filho.tag)
+        if nome not in campos and filho.text is not None:
+            campos[nome] = filho.text.strip()
+    return campos
+
+
+def _primeiro_grupo(el: Optional[etree._Element]) -> Optional[etree._Element]:
+    """Primeiro filho elemento (ex.: ICMS00 dentro de ICMS, PISAliq dentro de PIS)."""
+    if el is None:
+        return None
+    for filho in el:
+        if isinstance(filho.tag, str):
+            return filho
+    return None
+
+
+# ----------------------------------------------------------------------
+# ITENS
+# ----------------------------------------------------------------------
+
+
+class ItemNFe:
+    """
+    Um <det> da NF-e. Cada grupo (prod, ICMS, PIS, COFINS) é lido no
+    primeiro acesso e guardado.
+    """
+
+    def __init__(self, det: etree._Element) -> None:
+        self.det = det
+
+    @property
+    def nItem(self) -> Optional[int]:
+        n = self.det.get("nItem")
+        return int(n) if n and n.isdigit() else None
+
+    @cached_property
+    def _imposto(self) -> Optional[etree._Element]:
+        return self.det.find("nfe:imposto", NSMAP)
+
+    def _tributo(self, nome: str) -> Dict[str, str]:
+        if self._imposto is None:
+            return {}
+        return _campos(_primeiro_grupo(self._imposto.find(f"nfe:{nome}", NSMAP)))
+
+    @cached_property
+    def prod(self) -> Dict[str, str]:
+        return _campos(self.det.find("nfe:prod", NSMAP))
+
+    @cached_property
+    def icms(self) -> Dict[str, str]:
+        return self._tributo("ICMS")
+
+    @cached_property
+    def pis(self) -> Dict[str, str]:
+        return self._tributo("PIS")
+
+    @cached_property
+    def cofins(self) -> Dict[str, str]:
+        return self._tributo("COFINS")
+
+    @cached_property
+    def inf_ad_prod(self) -> str:
+        return (self.det.findtext("nfe:infAdProd", default="", namespaces=NSMAP) or "").strip()
+
+
+class ItensNFe(Sequence[ItemNFe]):
+    """
+    Sequência indexada dos <det>: os elementos são localizados uma vez e
+    cada ItemNFe só é criado quando acessado.
+    """
+
+    def __init__(self, dets: List[etree._Element]) -> None:
+        self._dets = dets
+        self._itens: List[Optional[ItemNFe]] = [None] * len(dets)
+
+    def __len__(self) -> int:
+        return len(self._dets)
+
+    def _item(self, i: int) -> ItemNFe:
+        item = self._itens[i]
+        if item is None:
+            item = self._itens[i] = ItemNFe(self._dets[i])
+        return item
+
+    @overload
+    def __getitem__(self, i: int) -> ItemNFe: ...
+
+    @overload
+    def __getitem__(self, i: slice) -> List[ItemNFe]: ...
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[ItemNFe, List[ItemNFe]]:
+        if isinstance(i, slice):
+            return [self._item(k) for k in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("item fora do intervalo")
+        return self._item(i)
+
+    def __iter__(self) -> Iterator[ItemNFe]:
+        for i in range(len(self)):
+            yield self._item(i)
+
+
+# ----------------------------------------------------------------------
+# DOCUMENTO
+# ----------------------------------------------------------------------
+
+
+class DocumentoNFe:
+    """
+    Visão somente leitura de uma NF-e/NFC-e (<nfeProc>, <NFe> ou <infNFe>)
+    já parseada.
+
+    O XML é lido uma vez; cada grupo (ide, emit, totais, itens...) é
+    calculado no primeiro acesso e guardado, então DANFE, DocSped,
+    xmlinfo e e-mail podem partir do mesmo objeto.
+
+    Os grupos simples vêm como dict {tag: texto}; grupos ausentes viram
+    dict vazio.
+    """
+
+    def __init__(self, root: etree._Element) -> None:
+        self.root = root
+        if _nome_local(root.tag) == "infNFe":
+            inf_nfe = root
+        else:
+            inf_nfe = root.find(".//nfe:infNFe", NSMAP)
+        if inf_nfe is None:
+            raise ValueError("Não foi encontrado o nó <infNFe> no XML.")
+        self.inf_nfe = inf_nfe
+
+        pai = inf_nfe.getparent()
+        self.nfe: Optional[etree._Element] = pai if pai is not None and pai.tag == _TAG_NFE else None
+
+    # --- raiz / identificação ----------------------------------------
+
+    @property
+    def tag_raiz(self) -> str:
+        return _nome_local(self.root.tag)
+
+    def _grupo(self, caminho: str) -> Optional[etree._Element]:
+        return self.inf_nfe.find(caminho, NSMAP)
+
+    @cached_property
+    def chave(self) -> str:
+        id_attr = self.inf_nfe.get("Id") or self.inf_nfe.get("id") or ""
+        return id_attr[3:] if id_attr.upper().startswith("NFE") else id_attr
+
+    @property
+    def modelo(self) -> str:
+        """mod do ide; sem ide, o modelo da chave (55 por padrão)."""
+        mod = self.ide.get("mod")
+        if mod:
+            return mod
+        if len(self.chave) == 44:
+            return self.chave[20:22]
+        return "55"
+
+    # --- grupos simples ----------------------------------------------
+
+    @cached_property
+    def ide(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:ide"))
+
+    @cached_property
+    def emit(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:emit"))
+
+    @cached_property
+    def ender_emit(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:emit/nfe:enderEmit"))
+
+    @cached_property
+    def dest(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:dest"))
+
+    @cached_property
+    def ender_dest(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:dest/nfe:enderDest"))
+
+    @cached_property
+    def icms_tot(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:total/nfe:ICMSTot"))
+
+    @cached_property
+    def transp(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:transp"))
+
+    @cached_property
+    def transporta(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:transp/nfe:transporta"))
+
+    @cached_property
+    def vol(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:transp/nfe:vol"))
+
+    @cached_property
+    def fat(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:cobr/nfe:fat"))
+
+    @cached_property
+    def inf_adic(self) -> Dict[str, str]:
+        return _campos(self._grupo("nfe:infAdic"))
+
+    @cached_property
+    def inf_prot(self) -> Dict[str, str]:
+        return _campos(self.root.find(".//nfe:infProt", NSMAP))
+
+    @cached_property
+    def inf_supl(self) -> Dict[str, str]:
+        """qrCode / urlChave (infNFeSupl é filho de NFe, não de infNFe)."""
+        if self.nfe is None:
+            return {}
+        return _campos(self.nfe.find("nfe:infNFeSupl", NSMAP))
+
+    # --- listas ------------------------------------------------------
+
+    @cached_property
+    def itens(self) -> ItensNFe:
+        return ItensNFe(self.inf_nfe.findall("nfe:det", NSMAP))
+
+    @cached_property
+    def duplicatas(self) -> List[Dict[str, str]]:
+        return [_campos(dup) for dup in self.inf_nfe.iterfind("nfe:cobr/nfe:dup", NSMAP)]
+
+    @cached_property
+    def pagamentos(self) -> List[Dict[str, str]]:
+        """
+        Um dict por <detPag> (layout 4.00). No layout 3.10, sem detPag,
+        o próprio <pag> é o pagamento.
+        """
+        return [p for grupo in self.grupos_pagamento for p in grupo]
+
+    @cached_property
+    def grupos_pagamento(self) -> List[List[Dict[str, str]]]:
+        """Os pagamentos separados por <pag>, na ordem do XML."""
+        grupos: List[List[Dict[str, str]]] = []
+        for pag in self.inf_nfe.iterfind("nfe:pag", NSMAP):
+            det_pags = pag.findall("nfe:detPag", NSMAP)
+            grupos.append([_campos(d) for d in det_pags] if det_pags else [_campos(pag)])
+        return grupos
+
+    @cached_property
+    def v_troco(self) -> str:
+        return (self.inf_nfe.findtext("nfe:pag/nfe:vTroco", default="", namespaces=NSMAP) or "").strip()
+
+    # --- assinatura --------------------------------------------------
+
+    @cached_property
+    def assinatura(self) -> Optional[etree._Element]:
+        """<Signature> (namespace xmldsig, procurada por curinga)."""
+        return self.root.find(".//{*}Signature")
+
+    @cached_property
+    def digest_value(self) -> str:
+        if self.assinatura is None:
+            return ""
+        return (self.assinatura.findtext(".//{*}DigestValue") or "").strip()
+
+
+# ----------------------------------------------------------------------
+# LEITURA
+# ----------------------------------------------------------------------
+
+
+def ler_nfe(
+    conteudo: Union[bytes, str, DocumentoNFe],
+    *,
+    recover: bool = False,
+) -> DocumentoNFe:
+    """
+    DocumentoNFe a partir do XML (bytes ou str). Se já receber um
+    DocumentoNFe, devolve o mesmo objeto, sem novo parse.
+
+    - recover: tolera XML malformado (parser do lxml com recover=True)
+
+    Erros de parse e XML sem <infNFe> levantam ValueError.
+    """
+    if isinstance(conteudo, DocumentoNFe):
+        return conteudo
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+    if not conteudo or not conteudo.strip():
+        raise ValueError("XML vazio")
+
+    try:
+        root = ler_xml(conteudo, "recover" if recover else "estrito")
+    except Exception as exc:
+        raise ValueError(f"XML inválido: {exc}") from exc
+    if root is None:
+        raise ValueError("XML inválido: documento vazio")
+
+    return DocumentoNFe(root)
+
+
+# ----------------------------------------------------------------------
+# CACHE DE DOCUMENTOS LIDOS
+# ----------------------------------------------------------------------
+
+# Uma árvore lxml ocupa algumas vezes o tamanho do XML; o peso de cada
+# entrada no cache é estimado por esse fator.
+FATOR_MEMORIA = 8
+
+# Orçamento do cache em MB (SEFAZ_DOC_CACHE_MB; 0 desliga o cache).
+documentos_cache = CacheLRU(
+    int(float(os.getenv("SEFAZ_DOC_CACHE_MB", "64")) * 1024 * 1024)
+)
+_leituras = SingleFlight()
+
+
+def ler_nfe_cache(
+    conteudo: Union[bytes, str, DocumentoNFe],
+    *,
+    recover: bool = False,
+    cache: Optional[CacheLRU] = None,
+) -> DocumentoNFe:
+    """
+    Como ler_nfe, mas reaproveita documentos já lidos: a chave é o
+    SHA-256 dos bytes do XML. Leituras simultâneas do mesmo XML fazem um
+    único parse.
+
+    Com recover=True o XML bem formado é lido no modo estrito, então
+    rotas com e sem recover compartilham a mesma entrada; só o XML que
+    precisou de recuperação fica numa entrada própria.
+
+    O documento devolvido é compartilhado entre chamadas: trate-o como
+    somente leitura (não altere a árvore de `root`).
+    """
+    if isinstance(conteudo, DocumentoNFe):
+        return conteudo
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+    if cache is None:
+        cache = documentos_cache
+
+    sha = hashlib.sha256(conteudo).hexdigest()
+    # com recover, a entrada recuperada é alternativa: uma leitura só no cache
+    doc = cache.get_qualquer((sha, False), (sha, True)) if recover else cache.get((sha, False))
+    if doc is not None:
+        return doc
+
+    def _ler() -> DocumentoNFe:
+        peso = len(conteudo) * FATOR_MEMORIA
+        try:
+            novo = ler_nfe(conteudo)
+            cache.set((sha, False), novo, peso=peso)
+        except ValueError:
+            if not recover:
+                raise
+            novo = ler_nfe(conteudo, recover=True)
+            cache.set((sha, True), novo, peso=peso)
+        return novo
+
+    doc, _ = _leituras.executar((sha, recover), _ler)
+    return doc
@@ -0,0 +1,127 @@
+# sefaz_service/core/envelope.py
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import Optional, Tuple, Union
+
+from .rastreamento import rastrear
+
+SOAP12_NS = "http://www.w3.org/2003/05/soap-envelope"
+
+# prefixo das tags CabecMsg/DadosMsg por projeto
+PREFIXOS = ("nfe", "mdfe", "cte")
+
+_DECLARACAO = b"<?xml"
+
+
+# ----------------------------------------------------------------------
+# MOLDES
+# ----------------------------------------------------------------------
+
+
+@lru_cache(maxsize=512)
+def moldes_envelope(
+    wsdl_ns: str,
+    prefixo: str = "nfe",
+    c_uf: Optional[str] = None,
+    versao_dados: Optional[str] = None,
+    operacao: Optional[str] = None,
+) -> Tuple[bytes, bytes]:
+    """
+    Início e fim (bytes) do envelope SOAP 1.2 para um serviço.
+
+    - prefixo: "nfe", "mdfe" ou "cte" (nfeCabecMsg/nfeDadosMsg, ...)
+    - c_uf / versao_dados: com c_uf, monta o <xxxCabecMsg>; sem, o
+      envelope vai só com o Body
+    - operacao: elemento da operação em volta do DadosMsg (ex.:
+      nfeDistDFeInteresse, ccgConsGTIN); nesse caso é ele que leva o
+      xmlns do WSDL
+
+    Os moldes ficam em cache por (serviço, cUF, versão), então cada
+    envelope é só a junção de três pedaços de bytes.
+    """
+    if prefixo not in PREFIXOS:
+        raise ValueError(f"Prefixo de envelope inválido: {prefixo!r} (use {', '.join(PREFIXOS)})")
+
+    inicio = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+        ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+        f' xmlns:soap12="{SOAP12_NS}">'
+    )
+    if c_uf is not None:
+        inicio += (
+            f'<soap12:Header><{prefixo}CabecMsg xmlns="{wsdl_ns}">'
+            f"<cUF>{c_uf}</cUF>"
+        )
+        if versao_dados is not None:
+            inicio += f"<versaoDados>{versao_dados}</versaoDados>"
+        inicio += f"</{prefixo}CabecMsg></soap12:Header>"
+
+    inicio += "<soap12:Body>"
+    if operacao:
+        inicio += f'<{operacao} xmlns="{wsdl_ns}"><{prefixo}DadosMsg>'
+        fim = f"</{prefixo}DadosMsg></{operacao}>"
+    else:
+        inicio += f'<{prefixo}DadosMsg xmlns="{wsdl_ns}">'
+        fim = f"</{prefixo}DadosMsg>"
+    fim += "</soap12:Body></soap12:Envelope>"
+
+    return inicio.encode("utf-8"), fim.encode("utf-8")
+
+
+# ----------------------------------------------------------------------
+# MONTAGEM
+# ----------------------------------------------------------------------
+
+
+def sem_declaracao(conteudo: Union[bytes, str]) -> bytes:
+    """
+    Conteúdo em bytes UTF-8, sem a declaração <?xml ...?> (se houver).
+    """
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+    if conteudo.startswith(b"\xef\xbb\xbf"):
+        conteudo = conteudo[3:]
+    conteudo = conteudo.strip()
+    if conteudo.startswith(_DECLARACAO):
+        fim = conteudo.find(b"?>")
+        if fim != -1:
+            return conteudo[fim + 2:].lstrip()
+    return conteudo
+
+
+@rastrear()
+def montar_envelope_soap(
+    conteudo: Union[bytes, str],
+    wsdl_ns: str,
+    *,
+    prefixo: str = "nfe",
+    c_uf: Optional[str] = None,
+    versao_dados: Optional[str] = None,
+    operacao: Optional[str] = None,
+) -> bytes:
+    """
+    Envelope SOAP 1.2 pronto para o POST (bytes UTF-8).
+
+    O conteúdo (XML já assinado e serializado, ou texto GZip+Base64) é
+    inserido como está, sem reparse, entre os moldes do serviço.
+    """
+    inicio, fim = moldes_envelope(wsdl_ns, prefixo, c_uf, versao_dados, operacao)
+    return b"".join((inicio, sem_declaracao(conteudo), fim))
+
+
+_CORPO_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+    ' xmlns:xsd="http://www.w3.org/2001/XMLSchema"'
+    f' xmlns:soap12="{SOAP12_NS}"><soap12:Body>'
+).encode("utf-8")
+_CORPO_FIM = b"</soap12:Body></soap12:Envelope>"
+
+
+def montar_envelope_corpo(corpo: Union[bytes, str]) -> bytes:
+    """
+    Envelope só com o Body, para quando quem chama já traz o DadosMsg.
+    """
+    return b"".join((_CORPO_INICIO, sem_declaracao(corpo), _CORPO_FIM))
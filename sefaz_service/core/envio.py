@@ -2,14 +2,19 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional, Tuple
-
-import tempfile
+from typing import Optional, Tuple, Union
 
 import requests
 from lxml import etree
 
-from .assinatura import assinar_nfe_xml, _load_pfx
+from .assinatura import assinar_nfe_xml
+from .envelope import montar_envelope_soap
+from .metricas import chamadas_em_andamento, etapa, rotulos_padrao
+from .parser_xml import ler_xml
+from .rastreamento import rastrear
+from .rate_limit import identificar_certificado, limitador, servico_da_requisicao
+from .sessao import sessao_com_pfx
+from .resposta import ler_resposta
 
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
 WSDL_NS = "http://www.portalfiscal.inf.br/nfe/wsdl/NFeAutorizacao4"
@@ -34,6 +39,7 @@ def strip_xml_declaration(xml: str) -> str:
     return xml
 
 
+@rastrear()
 def montar_envi_nfe_xml(
     nfe_assinada: str,
     versao: str = "4.00",
@@ -62,8 +68,7 @@ def _extrair_cuf_da_nfe(xml_nfe: str) -> str:
     Lê o cUF (código numérico da UF) da tag <ide><cUF> da NFe.
     Retorna, por exemplo, '12' para AC.
     """
-    parser = etree.XMLParser(remove_blank_text=True)
-    root = etree.fromstring(xml_nfe.encode("utf-8"), parser=parser)
+    root = ler_xml(xml_nfe, "compacto")
 
     # Se vier nfeProc, pega a <NFe>
     if root.tag.endswith("nfeProc"):
@@ -85,106 +90,82 @@ def _extrair_cuf_da_nfe(xml_nfe: str) -> str:
     return cuf_el.text.strip()
 
 
+@rastrear()
 def montar_soap_envelope(
     envi_nfe_xml: str,
     c_uf: str,
     versao_dados: str = "4.00",
-) -> str:
+) -> bytes:
     """
-    Monta o envelope SOAP 1.2 no padrão usado pelo Harbour:
-
-    <soap12:Envelope xmlns:xsi=... xmlns:xsd=... xmlns:soap12=...>
-      <soap12:Header>
-        <nfeCabecMsg xmlns="...NFeAutorizacao4">
-          <cUF>12</cUF>
-          <versaoDados>4.00</versaoDados>
-        </nfeCabecMsg>
-      </soap12:Header>
-      <soap12:Body>
-        <nfeDadosMsg xmlns="...NFeAutorizacao4">
-          {envi_nfe_xml}
-        </nfeDadosMsg>
-      </soap12:Body>
-    </soap12:Envelope>
+    Monta o envelope SOAP 1.2 do NFeAutorizacao4 (nfeCabecMsg com cUF e
+    versaoDados + nfeDadosMsg no Body), já em bytes UTF-8.
+
+    O <enviNFe> é inserido como está entre os moldes em cache de
+    core.envelope, sem reparse e sem espaços extras.
     """
-    return f"""<?xml version="1.0" encoding="UTF-8"?>
-<soap12:Envelope
-    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-    xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-    xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Header>
-    <nfeCabecMsg xmlns="{WSDL_NS}">
-      <cUF>{c_uf}</cUF>
-      <versaoDados>{versao_dados}</versaoDados>
-    </nfeCabecMsg>
-  </soap12:Header>
-  <soap12:Body>
-    <nfeDadosMsg xmlns="{WSDL_NS}">
-      {envi_nfe_xml}
-    </nfeDadosMsg>
-  </soap12:Body>
-</soap12:Envelope>"""
+    return montar_envelope_soap(envi_nfe_xml, WSDL_NS, c_uf=c_uf, versao_dados=versao_dados)
 
 
 def enviar_soap_com_pfx(
     endpoint: EndpointInfo,
-    soap_xml: str,
+    soap_xml: Union[bytes, str],
     pfx_path: str,
     pfx_password: str,
     timeout: int = 30,
 ) -> requests.Response:
     """
     Envia o SOAP 1.2 usando TLS com certificado de cliente extraído do PFX.
-    """
-    pem_key, pem_cert = _load_pfx(pfx_path, pfx_password)
-
-    # requests espera caminhos de arquivos PEM (cert, key). Criamos temporários.
-    with tempfile.NamedTemporaryFile("wb", delete=False) as f_key, tempfile.NamedTemporaryFile(
-        "wb", delete=False
-    ) as f_cert:
-        f_key.write(pem_key)
-        f_cert.write(pem_cert)
-        f_key.flush()
-        f_cert.flush()
-
-        # Em SOAP 1.2 o "action" vai no Content-Type.
-        if endpoint.soap_action:
-            content_type = (
-                f'application/soap+xml; charset=utf-8; action="{endpoint.soap_action}"'
-            )
-        else:
-            content_type = "application/soap+xml; charset=utf-8"
-
-        headers = {
-            "Content-Type": content_type,
-        }
 
-        # Alguns serviços ainda olham o header SOAPAction; mantemos se vier preenchido
-        if endpoint.soap_action:
-            headers["SOAPAction"] = endpoint.soap_action
-
-
-        resp = requests.post(
-            endpoint.url,
-            data=soap_xml.encode("utf-8"),
-            headers=headers,
-            timeout=timeout,
-            cert=(f_cert.name, f_key.name),
-            verify=False,  # ⚠ manter False enquanto não tiver cadeia da SEFAZ instalada
+    Passa pelo limitador de taxa (endpoint, CNPJ, serviço): se o balde
+    estiver vazio a chamada espera a vez, e um 656 na resposta pausa o balde.
+    """
+    sessao = sessao_com_pfx(pfx_path, pfx_password)
+    servico = servico_da_requisicao(endpoint.url, endpoint.soap_action)
+    cnpj = identificar_certificado(pfx_path, pfx_password)
+
+    # Em SOAP 1.2 o "action" vai no Content-Type.
+    if endpoint.soap_action:
+        content_type = (
+            f'application/soap+xml; charset=utf-8; action="{endpoint.soap_action}"'
         )
+    else:
+        content_type = "application/soap+xml; charset=utf-8"
+
+    headers = {
+        "Content-Type": content_type,
+    }
+
+    # Alguns serviços ainda olham o header SOAPAction; mantemos se vier preenchido
+    if endpoint.soap_action:
+        headers["SOAPAction"] = endpoint.soap_action
+
+    with rotulos_padrao(servico=servico):
+        with etapa("fila_limite"):
+            limitador.aguardar(endpoint.url, cnpj, servico)
+        with chamadas_em_andamento.em_andamento(servico=servico), etapa("http"):
+            resp = sessao.post(
+                endpoint.url,
+                data=soap_xml if isinstance(soap_xml, bytes) else soap_xml.encode("utf-8"),
+                headers=headers,
+                timeout=timeout,
+            )
+    limitador.registrar_resposta(endpoint.url, cnpj, servico, resp.content)
 
     # NÃO dar raise_for_status aqui; deixamos quem chamou decidir.
     # print("HTTP status SEFAZ:", resp.status_code)  # se quiser logar
     return resp
 
 
-def extrair_xml_resultado(resp_xml: str) -> str:
+def extrair_xml_resultado(resp_xml: Union[bytes, str]) -> Union[bytes, str]:
     """
     A partir do SOAP de resposta, extrai o XML que a SEFAZ retorna
     dentro de <nfeResultMsg><retEnviNFe>...</retEnviNFe></nfeResultMsg>.
     Se não encontrar, devolve o próprio SOAP para inspeção.
+
+    Devolve no mesmo tipo recebido: passando `resp.content` (bytes) o
+    payload sai em bytes, sem decodificar/recodificar a resposta.
     """
-    root = etree.fromstring(resp_xml.encode("utf-8"))
+    root = ler_xml(resp_xml)
 
     # Procura o elemento nfeResultMsg no namespace do WSDL
     ns = {"ws": WSDL_NS}
@@ -195,8 +176,8 @@ def extrair_xml_resultado(resp_xml: str) -> str:
         return resp_xml
 
     # Normalmente o primeiro filho é o <retEnviNFe> (ou outro XML de retorno)
-    payload = nfe_result[0]
-    return etree.tostring(payload, encoding="utf-8", xml_declaration=True).decode("utf-8")
+    payload = etree.tostring(nfe_result[0], encoding="utf-8", xml_declaration=True)
+    return payload if isinstance(resp_xml, bytes) else payload.decode("utf-8")
 
 
 def enviar_nfe(
@@ -247,7 +228,7 @@ def enviar_nfe(
     # 5) Enviar via HTTPS com certificado
     resp = enviar_soap_com_pfx(endpoint, soap_xml, pfx_path, pfx_password)
 
-    # 6) Extrair XML de retorno
-    xml_retorno = extrair_xml_resultado(resp.text)
+    # 6) Extrair XML de retorno (se não vier retEnviNFe, devolve o SOAP)
+    xml_retorno = ler_resposta(resp.content, "retEnviNFe").xml_retorno
 
     return envi_nfe_xml, xml_retorno
@@ -4,12 +4,13 @@ from dataclasses import dataclass
 from typing import Literal
 
 from lxml import etree
-import requests_pkcs12
 
+from sefaz_service.core.envelope import montar_envelope_soap
+from sefaz_service.core.rate_limit import post_pkcs12
+from sefaz_service.core.resposta import ler_resposta, texto_resposta
 from sefaz_service.core.uf_utils import uf_to_cuf, mdfe_url_consulta
 
 MDFe_NS = "http://www.portalfiscal.inf.br/mdfe"
-SOAP_ENV_NS = "http://www.w3.org/2003/05/soap-envelope"
 MDFe_WSDL_CONSULTA = "http://www.portalfiscal.inf.br/mdfe/wsdl/MDFeConsulta"
 
 
@@ -18,7 +19,12 @@ class MDFeResultado:
     status: str
     motivo: str
     xml_envio: str
-    xml_retorno: str
+    retorno: bytes                      # resposta como veio da SEFAZ
+
+    @property
+    def xml_retorno(self) -> str:
+        """Texto da resposta, decodificado só quando pedido."""
+        return texto_resposta(self.retorno)
 
 
 def _monta_xml_consulta(
@@ -44,48 +50,18 @@ def _monta_xml_consulta(
     return xml_bytes.decode("utf-8")
 
 
-def _monta_envelope_soap(xml_corpo: str, uf: str) -> str:
-    cuf = uf_to_cuf(uf)
-
-    nsmap_env = {
-        "soap12": SOAP_ENV_NS,
-        "xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xsd": "http://www.w3.org/2001/XMLSchema",
-    }
-    envelope = etree.Element(etree.QName(SOAP_ENV_NS, "Envelope"), nsmap=nsmap_env)
-
-    header = etree.SubElement(envelope, etree.QName(SOAP_ENV_NS, "Header"))
-    cabec = etree.SubElement(header, "mdfeCabecMsg", xmlns=MDFe_WSDL_CONSULTA)
-    etree.SubElement(cabec, "cUF").text = cuf
-    etree.SubElement(cabec, "versaoDados").text = "3.00"
-
-    body = etree.SubElement(envelope, etree.QName(SOAP_ENV_NS, "Body"))
-    dados_msg = etree.SubElement(body, "mdfeDadosMsg", xmlns=MDFe_WSDL_CONSULTA)
-
-    corpo_root = etree.fromstring(xml_corpo.encode("utf-8"))
-    dados_msg.append(corpo_root)
-
-    xml_bytes = etree.tostring(
-        envelope, encoding="utf-8", xml_declaration=True, pretty_print=False
+def _monta_envelope_soap(xml_corpo: str, uf: str) -> bytes:
+    return montar_envelope_soap(
+        xml_corpo, MDFe_WSDL_CONSULTA, prefixo="mdfe", c_uf=uf_to_cuf(uf), versao_dados="3.00"
     )
-    return xml_bytes.decode("utf-8")
-
 
-def _extrai_status_motivo(xml_retorno: str) -> tuple[str, str]:
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except Exception:
-        return "", ""
 
-    cstat = ""
-    xmotivo = ""
-    for el in root.iter():
-        tag = etree.QName(el).localname
-        if tag == "cStat" and not cstat:
-            cstat = (el.text or "").strip()
-        elif tag == "xMotivo" and not xmotivo:
-            xmotivo = (el.text or "").strip()
-    return cstat, xmotivo
+def _extrai_status_motivo(conteudo: bytes) -> tuple[str, str]:
+    """
+    Extrai cStat / xMotivo do retConsSitMDFe.
+    """
+    ret = ler_resposta(conteudo, "retConsSitMDFe")
+    return ret.cstat_txt, ret.xMotivo or ""
 
 
 def sefaz_mdfe_consulta(
@@ -104,21 +80,20 @@ def sefaz_mdfe_consulta(
         "Content-Type": 'application/soap+xml; charset="utf-8"',
     }
 
-    resp = requests_pkcs12.post(
+    resp = post_pkcs12(
         url,
-        data=xml_envelope.encode("utf-8"),
+        data=xml_envelope,
         headers=headers,
         pkcs12_filename=certificado,
         pkcs12_password=senha,
         timeout=30,
     )
 
-    xml_retorno = resp.text
-    cstat, xmotivo = _extrai_status_motivo(xml_retorno)
+    cstat, xmotivo = _extrai_status_motivo(resp.content)
 
     return MDFeResultado(
         status=cstat or str(resp.status_code),
         motivo=xmotivo or f"Retorno HTTP {resp.status_code}",
-        xml_envio=xml_envelope,
-        xml_retorno=xml_retorno,
+        xml_envio=xml_envelope.decode("utf-8"),
+        retorno=resp.content,
     )
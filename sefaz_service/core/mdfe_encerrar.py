@@ -5,13 +5,14 @@ from datetime import datetime, date
 from typing import Literal
 
 from lxml import etree
-import requests_pkcs12
 
+from sefaz_service.core.envelope import montar_envelope_soap
+from sefaz_service.core.rate_limit import post_pkcs12
+from sefaz_service.core.resposta import ler_resposta, texto_resposta
 from sefaz_service.core.assinatura import assinar_mdfe_evento_xml
 from sefaz_service.core.uf_utils import uf_to_cuf, mdfe_url_recepcao_evento
 
 MDFe_NS = "http://www.portalfiscal.inf.br/mdfe"
-SOAP_ENV_NS = "http://www.w3.org/2003/05/soap-envelope"
 MDFe_WSDL_EVENTO = "http://www.portalfiscal.inf.br/mdfe/wsdl/MDFeRecepcaoEvento"
 
 
@@ -20,7 +21,12 @@ class MDFeResultado:
     status: str
     motivo: str
     xml_envio: str
-    xml_retorno: str
+    retorno: bytes                      # resposta como veio da SEFAZ
+
+    @property
+    def xml_retorno(self) -> str:
+        """Texto da resposta, decodificado só quando pedido."""
+        return texto_resposta(self.retorno)
 
 
 def _monta_xml_evento_encerramento(
@@ -90,58 +96,21 @@ def _assinar_evento_mdfe(xml_evento: str, certificado: str, senha_certificado: s
     )
 
 
-def _monta_envelope_soap(xml_evento_assinado: str, uf: str) -> str:
+def _monta_envelope_soap(xml_evento_assinado: str, uf: str) -> bytes:
     """
     Monta o envelope SOAP 1.2 para MDFeRecepcaoEvento.
     """
-    cuf = uf_to_cuf(uf)
-
-    nsmap_env = {
-        "soap12": SOAP_ENV_NS,
-        "xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xsd": "http://www.w3.org/2001/XMLSchema",
-    }
-    envelope = etree.Element(etree.QName(SOAP_ENV_NS, "Envelope"), nsmap=nsmap_env)
-
-    header = etree.SubElement(envelope, etree.QName(SOAP_ENV_NS, "Header"))
-    cabec = etree.SubElement(header, "mdfeCabecMsg", xmlns=MDFe_WSDL_EVENTO)
-    etree.SubElement(cabec, "cUF").text = cuf
-    etree.SubElement(cabec, "versaoDados").text = "3.00"
-
-    body = etree.SubElement(envelope, etree.QName(SOAP_ENV_NS, "Body"))
-    dados_msg = etree.SubElement(body, "mdfeDadosMsg", xmlns=MDFe_WSDL_EVENTO)
-
-    evento_root = etree.fromstring(xml_evento_assinado.encode("utf-8"))
-    dados_msg.append(evento_root)
-
-    xml_bytes = etree.tostring(
-        envelope,
-        encoding="utf-8",
-        xml_declaration=True,
-        pretty_print=False,
+    return montar_envelope_soap(
+        xml_evento_assinado, MDFe_WSDL_EVENTO, prefixo="mdfe", c_uf=uf_to_cuf(uf), versao_dados="3.00"
     )
-    return xml_bytes.decode("utf-8")
 
 
-def _extrai_status_motivo(xml_retorno: str) -> tuple[str, str]:
+def _extrai_status_motivo(conteudo: bytes) -> tuple[str, str]:
     """
-    Extrai cStat / xMotivo do XML de retorno.
+    Extrai cStat / xMotivo do retEventoMDFe.
     """
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except Exception:
-        return "", ""
-
-    cstat = ""
-    xmotivo = ""
-    for el in root.iter():
-        tag = etree.QName(el).localname
-        if tag == "cStat" and not cstat:
-            cstat = (el.text or "").strip()
-        elif tag == "xMotivo" and not xmotivo:
-            xmotivo = (el.text or "").strip()
-
-    return cstat, xmotivo
+    ret = ler_resposta(conteudo, "retEventoMDFe")
+    return ret.cstat_txt, ret.xMotivo or ""
 
 
 def sefaz_mdfe_encerrar(
@@ -186,21 +155,20 @@ def sefaz_mdfe_encerrar(
         "Content-Type": 'application/soap+xml; charset="utf-8"',
     }
 
-    resp = requests_pkcs12.post(
+    resp = post_pkcs12(
         url,
-        data=xml_envelope.encode("utf-8"),
+        data=xml_envelope,
         headers=headers,
         pkcs12_filename=certificado,
         pkcs12_password=senha_certificado,
         timeout=30,
     )
 
-    xml_retorno = resp.text
-    cstat, xmotivo = _extrai_status_motivo(xml_retorno)
+    cstat, xmotivo = _extrai_status_motivo(resp.content)
 
     return MDFeResultado(
         status=cstat or str(resp.status_code),
         motivo=xmotivo or f"Retorno HTTP {resp.status_code}",
-        xml_envio=xml_envelope,
-        xml_retorno=xml_retorno,
+        xml_envio=xml_envelope.decode("utf-8"),
+        retorno=resp.content,
     )
@@ -1,17 +1,33 @@
 from __future__ import annotations
 
+import time
 from dataclasses import dataclass
-from typing import Literal
+from typing import Literal, Optional
 
 from lxml import etree
-import requests_pkcs12
 
+from sefaz_service.core.envelope import montar_envelope_soap, sem_declaracao
+from sefaz_service.core.rate_limit import post_pkcs12
 from sefaz_service.core.assinatura import assinar_mdfe_xml
-from sefaz_service.core.uf_utils import uf_to_cuf, mdfe_url_recepcao_sinc
+from sefaz_service.core.metricas import etapa, instrumentar
+from sefaz_service.core.resposta import NSMAP, RespostaSefaz, ler_resposta, texto_resposta
+from sefaz_service.core.uf_utils import (
+    uf_to_cuf,
+    mdfe_url_recepcao,
+    mdfe_url_recepcao_sinc,
+    mdfe_url_ret_recepcao,
+)
+from sefaz_service.core.utils import compactar_gzip_base64
 
 MDFe_NS = "http://www.portalfiscal.inf.br/mdfe"
-SOAP_ENV_NS = "http://www.w3.org/2003/05/soap-envelope"
 MDFe_WSDL_RECEP_SINC = "http://www.portalfiscal.inf.br/mdfe/wsdl/MDFeRecepcaoSinc"
+MDFe_WSDL_RECEP = "http://www.portalfiscal.inf.br/mdfe/wsdl/MDFeRecepcao"
+MDFe_WSDL_RET_RECEP = "http://www.portalfiscal.inf.br/mdfe/wsdl/MDFeRetRecepcao"
+
+# 103 = lote recebido, 104 = lote processado, 105 = lote em processamento
+CSTAT_LOTE_RECEBIDO = "103"
+CSTAT_LOTE_PROCESSADO = "104"
+CSTAT_LOTE_EM_PROCESSAMENTO = "105"
 
 
 @dataclass
@@ -19,98 +35,123 @@ class MDFeResultadoEnvio:
     status: str
     motivo: str
     xml_envio: str
-    xml_retorno: str
+    retorno: bytes                      # resposta como veio da SEFAZ
     xml_autorizado: str | None = None  # mdfeProc, se autorizado
+    bytes_enviados: int = 0             # tamanho do corpo HTTP enviado
+    tempo_envio: float = 0.0            # segundos da(s) chamada(s) HTTP
 
+    @property
+    def xml_retorno(self) -> str:
+        """Texto da resposta, decodificado só quando pedido."""
+        return texto_resposta(self.retorno)
 
-def _monta_envi_mdfe(xml_assinado: str, id_lote: str = "1") -> str:
-    root = etree.Element(
-        "enviMDFe",
-        nsmap={None: MDFe_NS},
-        versao="3.00",
-    )
-    etree.SubElement(root, "idLote").text = id_lote
 
-    mdfe_root = etree.fromstring(xml_assinado.encode("utf-8"))
-    root.append(mdfe_root)
+@dataclass
+class MDFeReciboEnvio:
+    """Retorno do envio assíncrono (retEnviMDFe)."""
+    status: str
+    motivo: str
+    nRec: str | None
+    tMed: int
+    xml_envio: str
+    retorno: bytes                      # resposta como veio da SEFAZ
+    bytes_enviados: int = 0
+    tempo_envio: float = 0.0
+    xml_assinado: str = ""              # MDFe assinado, para montar o mdfeProc
 
-    xml_bytes = etree.tostring(
-        root, encoding="utf-8", xml_declaration=True, pretty_print=False
-    )
-    return xml_bytes.decode("utf-8")
+    @property
+    def xml_retorno(self) -> str:
+        """Texto da resposta, decodificado só quando pedido."""
+        return texto_resposta(self.retorno)
 
 
-def _monta_envelope_soap(xml_envi_mdfe: str, uf: str) -> str:
-    cuf = uf_to_cuf(uf)
+def _monta_envi_mdfe(xml_assinado: str, id_lote: str = "1") -> str:
+    """
+    <enviMDFe> com o MDFe assinado inserido como está (sem reparse, para
+    não mexer no que foi assinado).
+    """
+    mdfe = sem_declaracao(xml_assinado).decode("utf-8")
+    return (
+        f'<enviMDFe xmlns="{MDFe_NS}" versao="3.00">'
+        f"<idLote>{id_lote}</idLote>"
+        f"{mdfe}"
+        f"</enviMDFe>"
+    )
+
 
-    nsmap_env = {
-        "soap12": SOAP_ENV_NS,
-        "xsi": "http://www.w3.org/2001/XMLSchema-instance",
-        "xsd": "http://www.w3.org/2001/XMLSchema",
-    }
-    envelope = etree.Element(etree.QName(SOAP_ENV_NS, "Envelope"), nsmap=nsmap_env)
+def _monta_envelope_soap(
+    xml_envi_mdfe: str,
+    uf: str,
+    wsdl_ns: str = MDFe_WSDL_RECEP_SINC,
+    compactar: bool = False,
+) -> bytes:
+    """
+    Envelope SOAP 1.2 do MDF-e. Com compactar=True o conteúdo vai em
+    mdfeDadosMsg como texto GZip + Base64 em vez de XML aninhado.
+    """
+    conteudo = compactar_gzip_base64(xml_envi_mdfe) if compactar else xml_envi_mdfe
+    return montar_envelope_soap(
+        conteudo, wsdl_ns, prefixo="mdfe", c_uf=uf_to_cuf(uf), versao_dados="3.00"
+    )
 
-    header = etree.SubElement(envelope, etree.QName(SOAP_ENV_NS, "Header"))
-    cabec = etree.SubElement(header, "mdfeCabecMsg", xmlns=MDFe_WSDL_RECEP_SINC)
-    etree.SubElement(cabec, "cUF").text = cuf
-    etree.SubElement(cabec, "versaoDados").text = "3.00"
 
-    body = etree.SubElement(envelope, etree.QName(SOAP_ENV_NS, "Body"))
-    dados_msg = etree.SubElement(body, "mdfeDadosMsg", xmlns=MDFe_WSDL_RECEP_SINC)
+def _monta_mdfe_proc(xml_assinado: str, prot: etree._Element) -> str:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<mdfeProc versao="3.00" xmlns="{MDFe_NS}">'
+        f"{sem_declaracao(xml_assinado).decode('utf-8')}"
+        f"{etree.tostring(prot, encoding='utf-8').decode('utf-8')}"
+        f"</mdfeProc>"
+    )
 
-    envi_root = etree.fromstring(xml_envi_mdfe.encode("utf-8"))
-    dados_msg.append(envi_root)
 
-    xml_bytes = etree.tostring(
-        envelope, encoding="utf-8", xml_declaration=True, pretty_print=False
+def _status_protocolo(ret: RespostaSefaz) -> tuple[etree._Element | None, str, str]:
+    """
+    (protMDFe, cStat, xMotivo) do protocolo dentro do retorno, se houver.
+    """
+    if ret.payload is None:
+        return None, "", ""
+    prot = ret.payload.find("mdfe:protMDFe", NSMAP)
+    if prot is None:
+        return None, "", ""
+    return (
+        prot,
+        prot.findtext("mdfe:infProt/mdfe:cStat", default="", namespaces=NSMAP).strip(),
+        prot.findtext("mdfe:infProt/mdfe:xMotivo", default="", namespaces=NSMAP).strip(),
     )
-    return xml_bytes.decode("utf-8")
 
 
-def _extrai_status_motivo_e_proc(xml_retorno: str) -> tuple[str, str, str | None]:
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except Exception:
-        return "", "", None
+def _extrai_status_motivo_e_proc(conteudo: bytes, xml_assinado: str) -> tuple[str, str, str | None]:
+    ret = ler_resposta(conteudo, "retMDFe")
+    prot, cstat_prot, _ = _status_protocolo(ret)
 
-    cstat = ""
-    xmotivo = ""
     mdfe_proc_xml: str | None = None
+    if prot is not None and cstat_prot == "100":
+        with etapa("proc"):
+            mdfe_proc_xml = _monta_mdfe_proc(xml_assinado, prot)
 
-    for el in root.iter():
-        tag = etree.QName(el).localname
-        if tag == "cStat" and not cstat:
-            cstat = (el.text or "").strip()
-        elif tag == "xMotivo" and not xmotivo:
-            xmotivo = (el.text or "").strip()
-
-    # Tenta localizar mdfeProc
-    mdfe_proc = root.find(".//{http://www.portalfiscal.inf.br/mdfe}mdfeProc")
-    if mdfe_proc is not None:
-        mdfe_proc_xml_bytes = etree.tostring(
-            mdfe_proc,
-            encoding="utf-8",
-            xml_declaration=True,
-            pretty_print=False,
-        )
-        mdfe_proc_xml = mdfe_proc_xml_bytes.decode("utf-8")
-
-    return cstat, xmotivo, mdfe_proc_xml
+    return ret.cstat_txt, ret.xMotivo or "", mdfe_proc_xml
 
 
+@instrumentar("MDFeRecepcaoSinc", modelo="58")
 def sefaz_mdfe_envio(
     xml: str,
     uf: str,
     ambiente: Literal["1", "2"],
     certificado: str,
     senha_certificado: str,
+    compactar: bool = False,
 ) -> MDFeResultadoEnvio:
     """
     Envia um MDFe via RecepcaoSinc:
     - Assina <infMDFe> com o PFX.
     - Envolve em enviMDFe/idLote.
     - Envia via SOAP 1.2 para MDFeRecepcaoSinc.
-    - Se cStat=100 e mdfeProc presente, devolve em xml_autorizado.
+    - Se cStat=100, monta o mdfeProc (MDFe assinado + protMDFe) em xml_autorizado.
+
+    Com compactar=True o <MDFe> assinado vai em mdfeDadosMsg compactado
+    (GZip + Base64, formato do MOC para o RecepcaoSinc), o que reduz bem o
+    upload de manifestos com muitos documentos vinculados.
     """
     # 1) Assinar o XML do MDF-e (infMDFe)
     xml_assinado = assinar_mdfe_xml(
@@ -119,35 +160,184 @@ def sefaz_mdfe_envio(
         pfx_password=senha_certificado,
     )
 
-    # 2) Monta enviMDFe
-    xml_envi_mdfe = _monta_envi_mdfe(xml_assinado)
+    # 2) Monta enviMDFe (compactado, vai só o <MDFe>)
+    if compactar:
+        xml_envelope = _monta_envelope_soap(
+            sem_declaracao(xml_assinado).decode("utf-8"), uf=uf, compactar=True
+        )
+    else:
+        xml_envi_mdfe = _monta_envi_mdfe(xml_assinado)
 
-    # 3) Monta envelope SOAP
-    xml_envelope = _monta_envelope_soap(xml_envi_mdfe, uf=uf)
+        # 3) Monta envelope SOAP
+        xml_envelope = _monta_envelope_soap(xml_envi_mdfe, uf=uf)
 
     # 4) URL do serviço
     url = mdfe_url_recepcao_sinc(ambiente)
 
-    headers = {
-        "Content-Type": 'application/soap+xml; charset="utf-8"',
-    }
+    resp, bytes_enviados, tempo = _post_mdfe(url, xml_envelope, certificado, senha_certificado)
+
+    cstat, xmotivo, mdfe_proc_xml = _extrai_status_motivo_e_proc(resp.content, xml_assinado)
+
+    return MDFeResultadoEnvio(
+        status=cstat or str(resp.status_code),
+        motivo=xmotivo or f"Retorno HTTP {resp.status_code}",
+        xml_envio=xml_envelope.decode("utf-8"),
+        retorno=resp.content,
+        xml_autorizado=mdfe_proc_xml,
+        bytes_enviados=bytes_enviados,
+        tempo_envio=tempo,
+    )
+
+
+# ----------------------------------------------------------------------
+# ENVIO ASSÍNCRONO (MDFeRecepcao + MDFeRetRecepcao)
+# ----------------------------------------------------------------------
+
 
-    resp = requests_pkcs12.post(
+def _post_mdfe(url: str, corpo: bytes, certificado: str, senha: str):
+    """
+    POST do envelope pela sessão mTLS reaproveitada (post_pkcs12).
+    Retorna (resposta, bytes enviados, segundos).
+    """
+    inicio = time.monotonic()
+    resp = post_pkcs12(
         url,
-        data=xml_envelope.encode("utf-8"),
-        headers=headers,
+        data=corpo,
+        headers={"Content-Type": 'application/soap+xml; charset="utf-8"'},
         pkcs12_filename=certificado,
-        pkcs12_password=senha_certificado,
+        pkcs12_password=senha,
         timeout=30,
     )
+    return resp, len(corpo), time.monotonic() - inicio
+
+
+@instrumentar("MDFeRecepcao", modelo="58")
+def sefaz_mdfe_envio_async(
+    xml: str,
+    uf: str,
+    ambiente: Literal["1", "2"],
+    certificado: str,
+    senha_certificado: str,
+    id_lote: Optional[str] = None,
+) -> MDFeReciboEnvio:
+    """
+    Envia um MDF-e pelo serviço assíncrono (MDFeRecepcao) e devolve o
+    recibo (nRec/tMed) para consulta posterior em sefaz_mdfe_ret_recepcao.
+    O enviMDFe vai sempre como XML: a mensagem compactada (GZip + Base64)
+    é do MDFeRecepcaoSinc.
+    """
+    xml_assinado = assinar_mdfe_xml(
+        xml,
+        pfx_path=certificado,
+        pfx_password=senha_certificado,
+    )
+    xml_envi_mdfe = _monta_envi_mdfe(xml_assinado, id_lote=id_lote or str(time.time_ns() // 1000)[-15:])
+    xml_envelope = _monta_envelope_soap(xml_envi_mdfe, uf=uf, wsdl_ns=MDFe_WSDL_RECEP)
 
-    xml_retorno = resp.text
-    cstat, xmotivo, mdfe_proc_xml = _extrai_status_motivo_e_proc(xml_retorno)
+    resp, bytes_enviados, tempo = _post_mdfe(
+        mdfe_url_recepcao(ambiente), xml_envelope, certificado, senha_certificado
+    )
+
+    ret = ler_resposta(resp.content, "retEnviMDFe")
+    t_med = ret.texto("mdfe:infRec/mdfe:tMed") or ""
+
+    return MDFeReciboEnvio(
+        status=ret.cstat_txt or str(resp.status_code),
+        motivo=ret.xMotivo or f"Retorno HTTP {resp.status_code}",
+        nRec=ret.texto("mdfe:infRec/mdfe:nRec"),
+        tMed=int(t_med) if t_med.isdigit() else 1,
+        xml_envio=xml_envi_mdfe,
+        retorno=ret.bruto,
+        bytes_enviados=bytes_enviados,
+        tempo_envio=tempo,
+        xml_assinado=xml_assinado,
+    )
+
+
+@instrumentar("MDFeRetRecepcao", modelo="58")
+def sefaz_mdfe_ret_recepcao(
+    n_rec: str,
+    uf: str,
+    ambiente: Literal["1", "2"],
+    certificado: str,
+    senha_certificado: str,
+    xml_mdfe_assinado: Optional[str] = None,
+) -> MDFeResultadoEnvio:
+    """
+    Consulta o recibo de um envio assíncrono (consReciMDFe).
+
+    O status devolvido é o do protMDFe quando o lote já foi processado
+    (104), senão o do próprio retorno (ex.: 105 = em processamento).
+    Informando xml_mdfe_assinado, o mdfeProc é montado quando autorizado.
+    """
+    xml_cons = (
+        f'<consReciMDFe versao="3.00" xmlns="{MDFe_NS}">'
+        f"<tpAmb>{ambiente}</tpAmb>"
+        f"<nRec>{n_rec}</nRec>"
+        f"</consReciMDFe>"
+    )
+    xml_envelope = _monta_envelope_soap(xml_cons, uf=uf, wsdl_ns=MDFe_WSDL_RET_RECEP)
+
+    resp, bytes_enviados, tempo = _post_mdfe(
+        mdfe_url_ret_recepcao(ambiente), xml_envelope, certificado, senha_certificado
+    )
+    ret = ler_resposta(resp.content, "retConsReciMDFe")
+    status, motivo, xml_autorizado = ret.cstat_txt, ret.xMotivo or "", None
+    prot, cstat_prot, xmotivo_prot = _status_protocolo(ret)
+    if status == CSTAT_LOTE_PROCESSADO and prot is not None:
+        status, motivo = cstat_prot, xmotivo_prot
+        if status == "100" and xml_mdfe_assinado:
+            xml_autorizado = _monta_mdfe_proc(xml_mdfe_assinado, prot)
 
     return MDFeResultadoEnvio(
-        status=cstat or str(resp.status_code),
-        motivo=xmotivo or f"Retorno HTTP {resp.status_code}",
-        xml_envio=xml_envelope,
-        xml_retorno=xml_retorno,
-        xml_autorizado=mdfe_proc_xml,
+        status=status or str(resp.status_code),
+        motivo=motivo or f"Retorno HTTP {resp.status_code}",
+        xml_envio=xml_cons,
+        retorno=ret.bruto,
+        xml_autorizado=xml_autorizado,
+        bytes_enviados=bytes_enviados,
+        tempo_envio=tempo,
     )
+
+
+def sefaz_mdfe_envio_async_aguardar(
+    xml: str,
+    uf: str,
+    ambiente: Literal["1", "2"],
+    certificado: str,
+    senha_certificado: str,
+    timeout: float = 120.0,
+    fator_backoff: float = 1.5,
+    intervalo_max: float = 30.0,
+) -> MDFeResultadoEnvio:
+    """
+    Envio assíncrono completo: envia o lote, espera o tMed informado e
+    consulta o recibo até sair do 105, aumentando o intervalo a cada
+    tentativa (fator_backoff, até intervalo_max) ou estourar o timeout.
+    """
+    recibo = sefaz_mdfe_envio_async(xml, uf, ambiente, certificado, senha_certificado)
+    if recibo.status != CSTAT_LOTE_RECEBIDO or not recibo.nRec:
+        return MDFeResultadoEnvio(
+            status=recibo.status,
+            motivo=recibo.motivo,
+            xml_envio=recibo.xml_envio,
+            retorno=recibo.retorno,
+            bytes_enviados=recibo.bytes_enviados,
+            tempo_envio=recibo.tempo_envio,
+        )
+
+    limite = time.monotonic() + timeout
+    intervalo = float(max(1, recibo.tMed))
+    bytes_total, tempo_total = recibo.bytes_enviados, recibo.tempo_envio
+    while True:
+        time.sleep(max(0.0, min(intervalo, limite - time.monotonic())))
+        res = sefaz_mdfe_ret_recepcao(
+            recibo.nRec, uf, ambiente, certificado, senha_certificado,
+            xml_mdfe_assinado=recibo.xml_assinado,
+        )
+        bytes_total += res.bytes_enviados
+        tempo_total += res.tempo_envio
+        if res.status != CSTAT_LOTE_EM_PROCESSAMENTO or time.monotonic() >= limite:
+            res.bytes_enviados, res.tempo_envio = bytes_total, tempo_total
+            return res
+        intervalo = min(intervalo_max, intervalo * fator_backoff)
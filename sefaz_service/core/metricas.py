@@ -0,0 +1,368 @@
+# sefaz_service/core/metricas.py
+from __future__ import annotations
+
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+from .rastreamento import rastreamento_ativo, span
+
+# ----------------------------------------------------------------------
+# Métricas em memória no formato de exposição do Prometheus (texto 0.0.4),
+# sem dependências e sem coletor externo: GET /metrics lê direto daqui.
+# ----------------------------------------------------------------------
+
+# Limites (segundos) dos histogramas de latência
+BUCKETS_PADRAO: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+Rotulos = Tuple[str, ...]
+Amostras = Iterable[Tuple[Dict[str, str], float]]
+
+
+def _escapar(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_rotulos(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if not float(valor).is_integer() else str(int(valor))
+
+
+class _Metrica:
+    tipo = ""
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> None:
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos: Rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: Dict[str, str]) -> Rotulos:
+        return tuple(str(rotulos.get(n) or "") for n in self.rotulos)
+
+    def cabecalho(self) -> List[str]:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    """Valor que só cresce (requisições, cStat recebidos...)."""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Rotulos, float] = {}
+
+    def inc(self, valor: float = 1.0, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return self.cabecalho() + [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, k)} {_numero(v)}" for k, v in itens
+        ]
+
+
+class Gauge(_Metrica):
+    """Valor que sobe e desce (requisições em andamento...)."""
+
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Rotulos, float] = {}
+
+    def inc(self, valor: float = 1.0, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+
+    def dec(self, valor: float = 1.0, **rotulos: str) -> None:
+        self.inc(-valor, **rotulos)
+
+    @contextmanager
+    def em_andamento(self, **rotulos: str) -> Iterator[None]:
+        self.inc(**rotulos)
+        try:
+            yield
+        finally:
+            self.dec(**rotulos)
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            itens = sorted(self._valores.items())
+        return self.cabecalho() + [
+            f"{self.nome}{_formatar_rotulos(self.rotulos, k)} {_numero(v)}" for k, v in itens
+        ]
+
+
+class Histograma(_Metrica):
+    """Distribuição de latências em buckets cumulativos (+ soma e contagem)."""
+
+    tipo = "histogram"
+
+    def __init__(
+        self,
+        nome: str,
+        ajuda: str,
+        rotulos: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS_PADRAO,
+    ) -> None:
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        # por rótulos: [contagem por bucket (não cumulativa) + estouro, soma]
+        self._series: Dict[Rotulos, Tuple[List[int], List[float]]] = {}
+
+    def observar(self, valor: float, **rotulos: str) -> None:
+        chave = self._chave(rotulos)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = ([0] * (len(self.buckets) + 1), [0.0])
+            serie[0][indice] += 1
+            serie[1][0] += valor
+
+    @contextmanager
+    def cronometrar(self, **rotulos: str) -> Iterator[None]:
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def exportar(self) -> List[str]:
+        with self._lock:
+            itens = sorted((k, (list(c), s[0])) for k, (c, s) in self._series.items())
+        linhas = self.cabecalho()
+        for chave, (contagens, soma) in itens:
+            acumulado = 0
+            for limite, qtd in zip(self.buckets + (float("inf"),), contagens):
+                acumulado += qtd
+                le = f'le="{_numero(limite)}"'
+                linhas.append(
+                    f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, chave, le)} {acumulado}"
+                )
+            rot = _formatar_rotulos(self.rotulos, chave)
+            linhas.append(f"{self.nome}_sum{rot} {_numero(soma)}")
+            linhas.append(f"{self.nome}_count{rot} {acumulado}")
+        return linhas
+
+
+class _Coletor(_Metrica):
+    """Métrica lida na hora da exportação (tamanho de cache, pool...)."""
+
+    def __init__(self, nome: str, tipo: str, ajuda: str, func: Callable[[], Amostras]) -> None:
+        super().__init__(nome, ajuda)
+        self.tipo = tipo
+        self.func = func
+
+    def exportar(self) -> List[str]:
+        linhas = self.cabecalho()
+        for rotulos, valor in self.func():
+            nomes = tuple(rotulos)
+            linhas.append(
+                f"{self.nome}{_formatar_rotulos(nomes, [str(rotulos[n]) for n in nomes])} {_numero(valor)}"
+            )
+        return linhas
+
+
+class RegistroMetricas:
+    """
+    Conjunto de métricas do processo. Métricas com estado (contadores,
+    gauges, histogramas) são criadas uma vez; coletores são funções
+    chamadas a cada exportação.
+    """
+
+    def __init__(self) -> None:
+        self._metricas: Dict[str, _Metrica] = {}
+        self._lock = threading.Lock()
+
+    def _registrar(self, metrica: _Metrica) -> _Metrica:
+        with self._lock:
+            existente = self._metricas.get(metrica.nome)
+            if existente is not None:
+                return existente
+            self._metricas[metrica.nome] = metrica
+            return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self._registrar(Contador(nome, ajuda, rotulos))  # type: ignore[return-value]
+
+    def gauge(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Gauge:
+        return self._registrar(Gauge(nome, ajuda, rotulos))  # type: ignore[return-value]
+
+    def histograma(
+        self,
+        nome: str,
+        ajuda: str,
+        rotulos: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS_PADRAO,
+    ) -> Histograma:
+        return self._registrar(Histograma(nome, ajuda, rotulos, buckets))  # type: ignore[return-value]
+
+    def coletor(self, nome: str, tipo: str, ajuda: str, func: Callable[[], Amostras]) -> None:
+        """Registra (ou substitui) uma métrica calculada na exportação."""
+        with self._lock:
+            self._metricas[nome] = _Coletor(nome, tipo, ajuda, func)
+
+    def exportar(self) -> str:
+        """Texto no formato de exposição do Prometheus."""
+        with self._lock:
+            metricas = list(self._metricas.values())
+        linhas: List[str] = []
+        for metrica in metricas:
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+
+registro = RegistroMetricas()
+
+
+# ----------------------------------------------------------------------
+# MÉTRICAS DAS CHAMADAS À SEFAZ
+# ----------------------------------------------------------------------
+
+ROTULOS_SEFAZ = ("servico", "uf", "ambiente", "modelo")
+
+etapas_sefaz = registro.histograma(
+    "sefaz_etapa_segundos",
+    "Duração de cada etapa das chamadas à SEFAZ (assinatura, envelope, "
+    "fila_limite, conexao, http, parse, proc, total)",
+    ROTULOS_SEFAZ + ("etapa",),
+)
+respostas_sefaz = registro.contador(
+    "sefaz_respostas_total",
+    "Respostas da SEFAZ por cStat (cStat vazio = sem retorno legível)",
+    ROTULOS_SEFAZ + ("cstat",),
+)
+chamadas_em_andamento = registro.gauge(
+    "sefaz_requisicoes_em_andamento",
+    "Requisições HTTP à SEFAZ em andamento",
+    ("servico",),
+)
+
+# Rótulos da chamada atual (por thread/tarefa): definidos por quem conhece
+# UF/ambiente/modelo e lidos pelas etapas de assinatura, transporte e parse.
+_rotulos_atuais: contextvars.ContextVar[Dict[str, str]] = contextvars.ContextVar(
+    "sefaz_rotulos", default={}
+)
+
+
+@contextmanager
+def _com_rotulos(novos: Dict[str, str]) -> Iterator[None]:
+    token = _rotulos_atuais.set(novos)
+    try:
+        yield
+    finally:
+        _rotulos_atuais.reset(token)
+
+
+def rotulos_sefaz(**rotulos: Optional[str]):
+    """
+    Define servico/uf/ambiente/modelo da chamada em andamento:
+
+        with rotulos_sefaz(servico="NFeAutorizacao4", uf="SP", ambiente="2", modelo="55"):
+            ...
+    """
+    atuais = dict(_rotulos_atuais.get())
+    atuais.update({k: str(v) for k, v in rotulos.items() if v})
+    return _com_rotulos(atuais)
+
+
+def rotulos_padrao(**rotulos: Optional[str]):
+    """Como rotulos_sefaz, mas só preenche o que ainda não foi definido."""
+    atuais = dict(_rotulos_atuais.get())
+    for k, v in rotulos.items():
+        if v and not atuais.get(k):
+            atuais[k] = str(v)
+    return _com_rotulos(atuais)
+
+
+def rotulos_atuais() -> Dict[str, str]:
+    return _rotulos_atuais.get()
+
+
+def etapa(nome: str, nome_span: Optional[str] = None):
+    """
+    Cronometra uma etapa com os rótulos da chamada em andamento. Com o
+    rastreamento ligado, a etapa também vira um span ("sefaz.<etapa>"),
+    com os rótulos como atributos.
+    """
+    rotulos = _rotulos_atuais.get()
+    if not rastreamento_ativo():
+        return etapas_sefaz.cronometrar(etapa=nome, **rotulos)
+    return _etapa_com_span(nome, nome_span or f"sefaz.{nome}", rotulos)
+
+
+@contextmanager
+def _etapa_com_span(nome: str, nome_span: str, rotulos: Dict[str, str]) -> Iterator[None]:
+    atributos = {f"sefaz.{k}": v for k, v in rotulos.items()}
+    with span(nome_span, **atributos), etapas_sefaz.cronometrar(etapa=nome, **rotulos):
+        yield
+
+
+def registrar_cstat(cstat: Optional[int], servico: Optional[str] = None) -> None:
+    rotulos = dict(_rotulos_atuais.get())
+    if servico and not rotulos.get("servico"):
+        rotulos["servico"] = servico
+    respostas_sefaz.inc(cstat="" if cstat is None else str(cstat), **rotulos)
+
+
+def instrumentar(
+    servico: Optional[str] = None,
+    **rotulos: Union[str, Callable[[Dict[str, Any]], Optional[str]]],
+):
+    """
+    Decorador para as funções de serviço (sefaz_nfe_envio, ...): define os
+    rótulos da chamada e mede a etapa "total" (no trace, o span raiz da
+    chamada, com o nome da função).
+
+    uf e ambiente vêm dos argumentos de mesmo nome; outros rótulos podem
+    ser fixos ou funções que recebem os argumentos da chamada:
+
+        @instrumentar("NFeConsultaProtocolo4", modelo=lambda a: a["chave"][20:22])
+    """
+    def decorador(func):
+        assinatura = inspect.signature(func)
+
+        @functools.wraps(func)
+        def envoltorio(*args, **kwargs):
+            try:
+                argumentos = assinatura.bind_partial(*args, **kwargs).arguments
+            except TypeError:
+                argumentos = {}
+            valores: Dict[str, Optional[str]] = {
+                "servico": servico,
+                "uf": str(argumentos.get("uf") or "").upper(),
+                "ambiente": argumentos.get("ambiente"),
+            }
+            for nome, valor in rotulos.items():
+                try:
+                    valores[nome] = valor(argumentos) if callable(valor) else valor
+                except Exception:
+                    valores[nome] = None
+            with rotulos_sefaz(**valores), etapa("total", func.__name__):
+                return func(*args, **kwargs)
+
+        return envoltorio
+
+    return decorador
@@ -7,6 +7,8 @@ from typing import Optional
 from lxml import etree
 
 from .assinatura import NFE_NS
+from .parser_xml import ler_xml
+from .rastreamento import rastrear
 
 
 @dataclass
@@ -33,20 +35,31 @@ class NFeAutorizadoResult:
     xml_protocolo_ajustado: str
 
 
+# XPaths por nome local, compilados uma vez
+_XP_INF_PROT = etree.XPath("//*[local-name()='infProt']")
+_XP_CSTAT = etree.XPath(".//*[local-name()='cStat']")
+_XP_XMOTIVO = etree.XPath(".//*[local-name()='xMotivo']")
+
+
 def _extrair_status_motivo(xml: str) -> tuple[Optional[int], Optional[str]]:
     """
     Extrai cStat e xMotivo de qualquer XML de retorno da SEFAZ
     (retEnviNFe, retConsReciNFe, retConsSitNFe, etc).
     """
     try:
-        root = etree.fromstring(xml.encode("utf-8"))
+        root = ler_xml(xml)
     except Exception:
         return None, None
 
     # Não usamos namespace aqui porque alguns retornos não vêm com o NFE_NS,
     # ou vêm com prefixo diferente. Buscamos por nome local.
-    cstat_el = root.find(".//cStat")
-    xmot_el = root.find(".//xMotivo")
+    # Se houver <infProt>, o status que vale é o da NFe, não o do lote
+    # (ex.: 104 "Lote processado" no retEnviNFe / retConsReciNFe).
+    base = _XP_INF_PROT(root) or [root]
+    cstat_nodes = _XP_CSTAT(base[0])
+    xmot_nodes = _XP_XMOTIVO(base[0])
+    cstat_el = cstat_nodes[0] if cstat_nodes else None
+    xmot_el = xmot_nodes[0] if xmot_nodes else None
 
     status: Optional[int] = None
     motivo: Optional[str] = None
@@ -63,6 +76,7 @@ def _extrair_status_motivo(xml: str) -> tuple[Optional[int], Optional[str]]:
     return status, motivo
 
 
+@rastrear()
 def sefaz_nfe_gera_autorizado(
     xml_assinado: str,
     xml_protocolo: str,
@@ -97,11 +111,9 @@ def sefaz_nfe_gera_autorizado(
     # (ajuste conforme sua regra de negócio)
     autorizado = status in (100, 101, 150)
 
-    parser = etree.XMLParser(remove_blank_text=True)
-
     # Parse da NFe assinada
     try:
-        nfe_root = etree.fromstring(xml_assinado.encode("utf-8"), parser=parser)
+        nfe_root = ler_xml(xml_assinado, "compacto")
     except Exception:
         # Se der erro aqui, não tem como gerar nfeProc
         return NFeAutorizadoResult(
@@ -114,7 +126,7 @@ def sefaz_nfe_gera_autorizado(
 
     # Parse do XML de protocolo (retEnviNFe / retConsReciNFe / retConsSitNFe / protNFe)
     try:
-        proto_root = etree.fromstring(xml_protocolo.encode("utf-8"), parser=parser)
+        proto_root = ler_xml(xml_protocolo, "compacto")
     except Exception:
         return NFeAutorizadoResult(
             autorizado=False,
@@ -143,7 +155,7 @@ def sefaz_nfe_gera_autorizado(
         )
 
     # Fazemos uma cópia de protNFe para não modificarmos o XML de entrada
-    prot_el = etree.fromstring(
+    prot_el = ler_xml(
         etree.tostring(prot_el, encoding="utf-8", xml_declaration=False)
     )
 
@@ -1,12 +1,16 @@
 # sefaz_service/core/nfe_consulta.py
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Optional
-
-from lxml import etree
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Iterator, List, Optional
 
+from .cache import CacheTTL, SingleFlight
+from .envelope import montar_envelope_soap
 from .envio import enviar_soap_com_pfx, EndpointInfo
+from .metricas import instrumentar
+from .rastreamento import propagar_contexto
+from .resposta import ler_resposta
 from .soaplist import get_nfe_consulta_protocolo4_endpoint
 
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
@@ -21,16 +25,55 @@ UF_TO_CUF = {
 }
 
 
+# Situações definitivas: a resposta não muda mais, fica no cache sem prazo.
+# 101/151/155 = cancelada, 110/301/302/303 = uso denegado
+CSTAT_SITUACAO_FINAL = {101, 110, 151, 155, 301, 302, 303}
+# Falhas momentâneas da SEFAZ: nunca vão para o cache
+CSTAT_CONSULTA_TRANSITORIOS = {108, 109, 656, 999}
+
+# Demais respostas (autorizada, não consta na base...) podem mudar
+TTL_CONSULTA = 300.0
+
+_consultas_em_voo = SingleFlight()
+
+
+CUF_TO_UF = {cuf: uf for uf, cuf in UF_TO_CUF.items()}
+
+MODELOS_NFE = ("55", "65")
+
+# Modelos com endpoint de NFeConsultaProtocolo4 no soaplist (só NF-e)
+MODELOS_CONSULTA = ("55",)
+
+
 def _resolver_cuf(uf: str) -> str:
     return UF_TO_CUF.get((uf or "").upper(), "")
 
 
+def uf_modelo_da_chave(chave: str) -> tuple[str, str]:
+    """
+    Lê UF (posições 1-2, cUF) e modelo (posições 21-22) da chave de acesso.
+    Levanta ValueError se a chave não for de NF-e/NFC-e válida.
+    """
+    chave = (chave or "").strip()
+    if len(chave) != 44 or not chave.isdigit():
+        raise ValueError(f"Chave de acesso inválida: {chave!r}")
+    uf = CUF_TO_UF.get(chave[:2])
+    if uf is None:
+        raise ValueError(f"cUF inválido na chave: {chave[:2]!r}")
+    modelo = chave[20:22]
+    if modelo not in MODELOS_NFE:
+        raise ValueError(f"Modelo {modelo!r} na chave não é NF-e (55) nem NFC-e (65)")
+    return uf, modelo
+
+
 @dataclass
 class NFeConsultaResult:
     cStat: Optional[int]
     xMotivo: Optional[str]
     xml_envio: str
     xml_retorno: str
+    cache: bool = False
+    chave: str = ""
 
 
 def _montar_cons_sit_nfe(
@@ -60,70 +103,25 @@ def _montar_cons_sit_nfe(
     return xml, c_uf
 
 
-def _montar_soap_consulta(cons_sit_xml: str, c_uf: str, versao_dados: str = "4.00") -> str:
+def _montar_soap_consulta(cons_sit_xml: str, c_uf: str, versao_dados: str = "4.00") -> bytes:
     """
     Envelope SOAP 1.2 para NFeConsultaProtocolo4.
     """
-    return f"""<?xml version="1.0" encoding="UTF-8"?>
-<soap12:Envelope
-    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-    xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-    xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Header>
-    <nfeCabecMsg xmlns="{CONSULTA_WSDL_NS}">
-      <cUF>{c_uf}</cUF>
-      <versaoDados>{versao_dados}</versaoDados>
-    </nfeCabecMsg>
-  </soap12:Header>
-  <soap12:Body>
-    <nfeDadosMsg xmlns="{CONSULTA_WSDL_NS}">
-      {cons_sit_xml}
-    </nfeDadosMsg>
-  </soap12:Body>
-</soap12:Envelope>"""
-
-
-def _extrair_xml_consulta(resp_xml: str) -> str:
-    """
-    Extrai <retConsSitNFe> do SOAP. Se não achar, devolve o SOAP inteiro.
-    """
-    try:
-        root = etree.fromstring(resp_xml.encode("utf-8"))
-    except Exception:
-        return resp_xml
-
-    # Procura qualquer nó cujo nome seja retConsSitNFe, ignorando namespace
-    nodes = root.xpath("//*[local-name()='retConsSitNFe']")
-    if nodes:
-        return etree.tostring(nodes[0], encoding="utf-8", xml_declaration=True).decode("utf-8")
-
-    return resp_xml
-
-
-def _obter_status_motivo(xml_retorno: str) -> tuple[Optional[int], Optional[str]]:
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except Exception:
-        return None, None
-
-    cstat_nodes = root.xpath("//*[local-name()='cStat']")
-    xmot_nodes = root.xpath("//*[local-name()='xMotivo']")
+    return montar_envelope_soap(cons_sit_xml, CONSULTA_WSDL_NS, c_uf=c_uf, versao_dados=versao_dados)
 
-    cstat_val: Optional[int] = None
-    xmot_val: Optional[str] = None
 
-    if cstat_nodes and cstat_nodes[0].text:
-        try:
-            cstat_val = int(cstat_nodes[0].text.strip())
-        except ValueError:
-            cstat_val = None
-
-    if xmot_nodes and xmot_nodes[0].text:
-        xmot_val = xmot_nodes[0].text.strip()
-
-    return cstat_val, xmot_val
+def _ttl_consulta(res: NFeConsultaResult) -> tuple[bool, Optional[float]]:
+    """
+    (guardar?, ttl) para o resultado. ttl=None = sem expiração.
+    """
+    if res.cStat is None or res.cStat in CSTAT_CONSULTA_TRANSITORIOS:
+        return False, None
+    if res.cStat in CSTAT_SITUACAO_FINAL:
+        return True, None
+    return True, TTL_CONSULTA
 
 
+@instrumentar("NFeConsultaProtocolo4", modelo=lambda a: a["chave"][20:22])
 def sefaz_nfe_consulta(
     uf: str,
     chave: str,
@@ -131,10 +129,47 @@ def sefaz_nfe_consulta(
     pfx_password: str,
     ambiente: str = "2",
     versao: str = "4.00",
+    cache: Optional[CacheTTL] = None,
 ) -> NFeConsultaResult:
     """
     Consulta a SITUAÇÃO da NFe/NFCe pela CHAVE (NFeConsultaProtocolo4).
+
+    Com `cache`, o retConsSitNFe fica guardado por (ambiente, chave):
+    situações finais (cancelada, denegada) sem prazo, as demais por
+    TTL_CONSULTA. Consultas simultâneas da mesma chave viram uma só
+    ida à SEFAZ.
     """
+    chave = (chave or "").strip()
+    chave_cache = (ambiente, chave)
+
+    # 1) cache
+    if cache is not None:
+        em_cache = cache.get(chave_cache)
+        if em_cache is not None:
+            em_cache["cache"] = True
+            return NFeConsultaResult(**em_cache)
+
+    def _consultar() -> NFeConsultaResult:
+        res = _consulta_sefaz(uf, chave, pfx_path, pfx_password, ambiente, versao)
+        if cache is not None:
+            guardar, ttl = _ttl_consulta(res)
+            if guardar:
+                cache.set(chave_cache, asdict(res), ttl=ttl)
+        return res
+
+    # 2) SEFAZ (uma chamada por chave em andamento)
+    res, _ = _consultas_em_voo.executar(chave_cache, _consultar)
+    return res
+
+
+def _consulta_sefaz(
+    uf: str,
+    chave: str,
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str,
+    versao: str,
+) -> NFeConsultaResult:
     # 1) Monta consSitNFe e descobre cUF
     xml_envio, c_uf = _montar_cons_sit_nfe(chave=chave, uf=uf, ambiente=ambiente, versao=versao)
 
@@ -152,15 +187,104 @@ def sefaz_nfe_consulta(
         pfx_password=pfx_password,
     )
 
-    # 5) Extrai retConsSitNFe
-    xml_retorno = _extrair_xml_consulta(resp.text)
-
-    # 6) Pega cStat / xMotivo
-    cstat, xmot = _obter_status_motivo(xml_retorno)
+    # 5) retConsSitNFe + cStat / xMotivo (um único parse)
+    ret = ler_resposta(resp.content, "retConsSitNFe")
+    xml_retorno = ret.xml_retorno
 
     return NFeConsultaResult(
-        cStat=cstat,
-        xMotivo=xmot,
+        cStat=ret.cStat,
+        xMotivo=ret.xMotivo,
         xml_envio=xml_envio,
         xml_retorno=xml_retorno,
+        chave=chave,
     )
+
+
+# ----------------------------------------------------------------------
+# Consulta em lote (resultados na ordem em que terminam)
+# ----------------------------------------------------------------------
+def sefaz_nfe_consulta_lote(
+    chaves: Iterable[str],
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str = "2",
+    cache: Optional[CacheTTL] = None,
+    max_por_uf: int = 4,
+) -> Iterator[NFeConsultaResult]:
+    """
+    Consulta a situação de várias chaves e devolve cada resultado assim
+    que fica pronto.
+
+    - a UF sai da própria chave; chaves repetidas são consultadas uma vez;
+    - só NF-e (modelo 55): chave de NFC-e (65) volta com cStat=None e o
+      motivo em xMotivo, sem ir ao endpoint de NF-e;
+    - o que está no cache sai primeiro, sem ir à SEFAZ;
+    - cada UF tem seu próprio pool de max_por_uf threads, então uma UF
+      lenta (ou pausada por 656) não segura as demais;
+    - chave inválida ou falha de consulta vira NFeConsultaResult com
+      cStat=None e o erro em xMotivo.
+    """
+    por_uf: Dict[str, List[str]] = {}
+    for chave in dict.fromkeys((c or "").strip() for c in chaves):
+        if not chave:
+            continue
+        try:
+            uf, modelo = uf_modelo_da_chave(chave)
+            if modelo not in MODELOS_CONSULTA:
+                raise ValueError(
+                    f"Consulta de NFC-e (modelo {modelo}) não suportada: "
+                    "não há endpoint de NFeConsultaProtocolo4 para NFC-e"
+                )
+        except ValueError as e:
+            yield NFeConsultaResult(
+                cStat=None, xMotivo=str(e), xml_envio="", xml_retorno="", chave=chave
+            )
+            continue
+
+        em_cache = cache.get((ambiente, chave)) if cache is not None else None
+        if em_cache is not None:
+            em_cache["cache"] = True
+            em_cache["chave"] = chave
+            yield NFeConsultaResult(**em_cache)
+        else:
+            por_uf.setdefault(uf, []).append(chave)
+
+    if not por_uf:
+        return
+
+    def _consultar(uf: str, chave: str) -> NFeConsultaResult:
+        try:
+            return sefaz_nfe_consulta(
+                uf=uf,
+                chave=chave,
+                pfx_path=pfx_path,
+                pfx_password=pfx_password,
+                ambiente=ambiente,
+                cache=cache,
+            )
+        except Exception as e:
+            return NFeConsultaResult(
+                cStat=None,
+                xMotivo=f"Erro ao consultar NFe por chave: {e}",
+                xml_envio="",
+                xml_retorno="",
+                chave=chave,
+            )
+
+    executores = {
+        uf: ThreadPoolExecutor(max_workers=max(1, max_por_uf), thread_name_prefix=f"consulta-{uf}")
+        for uf in por_uf
+    }
+    consultar = propagar_contexto(_consultar)
+    try:
+        futuros: List[Future] = [
+            executores[uf].submit(consultar, uf, chave)
+            for uf, lista in por_uf.items()
+            for chave in lista
+        ]
+        for fut in as_completed(futuros):
+            yield fut.result()
+    finally:
+        # se o consumidor desistir no meio, não dispara o restante
+        for ex in executores.values():
+            ex.shutdown(wait=False, cancel_futures=True)
@@ -5,16 +5,16 @@ from dataclasses import dataclass
 from typing import Optional
 import re
 
-from lxml import etree
-
-from .assinatura import assinar_nfe_xml
+from .assinatura import assinar_nfe
 from .envio import (
     montar_envi_nfe_xml,
     montar_soap_envelope,
     enviar_soap_com_pfx,
-    extrair_xml_resultado,
     EndpointInfo,
 )
+from .metricas import etapa, instrumentar
+from .protocolo import montar_nfe_proc
+from .resposta import ler_resposta
 from .soaplist import get_nfe_autorizacao4_endpoint
 
 
@@ -25,6 +25,11 @@ class NFeEnvioResult:
     xml_retorno: str
     status: Optional[int]
     motivo: Optional[str]
+    nProt: Optional[str] = None           # protocolo, no envio síncrono
+    xml_nfe_proc: Optional[str] = None    # nfeProc, se autorizada (100/150)
+    chNFe: Optional[str] = None           # chave do protNFe, no envio síncrono
+    nRec: Optional[str] = None            # recibo, no envio assíncrono (103)
+    tMed: Optional[int] = None            # tempo médio de resposta do lote (s)
 
 
 def _resolver_cuf(xml_nfe: str, uf: str) -> str:
@@ -42,21 +47,16 @@ def _resolver_cuf(xml_nfe: str, uf: str) -> str:
     return UF_TO_CUF.get(uf.upper(), "")
 
 
-def _obter_status_motivo(xml_retorno: str):
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except:
-        return None, None
+def _int_ou_none(txt: Optional[str]) -> Optional[int]:
+    return int(txt) if txt and txt.isdigit() else None
 
-    cstat = root.find(".//cStat")
-    xmot = root.find(".//xMotivo")
 
-    return (
-        int(cstat.text.strip()) if cstat is not None else None,
-        xmot.text.strip() if xmot is not None else None,
-    )
+def _modelo_do_xml(xml_nfe: str) -> str:
+    m = re.search(r"<mod>(\d{2})</mod>", xml_nfe)
+    return m.group(1) if m else ""
 
 
+@instrumentar("NFeAutorizacao4", modelo=lambda a: _modelo_do_xml(a["xml_nfe"]))
 def sefaz_nfe_envio(
     xml_nfe: str,
     uf: str,
@@ -69,35 +69,37 @@ def sefaz_nfe_envio(
     **kwargs,
 ) -> NFeEnvioResult:
 
-    # 1) Assinar
-    xml_assinado = assinar_nfe_xml(xml_nfe, pfx_path, pfx_password)
+    # 1) Assinar (a árvore assinada serve depois ao nfeProc)
+    xml_assinado, nfe_assinada = assinar_nfe(xml_nfe, pfx_path, pfx_password)
 
     if not xml_assinado.strip():
         raise RuntimeError("Falha ao assinar NFe.")
 
-    # 2) Montar enviNFe — incorporando o XML assinado INTACTO
-    xml_envi_nfe = montar_envi_nfe_xml(
-        nfe_assinada=xml_assinado,
-        versao=versao,
-        id_lote=id_lote,
-        ind_sinc=True,
-    )
-
-    # ❗ NÃO modificar assinatura
-    # (compactar_assinatura_no_envio foi removido)
-
-    # 3) Endpoint
+    # 2) Endpoint
     endpoint: EndpointInfo = get_nfe_autorizacao4_endpoint(uf=uf, ambiente=ambiente)
 
-    # 4) cUF
+    # 3) cUF
     c_uf = _resolver_cuf(xml_nfe, uf)
 
-    # 5) SOAP
-    soap_xml = montar_soap_envelope(
-        envi_nfe_xml=xml_envi_nfe,
-        c_uf=c_uf,
-        versao_dados=versao,
-    )
+    with etapa("envelope"):
+        # 4) Montar enviNFe — incorporando o XML assinado INTACTO
+        xml_envi_nfe = montar_envi_nfe_xml(
+            nfe_assinada=xml_assinado,
+            versao=versao,
+            id_lote=id_lote,
+            # envio_sinc=False → lote assíncrono (retorna nRec para NFeRetAutorizacao4)
+            ind_sinc=True if envio_sinc is None else bool(envio_sinc),
+        )
+
+        # ❗ NÃO modificar assinatura
+        # (compactar_assinatura_no_envio foi removido)
+
+        # 5) SOAP
+        soap_xml = montar_soap_envelope(
+            envi_nfe_xml=xml_envi_nfe,
+            c_uf=c_uf,
+            versao_dados=versao,
+        )
 
     # 6) Enviar
     resp = enviar_soap_com_pfx(
@@ -108,9 +110,17 @@ def sefaz_nfe_envio(
     )
 
     # 7) Extrair retorno
-    xml_retorno = extrair_xml_resultado(resp.text)
-
-    status, motivo = _obter_status_motivo(xml_retorno)
+    ret = ler_resposta(resp.content, "retEnviNFe")
+    xml_retorno = ret.xml_retorno
+    status, motivo = ret.cStat, ret.xMotivo
+
+    # Envio síncrono: o protNFe já vem no retEnviNFe; o nfeProc sai das
+    # árvores já lidas (NFe assinada e payload), sem novo parse
+    n_prot = ret.texto("nfe:protNFe/nfe:infProt/nfe:nProt")
+    xml_nfe_proc = None
+    if n_prot and ret.texto("nfe:protNFe/nfe:infProt/nfe:cStat") in ("100", "150"):
+        with etapa("proc"):
+            xml_nfe_proc = montar_nfe_proc(nfe_assinada, ret.payload)
 
     return NFeEnvioResult(
         xml_assinado=xml_assinado,
@@ -118,4 +128,9 @@ def sefaz_nfe_envio(
         xml_retorno=xml_retorno,
         status=status,
         motivo=motivo,
+        nProt=n_prot,
+        xml_nfe_proc=xml_nfe_proc,
+        chNFe=ret.texto("nfe:protNFe/nfe:infProt/nfe:chNFe"),
+        nRec=ret.texto("nfe:infRec/nfe:nRec"),
+        tMed=_int_ou_none(ret.texto("nfe:infRec/nfe:tMed")),
     )
@@ -1,24 +1,41 @@
 # sefaz_service/core/nfe_evento.py
 from __future__ import annotations
 
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from datetime import datetime
 from lxml import etree
 
 from sefaz_service.nfe.assinatura import NFeXmlSigner
 
+from .envelope import montar_envelope_soap
+from .metricas import etapa, instrumentar
+from .rastreamento import propagar_contexto, rastrear
 from .envio import (
     enviar_soap_com_pfx,
-    extrair_xml_resultado,
     EndpointInfo,
 )
-from .soaplist import get_nfe_autorizacao4_endpoint
+from .resposta import RespostaSefaz, ler_resposta
+from .soaplist import get_nfe_autorizacao4_endpoint, get_nfe_recepcao_evento_an_endpoint
 
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+EVENTO_WSDL_NS = "http://www.portalfiscal.inf.br/nfe/wsdl/NFeRecepcaoEvento4"
 NSMAP = {"nfe": NFE_NS}
 
+# Leiaute do envEvento: até 20 eventos por lote
+MAX_EVENTOS_LOTE = 20
+
+# Manifestação do destinatário (enviada ao AN, cOrgao 91)
+DESC_MANIFESTACAO = {
+    "210200": "Confirmacao da Operacao",
+    "210210": "Ciencia da Operacao",
+    "210220": "Desconhecimento da Operacao",
+    "210240": "Operacao nao Realizada",
+}
+
 
 # ----------------------------------------------------------------------
 # MODELOS
@@ -34,13 +51,15 @@ class EventoRequest:
         - "110110" = Carta de Correcao
         - "110111" = Cancelamento
         - "110112" = Cancelamento por substituição
+        - "210200", "210210", "210220", "210240" = Manifestação do destinatário
+          (cOrgao "91"; xJust obrigatório no 210240)
     """
 
     tpAmb: str          # "1" produção, "2" homologação
     cOrgao: str        # código da UF (ex.: "12" para AC)
     CNPJ: str
     chNFe: str
-    tpEvento: str      # 110110, 110111 ou 110112
+    tpEvento: str      # 110110, 110111, 110112 ou 2102xx
     nSeqEvento: int
     # Campos genéricos (usados conforme o tipo de evento)
     xJust: Optional[str] = None       # usado em cancelamentos
@@ -61,6 +80,18 @@ class EventoResult:
     nProt_evento: Optional[str]
 
 
+@dataclass
+class EventoPendente:
+    """
+    Evento aguardando envio em lote. Eventos com a mesma UF, cOrgao,
+    certificado e ambiente vão juntos no mesmo envEvento.
+    """
+    req: EventoRequest
+    uf: str
+    pfx_path: str
+    pfx_password: str
+
+
 # ----------------------------------------------------------------------
 # HELPERS
 # ----------------------------------------------------------------------
@@ -84,6 +115,7 @@ def _dh_evento_now() -> str:
 # ----------------------------------------------------------------------
 
 
+@rastrear()
 def montar_env_evento_xml(req: EventoRequest) -> str:
     """
     Monta o XML <envEvento> para um único evento (lote com 1 evento).
@@ -92,21 +124,57 @@ def montar_env_evento_xml(req: EventoRequest) -> str:
       - Cancelamento por substituição (110112)
       - Carta de Correção (110110)
     """
-    CNPJ = _only_digits(req.CNPJ).zfill(14)
-    chNFe = req.chNFe.strip()
-    nSeq = int(req.nSeqEvento)
+    return montar_env_evento_lote_xml([req])
 
-    # ID = "ID" + tpEvento + chNFe + nSeqEvento(2)
-    Id = f"ID{req.tpEvento}{chNFe}{nSeq:02d}"
+
+@rastrear()
+def montar_env_evento_lote_xml(reqs: List[EventoRequest], id_lote: str = "1") -> str:
+    """
+    Monta o XML <envEvento> com até MAX_EVENTOS_LOTE eventos.
+    """
+    if not reqs:
+        raise ValueError("Lote de eventos vazio")
+    if len(reqs) > MAX_EVENTOS_LOTE:
+        raise ValueError(f"Lote com {len(reqs)} eventos (máximo {MAX_EVENTOS_LOTE})")
 
     env = etree.Element(
         "{http://www.portalfiscal.inf.br/nfe}envEvento",
         versao="1.00",
         nsmap={None: NFE_NS},
     )
-    etree.SubElement(env, "{http://www.portalfiscal.inf.br/nfe}idLote").text = "1"
+    etree.SubElement(env, "{http://www.portalfiscal.inf.br/nfe}idLote").text = id_lote
+
+    for req in reqs:
+        _montar_evento_el(req, parent=env)
+
+    xml_bytes = etree.tostring(env, encoding="utf-8", xml_declaration=True)
+    return xml_bytes.decode("utf-8")
+
+
+def montar_evento_xml(req: EventoRequest) -> str:
+    """
+    Monta só o <evento> (sem envEvento), para ser assinado isoladamente
+    e depois juntado a outros no mesmo lote.
+    """
+    evento = _montar_evento_el(req)
+    return etree.tostring(evento, encoding="utf-8").decode("utf-8")
+
+
+def _montar_evento_el(req: EventoRequest, parent: Optional[etree._Element] = None) -> etree._Element:
+    CNPJ = _only_digits(req.CNPJ).zfill(14)
+    chNFe = req.chNFe.strip()
+    nSeq = int(req.nSeqEvento)
 
-    evento = etree.SubElement(env, "{http://www.portalfiscal.inf.br/nfe}evento")
+    # ID = "ID" + tpEvento + chNFe + nSeqEvento(2)
+    Id = f"ID{req.tpEvento}{chNFe}{nSeq:02d}"
+
+    if parent is None:
+        evento = etree.Element(
+            "{http://www.portalfiscal.inf.br/nfe}evento",
+            nsmap={None: NFE_NS},
+        )
+    else:
+        evento = etree.SubElement(parent, "{http://www.portalfiscal.inf.br/nfe}evento")
     evento.set("versao", "1.00")
 
     inf_evento = etree.SubElement(
@@ -159,13 +227,17 @@ def montar_env_evento_xml(req: EventoRequest) -> str:
             "II - a correcao de dados cadastrais que implique mudanca do remetente "
             "ou do destinatario; III - a data de emissao ou de saida."
         )
+    elif req.tpEvento in DESC_MANIFESTACAO:
+        # Manifestação do destinatário
+        etree.SubElement(det, "{http://www.portalfiscal.inf.br/nfe}descEvento").text = DESC_MANIFESTACAO[req.tpEvento]
+        if req.tpEvento == "210240":
+            etree.SubElement(det, "{http://www.portalfiscal.inf.br/nfe}xJust").text = req.xJust or ""
     else:
         # Caso queira suportar outros eventos no futuro
         etree.SubElement(det, "{http://www.portalfiscal.inf.br/nfe}descEvento").text = "Evento"
         etree.SubElement(det, "{http://www.portalfiscal.inf.br/nfe}xJust").text = req.xJust or ""
 
-    xml_bytes = etree.tostring(env, encoding="utf-8", xml_declaration=True)
-    return xml_bytes.decode("utf-8")
+    return evento
 
 
 # ----------------------------------------------------------------------
@@ -179,7 +251,8 @@ def assinar_evento_xml(xml_env: str, pfx_path: str, pfx_password: str) -> str:
     da NFe (classe NFeXmlSigner).
     """
     signer = NFeXmlSigner(pfx_path=pfx_path, pfx_password=pfx_password)
-    return signer.assinar_inf_evento(xml_env)
+    with etapa("assinatura", "assinar_evento_xml"):
+        return signer.assinar_inf_evento(xml_env)
 
 
 # ----------------------------------------------------------------------
@@ -191,7 +264,11 @@ def _get_evento_endpoint(uf_sigla: str, ambiente: str) -> EndpointInfo:
     """
     Usa o mesmo mapeamento de UF/ambiente da autorização, trocando apenas
     o caminho para o serviço de eventos (NFeRecepcaoEvento4).
+    Para uf="AN" usa o Ambiente Nacional (manifestação do destinatário).
     """
+    if (uf_sigla or "").upper() == "AN":
+        return get_nfe_recepcao_evento_an_endpoint(ambiente)
+
     aut_ep = get_nfe_autorizacao4_endpoint(uf_sigla, ambiente)
 
     url = aut_ep.url
@@ -206,11 +283,20 @@ def _get_evento_endpoint(uf_sigla: str, ambiente: str) -> EndpointInfo:
     return EndpointInfo(url=url, soap_action=soap_action)
 
 
+def _montar_soap_evento(xml_env_evento: str) -> bytes:
+    return montar_envelope_soap(xml_env_evento, EVENTO_WSDL_NS)
+
+
 # ----------------------------------------------------------------------
 # ENVIO COMPLETO (equivalente ao sefaz_nfe_envio)
 # ----------------------------------------------------------------------
 
 
+@instrumentar(
+    "NFeRecepcaoEvento4",
+    ambiente=lambda a: a["req"].tpAmb,
+    modelo=lambda a: a["req"].chNFe[20:22],
+)
 def sefaz_enviar_evento(
     req: EventoRequest,
     uf: str,
@@ -235,16 +321,7 @@ def sefaz_enviar_evento(
     endpoint = _get_evento_endpoint(uf_sigla=uf, ambiente=req.tpAmb)
 
     # 4) SOAP envelope específico para RecepcaoEvento4
-    soap_xml = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                 xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-                 xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Body>
-    <nfeDadosMsg xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeRecepcaoEvento4">
-      {xml_assinado}
-    </nfeDadosMsg>
-  </soap12:Body>
-</soap12:Envelope>"""
+    soap_xml = _montar_soap_evento(xml_assinado)
 
     # 5) Enviar usando a MESMA função da NFe (enviar_soap_com_pfx)
     resp = enviar_soap_com_pfx(
@@ -254,12 +331,11 @@ def sefaz_enviar_evento(
         pfx_password=pfx_password,
     )
 
-    # 6) Extrair o XML puro do resultado (igual na NFe)
-    xml_retorno = extrair_xml_resultado(resp.text)
+    # 6) retEnvEvento extraído do SOAP (um único parse)
+    ret = ler_resposta(resp.content, "retEnvEvento")
+    xml_retorno = ret.xml_retorno
 
-    cStat_lote, xMotivo_lote, cStat_evento, xMotivo_evento, nProt_evento = _parse_evento_retorno(
-        xml_retorno
-    )
+    cStat_lote, xMotivo_lote, cStat_evento, xMotivo_evento, nProt_evento = _parse_evento_retorno(ret)
 
     return EventoResult(
         xml_envio=xml_envio,
@@ -273,43 +349,220 @@ def sefaz_enviar_evento(
     )
 
 
+# ----------------------------------------------------------------------
+# ENVIO EM LOTE (até 20 eventos por envEvento)
+# ----------------------------------------------------------------------
+
+
+ChaveEvento = Tuple[str, str, int]   # (chNFe, tpEvento, nSeqEvento)
+GrupoEventos = Tuple[str, str, str, str, str]   # (uf, cOrgao, pfx, senha, tpAmb)
+
+
+def _chave_evento(req: EventoRequest) -> ChaveEvento:
+    return req.chNFe.strip(), req.tpEvento, int(req.nSeqEvento)
+
+
+def _novo_id_lote() -> str:
+    # idLote tem até 15 dígitos
+    return str(time.time_ns() // 1000)[-15:]
+
+
+def _assinar_evento_isolado(p: EventoPendente) -> Tuple[str, str]:
+    """
+    Monta e assina um <evento> sozinho; a assinatura fica dentro dele,
+    então vários eventos assinados podem ir no mesmo envEvento.
+    """
+    xml_evento = montar_evento_xml(p.req)
+    return xml_evento, assinar_evento_xml(xml_evento, p.pfx_path, p.pfx_password)
+
+
+def _enviar_lote_assinado(
+    eventos_assinados: List[str],
+    uf: str,
+    ambiente: str,
+    pfx_path: str,
+    pfx_password: str,
+) -> Tuple[str, RespostaSefaz]:
+    """
+    Junta os <evento> assinados num envEvento e envia. Retorna
+    (xml_env_evento, retEnvEvento lido).
+    """
+    xml_lote = (
+        f'<envEvento versao="1.00" xmlns="{NFE_NS}">'
+        f"<idLote>{_novo_id_lote()}</idLote>"
+        + "".join(eventos_assinados)
+        + "</envEvento>"
+    )
+    endpoint = _get_evento_endpoint(uf_sigla=uf, ambiente=ambiente)
+    resp = enviar_soap_com_pfx(
+        endpoint=endpoint,
+        soap_xml=_montar_soap_evento(xml_lote),
+        pfx_path=pfx_path,
+        pfx_password=pfx_password,
+    )
+    return xml_lote, ler_resposta(resp.content, "retEnvEvento")
+
+
+def sefaz_enviar_eventos_lote(
+    pendentes: List[EventoPendente],
+    max_workers: int = 4,
+) -> List[EventoResult]:
+    """
+    Envia muitos eventos (cancelamentos, CC-e...) usando lotes de até
+    MAX_EVENTOS_LOTE eventos por envEvento.
+
+    1) agrupa por (UF, cOrgao, certificado, ambiente);
+    2) assina os eventos em paralelo, cada <evento> isolado;
+    3) envia os lotes (em paralelo entre grupos/lotes);
+    4) separa cada <retEvento> e devolve ao evento correspondente.
+
+    Retorna um EventoResult por evento, na ordem de `pendentes`. Nele,
+    xml_envio/xml_assinado são do próprio evento e xml_retorno é o seu
+    <retEvento>; cStat_lote/xMotivo_lote são do lote em que ele foi.
+    Falha de um lote vira cStat_lote=None com o erro em xMotivo_lote.
+
+    Eventos repetidos (mesma chNFe, tpEvento e nSeqEvento) não são
+    enviados: só o primeiro segue, os demais voltam como falha.
+    """
+    resultados: List[Optional[EventoResult]] = [None] * len(pendentes)
+
+    def _falha(motivo: str, xml_envio: str = "", xml_assinado: str = "") -> EventoResult:
+        return EventoResult(
+            xml_envio=xml_envio,
+            xml_assinado=xml_assinado,
+            xml_retorno="",
+            cStat_lote=None,
+            xMotivo_lote=motivo,
+            cStat_evento=None,
+            xMotivo_evento=None,
+            nProt_evento=None,
+        )
+
+    # o retEvento volta para o evento pela tripla (chNFe, tpEvento, nSeq):
+    # repetidas colidiriam no mesmo lote (e a SEFAZ recusaria por duplicidade)
+    primeiros: Dict[ChaveEvento, int] = {}
+    grupos: Dict[GrupoEventos, List[int]] = {}
+    for i, p in enumerate(pendentes):
+        chave = _chave_evento(p.req)
+        if chave in primeiros:
+            resultados[i] = _falha(
+                f"Evento repetido: mesma chNFe, tpEvento e nSeqEvento do item {primeiros[chave]}"
+            )
+            continue
+        primeiros[chave] = i
+        grupo = (p.uf.upper(), p.req.cOrgao, p.pfx_path, p.pfx_password, p.req.tpAmb)
+        grupos.setdefault(grupo, []).append(i)
+
+    lotes: List[Tuple[GrupoEventos, List[int]]] = [
+        (grupo, indices[n:n + MAX_EVENTOS_LOTE])
+        for grupo, indices in grupos.items()
+        for n in range(0, len(indices), MAX_EVENTOS_LOTE)
+    ]
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        # 1) assinaturas em paralelo
+        assinados: Dict[int, Tuple[str, str]] = {}
+        assinar = propagar_contexto(_assinar_evento_isolado)
+        futuros = {
+            i: ex.submit(assinar, p) for i, p in enumerate(pendentes) if resultados[i] is None
+        }
+        for i, fut in futuros.items():
+            try:
+                assinados[i] = fut.result()
+            except Exception as e:
+                resultados[i] = _falha(f"Erro ao assinar evento: {e}")
+
+        # 2) envio dos lotes
+        def _enviar(grupo: GrupoEventos, indices: List[int]) -> None:
+            indices = [i for i in indices if i in assinados]
+            if not indices:
+                return
+            uf, _, pfx_path, pfx_password, ambiente = grupo
+            try:
+                _, ret_lote = _enviar_lote_assinado(
+                    [assinados[i][1] for i in indices], uf, ambiente, pfx_path, pfx_password
+                )
+            except Exception as e:
+                for i in indices:
+                    resultados[i] = _falha(f"Erro ao enviar lote de eventos: {e}", *assinados[i])
+                return
+
+            xml_retorno = ret_lote.xml_payload() or ""
+            cStat_lote, xMotivo_lote, por_evento = _parse_eventos_lote_retorno(ret_lote)
+            for i in indices:
+                ret = por_evento.get(_chave_evento(pendentes[i].req))
+                cStat_ev, xMotivo_ev, nProt_ev, xml_ret_ev = ret or (None, None, None, xml_retorno)
+                resultados[i] = EventoResult(
+                    xml_envio=assinados[i][0],
+                    xml_assinado=assinados[i][1],
+                    xml_retorno=xml_ret_ev,
+                    cStat_lote=cStat_lote,
+                    xMotivo_lote=xMotivo_lote,
+                    cStat_evento=cStat_ev,
+                    xMotivo_evento=xMotivo_ev,
+                    nProt_evento=nProt_ev,
+                )
+
+        list(ex.map(propagar_contexto(lambda lote: _enviar(*lote)), lotes))
+
+    return resultados  # type: ignore[return-value]
+
+
 # ----------------------------------------------------------------------
 # PARSE DO RETORNO
 # ----------------------------------------------------------------------
 
 
-def _parse_evento_retorno(xml_retorno: str):
+def _parse_evento_retorno(ret: RespostaSefaz):
     """
     Extrai:
       - cStat / xMotivo do lote (retEnvEvento)
       - cStat / xMotivo / nProt do evento (infEvento)
     """
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except Exception:
+    if ret.payload is None:
         return None, None, None, None, None
 
-    # retEnvEvento
-    ret_env = root.find(".//{http://www.portalfiscal.inf.br/nfe}retEnvEvento")
-    if ret_env is None:
-        return None, None, None, None, None
-
-    cStat_lote_el = ret_env.find("{http://www.portalfiscal.inf.br/nfe}cStat")
-    xMotivo_lote_el = ret_env.find("{http://www.portalfiscal.inf.br/nfe}xMotivo")
-
-    cStat_lote = int(cStat_lote_el.text.strip()) if cStat_lote_el is not None else None
-    xMotivo_lote = xMotivo_lote_el.text.strip() if xMotivo_lote_el is not None else None
-
-    inf_evento = ret_env.find(".//{http://www.portalfiscal.inf.br/nfe}infEvento")
-    if inf_evento is None:
-        return cStat_lote, xMotivo_lote, None, None, None
+    cStat_evento = ret.texto("nfe:retEvento/nfe:infEvento/nfe:cStat")
+    return (
+        ret.cStat,
+        ret.xMotivo,
+        int(cStat_evento) if cStat_evento and cStat_evento.isdigit() else None,
+        ret.texto("nfe:retEvento/nfe:infEvento/nfe:xMotivo"),
+        ret.texto("nfe:retEvento/nfe:infEvento/nfe:nProt"),
+    )
 
-    cStat_evento_el = inf_evento.find("{http://www.portalfiscal.inf.br/nfe}cStat")
-    xMotivo_evento_el = inf_evento.find("{http://www.portalfiscal.inf.br/nfe}xMotivo")
-    nProt_el = inf_evento.find("{http://www.portalfiscal.inf.br/nfe}nProt")
 
-    cStat_evento = int(cStat_evento_el.text.strip()) if cStat_evento_el is not None else None
-    xMotivo_evento = xMotivo_evento_el.text.strip() if xMotivo_evento_el is not None else None
-    nProt_evento = nProt_el.text.strip() if nProt_el is not None else None
+def _parse_eventos_lote_retorno(
+    ret: RespostaSefaz,
+) -> Tuple[Optional[int], Optional[str], Dict[ChaveEvento, Tuple[Optional[int], Optional[str], Optional[str], str]]]:
+    """
+    Para um retEnvEvento com vários <retEvento>, extrai:
+      - cStat / xMotivo do lote
+      - por (chNFe, tpEvento, nSeqEvento): (cStat, xMotivo, nProt, xml do retEvento)
+    """
+    ret_env = ret.payload
+    if ret_env is None:
+        return None, None, {}
+
+    por_evento: Dict[ChaveEvento, Tuple[Optional[int], Optional[str], Optional[str], str]] = {}
+    for ret_evento in ret_env.findall("nfe:retEvento", NSMAP):
+        inf = ret_evento.find("nfe:infEvento", NSMAP)
+        if inf is None:
+            continue
+        cStat = (inf.findtext("nfe:cStat", default="", namespaces=NSMAP) or "").strip()
+        nSeq = (inf.findtext("nfe:nSeqEvento", default="", namespaces=NSMAP) or "").strip()
+        chave = (
+            (inf.findtext("nfe:chNFe", default="", namespaces=NSMAP) or "").strip(),
+            (inf.findtext("nfe:tpEvento", default="", namespaces=NSMAP) or "").strip(),
+            int(nSeq) if nSeq.isdigit() else 1,
+        )
+        xMotivo = inf.findtext("nfe:xMotivo", namespaces=NSMAP)
+        nProt = inf.findtext("nfe:nProt", namespaces=NSMAP)
+        por_evento[chave] = (
+            int(cStat) if cStat.isdigit() else None,
+            xMotivo.strip() if xMotivo else None,
+            nProt.strip() if nProt else None,
+            etree.tostring(ret_evento, encoding="utf-8").decode("utf-8"),
+        )
 
-    return cStat_lote, xMotivo_lote, cStat_evento, xMotivo_evento, nProt_evento
+    return ret.cStat, ret.xMotivo, por_evento
@@ -1,10 +1,20 @@
 # sefaz_service/core/nfe_gtin.py
 from __future__ import annotations
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from typing import Iterable, Iterator, Optional
+
 from lxml import etree
-from dataclasses import dataclass
 
-from .envio import enviar_soap_com_pfx, extrair_xml_resultado, EndpointInfo
+from .cache import CacheTTL
+from .envelope import montar_envelope_soap
+from .envio import enviar_soap_com_pfx, EndpointInfo
+from .parser_xml import ler_xml
+from .rastreamento import propagar_contexto
+from .resposta import ler_resposta
+
+GTIN_WSDL_NS = "http://www.portalfiscal.inf.br/nfe/wsdl/ccgConsGtin"
 
 GTIN_ENDPOINT = EndpointInfo(
     url="https://dfe-servico.svrs.rs.gov.br/ws/ccgConsGTIN/ccgConsGTIN.asmx",
@@ -12,12 +22,23 @@ GTIN_ENDPOINT = EndpointInfo(
 )
 
 
+# 9490 = consulta realizada com sucesso (GTIN encontrado)
+CSTAT_GTIN_ENCONTRADO = 9490
+# Indisponibilidade momentânea – nunca vai para o cache
+CSTAT_GTIN_TRANSITORIOS = {108, 109, 656, 999}
+
+TTL_GTIN = 30 * 24 * 3600.0          # GTIN encontrado
+TTL_GTIN_NEGATIVO = 24 * 3600.0      # GTIN inexistente / inválido
+
+
 @dataclass
 class GtinResult:
     status: int | None
     motivo: str | None
     xml_envio: str
     xml_retorno: str
+    gtin: str = ""
+    cache: bool = False
 
 
 # ----------------------------------------------------------------------
@@ -42,21 +63,8 @@ def montar_xml_gtin(gtin: str) -> str:
 # ----------------------------------------------------------------------
 # SOAP envelope (ccgConsGTIN) – igual ao Harbour
 # ----------------------------------------------------------------------
-def montar_soap_gtin(xml_envio: str) -> str:
-    xml_envio = xml_envio.strip()
-
-    return f"""<?xml version="1.0" encoding="UTF-8"?>
-<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                 xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-                 xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Body>
-    <ccgConsGTIN xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/ccgConsGtin">
-      <nfeDadosMsg>
-        {xml_envio}
-      </nfeDadosMsg>
-    </ccgConsGTIN>
-  </soap12:Body>
-</soap12:Envelope>"""
+def montar_soap_gtin(xml_envio: str) -> bytes:
+    return montar_envelope_soap(xml_envio, GTIN_WSDL_NS, operacao="ccgConsGTIN")
 
 
 # ----------------------------------------------------------------------
@@ -91,7 +99,58 @@ def _get_text_any_ns(root: etree._Element, local_name: str) -> str | None:
 # ----------------------------------------------------------------------
 # Envio completo + parse robusto
 # ----------------------------------------------------------------------
-def sefaz_consulta_gtin(gtin: str, pfx_path: str, pfx_password: str) -> GtinResult:
+def _ttl_gtin(res: GtinResult) -> Optional[float]:
+    """
+    TTL de cache para o resultado, ou None se não deve ser guardado.
+    """
+    if res.status is None or res.status in CSTAT_GTIN_TRANSITORIOS:
+        return None
+    if res.status == CSTAT_GTIN_ENCONTRADO:
+        return TTL_GTIN
+    return TTL_GTIN_NEGATIVO
+
+
+def sefaz_consulta_gtin(
+    gtin: str,
+    pfx_path: str,
+    pfx_password: str,
+    cache: Optional[CacheTTL] = None,
+) -> GtinResult:
+    """
+    Consulta um GTIN no cadastro centralizado (ccgConsGTIN – SVRS).
+
+    Com `cache`, respostas definitivas ficam guardadas: GTIN encontrado
+    por TTL_GTIN, inexistente/inválido por TTL_GTIN_NEGATIVO.
+    """
+    gtin = (gtin or "").strip()
+
+    # 0) cache
+    if cache is not None:
+        em_cache = cache.get(gtin)
+        if em_cache is not None:
+            em_cache["cache"] = True
+            return GtinResult(**em_cache)
+
+    return _consulta_gtin_e_guarda(gtin, pfx_path, pfx_password, cache)
+
+
+def _consulta_gtin_e_guarda(
+    gtin: str, pfx_path: str, pfx_password: str, cache: Optional[CacheTTL]
+) -> GtinResult:
+    """
+    Consulta na SVRS (sem ler o cache) e grava a resposta definitiva no cache.
+    """
+    res = _consulta_gtin_sefaz(gtin, pfx_path, pfx_password)
+
+    if cache is not None:
+        ttl = _ttl_gtin(res)
+        if ttl is not None:
+            cache.set(gtin, asdict(res), ttl=ttl)
+
+    return res
+
+
+def _consulta_gtin_sefaz(gtin: str, pfx_path: str, pfx_password: str) -> GtinResult:
     # 1) XML de envio
     xml_envio = montar_xml_gtin(gtin)
 
@@ -106,11 +165,19 @@ def sefaz_consulta_gtin(gtin: str, pfx_path: str, pfx_password: str) -> GtinResu
         pfx_password=pfx_password,
     )
 
-    # 4) Extrai XML interno do SOAP; se falhar, fica com texto bruto
-    try:
-        xml_ret = extrair_xml_resultado(resp.text)
-    except Exception:
-        xml_ret = resp.text or ""
+    # 4) Retorno no formato esperado (retConsGTIN): parse único com XPath
+    #    compilado; se não vier, fica com o texto bruto
+    ret = ler_resposta(resp.content, "retConsGTIN")
+    if ret.payload is not None:
+        return GtinResult(
+            status=ret.cStat,
+            motivo=ret.xMotivo,
+            xml_envio=xml_envio,
+            xml_retorno=ret.xml_payload() or "",
+            gtin=gtin,
+        )
+
+    xml_ret = ret.xml_bruto
 
     status: int | None = None
     motivo: str | None = None
@@ -122,6 +189,7 @@ def sefaz_consulta_gtin(gtin: str, pfx_path: str, pfx_password: str) -> GtinResu
             motivo=None,
             xml_envio=xml_envio,
             xml_retorno=xml_ret,
+            gtin=gtin,
         )
 
     # Se não for XML (pode ser HTML de erro, texto, etc.)
@@ -131,11 +199,12 @@ def sefaz_consulta_gtin(gtin: str, pfx_path: str, pfx_password: str) -> GtinResu
             motivo=None,
             xml_envio=xml_envio,
             xml_retorno=xml_ret,
+            gtin=gtin,
         )
 
     # 5) Tentar interpretar cStat / xMotivo com tolerância a namespace
     try:
-        root = etree.fromstring(xml_ret.encode("utf-8"))
+        root = ler_xml(resp.content)
 
         cstat_txt = _get_text_any_ns(root, "cStat")
         xmot_txt = _get_text_any_ns(root, "xMotivo")
@@ -155,4 +224,63 @@ def sefaz_consulta_gtin(gtin: str, pfx_path: str, pfx_password: str) -> GtinResu
         motivo=motivo,
         xml_envio=xml_envio,
         xml_retorno=xml_ret,
+        gtin=gtin,
     )
+
+
+# ----------------------------------------------------------------------
+# Consulta em lote (resultados na ordem em que terminam)
+# ----------------------------------------------------------------------
+def sefaz_consulta_gtin_lote(
+    gtins: Iterable[str],
+    pfx_path: str,
+    pfx_password: str,
+    cache: Optional[CacheTTL] = None,
+    max_concorrencia: int = 4,
+) -> Iterator[GtinResult]:
+    """
+    Consulta vários GTINs e devolve cada GtinResult assim que fica pronto.
+
+    - GTINs repetidos são consultados uma vez;
+    - o que está no cache sai primeiro, sem ir à SVRS;
+    - no máximo `max_concorrencia` chamadas simultâneas; o ritmo contra
+      a SVRS é o do balde ccgConsGtin do limitador do transporte
+      (SEFAZ_RATE_LIMITS), compartilhado com as demais consultas;
+    - falha de uma consulta vira GtinResult com status=None.
+    """
+    pendentes = []
+    for gtin in dict.fromkeys((g or "").strip() for g in gtins):
+        if not gtin:
+            continue
+        em_cache = cache.get(gtin) if cache is not None else None
+        if em_cache is not None:
+            em_cache["cache"] = True
+            yield GtinResult(**em_cache)
+        else:
+            pendentes.append(gtin)
+
+    if not pendentes:
+        return
+
+    def _consultar(gtin: str) -> GtinResult:
+        try:
+            # o cache já foi lido acima: não conta a falta de novo
+            return _consulta_gtin_e_guarda(gtin, pfx_path, pfx_password, cache)
+        except Exception as e:
+            return GtinResult(
+                status=None,
+                motivo=f"Erro ao consultar GTIN: {e}",
+                xml_envio="",
+                xml_retorno="",
+                gtin=gtin,
+            )
+
+    ex = ThreadPoolExecutor(max_workers=max(1, max_concorrencia))
+    try:
+        consultar = propagar_contexto(_consultar)
+        futuros = [ex.submit(consultar, g) for g in pendentes]
+        for fut in as_completed(futuros):
+            yield fut.result()
+    finally:
+        # se o consumidor desistir no meio, não dispara o restante
+        ex.shutdown(wait=False, cancel_futures=True)
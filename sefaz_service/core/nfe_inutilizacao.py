@@ -8,16 +8,23 @@ from lxml import etree
 
 from sefaz_service.nfe.assinatura import NFeXmlSigner
 
+from .envelope import montar_envelope_soap
+from .parser_xml import ler_xml
 from .envio import (
     enviar_soap_com_pfx,
-    extrair_xml_resultado,
     EndpointInfo,
 )
+from .rastreamento import rastrear
+from .resposta import ler_resposta
 from .soaplist import get_nfe_autorizacao4_endpoint
 
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+INUTILIZACAO_WSDL_NS = "http://www.portalfiscal.inf.br/nfe/wsdl/NFeInutilizacao4"
 NSMAP = {"nfe": NFE_NS}
 
+# 102 = inutilização homologada
+CSTAT_INUTILIZACAO_HOMOLOGADA = "102"
+
 
 # ----------------------------------------------------------------------
 # MODELOS
@@ -43,7 +50,9 @@ class InutilizacaoResponse:
     xMotivo: Optional[str]
     nProt: Optional[str] = None
     dhRecbto: Optional[str] = None
-    raw_xml: Optional[str] = None
+    raw_xml: Optional[str] = None           # retInutNFe
+    xml_assinado: Optional[str] = None      # inutNFe assinado enviado
+    xml_proc: Optional[str] = None          # procInutNFe, se homologada (102)
 
 
 # ----------------------------------------------------------------------
@@ -60,6 +69,7 @@ def _only_digits(s: str) -> str:
 # ----------------------------------------------------------------------
 
 
+@rastrear()
 def montar_xml_inutilizacao(req: InutilizacaoRequest) -> str:
     """
     Monta o XML <inutNFe> 4.00 (não assinado).
@@ -118,6 +128,32 @@ def assinar_xml_inutilizacao(xml_inut: str, pfx_path: str, pfx_password: str) ->
     )
 
 
+@rastrear()
+def montar_proc_inut_nfe(
+    xml_inut_assinado: str,
+    xml_ret_inut: str,
+    versao: str = "4.00",
+) -> str:
+    """
+    Monta o XML de distribuição da inutilização:
+
+      <procInutNFe versao="4.00" xmlns="http://www.portalfiscal.inf.br/nfe">
+        <inutNFe>...</inutNFe>
+        <retInutNFe>...</retInutNFe>
+      </procInutNFe>
+    """
+    inut_root = ler_xml(xml_inut_assinado, "compacto")
+    ret_root = ler_xml(xml_ret_inut, "compacto")
+
+    proc = etree.Element(f"{{{NFE_NS}}}procInutNFe", nsmap={None: NFE_NS})
+    proc.set("versao", versao)
+    proc.append(inut_root)
+    proc.append(ret_root)
+
+    xml_bytes = etree.tostring(proc, encoding="UTF-8", xml_declaration=True)
+    return xml_bytes.decode("utf-8")
+
+
 # ----------------------------------------------------------------------
 # ENDPOINT do serviço NFeInutilizacao4
 # ----------------------------------------------------------------------
@@ -160,6 +196,7 @@ def enviar_inutilizacao(
       3) monta envelope SOAP
       4) envia via enviar_soap_com_pfx
       5) extrai e interpreta retorno
+      6) se homologada (102), monta o procInutNFe
     """
     # 1) monta
     xml_inut = montar_xml_inutilizacao(req)
@@ -175,16 +212,7 @@ def enviar_inutilizacao(
     ep = _get_inutilizacao_endpoint(uf_sigla=uf_sigla, ambiente=req.tpAmb)
 
     # 4) envelope SOAP
-    soap_xml = f"""<?xml version="1.0" encoding="utf-8"?>
-<soap12:Envelope xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-                 xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-                 xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Body>
-    <nfeDadosMsg xmlns="http://www.portalfiscal.inf.br/nfe/wsdl/NFeInutilizacao4">
-      {xml_assinado}
-    </nfeDadosMsg>
-  </soap12:Body>
-</soap12:Envelope>"""
+    soap_xml = montar_envelope_soap(xml_assinado, INUTILIZACAO_WSDL_NS)
 
     # 5) enviar usando MESMO fluxo da NFe
     resp = enviar_soap_com_pfx(
@@ -194,11 +222,12 @@ def enviar_inutilizacao(
         pfx_password=senha,
     )
 
-    # 6) extrair XML "limpo" da resposta
-    xml_retorno = extrair_xml_resultado(resp.text)
-
-    # 7) interpretar
-    return _parse_inutilizacao_response(xml_retorno)
+    # 6) interpretar (retInutNFe extraído do SOAP num único parse)
+    res = _parse_inutilizacao_response(resp.content)
+    res.xml_assinado = xml_assinado
+    if res.cStat == CSTAT_INUTILIZACAO_HOMOLOGADA and res.raw_xml:
+        res.xml_proc = montar_proc_inut_nfe(xml_assinado, res.raw_xml)
+    return res
 
 
 # ----------------------------------------------------------------------
@@ -206,36 +235,23 @@ def enviar_inutilizacao(
 # ----------------------------------------------------------------------
 
 
-def _parse_inutilizacao_response(xml_retorno: str) -> InutilizacaoResponse:
+def _parse_inutilizacao_response(conteudo: bytes | str) -> InutilizacaoResponse:
     """
     Extrai cStat, xMotivo, nProt e dhRecbto do retorno de inutilização.
     """
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except Exception:
+    ret = ler_resposta(conteudo, "retInutNFe")
+    if ret.payload is None:
+        raw = conteudo.decode("utf-8", "replace") if isinstance(conteudo, bytes) else conteudo
         return InutilizacaoResponse(
             cStat=None,
-            xMotivo="Falha ao parsear XML de retorno da inutilizacao",
-            raw_xml=xml_retorno,
+            xMotivo=ret.erro,
+            raw_xml=raw,
         )
 
-    inf_inut = root.find(".//{http://www.portalfiscal.inf.br/nfe}infInut")
-    if inf_inut is None:
-        return InutilizacaoResponse(
-            cStat=None,
-            xMotivo="Retorno de inutilizacao sem infInut",
-            raw_xml=xml_retorno,
-        )
-
-    cStat = inf_inut.findtext("{http://www.portalfiscal.inf.br/nfe}cStat", default=None)
-    xMotivo = inf_inut.findtext("{http://www.portalfiscal.inf.br/nfe}xMotivo", default=None)
-    nProt = inf_inut.findtext("{http://www.portalfiscal.inf.br/nfe}nProt", default=None)
-    dhRecbto = inf_inut.findtext("{http://www.portalfiscal.inf.br/nfe}dhRecbto", default=None)
-
     return InutilizacaoResponse(
-        cStat=cStat,
-        xMotivo=xMotivo,
-        nProt=nProt,
-        dhRecbto=dhRecbto,
-        raw_xml=xml_retorno,
+        cStat=ret.cstat_txt or None,
+        xMotivo=ret.xMotivo,
+        nProt=ret.texto("nfe:infInut/nfe:nProt"),
+        dhRecbto=ret.texto("nfe:infInut/nfe:dhRecbto"),
+        raw_xml=ret.xml_payload(),
     )
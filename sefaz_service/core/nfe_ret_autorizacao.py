@@ -0,0 +1,130 @@
+# sefaz_service/core/nfe_ret_autorizacao.py
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from lxml import etree
+
+from .envelope import montar_envelope_soap
+from .envio import enviar_soap_com_pfx, EndpointInfo
+from .nfe_consulta import UF_TO_CUF
+from .resposta import ler_resposta
+from .soaplist import get_nfe_ret_autorizacao4_endpoint
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+RET_AUT_WSDL_NS = "http://www.portalfiscal.inf.br/nfe/wsdl/NFeRetAutorizacao4"
+
+
+@dataclass
+class NFeRetAutorizacaoResult:
+    """
+    Resultado da consulta do recibo (retConsReciNFe).
+
+    - cStat/xMotivo: status do LOTE (104 = processado, 105 = em processamento...)
+    - tMed: tempo médio de resposta informado pela SEFAZ (segundos), se houver
+    - protocolos: chave de acesso -> XML do <protNFe> correspondente
+    """
+    cStat: Optional[int]
+    xMotivo: Optional[str]
+    xml_envio: str
+    xml_retorno: str
+    tMed: Optional[int] = None
+    protocolos: Dict[str, str] = field(default_factory=dict)
+
+
+def montar_cons_reci_nfe(n_rec: str, ambiente: str = "2", versao: str = "4.00") -> str:
+    """
+    <consReciNFe versao="4.00" xmlns="http://www.portalfiscal.inf.br/nfe">
+       <tpAmb>2</tpAmb>
+       <nRec>...</nRec>
+    </consReciNFe>
+    """
+    return (
+        f'<consReciNFe versao="{versao}" xmlns="{NFE_NS}">'
+        f"<tpAmb>{ambiente}</tpAmb>"
+        f"<nRec>{n_rec}</nRec>"
+        f"</consReciNFe>"
+    )
+
+
+def _montar_soap_ret_autorizacao(cons_reci_xml: str, c_uf: str, versao_dados: str = "4.00") -> bytes:
+    """
+    Envelope SOAP 1.2 para NFeRetAutorizacao4.
+    """
+    return montar_envelope_soap(cons_reci_xml, RET_AUT_WSDL_NS, c_uf=c_uf, versao_dados=versao_dados)
+
+
+def _parse_ret_cons_reci(conteudo: bytes | str) -> NFeRetAutorizacaoResult:
+    """
+    Extrai <retConsReciNFe> do SOAP, com cStat/xMotivo do lote, tMed e
+    cada <protNFe> indexado pela chave.
+    """
+    resposta = ler_resposta(conteudo, "retConsReciNFe")
+    if resposta.payload is None:
+        return NFeRetAutorizacaoResult(
+            cStat=None,
+            xMotivo=resposta.erro,
+            xml_envio="",
+            xml_retorno=conteudo.decode("utf-8", "replace") if isinstance(conteudo, bytes) else conteudo,
+        )
+
+    ret = resposta.payload
+    ns = {"nfe": NFE_NS}
+
+    tmed_txt = resposta.texto("nfe:tMed") or ""
+    tmed: Optional[int] = int(tmed_txt) if tmed_txt.isdigit() else None
+
+    protocolos: Dict[str, str] = {}
+    for prot in ret.findall("nfe:protNFe", ns):
+        chave = prot.findtext("nfe:infProt/nfe:chNFe", default="", namespaces=ns).strip()
+        if chave:
+            protocolos[chave] = etree.tostring(prot, encoding="utf-8").decode("utf-8")
+
+    return NFeRetAutorizacaoResult(
+        cStat=resposta.cStat,
+        xMotivo=resposta.xMotivo,
+        xml_envio="",
+        xml_retorno=resposta.xml_payload(),
+        tMed=tmed,
+        protocolos=protocolos,
+    )
+
+
+def sefaz_nfe_ret_autorizacao(
+    uf: str,
+    n_rec: str,
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str = "2",
+    versao: str = "4.00",
+) -> NFeRetAutorizacaoResult:
+    """
+    Consulta o resultado de um lote assíncrono pelo número do recibo
+    (NFeRetAutorizacao4).
+    """
+    c_uf = UF_TO_CUF.get((uf or "").upper(), "")
+    if not c_uf:
+        raise ValueError(f"UF inválida para cUF: {uf!r}")
+
+    # 1) consReciNFe
+    xml_envio = montar_cons_reci_nfe(n_rec=n_rec, ambiente=ambiente, versao=versao)
+
+    # 2) Endpoint
+    endpoint: EndpointInfo = get_nfe_ret_autorizacao4_endpoint(uf=uf, ambiente=ambiente)
+
+    # 3) Envelope SOAP
+    soap_xml = _montar_soap_ret_autorizacao(xml_envio, c_uf=c_uf, versao_dados=versao)
+
+    # 4) Envia
+    resp = enviar_soap_com_pfx(
+        endpoint=endpoint,
+        soap_xml=soap_xml,
+        pfx_path=pfx_path,
+        pfx_password=pfx_password,
+    )
+
+    # 5) Interpreta
+    result = _parse_ret_cons_reci(resp.content)
+    result.xml_envio = xml_envio
+    return result
@@ -4,12 +4,13 @@ from __future__ import annotations
 from dataclasses import dataclass
 from typing import Optional
 
-from lxml import etree
-
+from .envelope import montar_envelope_soap
+from .metricas import instrumentar
 from .envio import (
     enviar_soap_com_pfx,
     EndpointInfo,
 )
+from .resposta import ler_resposta
 from .soaplist import get_nfe_status_servico4_endpoint
 
 # Namespaces
@@ -70,85 +71,17 @@ def _montar_cons_stat_serv(uf: str, ambiente: str = "2", versao: str = "4.00") -
     return xml, c_uf
 
 
-def _montar_soap_status(cons_stat_serv_xml: str, c_uf: str, versao_dados: str = "4.00") -> str:
+def _montar_soap_status(cons_stat_serv_xml: str, c_uf: str, versao_dados: str = "4.00") -> bytes:
     """
     Monta o envelope SOAP 1.2 para o serviço NFeStatusServico4
     no mesmo padrão do envio da NFe: Header + nfeDadosMsg no Body.
     """
-    envelope = f"""<?xml version="1.0" encoding="UTF-8"?>
-<soap12:Envelope
-    xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
-    xmlns:xsd="http://www.w3.org/2001/XMLSchema"
-    xmlns:soap12="http://www.w3.org/2003/05/soap-envelope">
-  <soap12:Header>
-    <nfeCabecMsg xmlns="{STATUS_WSDL_NS}">
-      <cUF>{c_uf}</cUF>
-      <versaoDados>{versao_dados}</versaoDados>
-    </nfeCabecMsg>
-  </soap12:Header>
-  <soap12:Body>
-    <nfeDadosMsg xmlns="{STATUS_WSDL_NS}">
-      {cons_stat_serv_xml}
-    </nfeDadosMsg>
-  </soap12:Body>
-</soap12:Envelope>"""
-    return envelope
-
-
-
-def _extrair_xml_status(resp_xml: str) -> str:
-    """
-    Extrai o <retConsStatServ> de dentro do SOAP de resposta do
-    NFeStatusServico4. Se não encontrar, devolve o SOAP inteiro.
-    """
-    try:
-        root = etree.fromstring(resp_xml.encode("utf-8"))
-    except Exception:
-        return resp_xml
-
-    ns = {
-        "soap": "http://www.w3.org/2003/05/soap-envelope",
-        "ws": STATUS_WSDL_NS,
-    }
-
-    # <soap:Body><ws:nfeResultMsg>...</ws:nfeResultMsg></soap:Body>
-    result = root.find(".//ws:nfeResultMsg", ns)
-    if result is None or len(result) == 0:
-        return resp_xml
-
-    payload = result[0]  # normalmente <retConsStatServ>
-    return etree.tostring(payload, encoding="utf-8", xml_declaration=True).decode("utf-8")
-
-
-def _obter_status_motivo(xml_retorno: str) -> tuple[Optional[int], Optional[str]]:
-    """
-    Lê <cStat> e <xMotivo> do retorno da SEFAZ (retConsStatServ),
-    independente de namespace.
-    """
-    try:
-        root = etree.fromstring(xml_retorno.encode("utf-8"))
-    except Exception:
-        return None, None
-
-    # Busca por local-name() para não depender de namespace
-    cstat_nodes = root.xpath("//*[local-name()='cStat']")
-    xmot_nodes = root.xpath("//*[local-name()='xMotivo']")
-
-    cstat_val = None
-    xmot_val = None
-
-    if cstat_nodes and cstat_nodes[0].text:
-        try:
-            cstat_val = int(cstat_nodes[0].text.strip())
-        except ValueError:
-            cstat_val = None
-
-    if xmot_nodes and xmot_nodes[0].text:
-        xmot_val = xmot_nodes[0].text.strip()
-
-    return cstat_val, xmot_val
+    return montar_envelope_soap(
+        cons_stat_serv_xml, STATUS_WSDL_NS, c_uf=c_uf, versao_dados=versao_dados
+    )
 
 
+@instrumentar("NFeStatusServico4")
 def sefaz_nfe_status(
     uf: str,
     pfx_path: str,
@@ -180,15 +113,13 @@ def sefaz_nfe_status(
         pfx_password=pfx_password,
     )
 
-    # 5) Extrair o XML retConsStatServ do SOAP
-    xml_retorno = _extrair_xml_status(resp.text)
-
-    # 6) Pegar cStat / xMotivo
-    cstat, xmot = _obter_status_motivo(xml_retorno)
+    # 5) retConsStatServ + cStat / xMotivo (um único parse)
+    ret = ler_resposta(resp.content, "retConsStatServ")
+    xml_retorno = ret.xml_retorno
 
     return NFeStatusResult(
-        cStat=cstat,
-        xMotivo=xmot,
+        cStat=ret.cStat,
+        xMotivo=ret.xMotivo,
         xml_envio=xml_envio,
         xml_retorno=xml_retorno,
     )
@@ -0,0 +1,71 @@
+# sefaz_service/core/parser_xml.py
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Union
+
+from lxml import etree
+
+# Tamanho máximo aceito para um XML (SEFAZ_XML_MAX_MB, padrão 20 MB).
+XML_MAX_BYTES = int(float(os.getenv("SEFAZ_XML_MAX_MB", "20")) * 1024 * 1024)
+
+# Configurações comuns a todos os perfis: sem expansão de entidades,
+# sem acesso à rede e sem o modo huge_tree (mantém os limites internos
+# da libxml2 para profundidade e tamanho de nós de texto).
+_SEGURO: Dict[str, Any] = {
+    "resolve_entities": False,
+    "no_network": True,
+    "huge_tree": False,
+}
+
+PERFIS: Dict[str, Dict[str, Any]] = {
+    # preserva espaços: retornos da SEFAZ, XML a assinar, leitura em geral
+    "estrito": {},
+    # remove espaços entre tags: montagem de lotes, protocolo, QRCode
+    "compacto": {"remove_blank_text": True},
+    # tolera XML malformado (leitura de XML vindo do ERP)
+    "recover": {"recover": True},
+    # XSDs e documentos validados contra eles
+    "schema": {"remove_blank_text": True, "remove_comments": True},
+}
+
+_locais = threading.local()
+
+
+def obter_parser(perfil: str = "estrito") -> etree.XMLParser:
+    """
+    XMLParser do perfil informado, criado uma vez por thread e
+    reaproveitado (parsers do lxml não devem ser compartilhados entre
+    threads).
+    """
+    parsers = getattr(_locais, "parsers", None)
+    if parsers is None:
+        parsers = _locais.parsers = {}
+    parser = parsers.get(perfil)
+    if parser is None:
+        if perfil not in PERFIS:
+            raise ValueError(f"Perfil de parser desconhecido: {perfil!r}")
+        parser = parsers[perfil] = etree.XMLParser(**_SEGURO, **PERFIS[perfil])
+    return parser
+
+
+def ler_xml(
+    conteudo: Union[bytes, bytearray, str],
+    perfil: str = "estrito",
+    *,
+    max_bytes: int = XML_MAX_BYTES,
+) -> etree._Element:
+    """
+    Faz o parse de `conteudo` com o parser do perfil e devolve o root.
+
+    XML maior que `max_bytes` (0 = sem limite) levanta ValueError antes
+    do parse; erros de sintaxe propagam como etree.XMLSyntaxError.
+    """
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+    if max_bytes and len(conteudo) > max_bytes:
+        raise ValueError(
+            f"XML com {len(conteudo)} bytes excede o limite de {max_bytes} bytes"
+        )
+    return etree.fromstring(bytes(conteudo), parser=obter_parser(perfil))
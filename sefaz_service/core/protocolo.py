@@ -1,14 +1,20 @@
 # sefaz_service/core/protocolo.py
 from __future__ import annotations
 
+import copy
+from typing import Union
+
 from lxml import etree
 
 from .assinatura import NFE_NS
+from .parser_xml import ler_xml
+from .rastreamento import rastrear
 
 
+@rastrear()
 def montar_nfe_proc(
-    xml_assinado: str,
-    xml_retorno: str,
+    xml_assinado: Union[str, etree._Element],
+    xml_retorno: Union[str, etree._Element],
     versao: str = "4.00",
 ) -> str:
     """
@@ -25,15 +31,24 @@ def montar_nfe_proc(
         <protNFe>...</protNFe>
       </nfeProc>
 
+    Os dois também podem vir já em árvore (o <NFe> devolvido por
+    assinar_nfe e o payload de ler_resposta), sem novo parse; o <NFe>
+    passado assim é movido para dentro do nfeProc.
+
     Lança ValueError se não encontrar <protNFe>.
     """
 
-    # 1) Parse da NFe assinada (root = <NFe>)
-    parser = etree.XMLParser(remove_blank_text=True)
-    nfe_root = etree.fromstring(xml_assinado.encode("utf-8"), parser=parser)
+    # 1) NFe assinada (root = <NFe>)
+    if isinstance(xml_assinado, str):
+        nfe_root = ler_xml(xml_assinado, "compacto")
+    else:
+        nfe_root = xml_assinado
 
-    # 2) Parse do retorno (retEnviNFe, retConsReciNFe, etc.)
-    ret_root = etree.fromstring(xml_retorno.encode("utf-8"), parser=parser)
+    # 2) Retorno (retEnviNFe, retConsReciNFe, etc.)
+    if isinstance(xml_retorno, str):
+        ret_root = ler_xml(xml_retorno, "compacto")
+    else:
+        ret_root = xml_retorno
 
     ns = {"nfe": NFE_NS}
 
@@ -43,7 +58,7 @@ def montar_nfe_proc(
         raise ValueError("XML de retorno não contém <protNFe>.")
 
     # Faz uma cópia profunda do protNFe para não "arrancar" ele do retorno
-    prot_el = etree.fromstring(etree.tostring(prot_el, encoding="utf-8"))
+    prot_el = copy.deepcopy(prot_el)
 
     # 3) Monta o nfeProc
     nsmap = {None: NFE_NS}
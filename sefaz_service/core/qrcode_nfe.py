@@ -6,6 +6,9 @@ from typing import Optional
 
 from lxml import etree
 
+from .documento_nfe import DocumentoNFe
+from .parser_xml import ler_xml
+
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
 DSIG_NS = "http://www.w3.org/2000/09/xmldsig#"
 
@@ -54,57 +57,47 @@ def gerar_qrcode_nfce(
 
     # 1) Parse do XML já assinado (apenas <NFe>...</NFe>)
     xml_sem_decl = _strip_xml_decl(xml_assinado)
-    parser = etree.XMLParser(remove_blank_text=True)
-    root = etree.fromstring(xml_sem_decl.encode("utf-8"), parser=parser)
-
-    ns = {"nfe": NFE_NS, "ds": DSIG_NS}
+    root = ler_xml(xml_sem_decl, "compacto")
 
     if root.tag != f"{{{NFE_NS}}}NFe":
         raise ValueError("Esperado XML com nó raiz <NFe> para gerar QRCode")
 
-    inf_nfe = root.find("nfe:infNFe", namespaces=ns)
-    if inf_nfe is None:
+    try:
+        nfe = DocumentoNFe(root)
+    except ValueError:
         raise ValueError("Não encontrado nó <infNFe> na NFe")
 
     # Se já existir infNFeSupl, removemos para recriar
-    inf_supl_exist = root.find("nfe:infNFeSupl", namespaces=ns)
+    inf_supl_exist = root.find(f"{{{NFE_NS}}}infNFeSupl")
     if inf_supl_exist is not None:
         root.remove(inf_supl_exist)
 
     # 2) Campos básicos para o QRCode
-    ide = inf_nfe.find("nfe:ide", namespaces=ns)
-    if ide is None:
+    ide = nfe.ide
+    if not ide:
         raise ValueError("Não encontrado nó <ide> em <infNFe>")
 
-    tp_amb = ide.findtext("nfe:tpAmb", namespaces=ns)
-    mod = ide.findtext("nfe:mod", namespaces=ns)
-    tp_emis = ide.findtext("nfe:tpEmis", namespaces=ns)
-    dh_emi = ide.findtext("nfe:dhEmi", namespaces=ns)
+    tp_amb = ide.get("tpAmb")
+    mod = ide.get("mod")
+    tp_emis = ide.get("tpEmis")
+    dh_emi = ide.get("dhEmi")
 
     if mod != "65":
         raise ValueError("gerar_qrcode_nfce: esperado modelo 65 (NFC-e)")
 
     # chave NFe = atributo Id de infNFe sem o prefixo "NFe"
-    inf_id = inf_nfe.get("Id") or ""
-    ch_nfe = inf_id[3:] if inf_id.startswith("NFe") else inf_id
+    ch_nfe = nfe.chave
 
     # totais
-    icms_tot = inf_nfe.find("nfe:total/nfe:ICMSTot", namespaces=ns)
-    v_nf = icms_tot.findtext("nfe:vNF", namespaces=ns) if icms_tot is not None else None
-    v_icms = icms_tot.findtext("nfe:vICMS", namespaces=ns) if icms_tot is not None else None
+    v_nf = nfe.icms_tot.get("vNF")
+    v_icms = nfe.icms_tot.get("vICMS")
 
     # DigestValue da assinatura
-    signature = root.find("ds:Signature", namespaces=ns)
-    if signature is None:
-        # tenta localizar por local-name, caso namespace explícito não esteja no root
-        signature = root.find(".//*[local-name()='Signature']")
+    signature = nfe.assinatura
     if signature is None:
         raise ValueError("Não encontrado nó <Signature> para obter DigestValue")
 
-    digest_value_el = signature.find(".//ds:DigestValue", namespaces=ns)
-    if digest_value_el is None:
-        digest_value_el = signature.find(".//*[local-name()='DigestValue']")
-    digest_value = (digest_value_el.text or "").strip()
+    digest_value = nfe.digest_value
 
     if not tp_amb or not ch_nfe or not v_nf or not dh_emi:
         raise ValueError("Dados insuficientes para gerar QRCode (chNFe, tpAmb, vNF, dhEmi, etc.)")
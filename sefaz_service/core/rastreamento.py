@@ -0,0 +1,204 @@
+# sefaz_service/core/rastreamento.py
+from __future__ import annotations
+
+import contextvars
+import functools
+import os
+import sys
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, Mapping, Optional
+
+# ----------------------------------------------------------------------
+# Spans OpenTelemetry da emissão (assinatura, montagem, transporte,
+# parse, nfeProc, DANFE). Sem o pacote opentelemetry, ou sem nenhum
+# TracerProvider configurado, tudo aqui vira no-op com custo de um if.
+#
+# SEFAZ_TRACE_EXPORTADOR=console  → um JSON por span na saída padrão
+# SEFAZ_TRACE_EXPORTADOR=arquivo  → idem, no arquivo SEFAZ_TRACE_ARQUIVO
+#
+# Um TracerProvider configurado por fora (opentelemetry-instrument,
+# exportador OTLP...) antes da importação também é usado.
+# ----------------------------------------------------------------------
+
+try:  # opentelemetry é opcional
+    from opentelemetry import propagate, trace
+except ImportError:  # pragma: no cover
+    propagate = trace = None
+
+try:  # o SDK só é necessário para os exportadores console/arquivo
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:  # pragma: no cover
+    TracerProvider = None
+
+TRACE_EXPORTADOR = os.getenv("SEFAZ_TRACE_EXPORTADOR", "").strip().lower()
+TRACE_ARQUIVO = os.getenv("SEFAZ_TRACE_ARQUIVO", "sefaz_traces.jsonl")
+SERVICO = os.getenv("OTEL_SERVICE_NAME", "sefaz-service")
+
+_tracer = None
+
+# Id da requisição HTTP em andamento (X-Request-ID), gravado em todos os spans.
+_id_requisicao: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "sefaz_id_requisicao", default=None
+)
+
+
+def _json_linha(span) -> str:
+    return span.to_json(indent=None) + "\n"
+
+
+def configurar_rastreamento(
+    exportador: str = TRACE_EXPORTADOR,
+    arquivo: str = TRACE_ARQUIVO,
+) -> bool:
+    """
+    Liga os spans. Com `exportador` ("console" ou "arquivo") instala um
+    TracerProvider do SDK que grava os spans em JSON (uma linha por span);
+    sem ele, usa o TracerProvider global se alguém já tiver configurado.
+    Retorna True se os spans ficaram ativos.
+    """
+    global _tracer
+    if trace is None:
+        return False
+
+    if exportador:
+        if TracerProvider is None:
+            raise RuntimeError(
+                f"SEFAZ_TRACE_EXPORTADOR={exportador} requer o pacote opentelemetry-sdk"
+            )
+        if exportador == "console":
+            saida = sys.stdout
+        elif exportador == "arquivo":
+            saida = open(arquivo, "a", encoding="utf-8")
+        else:
+            raise ValueError(
+                f"SEFAZ_TRACE_EXPORTADOR inválido: {exportador!r} (use console ou arquivo)"
+            )
+        provider = TracerProvider(resource=Resource.create({"service.name": SERVICO}))
+        provider.add_span_processor(
+            BatchSpanProcessor(ConsoleSpanExporter(out=saida, formatter=_json_linha))
+        )
+        trace.set_tracer_provider(provider)
+
+    if isinstance(trace.get_tracer_provider(), trace.ProxyTracerProvider):
+        _tracer = None  # nenhum provider: spans desligados
+    else:
+        _tracer = trace.get_tracer("sefaz_service")
+    return _tracer is not None
+
+
+def rastreamento_ativo() -> bool:
+    return _tracer is not None
+
+
+def id_requisicao() -> Optional[str]:
+    return _id_requisicao.get()
+
+
+@contextmanager
+def com_id_requisicao(valor: str) -> Iterator[None]:
+    token = _id_requisicao.set(valor)
+    try:
+        yield
+    finally:
+        _id_requisicao.reset(token)
+
+
+def _atributos(atributos: Dict[str, Any]) -> Dict[str, Any]:
+    limpos = {k: v for k, v in atributos.items() if v is not None and v != ""}
+    valor = _id_requisicao.get()
+    if valor:
+        limpos["sefaz.request_id"] = valor
+    return limpos
+
+
+def span(nome: str, **atributos: Any):
+    """
+    Span filho do span atual (no-op se o rastreamento estiver desligado):
+
+        with span("sefaz.http", **{"url.full": url}):
+            ...
+
+    Exceções são registradas no span e marcam status de erro.
+    """
+    if _tracer is None:
+        return nullcontext()
+    return _tracer.start_as_current_span(nome, attributes=_atributos(atributos))
+
+
+def iniciar_span(nome: str, **atributos: Any):
+    """
+    Abre um span sem torná-lo o atual, para intervalos que começam num
+    método e terminam em outro; quem chama encerra com .end(). None se o
+    rastreamento estiver desligado.
+    """
+    if _tracer is None:
+        return None
+    return _tracer.start_span(nome, attributes=_atributos(atributos))
+
+
+def anotar(**atributos: Any) -> None:
+    """Acrescenta atributos ao span atual."""
+    if _tracer is not None:
+        trace.get_current_span().set_attributes(_atributos(atributos))
+
+
+def span_requisicao(nome: str, cabecalhos: Mapping[str, str], **atributos: Any):
+    """
+    Span raiz (SERVER) de uma requisição HTTP; continua o trace do
+    cliente se vier o cabeçalho W3C `traceparent`. Se o servidor ou o
+    framework já abriu esse span (telemetria do FastAPI, instrumentação
+    ASGI), só acrescenta os atributos a ele.
+    """
+    if _tracer is None:
+        return nullcontext()
+    atual = trace.get_current_span()
+    if atual.is_recording():
+        atual.set_attributes(_atributos(atributos))
+        return nullcontext(atual)
+    return _tracer.start_as_current_span(
+        nome,
+        context=propagate.extract(cabecalhos),
+        kind=trace.SpanKind.SERVER,
+        attributes=_atributos(atributos),
+    )
+
+
+def propagar_contexto(func: Callable) -> Callable:
+    """
+    Para funções entregues a um ThreadPoolExecutor: roda `func` numa
+    cópia do contexto de quem chamou, para que os spans das threads
+    fiquem sob o span atual e levem o mesmo id de requisição.
+    """
+    if _tracer is None and _id_requisicao.get() is None:
+        return func
+    contexto = contextvars.copy_context()
+
+    @functools.wraps(func)
+    def envoltorio(*args, **kwargs):
+        # cada execução numa cópia própria: um Context não pode estar
+        # ativo em duas threads ao mesmo tempo
+        return contexto.copy().run(func, *args, **kwargs)
+
+    return envoltorio
+
+
+def rastrear(nome: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorador: executa a função dentro de um span (nome padrão: o da função)."""
+    def decorador(func):
+        nome_span = nome or func.__name__
+
+        @functools.wraps(func)
+        def envoltorio(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.start_as_current_span(nome_span, attributes=_atributos({})):
+                return func(*args, **kwargs)
+
+        return envoltorio
+
+    return decorador
+
+
+configurar_rastreamento()
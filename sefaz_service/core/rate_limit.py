@@ -0,0 +1,362 @@
+# sefaz_service/core/rate_limit.py
+from __future__ import annotations
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+
+from sefaz_service.core.assinatura import _load_pfx
+from sefaz_service.core.metricas import chamadas_em_andamento, etapa, rotulos_padrao
+from sefaz_service.core.sessao import sessao_com_pfx
+
+# 656 = consumo indevido (a SEFAZ bloqueia o CNPJ naquele serviço)
+CSTAT_CONSUMO_INDEVIDO = 656
+
+# Pausa aplicada ao balde quando volta 656; dobra a cada 656 seguido
+PAUSA_656 = 60.0
+PAUSA_656_MAX = 3600.0
+
+_RE_CSTAT_656 = re.compile(rb"<(?:\w+:)?cStat>\s*656\s*</")
+_RE_SERVICO_WSDL = re.compile(r"/wsdl/([A-Za-z0-9_]+)")
+_RE_CNPJ_CN = re.compile(r"(\d{14})")
+
+
+# ----------------------------------------------------------------------
+# CONFIGURAÇÃO
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class LimiteServico:
+    """
+    Limite de um serviço SEFAZ.
+
+    - taxa: requisições por segundo (reposição do balde)
+    - capacidade: rajada máxima (tamanho do balde)
+    """
+    taxa: float
+    capacidade: float
+
+
+# Valores conservadores; serviços de consulta são os que mais geram 656.
+LIMITES_PADRAO: Dict[str, LimiteServico] = {
+    "NFeAutorizacao4": LimiteServico(taxa=5.0, capacidade=10),
+    "NFeRetAutorizacao4": LimiteServico(taxa=2.0, capacidade=4),
+    "NFeConsultaProtocolo4": LimiteServico(taxa=2.0, capacidade=5),
+    "NFeStatusServico4": LimiteServico(taxa=0.2, capacidade=2),
+    "NFeRecepcaoEvento4": LimiteServico(taxa=5.0, capacidade=10),
+    "NFeInutilizacao4": LimiteServico(taxa=1.0, capacidade=2),
+    "CadConsultaCadastro4": LimiteServico(taxa=1.0, capacidade=3),
+    "NFeDistribuicaoDFe": LimiteServico(taxa=0.5, capacidade=2),
+    "ccgConsGtin": LimiteServico(taxa=5.0, capacidade=5),
+    "*": LimiteServico(taxa=2.0, capacidade=5),
+}
+
+
+def _limites_do_ambiente() -> Dict[str, LimiteServico]:
+    """
+    Lê SEFAZ_RATE_LIMITS no formato "Servico=taxa/capacidade,...",
+    por exemplo: "NFeConsultaProtocolo4=1/3,NFeStatusServico4=0.1/1".
+    """
+    limites: Dict[str, LimiteServico] = {}
+    valor = os.getenv("SEFAZ_RATE_LIMITS", "").strip()
+    for item in filter(None, (p.strip() for p in valor.split(","))):
+        try:
+            servico, regra = item.split("=", 1)
+            taxa, _, capacidade = regra.partition("/")
+            limites[servico.strip()] = LimiteServico(
+                taxa=float(taxa),
+                capacidade=float(capacidade or taxa),
+            )
+        except ValueError:
+            raise ValueError(f"SEFAZ_RATE_LIMITS inválido em {item!r}")
+    return limites
+
+
+# ----------------------------------------------------------------------
+# TOKEN BUCKET
+# ----------------------------------------------------------------------
+
+
+class TokenBucket:
+    """
+    Balde de fichas com fila: quem chega reserva a próxima ficha e espera
+    o tempo necessário (o saldo pode ficar negativo), então a ordem de
+    chegada é respeitada e ninguém é rejeitado.
+    """
+
+    def __init__(self, taxa: float, capacidade: float) -> None:
+        if taxa <= 0 or capacidade <= 0:
+            raise ValueError("taxa e capacidade devem ser positivas")
+        self.taxa_configurada = float(taxa)
+        self.taxa = float(taxa)
+        self.capacidade = float(capacidade)
+        self._fichas = float(capacidade)
+        self._atualizado = time.monotonic()
+        self._pausado_ate = 0.0
+        self._pausa_atual = 0.0
+        self._lock = threading.Lock()
+
+    def _repor(self, agora: float) -> None:
+        inicio = max(self._atualizado, self._pausado_ate)
+        if agora > inicio:
+            self._fichas = min(self.capacidade, self._fichas + (agora - inicio) * self.taxa)
+        self._atualizado = max(agora, self._atualizado)
+
+    def reservar(self) -> float:
+        """
+        Consome uma ficha e devolve quantos segundos o chamador deve
+        esperar antes de enviar.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            self._repor(agora)
+            self._fichas -= 1.0
+            espera = max(0.0, self._pausado_ate - agora)
+            if self._fichas < 0:
+                espera += -self._fichas / self.taxa
+            return espera
+
+    def pausar(self) -> float:
+        """
+        Reação a um 656: zera o saldo, pausa o balde (PAUSA_656, dobrando
+        a cada 656 seguido até PAUSA_656_MAX) e reduz a taxa à metade.
+        Um 656 que chega com a pausa ainda valendo vem de requisição que já
+        estava em voo e não agrava a punição. Devolve a pausa restante.
+        """
+        with self._lock:
+            agora = time.monotonic()
+            if agora < self._pausado_ate:
+                return self._pausado_ate - agora
+            self._repor(agora)
+            self._pausa_atual = min(PAUSA_656_MAX, max(PAUSA_656, self._pausa_atual * 2))
+            self._pausado_ate = max(self._pausado_ate, agora + self._pausa_atual)
+            self._fichas = min(self._fichas, 0.0)
+            self.taxa = max(self.taxa_configurada / 16, self.taxa / 2)
+            return self._pausa_atual
+
+    def sucesso(self) -> None:
+        """
+        Resposta sem 656: a taxa volta aos poucos (+10%) ao configurado.
+        """
+        with self._lock:
+            self._pausa_atual = 0.0
+            if self.taxa < self.taxa_configurada:
+                self.taxa = min(self.taxa_configurada, self.taxa * 1.1)
+
+    @property
+    def pausado_por(self) -> float:
+        return max(0.0, self._pausado_ate - time.monotonic())
+
+
+# ----------------------------------------------------------------------
+# LIMITADOR (um balde por endpoint + CNPJ + serviço)
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class MetricasLimite:
+    requisicoes: int = 0
+    esperas: int = 0            # requisições que precisaram esperar
+    espera_total: float = 0.0   # segundos
+    espera_max: float = 0.0
+    bloqueios_656: int = 0
+
+
+@dataclass
+class _Entrada:
+    bucket: TokenBucket
+    metricas: MetricasLimite = field(default_factory=MetricasLimite)
+
+
+Chave = Tuple[str, str, str]
+
+
+class LimitadorSefaz:
+    """
+    Registro de TokenBuckets por (endpoint, CNPJ, serviço).
+
+        limitador.aguardar(url, cnpj, "NFeConsultaProtocolo4")
+        resp = requests.post(...)
+        limitador.registrar_resposta(url, cnpj, "NFeConsultaProtocolo4", resp.content)
+
+    Os limites vêm de LIMITES_PADRAO, sobrescritos por SEFAZ_RATE_LIMITS
+    e por configurar(); serviço sem limite próprio usa o de "*".
+    """
+
+    def __init__(self, limites: Optional[Dict[str, LimiteServico]] = None) -> None:
+        self.limites: Dict[str, LimiteServico] = dict(LIMITES_PADRAO)
+        self.limites.update(_limites_do_ambiente())
+        if limites:
+            self.limites.update(limites)
+        self._entradas: Dict[Chave, _Entrada] = {}
+        self._lock = threading.Lock()
+
+    def configurar(self, servico: str, taxa: float, capacidade: float) -> None:
+        """
+        Define o limite de um serviço. Baldes já criados são refeitos.
+        """
+        with self._lock:
+            self.limites[servico] = LimiteServico(taxa=taxa, capacidade=capacidade)
+            for chave in [c for c in self._entradas if c[2] == servico]:
+                self._entradas[chave].bucket = TokenBucket(taxa, capacidade)
+
+    def _entrada(self, endpoint: str, cnpj: str, servico: str) -> _Entrada:
+        chave = (endpoint, cnpj, servico)
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                limite = self.limites.get(servico) or self.limites["*"]
+                entrada = _Entrada(bucket=TokenBucket(limite.taxa, limite.capacidade))
+                self._entradas[chave] = entrada
+            return entrada
+
+    def aguardar(self, endpoint: str, cnpj: str, servico: str) -> float:
+        """
+        Bloqueia até haver ficha para a requisição. Devolve o tempo esperado.
+
+        Se um 656 pausar o balde enquanto a requisição dorme, ela espera
+        também o restante da pausa antes de seguir.
+        """
+        entrada = self._entrada(endpoint, cnpj, servico)
+        espera = entrada.bucket.reservar()
+        if espera > 0:
+            time.sleep(espera)
+            pausa = entrada.bucket.pausado_por
+            while pausa > 0:
+                time.sleep(pausa)
+                espera += pausa
+                pausa = entrada.bucket.pausado_por
+
+        with self._lock:
+            m = entrada.metricas
+            m.requisicoes += 1
+            if espera > 0:
+                m.esperas += 1
+                m.espera_total += espera
+                m.espera_max = max(m.espera_max, espera)
+        return espera
+
+    def registrar_cstat(self, endpoint: str, cnpj: str, servico: str, cstat: Optional[int]) -> None:
+        entrada = self._entrada(endpoint, cnpj, servico)
+        if cstat == CSTAT_CONSUMO_INDEVIDO:
+            entrada.bucket.pausar()
+            with self._lock:
+                entrada.metricas.bloqueios_656 += 1
+        else:
+            entrada.bucket.sucesso()
+
+    def registrar_resposta(self, endpoint: str, cnpj: str, servico: str, conteudo: bytes) -> None:
+        """
+        Procura cStat 656 no corpo da resposta (sem parsear o XML).
+        """
+        cstat = CSTAT_CONSUMO_INDEVIDO if _RE_CSTAT_656.search(conteudo or b"") else None
+        self.registrar_cstat(endpoint, cnpj, servico, cstat)
+
+    def metricas(self) -> List[Dict[str, Any]]:
+        """
+        Uma linha por balde: chave, limites atuais, pausa e tempos de espera.
+        """
+        with self._lock:
+            itens = list(self._entradas.items())
+        linhas: List[Dict[str, Any]] = []
+        for (endpoint, cnpj, servico), entrada in itens:
+            b, m = entrada.bucket, entrada.metricas
+            linhas.append({
+                "endpoint": endpoint,
+                "cnpj": cnpj,
+                "servico": servico,
+                "taxa": b.taxa,
+                "taxa_configurada": b.taxa_configurada,
+                "capacidade": b.capacidade,
+                "pausado_por": round(b.pausado_por, 3),
+                "requisicoes": m.requisicoes,
+                "esperas": m.esperas,
+                "espera_total": round(m.espera_total, 3),
+                "espera_media": round(m.espera_total / m.requisicoes, 3) if m.requisicoes else 0.0,
+                "espera_max": round(m.espera_max, 3),
+                "bloqueios_656": m.bloqueios_656,
+            })
+        return linhas
+
+
+# Instância compartilhada pelo transporte (envio.py, soap_client.py, MDF-e, CT-e)
+limitador = LimitadorSefaz()
+
+
+# ----------------------------------------------------------------------
+# HELPERS PARA O TRANSPORTE
+# ----------------------------------------------------------------------
+
+
+def servico_da_requisicao(url: str, soap_action: Optional[str] = None) -> str:
+    """
+    Nome do serviço a partir da soapAction (".../wsdl/NFeConsultaProtocolo4/...")
+    ou, na falta dela, do último segmento da URL sem extensão
+    (".../MDFeStatusServico.asmx" → "MDFeStatusServico").
+    """
+    if soap_action:
+        m = _RE_SERVICO_WSDL.search(soap_action)
+        if m:
+            return m.group(1)
+    caminho = (url or "").split("?", 1)[0].rstrip("/")
+    nome = caminho.rsplit("/", 1)[-1]
+    return nome.split(".", 1)[0] or "*"
+
+
+_cnpj_por_certificado: Dict[str, str] = {}
+
+
+def cnpj_do_certificado(pem_cert: bytes) -> Optional[str]:
+    """
+    CNPJ do titular de um certificado ICP-Brasil (CN "RAZAO:CNPJ").
+    """
+    cert = x509.load_pem_x509_certificate(pem_cert)
+    for attr in cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME):
+        m = _RE_CNPJ_CN.search(str(attr.value))
+        if m:
+            return m.group(1)
+    return None
+
+
+def identificar_certificado(pfx_path: str, pfx_password: str) -> str:
+    """
+    CNPJ do certificado (cacheado por arquivo). Se não der para ler o
+    CNPJ, o próprio caminho do PFX identifica o balde.
+    """
+    cnpj = _cnpj_por_certificado.get(pfx_path)
+    if cnpj is None:
+        try:
+            _, pem_cert = _load_pfx(pfx_path, pfx_password)
+            cnpj = cnpj_do_certificado(pem_cert) or pfx_path
+        except Exception:
+            cnpj = pfx_path
+        _cnpj_por_certificado[pfx_path] = cnpj
+    return cnpj
+
+
+def post_pkcs12(url: str, *, pkcs12_filename: str, pkcs12_password: str, **kwargs: Any):
+    """
+    POST com o certificado PFX (mesma assinatura do requests_pkcs12.post)
+    usando a sessão mTLS reaproveitada do certificado, com o limitador na
+    frente. Usado por MDF-e e CT-e.
+    """
+    headers = kwargs.get("headers") or {}
+    soap_action = headers.get("SOAPAction") or headers.get("Content-Type", "")
+    servico = servico_da_requisicao(url, soap_action)
+    cnpj = identificar_certificado(pkcs12_filename, pkcs12_password)
+
+    sessao = sessao_com_pfx(pkcs12_filename, pkcs12_password)
+    with rotulos_padrao(servico=servico):
+        with etapa("fila_limite"):
+            limitador.aguardar(url, cnpj, servico)
+        with chamadas_em_andamento.em_andamento(servico=servico), etapa("http"):
+            resp = sessao.post(url, **kwargs)
+    limitador.registrar_resposta(url, cnpj, servico, resp.content)
+    return resp
@@ -0,0 +1,265 @@
+# sefaz_service/core/repositorio.py
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Union
+
+
+# ----------------------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class DocumentoArmazenado:
+    """
+    Metadados de um documento gravado no repositório.
+
+    - id: identificador do documento (uuid4 hex)
+    - tipo: tipo/schema do documento (ex.: "procNFe_v4.00.xsd", "nfeProc")
+    - chave: chave de acesso (44 dígitos), quando houver
+    - cnpj: CNPJ/CPF "dono" do documento (emitente ou interessado)
+    - nsu: NSU da Distribuição DF-e, quando vier de lá
+    - tamanho: tamanho em bytes do conteúdo
+    - caminho: arquivo onde o conteúdo está gravado
+    """
+    id: str
+    tipo: str
+    chave: Optional[str]
+    cnpj: Optional[str]
+    nsu: Optional[str]
+    tamanho: int
+    caminho: str
+    criado_em: float
+
+
+_SQL_CRIAR = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id        TEXT PRIMARY KEY,
+    tipo      TEXT NOT NULL,
+    chave     TEXT,
+    cnpj      TEXT,
+    nsu       TEXT,
+    tamanho   INTEGER NOT NULL,
+    caminho   TEXT NOT NULL,
+    criado_em REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_documentos_chave ON documentos (chave);
+CREATE INDEX IF NOT EXISTS ix_documentos_cnpj ON documentos (cnpj, tipo);
+CREATE UNIQUE INDEX IF NOT EXISTS ux_documentos_nsu ON documentos (cnpj, nsu)
+    WHERE nsu IS NOT NULL;
+"""
+
+
+Conteudo = Union[bytes, str, Iterable[bytes]]
+
+
+# ----------------------------------------------------------------------
+# REPOSITÓRIO
+# ----------------------------------------------------------------------
+
+
+class RepositorioDocumentos:
+    """
+    Repositório local de documentos fiscais (XML, PDF...).
+
+    O conteúdo vai para arquivos em base_dir/<cnpj>/<aaaa-mm>/<id>.<ext>
+    e os metadados para um índice SQLite (base_dir/index.db), o que
+    permite buscar por chave, CNPJ, tipo ou NSU sem abrir os arquivos.
+
+    salvar() aceita bytes, str ou um iterável de blocos de bytes; neste
+    último caso o conteúdo é gravado em streaming, sem montar tudo em
+    memória.
+    """
+
+    def __init__(self, base_dir: str = "sefaz_docs") -> None:
+        self.base_dir = base_dir
+        os.makedirs(self.base_dir, exist_ok=True)
+        self._db_path = os.path.join(self.base_dir, "index.db")
+        self._lock = threading.Lock()
+        with self._conectar() as conn:
+            conn.executescript(_SQL_CRIAR)
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_doc(row: sqlite3.Row) -> DocumentoArmazenado:
+        return DocumentoArmazenado(
+            id=row["id"],
+            tipo=row["tipo"],
+            chave=row["chave"],
+            cnpj=row["cnpj"],
+            nsu=row["nsu"],
+            tamanho=row["tamanho"],
+            caminho=row["caminho"],
+            criado_em=row["criado_em"],
+        )
+
+    # ------------------------------------------------------------------
+    # Gravação
+    # ------------------------------------------------------------------
+
+    def salvar(
+        self,
+        conteudo: Conteudo,
+        tipo: str,
+        *,
+        chave: Optional[str] = None,
+        cnpj: Optional[str] = None,
+        nsu: Optional[str] = None,
+        extensao: str = "xml",
+    ) -> str:
+        """
+        Grava o conteúdo e devolve o id do documento.
+
+        Se (cnpj, nsu) já existir no índice, o documento não é gravado
+        de novo e o id existente é devolvido.
+
+        `cnpj` vira nome de pasta: só dígitos (CNPJ/CPF sem máscara).
+        """
+        if cnpj is not None and not (cnpj.isascii() and cnpj.isdigit()):
+            raise ValueError(f"CNPJ/CPF deve conter só dígitos: {cnpj!r}")
+        if nsu is not None and cnpj is not None:
+            existente = self.buscar_por_nsu(cnpj, nsu)
+            if existente is not None:
+                return existente.id
+
+        doc_id = uuid.uuid4().hex
+        pasta = os.path.join(self.base_dir, cnpj or "_", time.strftime("%Y-%m"))
+        os.makedirs(pasta, exist_ok=True)
+        caminho = os.path.join(pasta, f"{doc_id}.{extensao}")
+
+        # 1) conteúdo → arquivo temporário (streaming se for iterável)
+        tmp = caminho + ".tmp"
+        tamanho = 0
+        with open(tmp, "wb") as f:
+            if isinstance(conteudo, str):
+                conteudo = conteudo.encode("utf-8")
+            if isinstance(conteudo, (bytes, bytearray, memoryview)):
+                f.write(conteudo)
+                tamanho = len(conteudo)
+            else:
+                for bloco in conteudo:
+                    f.write(bloco)
+                    tamanho += len(bloco)
+        os.replace(tmp, caminho)
+
+        # 2) índice
+        with self._lock, self._conectar() as conn:
+            try:
+                conn.execute(
+                    "INSERT INTO documentos (id, tipo, chave, cnpj, nsu, tamanho,"
+                    " caminho, criado_em) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (doc_id, tipo, chave, cnpj, nsu, tamanho, caminho, time.time()),
+                )
+            except sqlite3.IntegrityError:
+                # corrida com outro processo gravando o mesmo NSU
+                os.remove(caminho)
+                existente = self.buscar_por_nsu(cnpj or "", nsu or "")
+                if existente is None:
+                    raise
+                return existente.id
+
+        return doc_id
+
+    def definir_chave(self, doc_id: str, chave: str) -> None:
+        """
+        Preenche a chave de um documento gravado sem ela (ex.: docZip,
+        cuja chave só aparece depois de descompactado).
+        """
+        with self._lock, self._conectar() as conn:
+            conn.execute(
+                "UPDATE documentos SET chave = ? WHERE id = ? AND chave IS NULL",
+                (chave, doc_id),
+            )
+
+    # ------------------------------------------------------------------
+    # Leitura
+    # ------------------------------------------------------------------
+
+    def obter(self, doc_id: str) -> Optional[DocumentoArmazenado]:
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT * FROM documentos WHERE id = ?", (doc_id,)
+            ).fetchone()
+        return self._row_to_doc(row) if row else None
+
+    def abrir(self, doc_id: str) -> BinaryIO:
+        """
+        Abre o conteúdo para leitura binária (o chamador fecha o arquivo).
+        """
+        doc = self.obter(doc_id)
+        if doc is None:
+            raise KeyError(f"Documento não encontrado: {doc_id}")
+        return open(doc.caminho, "rb")
+
+    def ler(self, doc_id: str) -> bytes:
+        with self.abrir(doc_id) as f:
+            return f.read()
+
+    def buscar_por_nsu(self, cnpj: str, nsu: str) -> Optional[DocumentoArmazenado]:
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT * FROM documentos WHERE cnpj = ? AND nsu = ?", (cnpj, nsu)
+            ).fetchone()
+        return self._row_to_doc(row) if row else None
+
+    def listar(
+        self,
+        *,
+        cnpj: Optional[str] = None,
+        tipo: Optional[str] = None,
+        chave: Optional[str] = None,
+        limite: int = 1000,
+    ) -> List[DocumentoArmazenado]:
+        """
+        Lista documentos filtrando por CNPJ, tipo e/ou chave.
+        """
+        filtros: List[str] = []
+        params: List[object] = []
+        if cnpj is not None:
+            filtros.append("cnpj = ?")
+            params.append(cnpj)
+        if tipo is not None:
+            filtros.append("tipo = ?")
+            params.append(tipo)
+        if chave is not None:
+            filtros.append("chave = ?")
+            params.append(chave)
+
+        where = f" WHERE {' AND '.join(filtros)}" if filtros else ""
+        params.append(limite)
+        with self._conectar() as conn:
+            rows = conn.execute(
+                f"SELECT * FROM documentos{where} ORDER BY criado_em LIMIT ?", params
+            ).fetchall()
+        return [self._row_to_doc(r) for r in rows]
+
+    def chaves(self, padrao: str, *, tipo: Optional[str] = None) -> Iterator[str]:
+        """
+        Chaves distintas que casam com `padrao` (LIKE do SQLite: "_" é um
+        caractere qualquer, "%" qualquer sequência), sem montar a lista
+        inteira em memória.
+        """
+        sql = "SELECT DISTINCT chave FROM documentos WHERE chave LIKE ?"
+        params: List[object] = [padrao]
+        if tipo is not None:
+            sql += " AND tipo = ?"
+            params.append(tipo)
+        with self._conectar() as conn:
+            for (chave,) in conn.execute(sql, params):
+                yield chave
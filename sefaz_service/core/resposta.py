@@ -0,0 +1,213 @@
+# sefaz_service/core/resposta.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import cached_property, lru_cache
+from typing import Dict, Optional, Tuple, Union
+
+from lxml import etree
+
+from .envelope import SOAP12_NS
+from .metricas import etapa, registrar_cstat
+from .parser_xml import ler_xml
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+MDFE_NS = "http://www.portalfiscal.inf.br/mdfe"
+CTE_NS = "http://www.portalfiscal.inf.br/cte"
+
+NSMAP = {"soap": SOAP12_NS, "nfe": NFE_NS, "mdfe": MDFE_NS, "cte": CTE_NS}
+
+
+# ----------------------------------------------------------------------
+# TIPOS DE RESPOSTA
+# ----------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class TipoResposta:
+    """
+    - nomes: nome(s) local(is) do elemento de retorno (payload)
+    - prefixo: nfe / mdfe / cte (namespace do payload)
+    - status: caminho, a partir do payload, do nó que tem cStat/xMotivo
+      ("" = o próprio payload)
+    """
+    nomes: Tuple[str, ...]
+    prefixo: str = "nfe"
+    status: str = ""
+
+
+TIPOS_RESPOSTA: Dict[str, TipoResposta] = {
+    # NF-e
+    "retConsStatServ": TipoResposta(("retConsStatServ",)),
+    "retConsSitNFe": TipoResposta(("retConsSitNFe",)),
+    "retEnviNFe": TipoResposta(("retEnviNFe",)),
+    "retConsReciNFe": TipoResposta(("retConsReciNFe",)),
+    "retEnvEvento": TipoResposta(("retEnvEvento",)),
+    "retInutNFe": TipoResposta(("retInutNFe",), status="nfe:infInut/"),
+    "retConsCad": TipoResposta(("retConsCad",), status="nfe:infCons/"),
+    "retDistDFeInt": TipoResposta(("retDistDFeInt",)),
+    "retConsGTIN": TipoResposta(("retConsGTIN",)),
+    # MDF-e
+    "retConsStatServMDFe": TipoResposta(("retConsStatServMDFe",), "mdfe"),
+    "retConsSitMDFe": TipoResposta(("retConsSitMDFe",), "mdfe"),
+    "retEventoMDFe": TipoResposta(("retEventoMDFe",), "mdfe", status="mdfe:infEvento/"),
+    "retMDFe": TipoResposta(("retMDFe",), "mdfe"),
+    "retEnviMDFe": TipoResposta(("retEnviMDFe",), "mdfe"),
+    "retConsReciMDFe": TipoResposta(("retConsReciMDFe",), "mdfe"),
+    # CT-e (3.00 usa "Cte", 4.00 usa "CTe")
+    "retConsStatServCTe": TipoResposta(("retConsStatServCTe", "retConsStatServCte"), "cte"),
+}
+
+
+class _XPathTipo:
+    """XPaths já compilados de um tipo de resposta."""
+
+    def __init__(self, tipo: TipoResposta) -> None:
+        p = tipo.prefixo
+        nomes = [f"{p}:{n}" for n in tipo.nomes]
+        # caminho direto: Body/xxxResult/payload, Body/xxxResponse/xxxResult/payload
+        # ou o payload como raiz (XML já extraído do SOAP)
+        caminhos = []
+        for n in nomes:
+            caminhos += [
+                f"/soap:Envelope/soap:Body/*/{n}",
+                f"/soap:Envelope/soap:Body/*/*/{n}",
+                f"/{n}",
+            ]
+        self.payload = etree.XPath(" | ".join(caminhos), namespaces=NSMAP)
+        # fallback para envelopes fora do padrão (SOAP 1.1, wrappers extras)
+        self.payload_qualquer = etree.XPath(" | ".join(f"//{n}" for n in nomes), namespaces=NSMAP)
+        self.cstat = etree.XPath(f"string({tipo.status}{p}:cStat)", namespaces=NSMAP)
+        self.xmotivo = etree.XPath(f"string({tipo.status}{p}:xMotivo)", namespaces=NSMAP)
+
+
+_XPATHS: Dict[str, _XPathTipo] = {nome: _XPathTipo(t) for nome, t in TIPOS_RESPOSTA.items()}
+
+
+@lru_cache(maxsize=256)
+def _xpath_texto(caminho: str) -> etree.XPath:
+    return etree.XPath(f"string({caminho})", namespaces=NSMAP)
+
+
+# ----------------------------------------------------------------------
+# RESULTADO
+# ----------------------------------------------------------------------
+
+
+def texto_resposta(conteudo: Union[bytes, str, None]) -> str:
+    """
+    Texto da resposta HTTP da SEFAZ (sempre UTF-8). Substitui
+    `resp.text`, que sem charset no Content-Type roda a detecção de
+    encoding do requests sobre o corpo inteiro.
+    """
+    if conteudo is None:
+        return ""
+    if isinstance(conteudo, str):
+        return conteudo
+    return conteudo.decode("utf-8", errors="replace")
+
+
+@dataclass
+class RespostaSefaz:
+    """
+    Resposta da SEFAZ lida uma única vez.
+
+    - payload: elemento de retorno (retEnviNFe, retConsSitNFe, ...) ou
+      None se não veio (erro de parse, SOAP Fault, HTML de erro...)
+    - erro: motivo quando o payload não foi encontrado
+    - bruto: bytes da resposta como vieram (SOAP completo)
+
+    As versões texto (xml_bruto, xml_payload) são geradas só quando pedidas.
+    """
+    tipo: str
+    cStat: Optional[int]
+    xMotivo: Optional[str]
+    payload: Optional[etree._Element] = None
+    erro: Optional[str] = None
+    bruto: bytes = b""
+
+    @property
+    def cstat_txt(self) -> str:
+        return "" if self.cStat is None else str(self.cStat)
+
+    def texto(self, caminho: str) -> Optional[str]:
+        """
+        Texto de um caminho relativo ao payload (ex.: "nfe:infRec/nfe:nRec"),
+        com XPath compilado em cache. None se vazio ou sem payload.
+        """
+        if self.payload is None:
+            return None
+        valor = _xpath_texto(caminho)(self.payload).strip()
+        return valor or None
+
+    def payload_bytes(self, declaracao: bool = True) -> Optional[bytes]:
+        if self.payload is None:
+            return None
+        return etree.tostring(self.payload, encoding="utf-8", xml_declaration=declaracao)
+
+    def xml_payload(self, declaracao: bool = True) -> Optional[str]:
+        dados = self.payload_bytes(declaracao)
+        return None if dados is None else dados.decode("utf-8")
+
+    @cached_property
+    def xml_bruto(self) -> str:
+        """Resposta completa como str (decodificada no primeiro acesso)."""
+        return texto_resposta(self.bruto)
+
+    @property
+    def xml_retorno(self) -> str:
+        """O payload, se veio; senão a resposta bruta (para inspeção)."""
+        return self.xml_payload() or self.xml_bruto
+
+
+def _int(txt: str) -> Optional[int]:
+    txt = txt.strip()
+    return int(txt) if txt.isdigit() else None
+
+
+def ler_resposta(
+    conteudo: Union[bytes, str], tipo: str, *, metricas: bool = True
+) -> RespostaSefaz:
+    """
+    Faz o parse da resposta (SOAP completo ou o payload já extraído) uma
+    vez e devolve o payload com cStat/xMotivo do tipo informado.
+
+    Conta na etapa "parse" e no contador de cStat das métricas; com
+    metricas=False (releitura de uma resposta já contada) não conta.
+    """
+    if not metricas:
+        return _ler_resposta(conteudo, tipo)
+    with etapa("parse"):
+        ret = _ler_resposta(conteudo, tipo)
+    registrar_cstat(ret.cStat, servico=tipo)
+    return ret
+
+
+def _ler_resposta(conteudo: Union[bytes, str], tipo: str) -> RespostaSefaz:
+    xp = _XPATHS.get(tipo)
+    if xp is None:
+        raise ValueError(f"Tipo de resposta desconhecido: {tipo!r}")
+
+    if isinstance(conteudo, str):
+        conteudo = conteudo.encode("utf-8")
+
+    try:
+        root = ler_xml(conteudo)
+    except Exception:
+        return RespostaSefaz(
+            tipo, None, None, erro="Falha ao parsear XML de retorno", bruto=conteudo
+        )
+
+    nodes = xp.payload(root) or xp.payload_qualquer(root)
+    if not nodes:
+        return RespostaSefaz(tipo, None, None, erro=f"Retorno sem {tipo}", bruto=conteudo)
+
+    payload = nodes[0]
+    xmotivo = xp.xmotivo(payload).strip()
+    return RespostaSefaz(
+        tipo=tipo,
+        cStat=_int(xp.cstat(payload)),
+        xMotivo=xmotivo or None,
+        payload=payload,
+        bruto=conteudo,
+    )
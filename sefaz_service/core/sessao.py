@@ -0,0 +1,221 @@
+# sefaz_service/core/sessao.py
+from __future__ import annotations
+
+import atexit
+import os
+import socket
+import tempfile
+import threading
+from typing import Dict, List, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPSConnection
+from urllib3.connectionpool import HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+
+try:  # fora da API documentada do urllib3; sem ele, DNS e TCP não são separados
+    from urllib3.util.connection import allowed_gai_family
+except ImportError:  # pragma: no cover
+    allowed_gai_family = None
+
+from .assinatura import _load_pfx
+from .metricas import etapa, registro
+from .rastreamento import iniciar_span, rastreamento_ativo, span
+
+# Sessões HTTPS reaproveitadas por certificado (pool de conexões keep-alive)
+POOL_MAXSIZE = 32
+
+_sessoes: Dict[Tuple[str, float, str], requests.Session] = {}
+_sessoes_lock = threading.Lock()
+_arquivos_pem: List[str] = []
+
+
+def _remover_arquivos_pem() -> None:
+    for caminho in _arquivos_pem:
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+
+
+atexit.register(_remover_arquivos_pem)
+
+
+def _gravar_pem_temporario(conteudo: bytes) -> str:
+    with tempfile.NamedTemporaryFile("wb", suffix=".pem", delete=False) as f:
+        f.write(conteudo)
+    _arquivos_pem.append(f.name)
+    return f.name
+
+
+def _descartar_sessao(sessao: requests.Session) -> None:
+    """Fecha a sessão e apaga os PEM temporários dela (com _sessoes_lock)."""
+    sessao.close()
+    for caminho in sessao.cert or ():
+        try:
+            os.remove(caminho)
+        except OSError:
+            pass
+        if caminho in _arquivos_pem:
+            _arquivos_pem.remove(caminho)
+
+
+class _ConexaoMedida(HTTPSConnection):
+    """
+    Conexão HTTPS que mede o connect (TCP + handshake TLS) nas métricas e,
+    com o rastreamento ligado, abre spans de DNS, TCP, TLS, envio do
+    pedido e espera pelo primeiro byte da resposta (TTFB).
+
+    O urllib3 não tem gancho público entre a resolução de nomes e o
+    connect TCP; os spans de DNS/TCP/TLS sobrescrevem _new_conn e usam
+    _dns_host (urllib3 2.x, faixa fixada em requirements.txt). Se esses
+    detalhes mudarem, a conexão segue o caminho normal do urllib3 e fica
+    só a etapa "conexao" e os spans de envio/TTFB.
+    """
+
+    _span_tls = None
+
+    def connect(self) -> None:
+        with etapa("conexao"):
+            try:
+                super().connect()
+            finally:
+                if self._span_tls is not None:
+                    self._span_tls.end()
+                    self._span_tls = None
+
+    def _separar_dns_tcp(self) -> bool:
+        return (
+            rastreamento_ativo()
+            and allowed_gai_family is not None
+            and isinstance(getattr(self, "_dns_host", None), str)
+        )
+
+    def _new_conn(self) -> socket.socket:
+        if not self._separar_dns_tcp():
+            return super()._new_conn()
+
+        # Resolve aqui para separar DNS de TCP; o connect vai direto ao IP
+        with span("sefaz.conexao.dns", **{"server.address": self.host}):
+            try:
+                enderecos = list(dict.fromkeys(
+                    info[4][0]
+                    for info in socket.getaddrinfo(
+                        self._dns_host, self.port, allowed_gai_family(), socket.SOCK_STREAM
+                    )
+                ))
+            except socket.gaierror:
+                enderecos = []  # o urllib3 resolve de novo e gera o erro dele
+
+        with span("sefaz.conexao.tcp", **{"server.port": self.port}):
+            sock = self._conectar_enderecos(enderecos)
+        # o restante do connect() é o handshake TLS; encerrado em connect()
+        self._span_tls = iniciar_span("sefaz.conexao.tls", **{"server.address": self.host})
+        return sock
+
+    def _conectar_enderecos(self, enderecos: List[str]) -> socket.socket:
+        if not enderecos:
+            return super()._new_conn()
+        # _dns_host só é usado no connect TCP; o SNI e a verificação do
+        # certificado usam self.host, restaurado antes do handshake
+        nome = self._dns_host
+        erro = None
+        try:
+            for endereco in enderecos:
+                self._dns_host = endereco
+                try:
+                    return super()._new_conn()
+                except ConnectTimeoutError as e:  # inclui NewConnectionError
+                    erro = e
+        finally:
+            self._dns_host = nome
+        raise erro
+
+    def request(self, method, url, *args, **kwargs) -> None:
+        with span("sefaz.http.envio", **{"http.request.method": method, "url.path": url}):
+            super().request(method, url, *args, **kwargs)
+
+    def getresponse(self):
+        with span("sefaz.http.ttfb") as s:
+            resposta = super().getresponse()
+            if s is not None:
+                s.set_attribute("http.response.status_code", resposta.status)
+            return resposta
+
+
+class _PoolMedido(HTTPSConnectionPool):
+    ConnectionCls = _ConexaoMedida
+
+
+class _AdaptadorMedido(HTTPAdapter):
+    """HTTPAdapter cujas conexões HTTPS entram na etapa "conexao" das métricas."""
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            **self.poolmanager.pool_classes_by_scheme,
+            "https": _PoolMedido,
+        }
+
+
+def _pools():
+    with _sessoes_lock:
+        sessoes = list(_sessoes.values())
+    for sessao in sessoes:
+        adapter = sessao.get_adapter("https://")
+        gerenciador = adapter.poolmanager
+        for chave in gerenciador.pools.keys():
+            pool = gerenciador.pools.get(chave)
+            if pool is not None and pool.pool is not None:
+                yield pool
+
+
+def _metricas_pool():
+    """Conexões por host: em uso / ociosas (somando todos os certificados)."""
+    por_host: Dict[Tuple[str, str], float] = {}
+    for pool in _pools():
+        fila = list(pool.pool.queue)
+        ociosas = sum(1 for c in fila if c is not None)
+        em_uso = pool.pool.maxsize - len(fila)
+        for estado, valor in (("ociosas", ociosas), ("em_uso", em_uso)):
+            chave = (pool.host, estado)
+            por_host[chave] = por_host.get(chave, 0) + valor
+    return [({"host": h, "estado": e}, v) for (h, e), v in sorted(por_host.items())]
+
+
+registro.coletor(
+    "sefaz_pool_conexoes",
+    "gauge",
+    f"Conexões HTTPS dos pools de sessão mTLS por host (máximo {POOL_MAXSIZE} por pool)",
+    _metricas_pool,
+)
+
+
+def sessao_com_pfx(pfx_path: str, pfx_password: str) -> requests.Session:
+    """
+    Sessão requests com o certificado do PFX (mTLS), criada uma vez por
+    arquivo (recriada se o .pfx ou a senha mudar) e compartilhada entre
+    threads, para que chamadas seguidas ao mesmo endpoint reaproveitem a
+    conexão TLS. Ao recriar, a sessão anterior do mesmo arquivo é fechada
+    e os PEM temporários dela são apagados.
+
+    Usada por NF-e (enviar_soap_com_pfx) e por MDF-e/CT-e (post_pkcs12).
+    """
+    chave = (pfx_path, os.path.getmtime(pfx_path), pfx_password)
+    with _sessoes_lock:
+        sessao = _sessoes.get(chave)
+        if sessao is None:
+            pem_key, pem_cert = _load_pfx(pfx_path, pfx_password)
+
+            # requests espera caminhos de arquivos PEM (cert, key).
+            sessao = requests.Session()
+            sessao.cert = (_gravar_pem_temporario(pem_cert), _gravar_pem_temporario(pem_key))
+            sessao.verify = False  # ⚠ manter False enquanto não tiver cadeia da SEFAZ instalada
+            adapter = _AdaptadorMedido(pool_connections=POOL_MAXSIZE, pool_maxsize=POOL_MAXSIZE)
+            sessao.mount("https://", adapter)
+
+            for antiga in [c for c in _sessoes if c[0] == pfx_path]:
+                _descartar_sessao(_sessoes.pop(antiga))
+            _sessoes[chave] = sessao
+        return sessao
@@ -7,6 +7,14 @@ from typing import Optional
 import requests
 from requests_pkcs12 import Pkcs12Adapter
 
+from sefaz_service.core.metricas import chamadas_em_andamento, etapa, rotulos_padrao
+from sefaz_service.core.rate_limit import (
+    identificar_certificado,
+    limitador,
+    servico_da_requisicao,
+)
+from sefaz_service.core.resposta import texto_resposta
+
 
 @dataclass
 class SoapClient:
@@ -35,9 +43,10 @@ class SoapClient:
         Envia XML via POST SOAP para o endpoint informado.
         """
 
+        dados = xml.encode("utf-8")
         headers = {
             "Content-Type": "text/xml; charset=utf-8",
-            "Content-Length": str(len(xml)),
+            "Content-Length": str(len(dados)),
         }
 
         if soap_action:
@@ -45,17 +54,25 @@ class SoapClient:
 
         session = self._get_session()
 
-        response = session.post(
-            url=url,
-            data=xml.encode("utf-8"),
-            headers=headers,
-            timeout=self.timeout,
-        )
+        servico = servico_da_requisicao(url, soap_action)
+        cnpj = identificar_certificado(self.pfx_path, self.pfx_password)
+        with rotulos_padrao(servico=servico):
+            with etapa("fila_limite"):
+                limitador.aguardar(url, cnpj, servico)
+            with chamadas_em_andamento.em_andamento(servico=servico), etapa("http"):
+                response = session.post(
+                    url=url,
+                    data=dados,
+                    headers=headers,
+                    timeout=self.timeout,
+                )
+
+        limitador.registrar_resposta(url, cnpj, servico, response.content)
 
         # erro HTTP?
         response.raise_for_status()
 
-        return response.text
+        return texto_resposta(response.content)
 
     # alias opcional
     def post(self, url: str, xml: str, soap_action: Optional[str] = None) -> str:
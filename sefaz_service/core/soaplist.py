@@ -235,3 +235,175 @@ def get_nfe_cons_gtin_endpoint() -> EndpointInfo:
     Não depende de UF nem de ambiente.
     """
     return EndpointInfo(url=GTIN_ENDPOINT, soap_action=GTIN_SOAP_ACTION)
+
+
+# ============================================================
+# 5) NFeRetAutorizacao4 (consulta do RECIBO de lote assíncrono)
+# ============================================================
+
+SOAP_ACTION_RET_AUT = (
+    "http://www.portalfiscal.inf.br/nfe/wsdl/NFeRetAutorizacao4/nfeRetAutorizacaoLote"
+)
+
+# UFs com endpoint próprio para RETORNO DA AUTORIZAÇÃO
+UF_RET_AUT_ENDPOINTS = {
+    "SP": {
+        "1": "https://nfe.fazenda.sp.gov.br/ws/nferetautorizacao4.asmx",
+        "2": "https://homologacao.nfe.fazenda.sp.gov.br/ws/nferetautorizacao4.asmx",
+    },
+    "PR": {
+        "1": "https://nfe.sefa.pr.gov.br/nfe/NFeRetAutorizacao4",
+        "2": "https://homologacao.nfe.sefa.pr.gov.br/nfe/NFeRetAutorizacao4",
+    },
+    "MG": {
+        "1": "https://nfe.fazenda.mg.gov.br/nfe2/services/NFeRetAutorizacao4",
+        "2": "https://hnfe.fazenda.mg.gov.br/nfe2/services/NFeRetAutorizacao4",
+    },
+    "GO": {
+        "1": "https://nfe.sefaz.go.gov.br/nfe/services/NFeRetAutorizacao4",
+        "2": "https://homolog.sefaz.go.gov.br/nfe/services/NFeRetAutorizacao4",
+    },
+    "MT": {
+        "1": "https://nfe.sefaz.mt.gov.br/nfews/v2/services/NfeRetAutorizacao4",
+        "2": "https://homologacao.sefaz.mt.gov.br/nfews/v2/services/NfeRetAutorizacao4",
+    },
+    "MS": {
+        "1": "https://nfe.sefaz.ms.gov.br/ws/NFeRetAutorizacao4",
+        "2": "https://hom.nfe.sefaz.ms.gov.br/ws/NFeRetAutorizacao4",
+    },
+    "BA": {
+        "1": "https://nfe.sefaz.ba.gov.br/webservices/NFeRetAutorizacao4/NFeRetAutorizacao4.asmx",
+        "2": "https://hnfe.sefaz.ba.gov.br/webservices/NFeRetAutorizacao4/NFeRetAutorizacao4.asmx",
+    },
+    "AM": {
+        "1": "https://nfe.sefaz.am.gov.br/services2/services/NfeRetAutorizacao4",
+        "2": "https://homnfe.sefaz.am.gov.br/services2/services/NfeRetAutorizacao4",
+    },
+    "PE": {
+        "1": "https://nfe.sefaz.pe.gov.br/nfe-service/services/NFeRetAutorizacao4",
+        "2": "https://nfehomolog.sefaz.pe.gov.br/nfe-service/services/NFeRetAutorizacao4",
+    },
+}
+
+# SVRS para RETORNO DA AUTORIZAÇÃO
+SVRS_RET_AUT_ENDPOINTS = {
+    "1": "https://nfe.svrs.rs.gov.br/ws/NfeRetAutorizacao/NFeRetAutorizacao4.asmx",
+    "2": "https://nfe-homologacao.svrs.rs.gov.br/ws/NfeRetAutorizacao/NFeRetAutorizacao4.asmx",
+}
+
+
+def get_nfe_ret_autorizacao4_endpoint(uf: str, ambiente: str = "2") -> EndpointInfo:
+    """
+    Retorna o endpoint (URL + SOAPAction) do serviço NFeRetAutorizacao4
+    (consulta do recibo nRec) para a UF e ambiente informados.
+    """
+    uf = (uf or "").upper()
+    ambiente = (ambiente or "2").strip()
+    if ambiente not in {"1", "2"}:
+        ambiente = "2"
+
+    # 1) UF com endpoint próprio
+    if uf in UF_RET_AUT_ENDPOINTS:
+        url = UF_RET_AUT_ENDPOINTS[uf][ambiente]
+        return EndpointInfo(url=url, soap_action=SOAP_ACTION_RET_AUT)
+
+    # 2) UF atendida pela SVRS / fallback
+    url = SVRS_RET_AUT_ENDPOINTS[ambiente]
+    return EndpointInfo(url=url, soap_action=SOAP_ACTION_RET_AUT)
+
+
+# ============================================================
+# 6) CadConsultaCadastro4 (consulta cadastro de contribuinte)
+# ============================================================
+
+SOAP_ACTION_CADASTRO = (
+    "http://www.portalfiscal.inf.br/nfe/wsdl/CadConsultaCadastro4/consultaCadastro"
+)
+
+# UFs com endpoint próprio para CONSULTA CADASTRO
+UF_CADASTRO_ENDPOINTS = {
+    "SP": {
+        "1": "https://nfe.fazenda.sp.gov.br/ws/cadconsultacadastro4.asmx",
+        "2": "https://homologacao.nfe.fazenda.sp.gov.br/ws/cadconsultacadastro4.asmx",
+    },
+    "PR": {
+        "1": "https://nfe.sefa.pr.gov.br/nfe/CadConsultaCadastro4",
+        "2": "https://homologacao.nfe.sefa.pr.gov.br/nfe/CadConsultaCadastro4",
+    },
+    "MG": {
+        "1": "https://nfe.fazenda.mg.gov.br/nfe2/services/CadConsultaCadastro4",
+        "2": "https://hnfe.fazenda.mg.gov.br/nfe2/services/CadConsultaCadastro4",
+    },
+    "GO": {
+        "1": "https://nfe.sefaz.go.gov.br/nfe/services/CadConsultaCadastro4",
+        "2": "https://homolog.sefaz.go.gov.br/nfe/services/CadConsultaCadastro4",
+    },
+    "MT": {
+        "1": "https://nfe.sefaz.mt.gov.br/nfews/v2/services/CadConsultaCadastro4",
+        "2": "https://homologacao.sefaz.mt.gov.br/nfews/v2/services/CadConsultaCadastro4",
+    },
+    "MS": {
+        "1": "https://nfe.sefaz.ms.gov.br/ws/CadConsultaCadastro4",
+        "2": "https://hom.nfe.sefaz.ms.gov.br/ws/CadConsultaCadastro4",
+    },
+    "BA": {
+        "1": "https://nfe.sefaz.ba.gov.br/webservices/CadConsultaCadastro4/CadConsultaCadastro4.asmx",
+        "2": "https://hnfe.sefaz.ba.gov.br/webservices/CadConsultaCadastro4/CadConsultaCadastro4.asmx",
+    },
+    "PE": {
+        "1": "https://nfe.sefaz.pe.gov.br/nfe-service/services/CadConsultaCadastro4",
+        "2": "https://nfehomolog.sefaz.pe.gov.br/nfe-service/services/CadConsultaCadastro4",
+    },
+}
+
+# SVRS para CONSULTA CADASTRO
+SVRS_CADASTRO_ENDPOINTS = {
+    "1": "https://cad.svrs.rs.gov.br/ws/cadconsultacadastro/cadconsultacadastro4.asmx",
+    "2": "https://cad-homologacao.svrs.rs.gov.br/ws/cadconsultacadastro/cadconsultacadastro4.asmx",
+}
+
+
+def get_cad_consulta_cadastro4_endpoint(uf: str, ambiente: str = "1") -> EndpointInfo:
+    """
+    Retorna o endpoint (URL + SOAPAction) do serviço CadConsultaCadastro4
+    para a UF e ambiente informados.
+    """
+    uf = (uf or "").upper()
+    ambiente = (ambiente or "1").strip()
+    if ambiente not in {"1", "2"}:
+        ambiente = "1"
+
+    # 1) UF com endpoint próprio
+    if uf in UF_CADASTRO_ENDPOINTS:
+        url = UF_CADASTRO_ENDPOINTS[uf][ambiente]
+        return EndpointInfo(url=url, soap_action=SOAP_ACTION_CADASTRO)
+
+    # 2) UF atendida pela SVRS / fallback
+    url = SVRS_CADASTRO_ENDPOINTS[ambiente]
+    return EndpointInfo(url=url, soap_action=SOAP_ACTION_CADASTRO)
+
+
+# ============================================================
+# 7) NFeRecepcaoEvento4 – Ambiente Nacional (cOrgao 91)
+#    Manifestação do destinatário (2102xx)
+# ============================================================
+
+SOAP_ACTION_EVENTO = (
+    "http://www.portalfiscal.inf.br/nfe/wsdl/NFeRecepcaoEvento4/nfeRecepcaoEvento"
+)
+
+AN_EVENTO_ENDPOINTS = {
+    "1": "https://www.nfe.fazenda.gov.br/NFeRecepcaoEvento4/NFeRecepcaoEvento4.asmx",
+    "2": "https://hom1.nfe.fazenda.gov.br/NFeRecepcaoEvento4/NFeRecepcaoEvento4.asmx",
+}
+
+
+def get_nfe_recepcao_evento_an_endpoint(ambiente: str = "1") -> EndpointInfo:
+    """
+    Endpoint do NFeRecepcaoEvento4 no Ambiente Nacional (eventos com
+    cOrgao=91, como a manifestação do destinatário).
+    """
+    ambiente = (ambiente or "1").strip()
+    if ambiente not in {"1", "2"}:
+        ambiente = "1"
+    return EndpointInfo(url=AN_EVENTO_ENDPOINTS[ambiente], soap_action=SOAP_ACTION_EVENTO)
@@ -79,6 +79,13 @@ def mdfe_url_recepcao_sinc(ambiente: str) -> str:
     return "https://mdfe-homologacao.svrs.rs.gov.br/ws/MDFeRecepcaoSinc/MDFeRecepcaoSinc.asmx"
 
 
+def mdfe_url_ret_recepcao(ambiente: str) -> str:
+    """URL do serviço MDFeRetRecepcao (consulta do recibo do envio assíncrono)."""
+    if ambiente == "1":
+        return "https://mdfe.svrs.rs.gov.br/ws/MDFeRetRecepcao/MDFeRetRecepcao.asmx"
+    return "https://mdfe-homologacao.svrs.rs.gov.br/ws/MDFeRetRecepcao/MDFeRetRecepcao.asmx"
+
+
 def mdfe_url_recepcao_evento(ambiente: str) -> str:
     """URL do serviço MDFeRecepcaoEvento (pagamento, cancelamento, encerramento etc.)."""
     if ambiente == "1":
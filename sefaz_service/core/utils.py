@@ -3,11 +3,11 @@ from __future__ import annotations
 
 from typing import Optional
 
-from lxml import etree
-
 import gzip
 import base64
 
+from .parser_xml import ler_xml
+
 MDFE_NS = "http://www.portalfiscal.inf.br/mdfe"
 
 UF_CODIGOS = {
@@ -76,7 +76,7 @@ def extrair_chave_mdfe(xml: str) -> Optional[str]:
     em <infMDFe>.
     """
     try:
-        root = etree.fromstring(xml.encode("utf-8"))
+        root = ler_xml(xml)
     except Exception:
         return None
 
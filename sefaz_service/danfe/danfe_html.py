@@ -4,26 +4,14 @@ from __future__ import annotations
 import io
 import pdfkit
 
-from typing import Optional, List
+from typing import Dict, Optional, List, Union
 from io import BytesIO
 import base64
-from lxml import etree
+from sefaz_service.core.documento_nfe import DocumentoNFe, ler_nfe
+from sefaz_service.core.rastreamento import rastrear, span
 from .nfce_html import nfce_xml_to_html
 
 
-NFE_NS = "http://www.portalfiscal.inf.br/nfe"
-
-
-def _get_text(elem, path: str, ns: dict, default: str = "") -> str:
-    """Helper pra pegar texto de um caminho XPath simples."""
-    if elem is None:
-        return default
-    node = elem.find(path, ns)
-    if node is not None and node.text:
-        return node.text.strip()
-    return default
-
-
 def _format_cnpj_cpf(doc: str) -> str:
     d = "".join([c for c in (doc or "") if c.isdigit()])
     if len(d) == 14:
@@ -54,30 +42,14 @@ def _format_data_br(iso: str) -> str:
     return f"{dia}/{mes}/{ano}"
 
 
-def _extrair_icms_info(det, ns) -> dict:
+def _extrair_icms_info(icms: Dict[str, str]) -> dict:
     """
-    Extrai CST/CSOSN, vBC, vICMS, pICMS do bloco <imposto><ICMS>.
-    Retorna dict com chaves: cst_csosn, vbc, vicms, picms.
+    Extrai CST/CSOSN, vBC, vICMS, pICMS do grupo ICMS do item
+    (ItemNFe.icms). Retorna dict com chaves: cst_csosn, vbc, vicms, picms.
     """
-    imposto = det.find("nfe:imposto", ns)
-    if imposto is None:
-        return {"cst_csosn": "", "vbc": "", "vicms": "", "piccs": ""}
-
-    icms = imposto.find("nfe:ICMS", ns)
-    if icms is None:
-        return {"cst_csosn": "", "vbc": "", "vicms": "", "picms": ""}
-
-    icms_child = None
-    for child in icms:
-        icms_child = child
-        break
-
-    if icms_child is None:
-        return {"cst_csosn": "", "vbc": "", "vicms": "", "picms": ""}
-
-    cst = _get_text(icms_child, "nfe:CST", ns)
-    csosn = _get_text(icms_child, "nfe:CSOSN", ns)
-    orig = _get_text(icms_child, "nfe:orig", ns)
+    cst = icms.get("CST", "")
+    csosn = icms.get("CSOSN", "")
+    orig = icms.get("orig", "")
 
     # monta CST/CSOSN com origem (orig + CST/CSOSN) → ex: 0 + 41 = 041
     if csosn:
@@ -87,15 +59,11 @@ def _extrair_icms_info(det, ns) -> dict:
     else:
         cst_csosn = ""
 
-    vbc = _get_text(icms_child, "nfe:vBC", ns)
-    vicms = _get_text(icms_child, "nfe:vICMS", ns)
-    picms = _get_text(icms_child, "nfe:pICMS", ns)
-
     return {
         "cst_csosn": cst_csosn,
-        "vbc": vbc,
-        "vicms": vicms,
-        "picms": picms,
+        "vbc": icms.get("vBC", ""),
+        "vicms": icms.get("vICMS", ""),
+        "picms": icms.get("pICMS", ""),
     }
 
 
@@ -134,47 +102,31 @@ def _gerar_barcode_base64(chave: str) -> Optional[str]:
 
 
 def gerar_danfe_html(
-    xml_nfe_proc: str,
+    xml_nfe_proc: Union[bytes, str, DocumentoNFe],
     logo_url: Optional[str] = None,
 ) -> str:
     """
-    Gera um DANFE (layout retrato) em HTML a partir do XML nfeProc.
+    Gera um DANFE (layout retrato) em HTML a partir do XML nfeProc
+    (ou de um DocumentoNFe já lido).
 
     - 1ª folha: canhoto + cabeçalho completo + FATURA/DUPLICATAS +
       TRANSPORTADOR + itens + INF. COMPL./PAGAMENTO.
     - Demais folhas: cabeçalho até NATUREZA DA OPERAÇÃO + itens.
     """
-    parser = etree.XMLParser(remove_blank_text=True)
-    root = etree.fromstring(xml_nfe_proc.encode("utf-8"), parser=parser)
-
-    ns = {"nfe": NFE_NS}
-
-    nfe_el = root.find("nfe:NFe", ns)
-    prot_el = root.find("nfe:protNFe", ns)
-
-    if nfe_el is None:
+    nfe = ler_nfe(xml_nfe_proc)
+    if nfe.nfe is None:
         raise ValueError("nfeProc sem nó <NFe>")
 
-    inf_nfe = nfe_el.find("nfe:infNFe", ns)
-    if inf_nfe is None:
-        raise ValueError("NFe sem <infNFe>")
-
-    ide = inf_nfe.find("nfe:ide", ns)
-    emit = inf_nfe.find("nfe:emit", ns)
-    dest = inf_nfe.find("nfe:dest", ns)
-    total = inf_nfe.find("nfe:total", ns)
-    transp = inf_nfe.find("nfe:transp", ns)
-    pag = inf_nfe.find("nfe:pag", ns)
-    inf_adic = inf_nfe.find("nfe:infAdic", ns)
+    ide = nfe.ide
 
     # ----- CABEÇALHO / DADOS PRINCIPAIS -----
-    n_nf = _get_text(ide, "nfe:nNF", ns)
-    serie = _get_text(ide, "nfe:serie", ns)
-    dh_emi = _get_text(ide, "nfe:dhEmi", ns)
-    dh_saida = _get_text(ide, "nfe:dhSaiEnt", ns)
-    nat_op = _get_text(ide, "nfe:natOp", ns)
-    tp_amb = _get_text(ide, "nfe:tpAmb", ns)
-    tp_nf = _get_text(ide, "nfe:tpNF", ns)
+    n_nf = ide.get("nNF", "")
+    serie = ide.get("serie", "")
+    dh_emi = ide.get("dhEmi", "")
+    dh_saida = ide.get("dhSaiEnt", "")
+    nat_op = ide.get("natOp", "")
+    tp_amb = ide.get("tpAmb", "")
+    tp_nf = ide.get("tpNF", "")
 
     def _so_data(iso: str) -> str:
         if "T" in iso:
@@ -203,7 +155,7 @@ def gerar_danfe_html(
     data_saida_br = _format_data_br(dh_saida)
     hora_saida = _extrair_hora(dh_saida)
 
-    chave_acesso = (inf_nfe.get("Id") or "").replace("NFe", "")
+    chave_acesso = nfe.chave
     chave_formatada = _format_chave(chave_acesso)
 
     # código de barras da chave
@@ -218,68 +170,61 @@ def gerar_danfe_html(
         )
 
     # ----- EMITENTE -----
-    emit_xnome = _get_text(emit, "nfe:xNome", ns)
-    emit_xfant = _get_text(emit, "nfe:xFant", ns)
-    emit_cnpj = _format_cnpj_cpf(_get_text(emit, "nfe:CNPJ", ns))
-    emit_ie = _get_text(emit, "nfe:IE", ns)
-    emit_fone = _get_text(emit, "nfe:fone", ns)
-
-    ender_emit = emit.find("nfe:enderEmit", ns) if emit is not None else None
-    emit_log = emit_nro = emit_bai = emit_mun = emit_uf = emit_cep = ""
-    if ender_emit is not None:
-        emit_log = _get_text(ender_emit, "nfe:xLgr", ns)
-        emit_nro = _get_text(ender_emit, "nfe:nro", ns)
-        emit_bai = _get_text(ender_emit, "nfe:xBairro", ns)
-        emit_mun = _get_text(ender_emit, "nfe:xMun", ns)
-        emit_uf = _get_text(ender_emit, "nfe:UF", ns)
-        emit_cep = _get_text(ender_emit, "nfe:CEP", ns)
+    emit = nfe.emit
+    emit_xnome = emit.get("xNome", "")
+    emit_xfant = emit.get("xFant", "")
+    emit_cnpj = _format_cnpj_cpf(emit.get("CNPJ", ""))
+    emit_ie = emit.get("IE", "")
+    emit_fone = emit.get("fone", "")
+
+    ender_emit = nfe.ender_emit
+    emit_log = ender_emit.get("xLgr", "")
+    emit_nro = ender_emit.get("nro", "")
+    emit_bai = ender_emit.get("xBairro", "")
+    emit_mun = ender_emit.get("xMun", "")
+    emit_uf = ender_emit.get("UF", "")
+    emit_cep = ender_emit.get("CEP", "")
 
     # ----- DESTINATÁRIO -----
-    dest_xnome = _get_text(dest, "nfe:xNome", ns)
+    dest = nfe.dest
+    dest_xnome = dest.get("xNome", "")
     dest_cnpj = _format_cnpj_cpf(
-        _get_text(dest, "nfe:CNPJ", ns) or _get_text(dest, "nfe:CPF", ns)
+        dest.get("CNPJ", "") or dest.get("CPF", "")
     )
-    dest_ie = _get_text(dest, "nfe:IE", ns)
-    dest_fone = _get_text(dest, "nfe:fone", ns)
-    dest_im = _get_text(dest, "nfe:IM", ns)
-
-    ender_dest = dest.find("nfe:enderDest", ns) if dest is not None else None
-    dest_log = dest_nro = dest_bai = dest_mun = dest_uf = dest_cep = ""
-    if ender_dest is not None:
-        dest_log = _get_text(ender_dest, "nfe:xLgr", ns)
-        dest_nro = _get_text(ender_dest, "nfe:nro", ns)
-        dest_bai = _get_text(ender_dest, "nfe:xBairro", ns)
-        dest_mun = _get_text(ender_dest, "nfe:xMun", ns)
-        dest_uf = _get_text(ender_dest, "nfe:UF", ns)
-        dest_cep = _get_text(ender_dest, "nfe:CEP", ns)
+    dest_ie = dest.get("IE", "")
+    dest_fone = dest.get("fone", "")
+    dest_im = dest.get("IM", "")
+
+    ender_dest = nfe.ender_dest
+    dest_log = ender_dest.get("xLgr", "")
+    dest_nro = ender_dest.get("nro", "")
+    dest_bai = ender_dest.get("xBairro", "")
+    dest_mun = ender_dest.get("xMun", "")
+    dest_uf = ender_dest.get("UF", "")
+    dest_cep = ender_dest.get("CEP", "")
 
     # ----- TOTAIS -----
-    icmstot = total.find("nfe:ICMSTot", ns) if total is not None else None
-    v_bc = _get_text(icmstot, "nfe:vBC", ns)
-    v_icms = _get_text(icmstot, "nfe:vICMS", ns)
-    v_bc_st = _get_text(icmstot, "nfe:vBCST", ns)
-    v_st = _get_text(icmstot, "nfe:vST", ns)
-    v_prod = _get_text(icmstot, "nfe:vProd", ns)
-    v_frete = _get_text(icmstot, "nfe:vFrete", ns)
-    v_seg = _get_text(icmstot, "nfe:vSeg", ns)
-    v_desc = _get_text(icmstot, "nfe:vDesc", ns)
-    v_outro = _get_text(icmstot, "nfe:vOutro", ns)
-    v_ipi = _get_text(icmstot, "nfe:vIPI", ns)
-    v_nf = _get_text(icmstot, "nfe:vNF", ns)
-    v_tot_trib = _get_text(icmstot, "nfe:vTotTrib", ns)
-    v_icms_uf_dest = _get_text(icmstot, "nfe:vICMSUFDest", ns)
+    icmstot = nfe.icms_tot
+    v_bc = icmstot.get("vBC", "")
+    v_icms = icmstot.get("vICMS", "")
+    v_bc_st = icmstot.get("vBCST", "")
+    v_st = icmstot.get("vST", "")
+    v_prod = icmstot.get("vProd", "")
+    v_frete = icmstot.get("vFrete", "")
+    v_seg = icmstot.get("vSeg", "")
+    v_desc = icmstot.get("vDesc", "")
+    v_outro = icmstot.get("vOutro", "")
+    v_ipi = icmstot.get("vIPI", "")
+    v_nf = icmstot.get("vNF", "")
+    v_tot_trib = icmstot.get("vTotTrib", "")
+    v_icms_uf_dest = icmstot.get("vICMSUFDest", "")
 
     # ----- PROTOCOLO -----
-    protocolo = ""
-    dh_prot = ""
-    if prot_el is not None:
-        inf_prot = prot_el.find("nfe:infProt", ns)
-        if inf_prot is not None:
-            protocolo = _get_text(inf_prot, "nfe:nProt", ns)
-            dh_prot = _get_text(inf_prot, "nfe:dhRecbto", ns)
+    protocolo = nfe.inf_prot.get("nProt", "")
+    dh_prot = nfe.inf_prot.get("dhRecbto", "")
 
     # ----- TRANSPORTE -----
-    mod_frete = _get_text(transp, "nfe:modFrete", ns)
+    mod_frete = nfe.transp.get("modFrete", "")
     mod_frete_map = {
         "0": "0-EMITENTE",
         "1": "1-DEST/REM",
@@ -288,38 +233,25 @@ def gerar_danfe_html(
     }
     mod_frete_desc = mod_frete_map.get(mod_frete, mod_frete)
 
-    transp_nome = ""
-    transp_cnpj = ""
-    transp_ie = ""
-    transp_ender = ""
-    transp_mun = ""
-    transp_uf = ""
-    vol_qtd = vol_peso_b = vol_peso_l = ""
-    transporta = transp.find("nfe:transporta", ns) if transp is not None else None
-    if transporta is not None:
-        transp_nome = _get_text(transporta, "nfe:xNome", ns)
-        transp_cnpj = _format_cnpj_cpf(
-            _get_text(transporta, "nfe:CNPJ", ns) or _get_text(transporta, "nfe:CPF", ns)
-        )
-        transp_ie = _get_text(transporta, "nfe:IE", ns)
-        transp_ender = _get_text(transporta, "nfe:xEnder", ns)
-        transp_mun = _get_text(transporta, "nfe:xMun", ns)
-        transp_uf = _get_text(transporta, "nfe:UF", ns)
+    transporta = nfe.transporta
+    transp_nome = transporta.get("xNome", "")
+    transp_cnpj = _format_cnpj_cpf(
+        transporta.get("CNPJ", "") or transporta.get("CPF", "")
+    )
+    transp_ie = transporta.get("IE", "")
+    transp_ender = transporta.get("xEnder", "")
+    transp_mun = transporta.get("xMun", "")
+    transp_uf = transporta.get("UF", "")
 
-    vol = transp.find("nfe:vol", ns) if transp is not None else None
-    if vol is not None:
-        vol_qtd = _get_text(vol, "nfe:qVol", ns)
-        vol_peso_b = _get_text(vol, "nfe:pesoB", ns)
-        vol_peso_l = _get_text(vol, "nfe:pesoL", ns)
+    vol = nfe.vol
+    vol_qtd = vol.get("qVol", "")
+    vol_peso_b = vol.get("pesoB", "")
+    vol_peso_l = vol.get("pesoL", "")
 
     # ----- PAGAMENTO -----
-    t_pag = ""
-    v_pag = ""
-    if pag is not None:
-        det_pag = pag.find("nfe:detPag", ns)
-        if det_pag is not None:
-            t_pag = _get_text(det_pag, "nfe:tPag", ns)
-            v_pag = _get_text(det_pag, "nfe:vPag", ns)
+    det_pag = nfe.pagamentos[0] if nfe.pagamentos else {}
+    t_pag = det_pag.get("tPag", "")
+    v_pag = det_pag.get("vPag", "")
 
     # Tabela atualizada de formas de pagamento
     t_pag_map = {
@@ -345,42 +277,40 @@ def gerar_danfe_html(
 
     # ----- FATURA / DUPLICATAS -----
     duplicatas: List[dict] = []
-    cobr = inf_nfe.find("nfe:cobr", ns)
-    if cobr is not None:
-        for dup in cobr.findall("nfe:dup", ns):
-            n_dup = _get_text(dup, "nfe:nDup", ns)
-            d_venc = _get_text(dup, "nfe:dVenc", ns)
-            v_dup = _get_text(dup, "nfe:vDup", ns)
-            duplicatas.append(
-                {
-                    "nDup": n_dup,
-                    "dVenc": _format_data_br(d_venc),
-                    "vDup": v_dup,
-                }
-            )
+    for dup in nfe.duplicatas:
+        n_dup = dup.get("nDup", "")
+        d_venc = dup.get("dVenc", "")
+        v_dup = dup.get("vDup", "")
+        duplicatas.append(
+            {
+                "nDup": n_dup,
+                "dVenc": _format_data_br(d_venc),
+                "vDup": v_dup,
+            }
+        )
 
     # ----- INF. ADICIONAIS -----
-    inf_cpl_raw = _get_text(inf_adic, "nfe:infCpl", ns)
+    inf_cpl_raw = nfe.inf_adic.get("infCpl", "")
     inf_cpl = _format_inf_cpl(inf_cpl_raw)
 
     # ----- ITENS -----
     itens: List[dict] = []
-    for det in inf_nfe.findall("nfe:det", ns):
-        prod = det.find("nfe:prod", ns)
-        if prod is None:
+    for item in nfe.itens:
+        prod = item.prod
+        if not prod:
             continue
-        n_item = det.get("nItem", "")
-        c_prod = _get_text(prod, "nfe:cProd", ns)
-        x_prod = _get_text(prod, "nfe:xProd", ns)
-        ncm = _get_text(prod, "nfe:NCM", ns)
-        cfop = _get_text(prod, "nfe:CFOP", ns)
-        u_com = _get_text(prod, "nfe:uCom", ns)
-        q_com = _get_text(prod, "nfe:qCom", ns)
-        v_un_com = _get_text(prod, "nfe:vUnCom", ns)
-        v_prod_item = _get_text(prod, "nfe:vProd", ns)
-        cean = _get_text(prod, "nfe:cEAN", ns)
-
-        icms_info = _extrair_icms_info(det, ns)
+        n_item = item.det.get("nItem", "")
+        c_prod = prod.get("cProd", "")
+        x_prod = prod.get("xProd", "")
+        ncm = prod.get("NCM", "")
+        cfop = prod.get("CFOP", "")
+        u_com = prod.get("uCom", "")
+        q_com = prod.get("qCom", "")
+        v_un_com = prod.get("vUnCom", "")
+        v_prod_item = prod.get("vProd", "")
+        cean = prod.get("cEAN", "")
+
+        icms_info = _extrair_icms_info(item.icms)
 
         itens.append(
             {
@@ -1051,64 +981,58 @@ def _format_inf_cpl(text: str) -> str:
 
 
 def gerar_danfe_html_automatico(
-    xml_or_path: str,
+    xml_or_path: Union[bytes, str, DocumentoNFe],
     **kwargs,
 ) -> str:
     """
     Lê o XML, detecta se é NF-e (mod=55) ou NFC-e (mod=65)
     e delega para o gerador correto.
 
-    - xml_or_path: XML em string OU caminho para arquivo.
+    - xml_or_path: XML (bytes ou str), caminho para arquivo ou DocumentoNFe.
     - kwargs: repassados para o gerador correspondente.
       NFC-e: nfce_xml_to_html(xml, logo_data_uri=..., desenvolvedor=...)
       NF-e : gerar_danfe_html(xml, logo_url=...)
+
+    O XML é parseado uma única vez; o DocumentoNFe segue para o gerador.
     """
 
     # 1) Carrega XML (string ou arquivo)
-    if len(xml_or_path) < 100 and not xml_or_path.lstrip().startswith("<"):
+    if (
+        isinstance(xml_or_path, str)
+        and len(xml_or_path) < 100
+        and not xml_or_path.lstrip().startswith("<")
+    ):
         # parece ser caminho de arquivo
         with open(xml_or_path, "r", encoding="utf-8") as f:
-            xml_str = f.read()
-    else:
-        xml_str = xml_or_path
+            xml_or_path = f.read()
 
     # 2) Descobre se é NF-e (55) ou NFC-e (65)
-    root = etree.fromstring(xml_str.encode("utf-8"))
-
-    # Pode ser nfeProc -> NFe ou direto NFe
-    nfe = root.find(f".//{{{NFE_NS}}}NFe")
-    if nfe is None:
-        nfe = root
-
-    ide = nfe.find(f".//{{{NFE_NS}}}ide")
-    mod = "55"  # default
-    if ide is not None:
-        mod_node = ide.find(f"{{{NFE_NS}}}mod")
-        if mod_node is not None and mod_node.text:
-            mod = mod_node.text.strip()
+    nfe = ler_nfe(xml_or_path)
 
     # 3) Roteia para o gerador correspondente
-    if mod == "65":
+    if nfe.modelo == "65":
         # NFC-e → remover logo_url se existir, pois nfce_xml_to_html não aceita
         if "logo_url" in kwargs:
             kwargs = dict(kwargs)
             kwargs.pop("logo_url")
-        return nfce_xml_to_html(xml_str, **kwargs)
+        return nfce_xml_to_html(nfe, **kwargs)
     else:
         # NF-e → converter logo_data_uri para logo_url, se necessário
         if "logo_data_uri" in kwargs and "logo_url" not in kwargs:
             kwargs = dict(kwargs)
             kwargs["logo_url"] = kwargs.pop("logo_data_uri")
-        return gerar_danfe_html(xml_str, **kwargs)
+        return gerar_danfe_html(nfe, **kwargs)
 
 
-def gerar_danfe_pdf_automatico(xml: str) -> bytes:
+@rastrear()
+def gerar_danfe_pdf_automatico(xml: Union[bytes, str, DocumentoNFe]) -> bytes:
     """
     Gera o DANFE em PDF (bytes) a partir do XML bruto.
     - Usa o mesmo HTML gerado por gerar_danfe_html_automatico().
     - Converte o HTML em PDF usando pdfkit + wkhtmltopdf.
     """
-    html = gerar_danfe_html_automatico(xml)
+    with span("danfe.html"):
+        html = gerar_danfe_html_automatico(xml)
 
     # Opções básicas para A4 retrato (ajusta se quiser)
     options = {
@@ -1120,7 +1044,8 @@ def gerar_danfe_pdf_automatico(xml: str) -> bytes:
         "margin-left": "5mm",
     }
 
-    pdf_bytes: bytes = pdfkit.from_string(html, False, options=options)
+    with span("wkhtmltopdf", **{"danfe.html_bytes": len(html)}):
+        pdf_bytes: bytes = pdfkit.from_string(html, False, options=options)
     return pdf_bytes
 
 
@@ -1132,11 +1057,9 @@ def nfe_xml_to_html(
     """
     Wrapper para uso na API:
     - aceita bytes ou string com o XML da NFe (nfeProc ou NFe)
-    - converte para str e delega para gerar_danfe_html.
+    - lê o documento e delega para gerar_danfe_html.
     """
-    if isinstance(xml_data, (bytes, bytearray)):
-        xml_str = xml_data.decode("utf-8")
-    else:
-        xml_str = xml_data
+    if isinstance(xml_data, bytearray):
+        xml_data = bytes(xml_data)
 
-    return gerar_danfe_html(xml_str, logo_url=logo_url)
+    return gerar_danfe_html(ler_nfe(xml_data), logo_url=logo_url)
@@ -4,22 +4,9 @@ from __future__ import annotations
 
 from dataclasses import dataclass, field
 from decimal import Decimal, ROUND_HALF_UP
-from typing import List, Optional
+from typing import List, Optional, Union
 
-from lxml import etree
-
-NFE_NS = "http://www.portalfiscal.inf.br/nfe"
-NSMAP = {"nfe": NFE_NS}
-
-
-def _get_text(elem, path: str, ns: dict = NSMAP, default: str = "") -> str:
-    """Helper pra pegar texto de um caminho XPath simples."""
-    if elem is None:
-        return default
-    node = elem.find(path, ns)
-    if node is not None and node.text:
-        return node.text.strip()
-    return default
+from sefaz_service.core.documento_nfe import DocumentoNFe, ler_nfe
 
 
 def _format_number(value: Decimal | float | str, casas: int) -> str:
@@ -90,116 +77,52 @@ class NfceData:
     v_troco: Decimal = Decimal("0.00")
 
 
-def _parse_nfce_xml(xml_str: str) -> NfceData:
-    root = etree.fromstring(xml_str.encode("utf-8"))
-
-    # Pode vir como <nfeProc><NFe>... ou direto <NFe>
-    nfe = root.find(".//nfe:NFe", NSMAP) or root
-    inf_nfe = nfe.find(".//nfe:infNFe", NSMAP)
-
-    ide = inf_nfe.find("nfe:ide", NSMAP)
-    emit = inf_nfe.find("nfe:emit", NSMAP)
-    dest = inf_nfe.find("nfe:dest", NSMAP)
-    total = inf_nfe.find("nfe:total/nfe:ICMSTot", NSMAP)
-    inf_adic = inf_nfe.find("nfe:infAdic", NSMAP)
-    inf_prot = root.find(".//nfe:infProt", NSMAP)
-
-    # ⚠️ infNFeSupl é filho de NFe, não de infNFe
-    inf_supl = nfe.find("nfe:infNFeSupl", NSMAP)
-
-    chave = (inf_nfe.get("Id") or "").replace("NFe", "").strip()
-
-    ide_dict = {
-        "tpAmb": _get_text(ide, "nfe:tpAmb"),
-        "cUF": _get_text(ide, "nfe:cUF"),
-        "serie": _get_text(ide, "nfe:serie"),
-        "nNF": _get_text(ide, "nfe:nNF"),
-        "dhEmi": _get_text(ide, "nfe:dhEmi"),
-        "tpEmis": _get_text(ide, "nfe:tpEmis"),
-    }
-
-    emit_dict = {
-        "CNPJ": _get_text(emit, "nfe:CNPJ"),
-        "CPF": _get_text(emit, "nfe:CPF"),
-        "IE": _get_text(emit, "nfe:IE"),
-        "xNome": _get_text(emit, "nfe:xNome"),
-        "xLgr": _get_text(emit, "nfe:enderEmit/nfe:xLgr"),
-        "nro": _get_text(emit, "nfe:enderEmit/nfe:nro"),
-        "xBairro": _get_text(emit, "nfe:enderEmit/nfe:xBairro"),
-        "xMun": _get_text(emit, "nfe:enderEmit/nfe:xMun"),
-        "UF": _get_text(emit, "nfe:enderEmit/nfe:UF"),
-    }
+def _parse_nfce_xml(xml: Union[bytes, str, DocumentoNFe]) -> NfceData:
+    nfe = ler_nfe(xml)
+
+    def _sel(campos: dict, nomes) -> dict:
+        return {n: campos.get(n, "") for n in nomes}
+
+    ide_dict = _sel(nfe.ide, ("tpAmb", "cUF", "serie", "nNF", "dhEmi", "tpEmis"))
+
+    emit_dict = _sel(nfe.emit, ("CNPJ", "CPF", "IE", "xNome"))
+    emit_dict.update(_sel(nfe.ender_emit, ("xLgr", "nro", "xBairro", "xMun", "UF")))
     if not emit_dict["CNPJ"]:
         emit_dict["CNPJ"] = emit_dict["CPF"]
 
-    dest_dict = {
-        "CNPJ": _get_text(dest, "nfe:CNPJ"),
-        "CPF": _get_text(dest, "nfe:CPF"),
-        "xNome": _get_text(dest, "nfe:xNome"),
-        "xLgr": _get_text(dest, "nfe:enderDest/nfe:xLgr"),
-        "nro": _get_text(dest, "nfe:enderDest/nfe:nro"),
-        "xBairro": _get_text(dest, "nfe:enderDest/nfe:xBairro"),
-        "xMun": _get_text(dest, "nfe:enderDest/nfe:xMun"),
-        "UF": _get_text(dest, "nfe:enderDest/nfe:UF"),
-    }
+    dest_dict = _sel(nfe.dest, ("CNPJ", "CPF", "xNome"))
+    dest_dict.update(_sel(nfe.ender_dest, ("xLgr", "nro", "xBairro", "xMun", "UF")))
     if not dest_dict["CNPJ"]:
         dest_dict["CNPJ"] = dest_dict["CPF"]
 
-    icms_tot_dict = {
-        "vProd": _get_text(total, "nfe:vProd"),
-        "vFrete": _get_text(total, "nfe:vFrete"),
-        "vSeg": _get_text(total, "nfe:vSeg"),
-        "vOutro": _get_text(total, "nfe:vOutro"),
-        "vDesc": _get_text(total, "nfe:vDesc"),
-        "vNF": _get_text(total, "nfe:vNF"),
-        "vTotTrib": _get_text(total, "nfe:vTotTrib"),
-    }
-
-    inf_prot_dict = {
-        "nProt": _get_text(inf_prot, "nfe:nProt"),
-        "dhRecbto": _get_text(inf_prot, "nfe:dhRecbto"),
-    }
-
-    inf_adic_dict = {
-        "infAdFisco": _get_text(inf_adic, "nfe:infAdFisco"),
-        "infCpl": _get_text(inf_adic, "nfe:infCpl"),
-    }
-
-    qrcode = ""
-    url_chave = ""
-    if inf_supl is not None:
-        qrcode = _get_text(inf_supl, "nfe:qrCode")
-        url_chave = _get_text(inf_supl, "nfe:urlChave")
+    icms_tot_dict = _sel(
+        nfe.icms_tot, ("vProd", "vFrete", "vSeg", "vOutro", "vDesc", "vNF", "vTotTrib")
+    )
+    inf_prot_dict = _sel(nfe.inf_prot, ("nProt", "dhRecbto"))
+    inf_adic_dict = _sel(nfe.inf_adic, ("infAdFisco", "infCpl"))
 
     # Itens
     itens: List[ItemNfce] = []
-    for det in inf_nfe.findall("nfe:det", NSMAP):
-        prod = det.find("nfe:prod", NSMAP)
-        if prod is None:
+    for item in nfe.itens:
+        prod = item.prod
+        if not prod:
             continue
         itens.append(
             ItemNfce(
-                cProd=_get_text(prod, "nfe:cProd"),
-                xProd=_get_text(prod, "nfe:xProd"),
-                qCom=Decimal(_get_text(prod, "nfe:qCom") or "0"),
-                uCom=_get_text(prod, "nfe:uCom"),
-                vUnCom=Decimal(_get_text(prod, "nfe:vUnCom") or "0"),
-                vProd=Decimal(_get_text(prod, "nfe:vProd") or "0"),
+                cProd=prod.get("cProd", ""),
+                xProd=prod.get("xProd", ""),
+                qCom=Decimal(prod.get("qCom") or "0"),
+                uCom=prod.get("uCom", ""),
+                vUnCom=Decimal(prod.get("vUnCom") or "0"),
+                vProd=Decimal(prod.get("vProd") or "0"),
             )
         )
 
     # Pagamentos
-    formas_pagto: List[tuple] = []
-    v_troco = Decimal("0.00")
-
-    for det_pag in inf_nfe.findall("nfe:pag/nfe:detPag", NSMAP):
-        tPag = _get_text(det_pag, "nfe:tPag")
-        vPag = Decimal(_get_text(det_pag, "nfe:vPag") or "0")
-        formas_pagto.append((tPag, vPag))
-
-    troco_node = inf_nfe.find("nfe:pag/nfe:vTroco", NSMAP)
-    if troco_node is not None and troco_node.text:
-        v_troco = Decimal(troco_node.text.strip())
+    formas_pagto: List[tuple] = [
+        (pag.get("tPag", ""), Decimal(pag.get("vPag") or "0")) for pag in nfe.pagamentos
+    ]
+    v_troco = Decimal(nfe.v_troco) if nfe.v_troco else Decimal("0.00")
 
     return NfceData(
         ide=ide_dict,
@@ -208,9 +131,9 @@ def _parse_nfce_xml(xml_str: str) -> NfceData:
         icms_tot=icms_tot_dict,
         inf_prot=inf_prot_dict,
         inf_adic=inf_adic_dict,
-        chave=chave,
-        qrcode=qrcode,
-        url_chave=url_chave,
+        chave=nfe.chave,
+        qrcode=nfe.inf_supl.get("qrCode", ""),
+        url_chave=nfe.inf_supl.get("urlChave", ""),
         itens=itens,
         formas_pagto=formas_pagto,
         v_troco=v_troco,
@@ -218,24 +141,26 @@ def _parse_nfce_xml(xml_str: str) -> NfceData:
 
 
 def nfce_xml_to_html(
-    xml_or_path: str,
+    xml_or_path: Union[bytes, str, DocumentoNFe],
     logo_data_uri: Optional[str] = None,
     desenvolvedor: str = "",
 ) -> str:
     """
     Gera HTML do DANFE NFC-e em formato de cupom (80mm).
-    xml_or_path: XML em string OU caminho para arquivo XML.
+    xml_or_path: XML (bytes ou str), caminho para arquivo XML ou DocumentoNFe já lido.
     logo_data_uri: se quiser um <img src="data:image/png;base64,..."> no topo.
     """
 
     # Carrega XML (string ou arquivo)
-    if len(xml_or_path) < 100 and not xml_or_path.strip().startswith("<"):
+    if (
+        isinstance(xml_or_path, str)
+        and len(xml_or_path) < 100
+        and not xml_or_path.strip().startswith("<")
+    ):
         with open(xml_or_path, "r", encoding="utf-8") as f:
-            xml_str = f.read()
-    else:
-        xml_str = xml_or_path
+            xml_or_path = f.read()
 
-    data = _parse_nfce_xml(xml_str)
+    data = _parse_nfce_xml(xml_or_path)
 
     emit = data.emit
     dest = data.dest
@@ -8,6 +8,7 @@ from lxml import etree as ET
 import xmlsec
 
 from sefaz_service.core.xml_utils import only_digits
+from sefaz_service.core.parser_xml import ler_xml
 
 NFE_NS = "http://www.portalfiscal.inf.br/nfe"
 DS_NS = "http://www.w3.org/2000/09/xmldsig#"
@@ -69,8 +70,7 @@ class NFeXmlSigner:
         - referencia_xpath: XPath do nó a ser assinado (ex.: //nfe:infNFe[1])
         - id_atributo: normalmente 'Id', que já vem no XML (Id="NFe...")
         """
-        parser = ET.XMLParser(remove_blank_text=False)
-        root = ET.fromstring(xml.encode("utf-8"), parser=parser)
+        root = ler_xml(xml)
 
         # Remove assinaturas antigas
         self._remove_previous_signatures(root)
@@ -0,0 +1,278 @@
+# sefaz_service/nfe/cadastro.py
+from __future__ import annotations
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from lxml import etree
+
+from sefaz_service.core.cache import CacheTTL
+from sefaz_service.core.envelope import montar_envelope_soap
+from sefaz_service.core.envio import enviar_soap_com_pfx, EndpointInfo
+from sefaz_service.core.rastreamento import propagar_contexto
+from sefaz_service.core.resposta import ler_resposta
+from sefaz_service.core.soaplist import get_cad_consulta_cadastro4_endpoint
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+CADASTRO_WSDL_NS = "http://www.portalfiscal.inf.br/nfe/wsdl/CadConsultaCadastro4"
+
+# 111 = uma ocorrência, 112 = múltiplas ocorrências
+CSTAT_CADASTRO_ENCONTRADO = (111, 112)
+# 259 = CNPJ não cadastrado na UF, 264 = CPF não cadastrado na UF
+CSTAT_CADASTRO_NAO_ENCONTRADO = (259, 264)
+
+TTL_CADASTRO = 24 * 3600.0
+TTL_CADASTRO_NEGATIVO = 6 * 3600.0
+
+TIPOS_DOCUMENTO = ("CNPJ", "CPF", "IE")
+
+
+# ----------------------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class CadastroResult:
+    """
+    Resultado do CadConsultaCadastro4.
+
+    - contribuintes: um dict por <infCad> (IE, CNPJ/CPF, xNome, cSit, ender...)
+    - cache: True se veio do cache local (sem ida à SEFAZ)
+    """
+    cStat: Optional[int]
+    xMotivo: Optional[str]
+    xml_envio: str
+    xml_retorno: str
+    contribuintes: List[Dict[str, Any]] = field(default_factory=list)
+    cache: bool = False
+
+
+@dataclass
+class CadastroConsulta:
+    """Item de uma consulta em lote."""
+    uf: str
+    tipo: str       # CNPJ | CPF | IE
+    documento: str
+
+
+# ----------------------------------------------------------------------
+# MONTAGEM / PARSE
+# ----------------------------------------------------------------------
+
+
+def _only_digits(s: str) -> str:
+    return "".join(c for c in (s or "") if c.isdigit())
+
+
+def _normalizar(uf: str, tipo: str, documento: str) -> Tuple[str, str, str]:
+    tipo = (tipo or "").upper()
+    if tipo not in TIPOS_DOCUMENTO:
+        raise ValueError(f"Tipo de documento inválido: {tipo!r} (use CNPJ, CPF ou IE)")
+    return (uf or "").upper(), tipo, _only_digits(documento)
+
+
+def montar_cons_cad(uf: str, tipo: str, documento: str) -> str:
+    """
+    <ConsCad versao="2.00" xmlns="http://www.portalfiscal.inf.br/nfe">
+       <infCons>
+          <xServ>CONS-CAD</xServ>
+          <UF>SP</UF>
+          <CNPJ>...</CNPJ>      (ou <CPF> / <IE>)
+       </infCons>
+    </ConsCad>
+    """
+    return (
+        f'<ConsCad versao="2.00" xmlns="{NFE_NS}">'
+        f"<infCons>"
+        f"<xServ>CONS-CAD</xServ>"
+        f"<UF>{uf}</UF>"
+        f"<{tipo}>{documento}</{tipo}>"
+        f"</infCons>"
+        f"</ConsCad>"
+    )
+
+
+def _montar_soap_cadastro(cons_cad_xml: str) -> bytes:
+    """
+    Envelope SOAP 1.2 para CadConsultaCadastro4.
+    """
+    return montar_envelope_soap(cons_cad_xml, CADASTRO_WSDL_NS)
+
+
+def _elemento_para_dict(el: etree._Element) -> Dict[str, Any]:
+    """
+    Converte <infCad> em dict usando o nome local das tags
+    (<ender> vira um dict aninhado).
+    """
+    dados: Dict[str, Any] = {}
+    for filho in el:
+        if not isinstance(filho.tag, str):
+            continue
+        nome = etree.QName(filho).localname
+        if len(filho):
+            dados[nome] = _elemento_para_dict(filho)
+        else:
+            dados[nome] = (filho.text or "").strip()
+    return dados
+
+
+def _parse_cadastro_retorno(conteudo: bytes | str, xml_envio: str) -> CadastroResult:
+    ret = ler_resposta(conteudo, "retConsCad")
+    if ret.payload is None:
+        return CadastroResult(
+            cStat=None,
+            xMotivo=ret.erro,
+            xml_envio=xml_envio,
+            xml_retorno=conteudo.decode("utf-8", "replace") if isinstance(conteudo, bytes) else conteudo,
+        )
+
+    return CadastroResult(
+        cStat=ret.cStat,
+        xMotivo=ret.xMotivo,
+        xml_envio=xml_envio,
+        xml_retorno=ret.xml_payload(),
+        contribuintes=[
+            _elemento_para_dict(inf)
+            for inf in ret.payload.findall("nfe:infCons/nfe:infCad", {"nfe": NFE_NS})
+        ],
+    )
+
+
+# ----------------------------------------------------------------------
+# CONSULTA
+# ----------------------------------------------------------------------
+
+
+def _ler_cache(cache: Optional[CacheTTL], chave_cache: Tuple[str, ...]) -> Optional[CadastroResult]:
+    if cache is None:
+        return None
+    em_cache = cache.get(chave_cache)
+    if em_cache is None:
+        return None
+    em_cache["cache"] = True
+    return CadastroResult(**em_cache)
+
+
+def sefaz_consulta_cadastro(
+    uf: str,
+    tipo: str,
+    documento: str,
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str = "1",
+    cache: Optional[CacheTTL] = None,
+) -> CadastroResult:
+    """
+    Consulta o cadastro de contribuinte (CadConsultaCadastro4) por
+    CNPJ, CPF ou IE.
+
+    Se `cache` for informado, a resposta é lida/gravada nele com chave
+    (UF, tipo, documento): cadastro encontrado vale TTL_CADASTRO e
+    "não cadastrado" vale TTL_CADASTRO_NEGATIVO. Erros não são guardados.
+    """
+    uf, tipo, documento = _normalizar(uf, tipo, documento)
+
+    # 1) cache
+    em_cache = _ler_cache(cache, (ambiente, uf, tipo, documento))
+    if em_cache is not None:
+        return em_cache
+
+    return _consultar_sefaz(uf, tipo, documento, pfx_path, pfx_password, ambiente, cache)
+
+
+def _consultar_sefaz(
+    uf: str,
+    tipo: str,
+    documento: str,
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str,
+    cache: Optional[CacheTTL],
+) -> CadastroResult:
+    """
+    Consulta na SEFAZ (sem ler o cache) e grava a resposta no cache.
+    Espera uf/tipo/documento já normalizados.
+    """
+    chave_cache = (ambiente, uf, tipo, documento)
+
+    # 2) ConsCad + endpoint
+    xml_envio = montar_cons_cad(uf, tipo, documento)
+    endpoint: EndpointInfo = get_cad_consulta_cadastro4_endpoint(uf=uf, ambiente=ambiente)
+
+    # 3) Envia
+    resp = enviar_soap_com_pfx(
+        endpoint=endpoint,
+        soap_xml=_montar_soap_cadastro(xml_envio),
+        pfx_path=pfx_path,
+        pfx_password=pfx_password,
+    )
+
+    # 4) Interpreta
+    result = _parse_cadastro_retorno(resp.content, xml_envio)
+
+    # 5) Grava no cache
+    if cache is not None:
+        if result.cStat in CSTAT_CADASTRO_ENCONTRADO:
+            cache.set(chave_cache, asdict(result), ttl=TTL_CADASTRO)
+        elif result.cStat in CSTAT_CADASTRO_NAO_ENCONTRADO:
+            cache.set(chave_cache, asdict(result), ttl=TTL_CADASTRO_NEGATIVO)
+
+    return result
+
+
+def sefaz_consulta_cadastro_lote(
+    consultas: List[CadastroConsulta],
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str = "1",
+    cache: Optional[CacheTTL] = None,
+    max_por_uf: int = 2,
+    max_workers: int = 8,
+) -> List[CadastroResult]:
+    """
+    Consulta vários contribuintes de uma vez.
+
+    - documentos repetidos na lista geram uma única consulta;
+    - o que estiver no cache não vai à SEFAZ;
+    - no máximo max_por_uf consultas simultâneas por UF.
+
+    Retorna os resultados na mesma ordem de `consultas`. Falhas de uma
+    consulta viram CadastroResult com cStat=None e o erro em xMotivo.
+    """
+    chaves = [_normalizar(c.uf, c.tipo, c.documento) for c in consultas]
+
+    # 1) o que já está no cache não ocupa vaga da UF
+    resultados: Dict[Tuple[str, str, str], CadastroResult] = {}
+    for chave in dict.fromkeys(chaves):
+        em_cache = _ler_cache(cache, (ambiente, *chave))
+        if em_cache is not None:
+            resultados[chave] = em_cache
+    unicas = [c for c in dict.fromkeys(chaves) if c not in resultados]
+
+    semaforos: Dict[str, threading.Semaphore] = {
+        uf: threading.Semaphore(max(1, max_por_uf)) for uf, _, _ in unicas
+    }
+
+    def _consultar(chave: Tuple[str, str, str]) -> CadastroResult:
+        uf, tipo, documento = chave
+        with semaforos[uf]:
+            try:
+                # o cache já foi lido acima: não conta a falta de novo
+                return _consultar_sefaz(uf, tipo, documento, pfx_path, pfx_password, ambiente, cache)
+            except Exception as e:
+                return CadastroResult(
+                    cStat=None,
+                    xMotivo=f"Erro ao consultar cadastro: {e}",
+                    xml_envio="",
+                    xml_retorno="",
+                )
+
+    # 2) restante vai à SEFAZ, limitado por UF
+    if unicas:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+            resultados.update(zip(unicas, ex.map(propagar_contexto(_consultar), unicas)))
+
+    return [resultados[c] for c in chaves]
@@ -0,0 +1,478 @@
+# sefaz_service/nfe/distribuicao.py
+from __future__ import annotations
+
+import base64
+import io
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional
+
+from lxml import etree
+
+from sefaz_service.core.envelope import montar_envelope_soap
+from sefaz_service.core.envio import enviar_soap_com_pfx, EndpointInfo
+from sefaz_service.core.nfe_consulta import UF_TO_CUF
+from sefaz_service.core.parser_xml import _SEGURO
+from sefaz_service.core.repositorio import RepositorioDocumentos
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+DIST_WSDL_NS = "http://www.portalfiscal.inf.br/nfe/wsdl/NFeDistribuicaoDFe"
+
+# Ambiente Nacional (AN) – único endpoint do serviço
+DIST_ENDPOINTS = {
+    "1": "https://www1.nfe.fazenda.gov.br/NFeDistribuicaoDFe/NFeDistribuicaoDFe.asmx",
+    "2": "https://hom1.nfe.fazenda.gov.br/NFeDistribuicaoDFe/NFeDistribuicaoDFe.asmx",
+}
+SOAP_ACTION_DIST = (
+    "http://www.portalfiscal.inf.br/nfe/wsdl/NFeDistribuicaoDFe/nfeDistDFeInteresse"
+)
+
+# cStat do retDistDFeInt
+CSTAT_NENHUM_DOCUMENTO = 137
+CSTAT_DOCUMENTOS_LOCALIZADOS = 138
+CSTAT_CONSUMO_INDEVIDO = 656
+
+# NT 2014.002: sem documentos novos (137) ou NSU em dia → aguardar 1 hora
+ESPERA_SEM_DOCUMENTOS = 3600.0
+
+_RE_CHAVE = re.compile(rb"<chNFe>(\d{44})</chNFe>|Id=\"NFe(\d{44})\"")
+
+
+# ----------------------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class DistribuicaoConfig:
+    """
+    Um interessado (CNPJ/CPF) a sincronizar.
+
+    uf: UF do interessado (vai em cUFAutor).
+    """
+    cnpj: str
+    uf: str
+    pfx_path: str
+    pfx_password: str
+    ambiente: str = "1"
+
+
+@dataclass
+class EstadoNSU:
+    cnpj: str
+    ambiente: str
+    ult_nsu: str = "0"
+    max_nsu: str = "0"
+    bloqueado_ate: float = 0.0
+
+
+@dataclass
+class DistribuicaoResult:
+    """
+    Resumo de uma sincronização.
+
+    - consultas: quantas chamadas ao AN foram feitas
+    - documentos: ids gravados no RepositorioDocumentos
+    - ult_nsu / max_nsu: cursor ao final
+    - cStat / xMotivo: último retorno do AN
+    - bloqueado_ate: epoch a partir do qual uma nova consulta é permitida
+    """
+    cnpj: str
+    consultas: int
+    ult_nsu: str
+    max_nsu: str
+    cStat: Optional[int]
+    xMotivo: Optional[str]
+    bloqueado_ate: float = 0.0
+    documentos: List[str] = field(default_factory=list)
+    erro: Optional[str] = None
+
+
+# ----------------------------------------------------------------------
+# ESTADO (ultNSU / maxNSU por CNPJ)
+# ----------------------------------------------------------------------
+
+
+_SQL_CRIAR = """
+CREATE TABLE IF NOT EXISTS dfe_nsu (
+    cnpj          TEXT NOT NULL,
+    ambiente      TEXT NOT NULL,
+    ult_nsu       TEXT NOT NULL,
+    max_nsu       TEXT NOT NULL,
+    bloqueado_ate REAL NOT NULL DEFAULT 0,
+    atualizado_em REAL NOT NULL,
+    PRIMARY KEY (cnpj, ambiente)
+);
+"""
+
+
+class EstadoNSUStore:
+    """
+    Guarda o cursor da Distribuição DF-e (ultNSU/maxNSU) e o bloqueio
+    de 1 hora por CNPJ/ambiente num SQLite local.
+    """
+
+    def __init__(self, db_path: str = "sefaz_dfe.db") -> None:
+        self.db_path = db_path
+        with self._conectar() as conn:
+            conn.executescript(_SQL_CRIAR)
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def obter(self, cnpj: str, ambiente: str) -> EstadoNSU:
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT ult_nsu, max_nsu, bloqueado_ate FROM dfe_nsu"
+                " WHERE cnpj = ? AND ambiente = ?",
+                (cnpj, ambiente),
+            ).fetchone()
+        if row is None:
+            return EstadoNSU(cnpj=cnpj, ambiente=ambiente)
+        return EstadoNSU(
+            cnpj=cnpj,
+            ambiente=ambiente,
+            ult_nsu=row[0],
+            max_nsu=row[1],
+            bloqueado_ate=row[2],
+        )
+
+    def gravar(self, estado: EstadoNSU) -> None:
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO dfe_nsu (cnpj, ambiente, ult_nsu, max_nsu, bloqueado_ate,"
+                " atualizado_em) VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (cnpj, ambiente) DO UPDATE SET"
+                " ult_nsu = excluded.ult_nsu, max_nsu = excluded.max_nsu,"
+                " bloqueado_ate = excluded.bloqueado_ate,"
+                " atualizado_em = excluded.atualizado_em",
+                (
+                    estado.cnpj,
+                    estado.ambiente,
+                    estado.ult_nsu,
+                    estado.max_nsu,
+                    estado.bloqueado_ate,
+                    time.time(),
+                ),
+            )
+
+
+# ----------------------------------------------------------------------
+# MONTAGEM / ENVIO
+# ----------------------------------------------------------------------
+
+
+def _only_digits(s: str) -> str:
+    return "".join(c for c in (s or "") if c.isdigit())
+
+
+def montar_dist_dfe_int(
+    cnpj: str,
+    c_uf_autor: str,
+    ult_nsu: str,
+    ambiente: str = "1",
+) -> str:
+    """
+    <distDFeInt versao="1.01" xmlns="http://www.portalfiscal.inf.br/nfe">
+       <tpAmb>1</tpAmb>
+       <cUFAutor>35</cUFAutor>
+       <CNPJ>...</CNPJ>            (ou <CPF>)
+       <distNSU><ultNSU>000000000000000</ultNSU></distNSU>
+    </distDFeInt>
+    """
+    doc = _only_digits(cnpj)
+    tag_doc = "CPF" if len(doc) == 11 else "CNPJ"
+    return (
+        f'<distDFeInt versao="1.01" xmlns="{NFE_NS}">'
+        f"<tpAmb>{ambiente}</tpAmb>"
+        f"<cUFAutor>{c_uf_autor}</cUFAutor>"
+        f"<{tag_doc}>{doc}</{tag_doc}>"
+        f"<distNSU><ultNSU>{_only_digits(ult_nsu).zfill(15)}</ultNSU></distNSU>"
+        f"</distDFeInt>"
+    )
+
+
+def _montar_soap_distribuicao(dist_xml: str) -> bytes:
+    """
+    Envelope SOAP 1.2 para NFeDistribuicaoDFe (sem nfeCabecMsg).
+    """
+    return montar_envelope_soap(dist_xml, DIST_WSDL_NS, operacao="nfeDistDFeInteresse")
+
+
+def _decodificar_doc_zip(conteudo_b64: str, bloco: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Decodifica um docZip (base64 de um gzip) em blocos, sem montar o
+    XML inteiro em memória antes de gravar.
+    """
+    conteudo_b64 = "".join(conteudo_b64.split())  # remove quebras de linha
+    d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    # blocos múltiplos de 4 para o base64 não quebrar no meio de um quantum
+    passo = bloco - (bloco % 4)
+    for i in range(0, len(conteudo_b64), passo):
+        parte = d.decompress(base64.b64decode(conteudo_b64[i: i + passo]))
+        if parte:
+            yield parte
+    resto = d.flush()
+    if resto:
+        yield resto
+
+
+class _CapturaChave:
+    """
+    Envolve o iterador de blocos e guarda a chave de acesso encontrada
+    no início do documento (resNFe/procNFe/resEvento/procEventoNFe).
+    """
+
+    def __init__(self, blocos: Iterator[bytes], limite: int = 8192) -> None:
+        self._blocos = blocos
+        self._limite = limite
+        self._inicio = b""
+        self.chave: Optional[str] = None
+
+    def __iter__(self) -> Iterator[bytes]:
+        for b in self._blocos:
+            if self.chave is None and len(self._inicio) < self._limite:
+                self._inicio += b
+                m = _RE_CHAVE.search(self._inicio)
+                if m:
+                    self.chave = (m.group(1) or m.group(2)).decode("ascii")
+            yield b
+
+
+def _processar_retorno(
+    conteudo: bytes,
+    cnpj: str,
+    repositorio: RepositorioDocumentos,
+    resultado: DistribuicaoResult,
+) -> EstadoNSU:
+    """
+    Lê o retDistDFeInt com iterparse: cada <docZip> é decodificado e
+    gravado no repositório assim que termina de ser lido, e descartado
+    da árvore em seguida. Mesmas proteções dos parsers de parser_xml
+    (sem entidades, sem rede, sem huge_tree).
+    """
+    cstat: Optional[int] = None
+    xmotivo: Optional[str] = None
+    ult_nsu = max_nsu = ""
+
+    for _, el in etree.iterparse(io.BytesIO(conteudo), events=("end",), **_SEGURO):
+        nome = etree.QName(el).localname
+        if nome == "docZip":
+            nsu = el.get("NSU") or ""
+            schema = el.get("schema") or ""
+            captura = _CapturaChave(_decodificar_doc_zip(el.text or ""))
+            doc_id = repositorio.salvar(captura, tipo=schema, cnpj=cnpj, nsu=nsu)
+            if captura.chave:
+                # a chave só é conhecida depois de gravar o conteúdo
+                repositorio.definir_chave(doc_id, captura.chave)
+            resultado.documentos.append(doc_id)
+            el.clear()
+        elif nome == "cStat" and cstat is None:
+            txt = (el.text or "").strip()
+            cstat = int(txt) if txt.isdigit() else None
+        elif nome == "xMotivo" and xmotivo is None:
+            xmotivo = (el.text or "").strip() or None
+        elif nome == "ultNSU":
+            ult_nsu = (el.text or "").strip()
+        elif nome == "maxNSU":
+            max_nsu = (el.text or "").strip()
+
+    resultado.cStat = cstat
+    resultado.xMotivo = xmotivo
+    return EstadoNSU(cnpj=cnpj, ambiente="", ult_nsu=ult_nsu, max_nsu=max_nsu)
+
+
+# ----------------------------------------------------------------------
+# SINCRONIZAÇÃO
+# ----------------------------------------------------------------------
+
+
+def sefaz_nfe_distribuicao_sincronizar(
+    config: DistribuicaoConfig,
+    repositorio: RepositorioDocumentos,
+    estado_store: EstadoNSUStore,
+    max_consultas: int = 50,
+    timeout: int = 60,
+) -> DistribuicaoResult:
+    """
+    Baixa todos os documentos novos do CNPJ desde o último NSU gravado.
+
+    Fluxo:
+      1) respeita o bloqueio de 1 hora (137 / NSU em dia / 656)
+      2) consulta distNSU a partir do ultNSU salvo
+      3) grava cada docZip no repositório e avança o cursor
+      4) repete até ultNSU == maxNSU (ou max_consultas)
+    """
+    cnpj = _only_digits(config.cnpj)
+    ambiente = config.ambiente
+    estado = estado_store.obter(cnpj, ambiente)
+
+    resultado = DistribuicaoResult(
+        cnpj=cnpj,
+        consultas=0,
+        ult_nsu=estado.ult_nsu,
+        max_nsu=estado.max_nsu,
+        cStat=None,
+        xMotivo=None,
+        bloqueado_ate=estado.bloqueado_ate,
+    )
+
+    # 1) bloqueio
+    if estado.bloqueado_ate > time.time():
+        resultado.xMotivo = "Aguardando intervalo minimo entre consultas (cStat 137)"
+        return resultado
+
+    c_uf = UF_TO_CUF.get((config.uf or "").upper(), "")
+    if not c_uf:
+        raise ValueError(f"UF inválida para cUF: {config.uf!r}")
+
+    endpoint = EndpointInfo(url=DIST_ENDPOINTS.get(ambiente, DIST_ENDPOINTS["1"]),
+                            soap_action=SOAP_ACTION_DIST)
+
+    while resultado.consultas < max_consultas:
+        # 2) consulta
+        dist_xml = montar_dist_dfe_int(cnpj, c_uf, estado.ult_nsu, ambiente)
+        resp = enviar_soap_com_pfx(
+            endpoint=endpoint,
+            soap_xml=_montar_soap_distribuicao(dist_xml),
+            pfx_path=config.pfx_path,
+            pfx_password=config.pfx_password,
+            timeout=timeout,
+        )
+        resultado.consultas += 1
+
+        # 3) grava documentos e lê o cursor
+        try:
+            novo = _processar_retorno(resp.content, cnpj, repositorio, resultado)
+        except etree.XMLSyntaxError as e:
+            resultado.erro = f"Retorno inválido da Distribuição DF-e: {e}"
+            break
+
+        if novo.ult_nsu:
+            estado.ult_nsu = novo.ult_nsu
+        if novo.max_nsu:
+            estado.max_nsu = novo.max_nsu
+
+        em_dia = _only_digits(estado.ult_nsu).lstrip("0") == _only_digits(estado.max_nsu).lstrip("0")
+
+        if resultado.cStat in (CSTAT_NENHUM_DOCUMENTO, CSTAT_CONSUMO_INDEVIDO) or (
+            resultado.cStat == CSTAT_DOCUMENTOS_LOCALIZADOS and em_dia
+        ):
+            estado.bloqueado_ate = time.time() + ESPERA_SEM_DOCUMENTOS
+            estado_store.gravar(estado)
+            break
+
+        estado_store.gravar(estado)
+
+        if resultado.cStat != CSTAT_DOCUMENTOS_LOCALIZADOS:
+            # rejeição (ex.: 589 NSU maior que o da base, 593 CNPJ divergente)
+            break
+
+    resultado.ult_nsu = estado.ult_nsu
+    resultado.max_nsu = estado.max_nsu
+    resultado.bloqueado_ate = estado.bloqueado_ate
+    return resultado
+
+
+# ----------------------------------------------------------------------
+# AGENDADOR MULTI-CNPJ
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class AgendadorDistribuicao:
+    """
+    Sincroniza vários CNPJs em paralelo.
+
+    CNPJs do mesmo certificado rodam em sequência (uma conexão mTLS
+    por vez por certificado); certificados diferentes rodam em paralelo,
+    até max_workers.
+    """
+    repositorio: RepositorioDocumentos
+    estado_store: EstadoNSUStore
+    max_workers: int = 4
+    intervalo: float = 300.0
+
+    def __post_init__(self) -> None:
+        self._configs: List[DistribuicaoConfig] = []
+        self._ultimos: Dict[str, DistribuicaoResult] = {}
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def adicionar(self, config: DistribuicaoConfig) -> None:
+        with self._lock:
+            self._configs.append(config)
+
+    def ultimos_resultados(self) -> Dict[str, DistribuicaoResult]:
+        with self._lock:
+            return dict(self._ultimos)
+
+    def _sincronizar_grupo(self, configs: List[DistribuicaoConfig]) -> List[DistribuicaoResult]:
+        resultados: List[DistribuicaoResult] = []
+        for cfg in configs:
+            try:
+                res = sefaz_nfe_distribuicao_sincronizar(
+                    cfg, self.repositorio, self.estado_store
+                )
+            except Exception as e:
+                res = DistribuicaoResult(
+                    cnpj=_only_digits(cfg.cnpj),
+                    consultas=0,
+                    ult_nsu="",
+                    max_nsu="",
+                    cStat=None,
+                    xMotivo=None,
+                    erro=str(e),
+                )
+            resultados.append(res)
+            with self._lock:
+                self._ultimos[res.cnpj] = res
+        return resultados
+
+    def executar_uma_vez(self) -> List[DistribuicaoResult]:
+        """
+        Uma rodada completa sobre todos os CNPJs cadastrados.
+        """
+        with self._lock:
+            grupos: Dict[str, List[DistribuicaoConfig]] = {}
+            for cfg in self._configs:
+                grupos.setdefault(cfg.pfx_path, []).append(cfg)
+
+        resultados: List[DistribuicaoResult] = []
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers)) as ex:
+            for parcial in ex.map(self._sincronizar_grupo, grupos.values()):
+                resultados.extend(parcial)
+        return resultados
+
+    def iniciar(self) -> None:
+        if self._thread is not None:
+            return
+        self._parar.clear()
+        self._thread = threading.Thread(
+            target=self._loop, name="sefaz-distribuicao", daemon=True
+        )
+        self._thread.start()
+
+    def parar(self, timeout: float = 30.0) -> None:
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._parar.is_set():
+            self.executar_uma_vez()
+            self._parar.wait(timeout=self.intervalo)
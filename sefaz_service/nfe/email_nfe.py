@@ -3,20 +3,22 @@
 import os
 import smtplib
 from email.message import EmailMessage
-from typing import Optional, List
+from typing import Optional, List, Union
 
 import pdfkit
 from dotenv import load_dotenv
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from pydantic import EmailStr
-from lxml import etree
 
-from sefaz_service.danfe.danfe_html import nfe_xml_to_html
+from sefaz_service.core.documento_nfe import DocumentoNFe, ler_nfe, ler_nfe_cache
+from sefaz_service.core.rastreamento import span
+from sefaz_service.danfe.danfe_html import gerar_danfe_html
 from sefaz_service.danfe.nfce_html import nfce_xml_to_html
+from sefaz_service.routers.perfil import RotaPerfilavel
 
 load_dotenv()
 
-router = APIRouter()
+router = APIRouter(route_class=RotaPerfilavel)
 
 # -------------------------------------------------------------------
 # CONFIG PDFKIT / WKHTMLTOPDF
@@ -29,13 +31,6 @@ WKHTMLTOPDF_PATH = os.getenv(
 
 pdfkit_config = pdfkit.configuration(wkhtmltopdf=WKHTMLTOPDF_PATH)
 
-NFE_NS = "http://www.portalfiscal.inf.br/nfe"
-
-
-def _q(tag: str) -> str:
-    return f"{{{NFE_NS}}}{tag}"
-
-
 # -------------------------------------------------------------------
 # HELPERS
 # -------------------------------------------------------------------
@@ -45,86 +40,42 @@ def html_to_pdf_bytes(html: str) -> bytes:
     Converte HTML em PDF (bytes) usando pdfkit/wkhtmltopdf.
     """
     try:
-        pdf_bytes = pdfkit.from_string(
-            html,
-            False,  # False = retorna bytes em memória
-            configuration=pdfkit_config,
-            options={
-                "enable-local-file-access": None,
-            },
-        )
+        with span("wkhtmltopdf", **{"danfe.html_bytes": len(html)}):
+            pdf_bytes = pdfkit.from_string(
+                html,
+                False,  # False = retorna bytes em memória
+                configuration=pdfkit_config,
+                options={
+                    "enable-local-file-access": None,
+                },
+            )
         return pdf_bytes
     except Exception as exc:
         raise RuntimeError(f"Erro gerando PDF a partir do HTML: {exc}") from exc
 
 
-def parse_nfe_basic_info(xml_bytes: bytes) -> dict:
+def parse_nfe_basic_info(xml: Union[bytes, DocumentoNFe]) -> dict:
     """
-    Extrai informações básicas da NFe a partir do XML:
+    Extrai informações básicas da NFe a partir do XML (ou de um
+    DocumentoNFe já lido):
     - xFant, xNome, CNPJ emitente
     - série, número, destinatário, CNPJ/CPF, valor, chave de acesso
     """
     try:
-        parser = etree.XMLParser(remove_blank_text=False, recover=True)
-        root = etree.fromstring(xml_bytes, parser=parser)
-    except Exception as exc:
+        nfe = ler_nfe(xml, recover=True)
+    except ValueError as exc:
         raise RuntimeError(f"XML inválido para leitura de dados da NF-e: {exc}") from exc
 
-    inf_nfe = root.find(f".//{_q('infNFe')}")
-    if inf_nfe is None:
-        raise RuntimeError("Não foi encontrado o nó <infNFe> no XML.")
-
-    # Chave de acesso
-    chave = inf_nfe.get("Id") or ""
-    if chave.upper().startswith("NFE"):
-        chave = chave[3:]
-
-    # IDE
-    ide_el = inf_nfe.find(_q("ide"))
-    serie = ide_el.findtext(_q("serie"), default="") if ide_el is not None else ""
-    nNF = ide_el.findtext(_q("nNF"), default="") if ide_el is not None else ""
-
-    # Emitente
-    emit_el = inf_nfe.find(_q("emit"))
-    emit_xFant = emit_el.findtext(_q("xFant"), default="") if emit_el is not None else ""
-    emit_xNome = emit_el.findtext(_q("xNome"), default="") if emit_el is not None else ""
-    emit_CNPJ = ""
-    if emit_el is not None:
-        emit_CNPJ = (
-            emit_el.findtext(_q("CNPJ"))
-            or emit_el.findtext(_q("CPF"))
-            or ""
-        )
-
-    # Destinatário
-    dest_el = inf_nfe.find(_q("dest"))
-    dest_xNome = dest_el.findtext(_q("xNome"), default="") if dest_el is not None else ""
-    dest_CNPJ = ""
-    if dest_el is not None:
-        dest_CNPJ = (
-            dest_el.findtext(_q("CNPJ"))
-            or dest_el.findtext(_q("CPF"))
-            or ""
-        )
-
-    # Totais (vNF)
-    total_el = inf_nfe.find(_q("total"))
-    vNF = ""
-    if total_el is not None:
-        icmstot_el = total_el.find(_q("ICMSTot"))
-        if icmstot_el is not None:
-            vNF = icmstot_el.findtext(_q("vNF"), default="")
-
     return {
-        "emit_xFant": emit_xFant,
-        "emit_xNome": emit_xNome,
-        "emit_CNPJ": emit_CNPJ,
-        "serie": serie,
-        "nNF": nNF,
-        "dest_xNome": dest_xNome,
-        "dest_CNPJ": dest_CNPJ,
-        "vNF": vNF,
-        "chave": chave,
+        "emit_xFant": nfe.emit.get("xFant", ""),
+        "emit_xNome": nfe.emit.get("xNome", ""),
+        "emit_CNPJ": nfe.emit.get("CNPJ") or nfe.emit.get("CPF") or "",
+        "serie": nfe.ide.get("serie", ""),
+        "nNF": nfe.ide.get("nNF", ""),
+        "dest_xNome": nfe.dest.get("xNome", ""),
+        "dest_CNPJ": nfe.dest.get("CNPJ") or nfe.dest.get("CPF") or "",
+        "vNF": nfe.icms_tot.get("vNF", ""),
+        "chave": nfe.chave,
     }
 
 
@@ -289,9 +240,10 @@ async def enviar_email_nfe(
     if not xml_bytes:
         raise HTTPException(status_code=400, detail="Arquivo XML vazio.")
 
-    # Extrai informações básicas para montar assunto/corpo HTML
+    # Lê o XML uma vez: dados do corpo do e-mail e DANFE saem do mesmo documento
     try:
-        info = parse_nfe_basic_info(xml_bytes)
+        nfe = ler_nfe_cache(xml_bytes, recover=True)
+        info = parse_nfe_basic_info(nfe)
     except Exception as exc:
         raise HTTPException(
             status_code=500,
@@ -308,10 +260,10 @@ async def enviar_email_nfe(
     # Gera HTML (DANFE) a partir do XML
     try:
         if modelo == 55:
-            html_danfe = nfe_xml_to_html(xml_bytes)
+            html_danfe = gerar_danfe_html(nfe)
             pdf_name = "danfe_nfe.pdf"
         elif modelo == 65:
-            html_danfe = nfce_xml_to_html(xml_bytes)
+            html_danfe = nfce_xml_to_html(nfe)
             pdf_name = "danfe_nfce.pdf"
         else:
             raise HTTPException(
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 
 # ⚠️ IMPORT RELATIVO (sobe para sefaz_service/core)
 from ...core.base_service import SefazBaseService
 from ...core.enums import Ambiente, Projeto
+from ...core.nfe_evento import MAX_EVENTOS_LOTE
 from ...core.xml_utils import (
     xml_tag,
     now_sefaz_datetime,
@@ -88,8 +89,19 @@ class NFeEventoBaseService(SefazBaseService):
         Monta o <envEvento>...<evento>...</evento>...</envEvento>.
         """
         id_lote = self._id_lote_from_chave(chave)
+        return self.montar_envio_lote_eventos([evento_xml], id_lote)
+
+    def montar_envio_lote_eventos(self, eventos_xml: List[str], id_lote: str) -> str:
+        """
+        Monta o <envEvento> com vários <evento> (até 20 pelo leiaute).
+        Cada evento já deve vir assinado.
+        """
+        if not eventos_xml:
+            raise ValueError("Lote de eventos vazio")
+        if len(eventos_xml) > MAX_EVENTOS_LOTE:
+            raise ValueError(f"Lote com {len(eventos_xml)} eventos (máximo {MAX_EVENTOS_LOTE})")
         xml = f'<envEvento versao="{EVENTO_VERSAO}" xmlns="{NFE_EVENTO_NS}">'
         xml += xml_tag("idLote", id_lote)
-        xml += evento_xml
+        xml += "".join(eventos_xml)
         xml += "</envEvento>"
         return xml
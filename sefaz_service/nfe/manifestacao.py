@@ -0,0 +1,161 @@
+# sefaz_service/nfe/manifestacao.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from sefaz_service.core.nfe_evento import (
+    DESC_MANIFESTACAO,
+    EventoPendente,
+    EventoRequest,
+    sefaz_enviar_eventos_lote,
+)
+from sefaz_service.core.repositorio import RepositorioDocumentos
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+
+# Eventos de manifestação vão sempre para o Ambiente Nacional
+C_ORGAO_AN = "91"
+
+# 135 = evento registrado e vinculado, 136 = registrado mas não vinculado
+CSTAT_EVENTO_REGISTRADO = (135, 136)
+
+
+# ----------------------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class ManifestacaoResult:
+    """
+    Resultado da manifestação de uma chave.
+
+    - documento_id: id no RepositorioDocumentos do procEventoNFe gravado
+      (só quando o evento foi registrado e há repositório)
+    """
+    chave: str
+    tpEvento: str
+    cStat_lote: Optional[int]
+    xMotivo_lote: Optional[str]
+    cStat: Optional[int]
+    xMotivo: Optional[str]
+    nProt: Optional[str]
+    xml_retorno: str
+    documento_id: Optional[str] = None
+
+
+# ----------------------------------------------------------------------
+# HELPERS
+# ----------------------------------------------------------------------
+
+
+def _only_digits(s: str) -> str:
+    return "".join(c for c in (s or "") if c.isdigit())
+
+
+def montar_proc_evento_nfe(xml_evento_assinado: str, xml_ret_evento: str) -> str:
+    """
+    <procEventoNFe versao="1.00"> com o <evento> assinado e o <retEvento>.
+    """
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<procEventoNFe versao="1.00" xmlns="{NFE_NS}">'
+        f"{xml_evento_assinado}{xml_ret_evento}"
+        f"</procEventoNFe>"
+    )
+
+
+# ----------------------------------------------------------------------
+# MANIFESTAÇÃO EM LOTE
+# ----------------------------------------------------------------------
+
+
+def sefaz_manifestar_destinatario(
+    chaves: Iterable[str],
+    tp_evento: str,
+    cnpj: str,
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str = "1",
+    xJust: Optional[str] = None,
+    nSeqEvento: int = 1,
+    repositorio: Optional[RepositorioDocumentos] = None,
+    max_workers: int = 4,
+) -> List[ManifestacaoResult]:
+    """
+    Manifestação do destinatário para uma lista de chaves:
+
+      210200 = Confirmação da Operação
+      210210 = Ciência da Operação
+      210220 = Desconhecimento da Operação
+      210240 = Operação não Realizada (exige xJust, 15 a 255 caracteres)
+
+    Usa o envio em lote de eventos (20 por envEvento, assinatura em
+    paralelo) contra o Ambiente Nacional. As chamadas passam pelo
+    limitador do transporte, com balde próprio para o CNPJ do certificado
+    no NFeRecepcaoEvento4 do AN.
+
+    Com `repositorio`, o procEventoNFe de cada evento registrado (135/136)
+    é gravado com tipo "procEventoNFe_<tpEvento>".
+
+    Retorna um ManifestacaoResult por chave (sem repetidas), na ordem recebida.
+    """
+    if tp_evento not in DESC_MANIFESTACAO:
+        raise ValueError(
+            f"tpEvento de manifestação inválido: {tp_evento!r} "
+            f"(use {', '.join(DESC_MANIFESTACAO)})"
+        )
+    if tp_evento == "210240" and not (15 <= len((xJust or "").strip()) <= 255):
+        raise ValueError("Operação não Realizada (210240) exige xJust com 15 a 255 caracteres")
+
+    cnpj = _only_digits(cnpj)
+    chaves_unicas = list(dict.fromkeys(_only_digits(c) for c in chaves if c))
+    invalidas = [c for c in chaves_unicas if len(c) != 44]
+    if invalidas:
+        raise ValueError(f"Chaves de acesso inválidas: {', '.join(invalidas[:5])}")
+
+    pendentes = [
+        EventoPendente(
+            req=EventoRequest(
+                tpAmb=ambiente,
+                cOrgao=C_ORGAO_AN,
+                CNPJ=cnpj,
+                chNFe=chave,
+                tpEvento=tp_evento,
+                nSeqEvento=nSeqEvento,
+                xJust=xJust,
+            ),
+            uf="AN",
+            pfx_path=pfx_path,
+            pfx_password=pfx_password,
+        )
+        for chave in chaves_unicas
+    ]
+
+    resultados: List[ManifestacaoResult] = []
+    for chave, res in zip(chaves_unicas, sefaz_enviar_eventos_lote(pendentes, max_workers=max_workers)):
+        documento_id: Optional[str] = None
+        if repositorio is not None and res.cStat_evento in CSTAT_EVENTO_REGISTRADO:
+            documento_id = repositorio.salvar(
+                montar_proc_evento_nfe(res.xml_assinado, res.xml_retorno),
+                f"procEventoNFe_{tp_evento}",
+                chave=chave,
+                cnpj=cnpj,
+            )
+
+        resultados.append(
+            ManifestacaoResult(
+                chave=chave,
+                tpEvento=tp_evento,
+                cStat_lote=res.cStat_lote,
+                xMotivo_lote=res.xMotivo_lote,
+                cStat=res.cStat_evento,
+                xMotivo=res.xMotivo_evento,
+                nProt=res.nProt_evento,
+                xml_retorno=res.xml_retorno,
+                documento_id=documento_id,
+            )
+        )
+
+    return resultados
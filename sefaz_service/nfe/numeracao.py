@@ -0,0 +1,362 @@
+# sefaz_service/nfe/numeracao.py
+from __future__ import annotations
+
+import re
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from sefaz_service.core.nfe_inutilizacao import (
+    CSTAT_INUTILIZACAO_HOMOLOGADA,
+    InutilizacaoRequest,
+    InutilizacaoResponse,
+    enviar_inutilizacao,
+)
+from sefaz_service.core.rastreamento import propagar_contexto
+from sefaz_service.core.repositorio import RepositorioDocumentos
+from sefaz_service.core.uf_utils import uf_to_cuf
+
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+
+NNF_MAX = 999_999_999
+
+TIPO_PROC_INUT = "procInutNFe"
+
+# Id do infInut: "ID" + cUF(2) ano(2) CNPJ(14) mod(2) serie(3) nNFIni(9) nNFFin(9)
+_RE_ID_INUT = re.compile(r'<(?:\w+:)?infInut[^>]*\sId="ID(\d{41})"')
+
+
+# ----------------------------------------------------------------------
+# ESTRUTURA DE INTERVALOS
+# ----------------------------------------------------------------------
+
+
+class ConjuntoIntervalos:
+    """
+    Conjunto de inteiros guardado como intervalos fechados disjuntos e
+    ordenados ([ini, fim]), com busca binária.
+
+    Números consecutivos viram um único intervalo, então um milhão de
+    notas emitidas em sequência ocupam um item só.
+    """
+
+    def __init__(self) -> None:
+        self._inis: List[int] = []
+        self._fins: List[int] = []
+
+    def __len__(self) -> int:
+        return len(self._inis)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return iter(zip(self._inis, self._fins))
+
+    def adicionar(self, ini: int, fim: Optional[int] = None) -> None:
+        """
+        Inclui [ini, fim] (ou só `ini`), unindo com vizinhos que se
+        sobrepõem ou encostam.
+        """
+        fim = ini if fim is None else fim
+        if fim < ini:
+            raise ValueError(f"Intervalo inválido: {ini}-{fim}")
+
+        # primeiro intervalo que pode encostar à esquerda e último à direita
+        i = bisect_left(self._fins, ini - 1)
+        j = bisect_right(self._inis, fim + 1)
+        if i < j:
+            ini = min(ini, self._inis[i])
+            fim = max(fim, self._fins[j - 1])
+        self._inis[i:j] = [ini]
+        self._fins[i:j] = [fim]
+
+    def contem(self, n: int) -> bool:
+        i = bisect_right(self._inis, n) - 1
+        return i >= 0 and self._fins[i] >= n
+
+    def minimo(self) -> Optional[int]:
+        return self._inis[0] if self._inis else None
+
+    def maximo(self) -> Optional[int]:
+        return self._fins[-1] if self._fins else None
+
+    def lacunas(self, ini: int, fim: int) -> Iterator[Tuple[int, int]]:
+        """
+        Intervalos de [ini, fim] que NÃO estão no conjunto, já máximos
+        (cada lacuna vira uma única faixa).
+        """
+        atual = ini
+        k = max(0, bisect_right(self._inis, ini) - 1)
+        for a, b in zip(self._inis[k:], self._fins[k:]):
+            if a > fim:
+                break
+            if b < atual:
+                continue
+            if a > atual:
+                yield atual, a - 1
+            atual = max(atual, b + 1)
+            if atual > fim:
+                return
+        if atual <= fim:
+            yield atual, fim
+
+
+# ----------------------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class FaixaInutilizacao:
+    cnpj: str
+    modelo: str
+    serie: str
+    ano: str          # 2 dígitos
+    nNFIni: int
+    nNFFin: int
+
+    @property
+    def quantidade(self) -> int:
+        return self.nNFFin - self.nNFIni + 1
+
+
+@dataclass
+class PlanoInutilizacao:
+    """
+    - emitidos: quantos números foram considerados como usados
+    - faixa_ini / faixa_fim: trecho da numeração analisado
+    - faixas: lacunas a inutilizar (mínimo de faixas possível)
+    """
+    cnpj: str
+    modelo: str
+    serie: str
+    ano: str
+    emitidos: int
+    faixa_ini: Optional[int]
+    faixa_fim: Optional[int]
+    faixas: List[FaixaInutilizacao]
+
+    @property
+    def total_inutilizar(self) -> int:
+        return sum(f.quantidade for f in self.faixas)
+
+
+@dataclass
+class ResultadoFaixa:
+    faixa: FaixaInutilizacao
+    enviado: bool
+    cStat: Optional[str] = None
+    xMotivo: Optional[str] = None
+    nProt: Optional[str] = None
+    documento_id: Optional[str] = None
+
+
+# ----------------------------------------------------------------------
+# LEITURA DA NUMERAÇÃO USADA
+# ----------------------------------------------------------------------
+
+
+def _only_digits(s: str) -> str:
+    return "".join(c for c in (s or "") if c.isdigit())
+
+
+def _normalizar(cnpj: str, modelo: str, serie: str, ano: str) -> Tuple[str, str, str, str]:
+    return (
+        _only_digits(cnpj).zfill(14),
+        str(modelo).zfill(2),
+        str(int(serie)).zfill(3),
+        str(ano)[-2:].zfill(2),
+    )
+
+
+def numeros_emitidos_do_repositorio(
+    repositorio: RepositorioDocumentos,
+    cnpj: str,
+    modelo: str,
+    serie: str,
+    ano: str,
+) -> Iterator[int]:
+    """
+    Números (nNF) das chaves gravadas no repositório para o emitente,
+    modelo, série e ano (AA da chave).
+
+    Chave: cUF(2) AAMM(4) CNPJ(14) mod(2) serie(3) nNF(9) tpEmis(1) cNF(8) cDV(1)
+    """
+    cnpj, modelo, serie, ano = _normalizar(cnpj, modelo, serie, ano)
+    padrao = f"__{ano}__{cnpj}{modelo}{serie}" + "_" * 19
+    for chave in repositorio.chaves(padrao):
+        yield int(chave[25:34])
+
+
+def faixas_inutilizadas_do_repositorio(
+    repositorio: RepositorioDocumentos,
+    cnpj: str,
+    modelo: str,
+    serie: str,
+    ano: str,
+) -> Iterator[Tuple[int, int]]:
+    """
+    Faixas já inutilizadas (gravadas por salvar_inutilizacao: plano,
+    /nfe/inutilizar e fila). A "chave" delas é o Id do infInut sem o prefixo "ID":
+    cUF(2) ano(2) CNPJ(14) mod(2) serie(3) nNFIni(9) nNFFin(9).
+    """
+    cnpj, modelo, serie, ano = _normalizar(cnpj, modelo, serie, ano)
+    padrao = f"__{ano}{cnpj}{modelo}{serie}" + "_" * 18
+    for chave in repositorio.chaves(padrao, tipo=TIPO_PROC_INUT):
+        yield int(chave[23:32]), int(chave[32:41])
+
+
+def salvar_inutilizacao(
+    repositorio: RepositorioDocumentos,
+    resp: InutilizacaoResponse,
+) -> Optional[str]:
+    """
+    Grava o procInutNFe de uma inutilização homologada (102) no
+    repositório, com o Id do infInut como chave, para que a faixa seja
+    descontada nos próximos planos. Retorna o id do documento, ou None
+    se não houve homologação.
+    """
+    if resp.cStat != CSTAT_INUTILIZACAO_HOMOLOGADA or not resp.xml_proc:
+        return None
+    m = _RE_ID_INUT.search(resp.xml_assinado or "")
+    if m is None:
+        return None
+    id_inut = m.group(1)
+    return repositorio.salvar(resp.xml_proc, TIPO_PROC_INUT, chave=id_inut, cnpj=id_inut[4:18])
+
+
+# ----------------------------------------------------------------------
+# PLANEJAMENTO
+# ----------------------------------------------------------------------
+
+
+def planejar_inutilizacao(
+    emitidos: Iterable[int],
+    cnpj: str,
+    modelo: str,
+    serie: str,
+    ano: str,
+    *,
+    inutilizados: Iterable[Tuple[int, int]] = (),
+    inicio: Optional[int] = None,
+    fim: Optional[int] = None,
+    max_por_faixa: Optional[int] = None,
+) -> PlanoInutilizacao:
+    """
+    Calcula as lacunas da numeração e devolve as faixas a inutilizar.
+
+    - emitidos: números já usados (repetidos e fora de ordem são aceitos)
+    - inutilizados: faixas já inutilizadas, que não são lacuna
+    - inicio / fim: trecho analisado; por padrão, do menor ao maior
+      número emitido (o que vem depois do último ainda não é lacuna)
+    - max_por_faixa: quebra faixas maiores que isso em várias
+    """
+    cnpj, modelo, serie, ano = _normalizar(cnpj, modelo, serie, ano)
+
+    usados = ConjuntoIntervalos()
+    emitidos_qtd = 0
+    for n in emitidos:
+        n = int(n)
+        if not 1 <= n <= NNF_MAX:
+            raise ValueError(f"Número de NF fora do intervalo 1..{NNF_MAX}: {n}")
+        usados.adicionar(n)
+        emitidos_qtd += 1
+
+    ini = inicio if inicio is not None else usados.minimo()
+    fim_ = fim if fim is not None else usados.maximo()
+
+    for a, b in inutilizados:
+        usados.adicionar(a, b)
+
+    faixas: List[FaixaInutilizacao] = []
+    if ini is not None and fim_ is not None and ini <= fim_:
+        for a, b in usados.lacunas(ini, fim_):
+            passo = max_por_faixa or (b - a + 1)
+            for n in range(a, b + 1, passo):
+                faixas.append(
+                    FaixaInutilizacao(
+                        cnpj=cnpj,
+                        modelo=modelo,
+                        serie=serie,
+                        ano=ano,
+                        nNFIni=n,
+                        nNFFin=min(b, n + passo - 1),
+                    )
+                )
+
+    return PlanoInutilizacao(
+        cnpj=cnpj,
+        modelo=modelo,
+        serie=serie,
+        ano=ano,
+        emitidos=emitidos_qtd,
+        faixa_ini=ini,
+        faixa_fim=fim_,
+        faixas=faixas,
+    )
+
+
+# ----------------------------------------------------------------------
+# EXECUÇÃO
+# ----------------------------------------------------------------------
+
+
+def executar_plano_inutilizacao(
+    plano: PlanoInutilizacao,
+    uf: str,
+    ambiente: str,
+    xJust: str,
+    pfx_path: str,
+    pfx_password: str,
+    *,
+    dry_run: bool = True,
+    max_workers: int = 2,
+    repositorio: Optional[RepositorioDocumentos] = None,
+) -> List[ResultadoFaixa]:
+    """
+    Envia as faixas do plano (NFeInutilizacao4), em paralelo.
+
+    O ritmo contra a SEFAZ fica a cargo do limitador do transporte
+    (balde do NFeInutilizacao4 por endpoint/CNPJ). Com dry_run=True nada é
+    enviado e o retorno serve de relatório do que seria inutilizado.
+
+    Com `repositorio`, cada inutilização homologada (102) é gravada
+    (tipo procInutNFe) e passa a ser descontada nos próximos planos.
+    """
+    if not (15 <= len((xJust or "").strip()) <= 255):
+        raise ValueError("xJust deve ter de 15 a 255 caracteres")
+
+    if dry_run:
+        return [ResultadoFaixa(faixa=f, enviado=False) for f in plano.faixas]
+
+    c_uf = uf_to_cuf(uf)
+
+    def _enviar(faixa: FaixaInutilizacao) -> ResultadoFaixa:
+        req = InutilizacaoRequest(
+            cUF=c_uf,
+            tpAmb=ambiente,
+            ano=faixa.ano,
+            CNPJ=faixa.cnpj,
+            mod=faixa.modelo,
+            serie=faixa.serie,
+            nNFIni=str(faixa.nNFIni),
+            nNFFin=str(faixa.nNFFin),
+            xJust=xJust,
+        )
+        try:
+            resp = enviar_inutilizacao(req=req, certificado=pfx_path, senha=pfx_password, uf_sigla=uf)
+        except Exception as e:
+            return ResultadoFaixa(faixa=faixa, enviado=False, xMotivo=f"Erro ao inutilizar: {e}")
+
+        documento_id = salvar_inutilizacao(repositorio, resp) if repositorio is not None else None
+
+        return ResultadoFaixa(
+            faixa=faixa,
+            enviado=True,
+            cStat=resp.cStat,
+            xMotivo=resp.xMotivo,
+            nProt=resp.nProt,
+            documento_id=documento_id,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        return list(ex.map(propagar_contexto(_enviar), plano.faixas))
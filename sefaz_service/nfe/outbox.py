@@ -0,0 +1,837 @@
+# sefaz_service/nfe/outbox.py
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import requests
+from cryptography.fernet import Fernet, InvalidToken
+from urllib3.exceptions import NewConnectionError
+
+from sefaz_service.core.assinatura import assinar_nfe_xml
+from sefaz_service.core.nfe_autorizado import sefaz_nfe_gera_autorizado
+from sefaz_service.core.nfe_consulta import sefaz_nfe_consulta
+from sefaz_service.core.nfe_evento import EventoRequest, sefaz_enviar_evento
+from sefaz_service.core.nfe_inutilizacao import (
+    InutilizacaoRequest,
+    InutilizacaoResponse,
+    enviar_inutilizacao,
+)
+from sefaz_service.core.repositorio import RepositorioDocumentos
+from sefaz_service.nfe.numeracao import salvar_inutilizacao
+from sefaz_service.nfe.recibo import AgendadorRecibos, ReciboResultado
+from sefaz_service.nfe.workflow import AutorizarNFeResult, autorizar_nfe
+
+logger = logging.getLogger(__name__)
+
+
+# ----------------------------------------------------------------------
+# CONSTANTES
+# ----------------------------------------------------------------------
+
+TIPO_AUTORIZACAO = "nfe_autorizacao"
+TIPO_EVENTO = "nfe_evento"
+TIPO_INUTILIZACAO = "nfe_inutilizacao"
+
+STATUS_PENDENTE = "pendente"
+STATUS_PROCESSANDO = "processando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_FALHA = "falha"
+# autorização em lote assíncrono: a SEFAZ devolveu o nRec, o protocolo
+# ainda vai chegar pela consulta do recibo
+STATUS_AGUARDANDO_RECIBO = "aguardando_recibo"
+
+STATUS_FINAIS = (STATUS_CONCLUIDO, STATUS_FALHA)
+
+# cStat que indicam indisponibilidade momentânea da SEFAZ
+# (108/109 = serviço paralisado, 656 = consumo indevido).
+CSTAT_TRANSITORIOS = {108, 109, 656}
+
+# Situações da consulta por chave que provam que a NF-e já foi recebida:
+# 100/150 = autorizada, 101/151/155 = cancelada, 110/301/302/303 = denegada
+CSTAT_JA_RECEBIDA = {100, 101, 110, 150, 151, 155, 301, 302, 303}
+# 217 = NF-e não consta na base de dados da SEFAZ
+CSTAT_NAO_CONSTA = 217
+
+# Marca gravada no payload da autorização cuja tentativa anterior pode
+# ter chegado à SEFAZ: antes de reenviar, consulta a chave.
+CAMPO_CONSULTAR_ANTES = "consultar_antes"
+
+# Campos do payload com a senha do certificado; apagados no status final.
+CAMPOS_SENHA = ("pfx_senha_cifrada", "pfx_password")
+
+# Chave de acesso no Id da infNFe (Id="NFe" + 44 dígitos)
+_RE_CHAVE_NFE = re.compile(r'Id="NFe(\d{44})"')
+
+
+class ErroTransitorio(RuntimeError):
+    """
+    Falha que deve ser reprocessada mais tarde (ex.: SEFAZ paralisada).
+    """
+
+
+class ErroCertificado(RuntimeError):
+    """
+    Certificado do job não pode ser resolvido (referência desconhecida ou
+    senha que não decifra mais); o job falha sem novas tentativas.
+    """
+
+
+def falha_antes_do_envio(erro: BaseException) -> bool:
+    """
+    True se a falha com certeza aconteceu antes de a requisição chegar à
+    SEFAZ (ou se a SEFAZ respondeu que não processou: cStat transitório).
+    Só nesses casos a autorização pode ser reenviada sem consultar a chave.
+    """
+    if isinstance(erro, (ErroTransitorio, ErroCertificado, requests.exceptions.ConnectTimeout)):
+        return True
+    # DNS ou conexão recusada: o urllib3 nem chegou a abrir o socket
+    if isinstance(erro, requests.exceptions.ConnectionError):
+        causa = erro.args[0] if erro.args else None
+        return isinstance(getattr(causa, "reason", causa), NewConnectionError)
+    return False
+
+
+# ----------------------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class OutboxJob:
+    """
+    Um trabalho da fila persistente.
+
+    - id: identificador devolvido ao cliente (uuid4 hex)
+    - tipo: nfe_autorizacao | nfe_evento | nfe_inutilizacao
+    - uf: sigla da UF (usada no limite de concorrência por UF)
+    - status: pendente | processando | aguardando_recibo | concluido | falha
+    - tentativas: quantas vezes o job já foi executado
+    - payload: parâmetros da chamada (JSON)
+    - resultado: dataclass de retorno convertido em dict (quando concluído)
+    - erro: última mensagem de erro
+    - proxima_tentativa: epoch em que o job volta a ficar elegível
+    """
+    id: str
+    tipo: str
+    uf: str
+    status: str
+    tentativas: int
+    payload: Dict[str, Any]
+    resultado: Optional[Dict[str, Any]] = None
+    erro: Optional[str] = None
+    criado_em: float = 0.0
+    atualizado_em: float = 0.0
+    proxima_tentativa: float = 0.0
+
+
+# ----------------------------------------------------------------------
+# HANDLERS PADRÃO (um por tipo de job)
+# ----------------------------------------------------------------------
+
+
+def _cstat_int(valor: Any) -> Optional[int]:
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def _chave_do_xml(xml_nfe: str) -> Optional[str]:
+    m = _RE_CHAVE_NFE.search(xml_nfe or "")
+    return m.group(1) if m else None
+
+
+def _consultar_antes_de_reenviar(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Consulta a chave de uma autorização que pode já ter sido recebida.
+    Retorna o resultado montado a partir do retConsSitNFe se a SEFAZ já
+    conhece a NF-e, ou None se ela não consta (pode reenviar).
+    """
+    xml_nfe = payload["xml_nfe"]
+    chave = _chave_do_xml(xml_nfe)
+    if chave is None:
+        # sem chave não há o que consultar; o envio seria rejeitado do mesmo jeito
+        return None
+
+    cons = sefaz_nfe_consulta(
+        uf=payload["uf"],
+        chave=chave,
+        pfx_path=payload["pfx_path"],
+        pfx_password=payload["pfx_password"],
+        ambiente=payload.get("ambiente", "2"),
+    )
+    if cons.cStat == CSTAT_NAO_CONSTA:
+        return None
+    if cons.cStat not in CSTAT_JA_RECEBIDA:
+        # 108/109/656/999, falha de comunicação ou rejeição da consulta:
+        # sem saber se a NF-e foi recebida, não reenvia agora
+        raise ErroTransitorio(
+            f"Consulta da chave {chave} antes do reenvio: {cons.cStat} - {cons.xMotivo}"
+        )
+
+    # Assinatura é determinística: a NFe assinada de novo é a mesma que
+    # foi enviada, e o protNFe da consulta fecha o nfeProc.
+    versao = payload.get("versao", "4.00")
+    xml_assinado = assinar_nfe_xml(xml_nfe, payload["pfx_path"], payload["pfx_password"])
+    aut = sefaz_nfe_gera_autorizado(
+        xml_assinado=xml_assinado,
+        xml_protocolo=cons.xml_retorno,
+        versao=versao,
+    )
+    return asdict(
+        AutorizarNFeResult(
+            autorizado=aut.autorizado,
+            status=aut.status,
+            motivo=aut.motivo,
+            xml_original=xml_nfe,
+            xml_assinado=xml_assinado,
+            xml_envi_nfe="",
+            xml_retorno=cons.xml_retorno,
+            xml_nfe_proc=aut.xml_nfe_proc,
+            xml_protocolo=aut.xml_protocolo_ajustado,
+        )
+    )
+
+
+def _executar_autorizacao(payload: Dict[str, Any]) -> Dict[str, Any]:
+    if payload.get(CAMPO_CONSULTAR_ANTES):
+        ja_recebida = _consultar_antes_de_reenviar(payload)
+        if ja_recebida is not None:
+            return ja_recebida
+
+    res = autorizar_nfe(
+        xml_nfe=payload["xml_nfe"],
+        uf=payload["uf"],
+        pfx_path=payload["pfx_path"],
+        pfx_password=payload["pfx_password"],
+        ambiente=payload.get("ambiente", "2"),
+        versao=payload.get("versao", "4.00"),
+        envio_sinc=payload.get("envio_sinc"),
+    )
+    if res.status in CSTAT_TRANSITORIOS:
+        raise ErroTransitorio(f"SEFAZ indisponivel: {res.status} - {res.motivo}")
+    return asdict(res)
+
+
+def _executar_evento(payload: Dict[str, Any]) -> Dict[str, Any]:
+    req = EventoRequest(**payload["evento"])
+    res = sefaz_enviar_evento(
+        req=req,
+        uf=payload["uf"],
+        pfx_path=payload["pfx_path"],
+        pfx_password=payload["pfx_password"],
+    )
+    if res.cStat_lote in CSTAT_TRANSITORIOS:
+        raise ErroTransitorio(
+            f"SEFAZ indisponivel: {res.cStat_lote} - {res.xMotivo_lote}"
+        )
+    return asdict(res)
+
+
+def _executar_inutilizacao(payload: Dict[str, Any]) -> Dict[str, Any]:
+    req = InutilizacaoRequest(**payload["inutilizacao"])
+    res = enviar_inutilizacao(
+        req=req,
+        certificado=payload["pfx_path"],
+        senha=payload["pfx_password"],
+        uf_sigla=payload["uf"],
+    )
+    if _cstat_int(res.cStat) in CSTAT_TRANSITORIOS:
+        raise ErroTransitorio(f"SEFAZ indisponivel: {res.cStat} - {res.xMotivo}")
+    return asdict(res)
+
+
+HANDLERS_PADRAO: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    TIPO_AUTORIZACAO: _executar_autorizacao,
+    TIPO_EVENTO: _executar_evento,
+    TIPO_INUTILIZACAO: _executar_inutilizacao,
+}
+
+
+# ----------------------------------------------------------------------
+# OUTBOX
+# ----------------------------------------------------------------------
+
+
+_SQL_CRIAR = """
+CREATE TABLE IF NOT EXISTS outbox_jobs (
+    id                TEXT PRIMARY KEY,
+    tipo              TEXT NOT NULL,
+    uf                TEXT NOT NULL,
+    status            TEXT NOT NULL,
+    tentativas        INTEGER NOT NULL DEFAULT 0,
+    payload           TEXT NOT NULL,
+    resultado         TEXT,
+    erro              TEXT,
+    criado_em         REAL NOT NULL,
+    atualizado_em     REAL NOT NULL,
+    proxima_tentativa REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_outbox_fila
+    ON outbox_jobs (status, proxima_tentativa);
+"""
+
+
+@dataclass
+class NFeOutbox:
+    """
+    Fila persistente (SQLite) de envios para a SEFAZ.
+
+    O cliente chama enfileirar() e recebe o id do job imediatamente;
+    um pool de threads consome a fila em segundo plano. Jobs que
+    estavam 'processando' quando o processo caiu voltam para 'pendente'
+    na próxima inicialização.
+
+    Regras:
+      - falhas (exceção ou cStat transitório) são reprocessadas com
+        backoff exponencial + jitter, até max_tentativas;
+      - autorização que pode ter chegado à SEFAZ (exceção depois do
+        envio, queda com o job 'processando') não é reenviada às cegas:
+        a próxima tentativa consulta a chave e só reenvia se a SEFAZ
+        responder que a NF-e não consta (217);
+      - no máximo max_por_uf jobs simultâneos para a mesma UF;
+      - autorização em lote assíncrono (envio_sinc=False) que volta com
+        recibo fica 'aguardando_recibo' (com o nRec gravado no resultado)
+        e é entregue a `recibos`, que consulta o nRec em segundo plano; o
+        job só conclui quando o recibo tiver resposta final. Na
+        inicialização esses jobs são registrados de novo em `recibos`;
+      - inutilização homologada vai para `repositorio` (procInutNFe),
+        como as feitas por /nfe/inutilizar e pelo plano de numeração.
+
+    Certificados: o banco nunca guarda a senha em claro. Certificados
+    registrados em `certificados` (nome → (pfx_path, senha)) viram só o
+    nome no payload; os demais levam a senha cifrada com `chave_cifra`
+    (Fernet), apagada quando o job chega ao status final. Sem
+    `chave_cifra`, a chave é gerada por processo e jobs com senha cifrada
+    que sobrevivem a um reinício falham.
+    """
+    db_path: str = "sefaz_outbox.db"
+    workers: int = 4
+    max_por_uf: int = 2
+    max_tentativas: int = 6
+    backoff_base: float = 2.0
+    backoff_max: float = 300.0
+    handlers: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = field(
+        default_factory=lambda: dict(HANDLERS_PADRAO)
+    )
+    certificados: Dict[str, Tuple[str, str]] = field(default_factory=dict)
+    chave_cifra: str = ""
+    recibos: Optional[AgendadorRecibos] = None
+    repositorio: Optional[RepositorioDocumentos] = None
+
+    def __post_init__(self) -> None:
+        self._fernet = Fernet(self.chave_cifra or Fernet.generate_key())
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._em_execucao_uf: Dict[str, int] = {}
+        self._threads: List[threading.Thread] = []
+        self._parar = threading.Event()
+        # nRec -> id do job aguardando o recibo
+        self._jobs_por_recibo: Dict[str, str] = {}
+        self._criar_tabela()
+        if self.recibos is not None:
+            self.recibos.ao_concluir = self._encadear_ao_concluir(self.recibos.ao_concluir)
+
+    # ------------------------------------------------------------------
+    # Banco
+    # ------------------------------------------------------------------
+
+    @contextmanager
+    def _conectar(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _criar_tabela(self) -> None:
+        with self._conectar() as conn:
+            conn.executescript(_SQL_CRIAR)
+
+    @staticmethod
+    def _row_to_job(row: sqlite3.Row) -> OutboxJob:
+        return OutboxJob(
+            id=row["id"],
+            tipo=row["tipo"],
+            uf=row["uf"],
+            status=row["status"],
+            tentativas=row["tentativas"],
+            payload=json.loads(row["payload"]),
+            resultado=json.loads(row["resultado"]) if row["resultado"] else None,
+            erro=row["erro"],
+            criado_em=row["criado_em"],
+            atualizado_em=row["atualizado_em"],
+            proxima_tentativa=row["proxima_tentativa"],
+        )
+
+    # ------------------------------------------------------------------
+    # Certificados
+    # ------------------------------------------------------------------
+
+    def referencia_certificado(self, pfx_path: str, pfx_password: str) -> Dict[str, Any]:
+        """
+        Campos do payload que identificam o certificado sem gravar a senha
+        em claro: o nome de um certificado registrado ou a senha cifrada.
+        """
+        for nome, (caminho, senha) in self.certificados.items():
+            if caminho == pfx_path and hmac.compare_digest(senha.encode("utf-8"), pfx_password.encode("utf-8")):
+                return {"certificado": nome}
+        return {
+            "pfx_path": pfx_path,
+            "pfx_senha_cifrada": self._fernet.encrypt(pfx_password.encode("utf-8")).decode("ascii"),
+        }
+
+    def _resolver_certificado(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Cópia do payload com pfx_path/pfx_password prontos para o handler.
+        """
+        dados = dict(payload)
+        nome = dados.pop("certificado", None)
+        if nome is not None:
+            if nome not in self.certificados:
+                raise ErroCertificado(f"Certificado '{nome}' não registrado no outbox")
+            dados["pfx_path"], dados["pfx_password"] = self.certificados[nome]
+        elif "pfx_senha_cifrada" in dados:
+            try:
+                dados["pfx_password"] = self._fernet.decrypt(
+                    dados.pop("pfx_senha_cifrada").encode("ascii")
+                ).decode("utf-8")
+            except InvalidToken:
+                raise ErroCertificado(
+                    "Senha do certificado não pode ser decifrada"
+                    " (defina SEFAZ_OUTBOX_CHAVE para manter jobs entre reinícios)"
+                )
+        return dados
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def enfileirar(self, tipo: str, uf: str, payload: Dict[str, Any]) -> str:
+        """
+        Grava o job na fila e devolve o id (não espera a SEFAZ).
+        """
+        if tipo not in self.handlers:
+            raise ValueError(f"Tipo de job desconhecido: {tipo}")
+
+        job_id = uuid.uuid4().hex
+        agora = time.time()
+        with self._conectar() as conn:
+            conn.execute(
+                "INSERT INTO outbox_jobs (id, tipo, uf, status, tentativas, payload,"
+                " criado_em, atualizado_em, proxima_tentativa)"
+                " VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?)",
+                (
+                    job_id,
+                    tipo,
+                    (uf or "").upper(),
+                    STATUS_PENDENTE,
+                    json.dumps(payload, ensure_ascii=False),
+                    agora,
+                    agora,
+                    agora,
+                ),
+            )
+
+        with self._cond:
+            self._cond.notify()
+        return job_id
+
+    def consultar(self, job_id: str) -> Optional[OutboxJob]:
+        """
+        Retorna o job (ou None se não existir).
+        """
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT * FROM outbox_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def aguardar(self, job_id: str, timeout: float = 30.0) -> Optional[OutboxJob]:
+        """
+        Espera (long-poll) até o job chegar a um status final ou estourar
+        o timeout. Retorna o estado mais recente do job.
+        """
+        limite = time.monotonic() + max(0.0, timeout)
+        while True:
+            job = self.consultar(job_id)
+            if job is None or job.status in STATUS_FINAIS:
+                return job
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return job
+            with self._cond:
+                self._cond.wait(timeout=min(restante, 1.0))
+
+    def iniciar(self) -> None:
+        """
+        Recupera jobs interrompidos e sobe o pool de workers.
+        """
+        if self._threads:
+            return
+
+        # 1) jobs que ficaram "processando" após uma queda voltam para a fila;
+        #    autorizações podem ter chegado à SEFAZ e consultam a chave antes
+        with self._conectar() as conn:
+            agora = time.time()
+            for row in conn.execute(
+                "SELECT id, payload FROM outbox_jobs WHERE status = ? AND tipo = ?",
+                (STATUS_PROCESSANDO, TIPO_AUTORIZACAO),
+            ).fetchall():
+                payload = json.loads(row["payload"])
+                payload[CAMPO_CONSULTAR_ANTES] = True
+                conn.execute(
+                    "UPDATE outbox_jobs SET payload = ? WHERE id = ?",
+                    (json.dumps(payload, ensure_ascii=False), row["id"]),
+                )
+            conn.execute(
+                "UPDATE outbox_jobs SET status = ?, atualizado_em = ?"
+                " WHERE status = ?",
+                (STATUS_PENDENTE, agora, STATUS_PROCESSANDO),
+            )
+            aguardando = conn.execute(
+                "SELECT * FROM outbox_jobs WHERE status = ?",
+                (STATUS_AGUARDANDO_RECIBO,),
+            ).fetchall()
+
+        # 2) autorizações assíncronas voltam a ter o recibo consultado
+        if self.recibos is not None:
+            for row in aguardando:
+                job = self._row_to_job(row)
+                try:
+                    dados = self._resolver_certificado(job.payload)
+                except ErroCertificado as e:
+                    self._finalizar(job, STATUS_FALHA, resultado=job.resultado, erro=str(e))
+                    continue
+                self._registrar_recibo(job, dados, job.resultado or {})
+
+        # 3) pool de workers
+        self._parar.clear()
+        for i in range(max(1, self.workers)):
+            t = threading.Thread(
+                target=self._worker_loop,
+                name=f"sefaz-outbox-{i}",
+                daemon=True,
+            )
+            t.start()
+            self._threads.append(t)
+
+    def parar(self, timeout: float = 10.0) -> None:
+        """
+        Sinaliza os workers para encerrar e aguarda o término.
+        """
+        self._parar.set()
+        with self._cond:
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
+        self._threads = []
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+
+    def _ufs_lotadas(self) -> List[str]:
+        return [uf for uf, n in self._em_execucao_uf.items() if n >= self.max_por_uf]
+
+    def _reservar_proximo(self) -> Optional[OutboxJob]:
+        """
+        Pega o próximo job elegível respeitando o limite por UF.
+        Deve ser chamado com self._lock adquirido.
+        """
+        agora = time.time()
+        lotadas = self._ufs_lotadas()
+        filtro_uf = ""
+        params: List[Any] = [STATUS_PENDENTE, agora]
+        if lotadas:
+            filtro_uf = f" AND uf NOT IN ({','.join('?' * len(lotadas))})"
+            params.extend(lotadas)
+
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT * FROM outbox_jobs WHERE status = ? AND proxima_tentativa <= ?"
+                f"{filtro_uf} ORDER BY proxima_tentativa LIMIT 1",
+                params,
+            ).fetchone()
+            if row is None:
+                return None
+
+            conn.execute(
+                "UPDATE outbox_jobs SET status = ?, tentativas = tentativas + 1,"
+                " atualizado_em = ? WHERE id = ?",
+                (STATUS_PROCESSANDO, agora, row["id"]),
+            )
+
+        job = self._row_to_job(row)
+        job.status = STATUS_PROCESSANDO
+        job.tentativas += 1
+        self._em_execucao_uf[job.uf] = self._em_execucao_uf.get(job.uf, 0) + 1
+        return job
+
+    def _espera_ate_proximo(self) -> float:
+        """
+        Segundos até o próximo job pendente ficar elegível (máx. 5s).
+        """
+        with self._conectar() as conn:
+            row = conn.execute(
+                "SELECT MIN(proxima_tentativa) FROM outbox_jobs WHERE status = ?",
+                (STATUS_PENDENTE,),
+            ).fetchone()
+        proximo = row[0] if row else None
+        if proximo is None:
+            return 5.0
+        return min(5.0, max(0.05, proximo - time.time()))
+
+    def _calcular_backoff(self, tentativas: int) -> float:
+        """
+        Backoff exponencial com "full jitter": random(0, base * 2^n),
+        limitado a backoff_max.
+        """
+        teto = min(self.backoff_max, self.backoff_base * (2 ** max(0, tentativas - 1)))
+        return random.uniform(0, teto)
+
+    def _finalizar(
+        self,
+        job: OutboxJob,
+        status: str,
+        resultado: Optional[Dict[str, Any]] = None,
+        erro: Optional[str] = None,
+        proxima_tentativa: Optional[float] = None,
+    ) -> None:
+        agora = time.time()
+        if status in STATUS_FINAIS:
+            # a senha só é necessária enquanto o job pode ser executado
+            for campo in CAMPOS_SENHA:
+                job.payload.pop(campo, None)
+        with self._conectar() as conn:
+            conn.execute(
+                "UPDATE outbox_jobs SET status = ?, resultado = ?, erro = ?,"
+                " atualizado_em = ?, proxima_tentativa = ?, payload = ? WHERE id = ?",
+                (
+                    status,
+                    json.dumps(resultado, ensure_ascii=False) if resultado is not None else None,
+                    erro,
+                    agora,
+                    proxima_tentativa if proxima_tentativa is not None else agora,
+                    json.dumps(job.payload, ensure_ascii=False),
+                    job.id,
+                ),
+            )
+
+    def _executar(self, job: OutboxJob) -> None:
+        handler = self.handlers[job.tipo]
+        try:
+            dados = self._resolver_certificado(job.payload)
+            resultado = handler(dados)
+        except ErroCertificado as e:
+            self._finalizar(job, STATUS_FALHA, erro=str(e))
+            return
+        except Exception as e:  # noqa: BLE001 - qualquer falha vira nova tentativa
+            if job.tipo == TIPO_AUTORIZACAO and not falha_antes_do_envio(e):
+                # o enviNFe pode ter chegado: a próxima tentativa consulta antes
+                job.payload[CAMPO_CONSULTAR_ANTES] = True
+            if job.tentativas >= self.max_tentativas:
+                self._finalizar(job, STATUS_FALHA, erro=str(e))
+            else:
+                espera = self._calcular_backoff(job.tentativas)
+                self._finalizar(
+                    job,
+                    STATUS_PENDENTE,
+                    erro=str(e),
+                    proxima_tentativa=time.time() + espera,
+                )
+            return
+
+        if job.tipo == TIPO_AUTORIZACAO and self.recibos is not None and resultado.get("nRec"):
+            self._finalizar(job, STATUS_AGUARDANDO_RECIBO, resultado=resultado)
+            self._registrar_recibo(job, dados, resultado)
+            return
+
+        self._finalizar(job, STATUS_CONCLUIDO, resultado=resultado)
+        if job.tipo == TIPO_INUTILIZACAO and self.repositorio is not None:
+            try:
+                salvar_inutilizacao(self.repositorio, InutilizacaoResponse(**resultado))
+            except Exception:  # noqa: BLE001 - o job já está concluído
+                logger.exception("Falha ao gravar o procInutNFe do job %s", job.id)
+
+    # ------------------------------------------------------------------
+    # Recibos (lote assíncrono)
+    # ------------------------------------------------------------------
+
+    def _registrar_recibo(self, job: OutboxJob, dados: Dict[str, Any], resultado: Dict[str, Any]) -> None:
+        """
+        Entrega o nRec de um job 'aguardando_recibo' ao agendador. Se nem
+        isso for possível (ex.: XML sem chave), o job falha.
+        """
+        n_rec = resultado.get("nRec")
+        with self._lock:
+            self._jobs_por_recibo[n_rec] = job.id
+        try:
+            self.recibos.registrar_envio(
+                AutorizarNFeResult(**resultado),
+                uf=dados["uf"],
+                ambiente=dados.get("ambiente", "2"),
+                pfx_path=dados["pfx_path"],
+                pfx_password=dados["pfx_password"],
+                versao=dados.get("versao", "4.00"),
+            )
+        except Exception as e:  # noqa: BLE001 - sem recibo registrado o job nunca concluiria
+            logger.exception("Falha ao registrar o recibo %s do job %s", n_rec, job.id)
+            with self._lock:
+                self._jobs_por_recibo.pop(n_rec, None)
+            self._finalizar(job, STATUS_FALHA, resultado=resultado, erro=f"Recibo {n_rec}: {e}")
+
+    def _encadear_ao_concluir(
+        self, anterior: Optional[Callable[[ReciboResultado], None]]
+    ) -> Callable[[ReciboResultado], None]:
+        def ao_concluir(res: ReciboResultado) -> None:
+            try:
+                self._concluir_recibo(res)
+            finally:
+                if anterior is not None:
+                    anterior(res)
+        return ao_concluir
+
+    def _concluir_recibo(self, res: ReciboResultado) -> None:
+        """
+        Resposta final do recibo: o job da autorização conclui com o
+        protNFe/nfeProc da nota (ou falha se o recibo foi abandonado).
+        """
+        with self._lock:
+            job_id = self._jobs_por_recibo.pop(res.n_rec, None)
+        job = self.consultar(job_id) if job_id else None
+        if job is None or job.status != STATUS_AGUARDANDO_RECIBO:
+            return
+
+        resultado = dict(job.resultado or {})
+        if res.erro:
+            self._finalizar(job, STATUS_FALHA, resultado=resultado, erro=res.erro)
+        else:
+            aut = res.autorizacoes.get(_chave_do_xml(resultado.get("xml_assinado", "")) or "")
+            resultado["xml_retorno"] = res.xml_retorno
+            if aut is not None:
+                resultado.update(
+                    autorizado=aut.autorizado,
+                    status=aut.status,
+                    motivo=aut.motivo,
+                    xml_nfe_proc=aut.xml_nfe_proc,
+                    xml_protocolo=aut.xml_protocolo_ajustado,
+                )
+            else:
+                # lote rejeitado (ou sem protNFe da nota): fica o cStat do lote
+                resultado.update(autorizado=False, status=res.cStat, motivo=res.xMotivo)
+            self._finalizar(job, STATUS_CONCLUIDO, resultado=resultado)
+
+        with self._cond:
+            self._cond.notify_all()
+
+    def _worker_loop(self) -> None:
+        while not self._parar.is_set():
+            try:
+                with self._cond:
+                    job = self._reservar_proximo()
+                    if job is None:
+                        self._cond.wait(timeout=self._espera_ate_proximo())
+                        continue
+            except Exception:  # noqa: BLE001 - ex.: banco travado; o worker não pode morrer
+                logger.exception("Falha ao ler a fila do outbox")
+                self._parar.wait(timeout=1.0)
+                continue
+
+            try:
+                self._executar(job)
+            except Exception:  # noqa: BLE001 - o job fica 'processando' e volta na próxima inicialização
+                logger.exception("Falha ao processar o job %s", job.id)
+            finally:
+                with self._cond:
+                    self._em_execucao_uf[job.uf] -= 1
+                    # libera vaga da UF e acorda quem estiver em aguardar()
+                    self._cond.notify_all()
+
+
+# ----------------------------------------------------------------------
+# HELPERS DE ENFILEIRAMENTO
+# ----------------------------------------------------------------------
+
+
+def enfileirar_autorizacao(
+    outbox: NFeOutbox,
+    xml_nfe: str,
+    uf: str,
+    pfx_path: str,
+    pfx_password: str,
+    ambiente: str = "2",
+    versao: str = "4.00",
+    envio_sinc: Optional[bool] = None,
+) -> str:
+    """
+    Versão assíncrona de autorizar_nfe(): retorna o id do job.
+    """
+    return outbox.enfileirar(
+        TIPO_AUTORIZACAO,
+        uf,
+        {
+            "xml_nfe": xml_nfe,
+            "uf": uf,
+            **outbox.referencia_certificado(pfx_path, pfx_password),
+            "ambiente": ambiente,
+            "versao": versao,
+            "envio_sinc": envio_sinc,
+        },
+    )
+
+
+def enfileirar_evento(
+    outbox: NFeOutbox,
+    req: EventoRequest,
+    uf: str,
+    pfx_path: str,
+    pfx_password: str,
+) -> str:
+    """
+    Versão assíncrona de sefaz_enviar_evento(): retorna o id do job.
+    """
+    return outbox.enfileirar(
+        TIPO_EVENTO,
+        uf,
+        {
+            "evento": asdict(req),
+            "uf": uf,
+            **outbox.referencia_certificado(pfx_path, pfx_password),
+        },
+    )
+
+
+def enfileirar_inutilizacao(
+    outbox: NFeOutbox,
+    req: InutilizacaoRequest,
+    uf_sigla: str,
+    certificado: str,
+    senha: str,
+) -> str:
+    """
+    Versão assíncrona de enviar_inutilizacao(): retorna o id do job.
+    """
+    return outbox.enfileirar(
+        TIPO_INUTILIZACAO,
+        uf_sigla,
+        {
+            "inutilizacao": asdict(req),
+            "uf": uf_sigla,
+            **outbox.referencia_certificado(certificado, senha),
+        },
+    )
@@ -0,0 +1,420 @@
+# sefaz_service/nfe/recibo.py
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from sefaz_service.core.nfe_autorizado import (
+    sefaz_nfe_gera_autorizado,
+    NFeAutorizadoResult,
+)
+from sefaz_service.core.nfe_envio import NFeEnvioResult
+from sefaz_service.core.nfe_ret_autorizacao import (
+    sefaz_nfe_ret_autorizacao,
+    NFeRetAutorizacaoResult,
+)
+from sefaz_service.core.resposta import ler_resposta
+from sefaz_service.core.soaplist import get_nfe_ret_autorizacao4_endpoint
+from sefaz_service.nfe.workflow import AutorizarNFeResult
+
+logger = logging.getLogger(__name__)
+
+# cStat do retConsReciNFe
+CSTAT_LOTE_PROCESSADO = 104
+CSTAT_LOTE_EM_PROCESSAMENTO = 105
+CSTAT_CONSUMO_INDEVIDO = 656
+CSTAT_SERVICO_PARALISADO = (108, 109)
+
+_RE_CHAVE = re.compile(r'Id="NFe(\d{44})"')
+
+
+# ----------------------------------------------------------------------
+# MODELOS
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class ReciboPendente:
+    """
+    Recibo (nRec) de um lote assíncrono aguardando processamento.
+
+    nfes_assinadas: chave de acesso -> XML da NFe assinada enviada no lote
+    (usada para montar o nfeProc de cada nota quando o protNFe chegar).
+    """
+    n_rec: str
+    uf: str
+    ambiente: str
+    pfx_path: str
+    pfx_password: str
+    nfes_assinadas: Dict[str, str]
+    versao: str = "4.00"
+    endpoint_url: str = ""
+    proxima_consulta: float = 0.0
+    intervalo: float = 0.0
+    tentativas: int = 0
+
+
+@dataclass
+class ReciboResultado:
+    """
+    Resultado final de um recibo.
+
+    - cStat/xMotivo: status do lote na última consulta
+    - autorizacoes: chave -> NFeAutorizadoResult (nfeProc montado quando houver protNFe)
+    - erro: preenchido quando o recibo foi abandonado (excesso de tentativas)
+    """
+    n_rec: str
+    cStat: Optional[int]
+    xMotivo: Optional[str]
+    xml_retorno: str
+    autorizacoes: Dict[str, NFeAutorizadoResult] = field(default_factory=dict)
+    erro: Optional[str] = None
+
+
+# ----------------------------------------------------------------------
+# HELPERS
+# ----------------------------------------------------------------------
+
+
+def extrair_chave_nfe(xml_assinado: str) -> str:
+    """
+    Lê a chave de acesso do atributo Id="NFe{chave}" de <infNFe>.
+    """
+    m = _RE_CHAVE.search(xml_assinado or "")
+    if not m:
+        raise ValueError("Não foi possível localizar a chave (infNFe/@Id) na NFe")
+    return m.group(1)
+
+
+def extrair_recibo(xml_ret_envi_nfe: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Extrai (nRec, tMed) do <retEnviNFe> de um envio assíncrono (cStat 103).
+
+    Para o resultado de sefaz_nfe_envio use envio.nRec/envio.tMed, que já
+    vêm da resposta lida no envio; esta função relê o XML (sem contar o
+    cStat de novo nas métricas).
+    """
+    ret = ler_resposta(xml_ret_envi_nfe, "retEnviNFe", metricas=False)
+    tmed = ret.texto("nfe:infRec/nfe:tMed") or ""
+    return ret.texto("nfe:infRec/nfe:nRec"), (int(tmed) if tmed.isdigit() else None)
+
+
+# ----------------------------------------------------------------------
+# AGENDADOR
+# ----------------------------------------------------------------------
+
+
+@dataclass
+class AgendadorRecibos:
+    """
+    Agenda as consultas de recibo (NFeRetAutorizacao4) de todos os lotes
+    assíncronos pendentes.
+
+    - Recibos do mesmo endpoint são consultados numa única passada,
+      em sequência e espaçados (espaco_endpoint), nunca em paralelo.
+      Endpoints diferentes são consultados em paralelo (max_workers).
+    - A primeira consulta respeita o tMed informado pela SEFAZ; a cada
+      105 (lote em processamento) o intervalo cresce por fator_backoff,
+      até intervalo_maximo.
+    - cStat 656 (consumo indevido) ou 108/109 pausam o endpoint inteiro.
+    - Com cStat 104 cada <protNFe> é anexado à NFe assinada via
+      sefaz_nfe_gera_autorizado e o recibo sai da fila.
+    - Resultados ficam disponíveis em resultado() por ttl_resultado
+      segundos, no máximo max_resultados (os mais antigos saem antes).
+    """
+    max_workers: int = 4
+    intervalo_minimo: float = 1.0
+    intervalo_maximo: float = 60.0
+    fator_backoff: float = 1.5
+    espaco_endpoint: float = 0.5
+    pausa_consumo_indevido: float = 60.0
+    max_tentativas: int = 30
+    ttl_resultado: float = 3600.0
+    max_resultados: int = 1000
+    ao_concluir: Optional[Callable[[ReciboResultado], None]] = None
+
+    def __post_init__(self) -> None:
+        self._lock = threading.Lock()
+        self._pendentes: Dict[str, ReciboPendente] = {}
+        # nRec -> (expira_em, resultado), em ordem de conclusão
+        self._resultados: "OrderedDict[str, Tuple[float, ReciboResultado]]" = OrderedDict()
+        self._endpoint_pausado_ate: Dict[str, float] = {}
+        self._endpoints_em_consulta: set[str] = set()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._parar = threading.Event()
+        self._acordar = threading.Event()
+
+    # ------------------------------------------------------------------
+    # Registro / consulta
+    # ------------------------------------------------------------------
+
+    def registrar(
+        self,
+        n_rec: str,
+        uf: str,
+        ambiente: str,
+        pfx_path: str,
+        pfx_password: str,
+        nfes_assinadas: List[str],
+        t_med: Optional[int] = None,
+        versao: str = "4.00",
+    ) -> None:
+        """
+        Inclui um recibo na fila de consultas.
+        """
+        espera = max(float(t_med or 0), self.intervalo_minimo)
+        recibo = ReciboPendente(
+            n_rec=n_rec,
+            uf=(uf or "").upper(),
+            ambiente=ambiente,
+            pfx_path=pfx_path,
+            pfx_password=pfx_password,
+            nfes_assinadas={extrair_chave_nfe(x): x for x in nfes_assinadas},
+            versao=versao,
+            endpoint_url=get_nfe_ret_autorizacao4_endpoint(uf, ambiente).url,
+            proxima_consulta=time.time() + espera,
+            intervalo=espera,
+        )
+        with self._lock:
+            self._pendentes[n_rec] = recibo
+        self._acordar.set()
+
+    def registrar_envio(
+        self,
+        envio: Union[NFeEnvioResult, AutorizarNFeResult],
+        uf: str,
+        ambiente: str,
+        pfx_path: str,
+        pfx_password: str,
+        versao: str = "4.00",
+    ) -> Optional[str]:
+        """
+        Atalho para sefaz_nfe_envio(..., envio_sinc=False) ou
+        autorizar_nfe(): registra o recibo (nRec/tMed do retEnviNFe).
+        Retorna o nRec (ou None se o lote não foi recebido).
+        """
+        if not envio.nRec:
+            return None
+        self.registrar(
+            n_rec=envio.nRec,
+            uf=uf,
+            ambiente=ambiente,
+            pfx_path=pfx_path,
+            pfx_password=pfx_password,
+            nfes_assinadas=[envio.xml_assinado],
+            t_med=envio.tMed,
+            versao=versao,
+        )
+        return envio.nRec
+
+    def resultado(self, n_rec: str) -> Optional[ReciboResultado]:
+        with self._lock:
+            self._expurgar_resultados()
+            item = self._resultados.get(n_rec)
+        return item[1] if item else None
+
+    def pendentes(self) -> List[str]:
+        with self._lock:
+            return list(self._pendentes)
+
+    # ------------------------------------------------------------------
+    # Ciclo de vida
+    # ------------------------------------------------------------------
+
+    def iniciar(self) -> None:
+        if self._thread is not None:
+            return
+        self._parar.clear()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, self.max_workers),
+            thread_name_prefix="sefaz-recibo",
+        )
+        self._thread = threading.Thread(
+            target=self._loop, name="sefaz-recibo-agendador", daemon=True
+        )
+        self._thread.start()
+
+    def parar(self, timeout: float = 10.0) -> None:
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # ------------------------------------------------------------------
+    # Agendamento
+    # ------------------------------------------------------------------
+
+    def _recibos_vencidos_por_endpoint(self) -> Dict[str, List[ReciboPendente]]:
+        """
+        Agrupa por endpoint os recibos cuja consulta já venceu, ignorando
+        endpoints pausados ou com uma passada em andamento.
+        """
+        agora = time.time()
+        grupos: Dict[str, List[ReciboPendente]] = {}
+        with self._lock:
+            for recibo in self._pendentes.values():
+                url = recibo.endpoint_url
+                if url in self._endpoints_em_consulta:
+                    continue
+                if self._endpoint_pausado_ate.get(url, 0.0) > agora:
+                    continue
+                if recibo.proxima_consulta <= agora:
+                    grupos.setdefault(url, []).append(recibo)
+            for url in grupos:
+                self._endpoints_em_consulta.add(url)
+        return grupos
+
+    def _proximo_vencimento(self) -> float:
+        with self._lock:
+            if not self._pendentes:
+                return 5.0
+            agora = time.time()
+            proximo = min(
+                max(r.proxima_consulta, self._endpoint_pausado_ate.get(r.endpoint_url, 0.0))
+                for r in self._pendentes.values()
+            )
+        return min(5.0, max(0.1, proximo - agora))
+
+    def _loop(self) -> None:
+        while not self._parar.is_set():
+            for url, recibos in self._recibos_vencidos_por_endpoint().items():
+                self._executor.submit(self._consultar_endpoint, url, recibos)
+            self._acordar.wait(timeout=self._proximo_vencimento())
+            self._acordar.clear()
+
+    def processar_uma_vez(self) -> None:
+        """
+        Executa uma passada síncrona (sem threads) sobre os recibos vencidos.
+        Útil em scripts/cron onde não se quer o agendador em segundo plano.
+        """
+        for url, recibos in self._recibos_vencidos_por_endpoint().items():
+            self._consultar_endpoint(url, recibos)
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    def _consultar_endpoint(self, url: str, recibos: List[ReciboPendente]) -> None:
+        try:
+            for i, recibo in enumerate(sorted(recibos, key=lambda r: r.proxima_consulta)):
+                if i and self.espaco_endpoint > 0:
+                    time.sleep(self.espaco_endpoint)
+                if not self._consultar_recibo(recibo):
+                    # endpoint pausado: o restante fica para depois da pausa
+                    break
+        finally:
+            with self._lock:
+                self._endpoints_em_consulta.discard(url)
+            self._acordar.set()
+
+    def _reagendar(self, recibo: ReciboPendente, intervalo: float) -> None:
+        recibo.intervalo = min(self.intervalo_maximo, max(self.intervalo_minimo, intervalo))
+        recibo.proxima_consulta = time.time() + recibo.intervalo
+        if recibo.tentativas >= self.max_tentativas:
+            self._concluir(
+                ReciboResultado(
+                    n_rec=recibo.n_rec,
+                    cStat=None,
+                    xMotivo=None,
+                    xml_retorno="",
+                    erro=f"Recibo sem resposta final após {recibo.tentativas} consultas",
+                )
+            )
+
+    def _pausar_endpoint(self, url: str, segundos: float) -> None:
+        with self._lock:
+            self._endpoint_pausado_ate[url] = time.time() + segundos
+
+    def _consultar_recibo(self, recibo: ReciboPendente) -> bool:
+        """
+        Consulta um recibo. Retorna False se o endpoint foi pausado.
+        """
+        recibo.tentativas += 1
+        try:
+            ret: NFeRetAutorizacaoResult = sefaz_nfe_ret_autorizacao(
+                uf=recibo.uf,
+                n_rec=recibo.n_rec,
+                pfx_path=recibo.pfx_path,
+                pfx_password=recibo.pfx_password,
+                ambiente=recibo.ambiente,
+                versao=recibo.versao,
+            )
+        except Exception:
+            # falha de rede/TLS: tenta de novo com backoff
+            self._reagendar(recibo, recibo.intervalo * self.fator_backoff)
+            return True
+
+        # 1) consumo indevido → pausa o endpoint inteiro
+        if ret.cStat == CSTAT_CONSUMO_INDEVIDO:
+            self._pausar_endpoint(recibo.endpoint_url, self.pausa_consumo_indevido)
+            recibo.tentativas -= 1
+            self._reagendar(recibo, self.pausa_consumo_indevido)
+            return False
+
+        # 2) serviço paralisado → pausa pelo intervalo máximo
+        if ret.cStat in CSTAT_SERVICO_PARALISADO:
+            self._pausar_endpoint(recibo.endpoint_url, self.intervalo_maximo)
+            self._reagendar(recibo, self.intervalo_maximo)
+            return False
+
+        # 3) lote em processamento → segue o tMed e aumenta o intervalo
+        if ret.cStat == CSTAT_LOTE_EM_PROCESSAMENTO or ret.cStat is None:
+            proximo = max(float(ret.tMed or 0), recibo.intervalo * self.fator_backoff)
+            self._reagendar(recibo, proximo)
+            return True
+
+        # 4) lote processado (104) ou rejeitado: resposta final
+        autorizacoes: Dict[str, NFeAutorizadoResult] = {}
+        if ret.cStat == CSTAT_LOTE_PROCESSADO:
+            for chave, xml_assinado in recibo.nfes_assinadas.items():
+                prot = ret.protocolos.get(chave)
+                if prot is None:
+                    continue
+                autorizacoes[chave] = sefaz_nfe_gera_autorizado(
+                    xml_assinado=xml_assinado,
+                    xml_protocolo=prot,
+                    versao=recibo.versao,
+                )
+
+        self._concluir(
+            ReciboResultado(
+                n_rec=recibo.n_rec,
+                cStat=ret.cStat,
+                xMotivo=ret.xMotivo,
+                xml_retorno=ret.xml_retorno,
+                autorizacoes=autorizacoes,
+            )
+        )
+        return True
+
+    def _expurgar_resultados(self) -> None:
+        """Descarta resultados vencidos ou além de max_resultados (com o lock)."""
+        agora = time.time()
+        while self._resultados:
+            n_rec, (expira_em, _) = next(iter(self._resultados.items()))
+            if expira_em > agora and len(self._resultados) <= self.max_resultados:
+                break
+            del self._resultados[n_rec]
+
+    def _concluir(self, resultado: ReciboResultado) -> None:
+        with self._lock:
+            self._pendentes.pop(resultado.n_rec, None)
+            self._resultados.pop(resultado.n_rec, None)
+            self._resultados[resultado.n_rec] = (time.time() + self.ttl_resultado, resultado)
+            self._expurgar_resultados()
+        if self.ao_concluir is not None:
+            try:
+                self.ao_concluir(resultado)
+            except Exception:
+                logger.exception("Falha no ao_concluir do recibo %s", resultado.n_rec)
@@ -1,8 +1,8 @@
 # nfe/utils.py
 
 from typing import Dict
-from lxml import etree
 from core.enums import Ambiente
+from sefaz_service.core.parser_xml import ler_xml
 
 
 def extrair_tag(xml: str, tag: str) -> str:
@@ -11,7 +11,7 @@ def extrair_tag(xml: str, tag: str) -> str:
     Se não encontrar, devolve string vazia.
     """
     try:
-        root = etree.fromstring(xml.encode("utf-8"))
+        root = ler_xml(xml)
     except Exception:
         return ""
 
@@ -26,6 +26,7 @@ class AutorizarNFeResult:
       - xml_retorno: XML de retorno da SEFAZ (<retEnviNFe> etc)
       - xml_nfe_proc: XML final do <nfeProc> (NFe + protNFe), se autorizado
       - xml_protocolo: XML de protocolo ajustado (infProt Id="ID{nProt}")
+      - nRec/tMed: recibo e tempo médio do lote assíncrono (envio_sinc=False)
     """
     autorizado: bool
     status: Optional[int]
@@ -37,6 +38,8 @@ class AutorizarNFeResult:
     xml_retorno: str
     xml_nfe_proc: Optional[str]
     xml_protocolo: str
+    nRec: Optional[str] = None
+    tMed: Optional[int] = None
 
 
 def autorizar_nfe(
@@ -101,4 +104,6 @@ def autorizar_nfe(
         xml_retorno=envio_res.xml_retorno,
         xml_nfe_proc=aut_res.xml_nfe_proc,
         xml_protocolo=aut_res.xml_protocolo_ajustado,
+        nRec=envio_res.nRec,
+        tMed=envio_res.tMed,
     )
@@ -4,12 +4,15 @@ from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 # 👇 agora o import correto, SEM o .nfe
+from sefaz_service.core.documento_nfe import ler_nfe_cache
+from sefaz_service.routers.perfil import RotaPerfilavel
 from sefaz_service.sped import xml_to_doc, doc_sped_to_dict
 
 
 router = APIRouter(
     prefix="/nfe",   # vai gerar /nfe/xmltodoc
     tags=["NFe"],
+    route_class=RotaPerfilavel,
 )
 
 
@@ -28,7 +31,7 @@ def convert_xml_to_doc(payload: XmlToDocRequest):
     Endpoint final: /nfe/xmltodoc
     """
     try:
-        doc = xml_to_doc(payload.xml)
+        doc = xml_to_doc(ler_nfe_cache(payload.xml))
         return XmlToDocResponse(data=doc_sped_to_dict(doc))
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc))
@@ -1,20 +1,23 @@
 # sefaz_service/routers/mdfe_router.py
 from __future__ import annotations
 
+from dataclasses import asdict
 from typing import Literal, List
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel, Field
 
 from sefaz_service.core.mdfe_status import sefaz_mdfe_status
 from sefaz_service.core.mdfe_consulta import sefaz_mdfe_consulta
-from sefaz_service.core.mdfe_envio import sefaz_mdfe_envio
+from sefaz_service.core.mdfe_envio import sefaz_mdfe_envio, sefaz_mdfe_envio_async_aguardar
 from sefaz_service.core.mdfe_cancelar import sefaz_mdfe_cancelar
 from sefaz_service.core.mdfe_encerrar import sefaz_mdfe_encerrar
 from sefaz_service.core.mdfe_incluir_condutor import sefaz_mdfe_inc_condutor
 from sefaz_service.core.mdfe_pagamento import sefaz_mdfe_pagamento
+from sefaz_service.routers.perfil import RotaPerfilavel
+from sefaz_service.routers.retorno import OpcoesRetorno, aplicar_retorno, opcoes_retorno
 
-router = APIRouter()
+router = APIRouter(route_class=RotaPerfilavel)
 
 
 # --------------------------- MODELOS DE REQUEST --------------------------- #
@@ -40,6 +43,13 @@ class MDFeEnvioRequest(BaseModel):
     certificado: str = Field(..., description="Caminho do .pfx no servidor")
     senha: str = Field(..., description="Senha do certificado PFX")
     xml: str = Field(..., description="XML do MDFe (sem assinatura; o serviço assina internamente)")
+    compactar: bool = Field(
+        False, description="Envia o conteúdo em GZip + Base64 (menor upload); só no modo sinc"
+    )
+    modo: Literal["sinc", "async"] = Field(
+        "sinc", description="sinc=MDFeRecepcaoSinc, async=MDFeRecepcao + consulta do recibo"
+    )
+    timeout: float = Field(120.0, gt=0, le=600, description="Espera máxima pelo recibo no modo async (segundos)")
 
 
 class MDFeCancelamentoRequest(BaseModel):
@@ -165,29 +175,58 @@ def mdfe_consulta(request: MDFeConsultaRequest):
 
 
 @router.post("/envio")  # prefixo /mdfe vem do main.py
-def mdfe_envio(request: MDFeEnvioRequest):
+def mdfe_envio(
+    request: MDFeEnvioRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Envia um MDF-e (RecepcaoSinc v3.00).
 
     - O XML do MDFe é assinado internamente (tag infMDFe) com o PFX.
     - Se não existir <infMDFeSupl>, o QRCode é montado automaticamente.
     - Se cStat = 100, retorna também mdfeProc em `xml_autorizado`.
+    - compactar=true envia o conteúdo em GZip + Base64 (só MDFeRecepcaoSinc).
+    - modo="async" usa MDFeRecepcao e consulta o recibo até o processamento.
+    - ?retorno=minimo devolve só status, motivo e `xml_autorizado`.
     """
-    try:
-        resultado = sefaz_mdfe_envio(
-            xml=request.xml,
-            uf=request.uf,
-            ambiente=request.ambiente,
-            certificado=request.certificado,
-            senha_certificado=request.senha,
+    if request.compactar and request.modo == "async":
+        raise HTTPException(
+            status_code=400,
+            detail="compactar só é aceito no modo sinc (MDFeRecepcaoSinc)",
         )
-        return resultado
+
+    try:
+        if request.modo == "async":
+            resultado = sefaz_mdfe_envio_async_aguardar(
+                xml=request.xml,
+                uf=request.uf,
+                ambiente=request.ambiente,
+                certificado=request.certificado,
+                senha_certificado=request.senha,
+                timeout=request.timeout,
+            )
+        else:
+            resultado = sefaz_mdfe_envio(
+                xml=request.xml,
+                uf=request.uf,
+                ambiente=request.ambiente,
+                certificado=request.certificado,
+                senha_certificado=request.senha,
+                compactar=request.compactar,
+            )
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Erro ao enviar MDFe: {exc}")
 
+    # retorno (bytes) vai como xml_retorno: aplicar_retorno só decodifica se for devolvê-lo
+    dados = {("xml_retorno" if k == "retorno" else k): v for k, v in asdict(resultado).items()}
+    return aplicar_retorno(dados, opcoes, tipo="mdfe_envio", finais=("xml_autorizado",))
+
 
 @router.post("/cancelar")
-def mdfe_cancelar(request: MDFeCancelamentoRequest):
+def mdfe_cancelar(
+    request: MDFeCancelamentoRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Evento 110111 – Cancelamento do MDF-e.
     """
@@ -202,18 +241,26 @@ def mdfe_cancelar(request: MDFeCancelamentoRequest):
             senha_certificado=request.senha,
             nseq_evento=request.nSeqEvento,
         )
-        return {
-            "status": res.status,
-            "motivo": res.motivo,
-            "xml_envio": res.xml_envio,
-            "xml_retorno": res.xml_retorno,
-        }
+        return aplicar_retorno(
+            {
+                "status": res.status,
+                "motivo": res.motivo,
+                "xml_envio": res.xml_envio,
+                "xml_retorno": res.retorno,
+            },
+            opcoes,
+            tipo="mdfe_cancelamento",
+            chave=request.chMDFe,
+        )
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Erro ao cancelar MDFe: {exc}")
 
 
 @router.post("/encerrar")
-def mdfe_encerrar(request: MDFeEncerramentoRequest):
+def mdfe_encerrar(
+    request: MDFeEncerramentoRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Encerramento de MDF-e autorizado (evento 110112).
     """
@@ -228,18 +275,26 @@ def mdfe_encerrar(request: MDFeEncerramentoRequest):
             senha_certificado=request.senha,
             nseq_evento=request.nSeqEvento,
         )
-        return {
-            "status": res.status,
-            "motivo": res.motivo,
-            "xml_envio": res.xml_envio,
-            "xml_retorno": res.xml_retorno,
-        }
+        return aplicar_retorno(
+            {
+                "status": res.status,
+                "motivo": res.motivo,
+                "xml_envio": res.xml_envio,
+                "xml_retorno": res.retorno,
+            },
+            opcoes,
+            tipo="mdfe_encerramento",
+            chave=request.chMDFe,
+        )
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Erro ao encerrar MDFe: {exc}")
 
 
 @router.post("/incluir-condutor")
-def mdfe_incluir_condutor(request: MDFeIncCondutorRequest):
+def mdfe_incluir_condutor(
+    request: MDFeIncCondutorRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Inclusão de Condutor em MDF-e (evento 110114).
     """
@@ -254,18 +309,26 @@ def mdfe_incluir_condutor(request: MDFeIncCondutorRequest):
             senha_certificado=request.senha,
             nseq_evento=request.nSeqEvento,
         )
-        return {
-            "status": res.status,
-            "motivo": res.motivo,
-            "xml_envio": res.xml_envio,
-            "xml_retorno": res.xml_retorno,
-        }
+        return aplicar_retorno(
+            {
+                "status": res.status,
+                "motivo": res.motivo,
+                "xml_envio": res.xml_envio,
+                "xml_retorno": res.retorno,
+            },
+            opcoes,
+            tipo="mdfe_inc_condutor",
+            chave=request.chMDFe,
+        )
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Erro ao incluir condutor no MDFe: {exc}")
 
 
 @router.post("/pagamento")
-def mdfe_pagamento(request: MDFePagamentoRequest):
+def mdfe_pagamento(
+    request: MDFePagamentoRequest,
+    opcoes: OpcoesRetorno = Depends(opcoes_retorno),
+):
     """
     Evento 110116 – Pagamento da Operação de Transporte (evPagtoOperMDFe).
     """
@@ -284,11 +347,16 @@ def mdfe_pagamento(request: MDFePagamentoRequest):
             senha_certificado=request.senha,
             nseq_evento=request.nSeqEvento,
         )
-        return {
-            "status": res.status,
-            "motivo": res.motivo,
-            "xml_envio": res.xml_envio,
-            "xml_retorno": res.xml_retorno,
-        }
+        return aplicar_retorno(
+            {
+                "status": res.status,
+                "motivo": res.motivo,
+                "xml_envio": res.xml_envio,
+                "xml_retorno": res.retorno,
+            },
+            opcoes,
+            tipo="mdfe_pagamento",
+            chave=request.chMDFe,
+        )
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Erro no evento de pagamento do MDFe: {exc}")
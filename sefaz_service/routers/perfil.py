@@ -0,0 +1,313 @@
+# sefaz_service/routers/perfil.py
+from __future__ import annotations
+
+import contextvars
+import cProfile
+import functools
+import hmac
+import inspect
+import json
+import os
+import pstats
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from io import StringIO
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterator, List, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from fastapi.routing import APIRoute
+
+# ----------------------------------------------------------------------
+# Perfil (cProfile) de requisições isoladas, sob demanda:
+#
+# - cabeçalho X-Perfil com o valor de SEFAZ_PERFIL_TOKEN, ou
+# - SEFAZ_PERFIL_TAXA (0 a 1) das requisições, por sorteio.
+#
+# Os perfis vão para SEFAZ_PERFIL_DIR (<id>.prof no formato pstats +
+# <id>.json com os dados da requisição) e são baixados em /admin/perfis.
+# Desligado (sem token e taxa 0), o custo por requisição é um if no
+# middleware e a leitura de um contextvar na rota.
+#
+# Em StreamingResponse (consulta em lote NDJSON...) o perfil segue até o
+# último bloco do corpo. Blocos de geradores síncronos são produzidos no
+# threadpool do Starlette: até o Python 3.11 o cProfile só vê a thread
+# que o ligou, e esse trabalho aparece como espera no event loop; do
+# 3.12 em diante (sys.monitoring) todas as threads entram no perfil.
+# ----------------------------------------------------------------------
+
+PERFIL_TOKEN = os.getenv("SEFAZ_PERFIL_TOKEN", "")
+PERFIL_TAXA = float(os.getenv("SEFAZ_PERFIL_TAXA", "0"))
+# Perfis de requisições mais rápidas que isso são descartados
+PERFIL_MIN_MS = float(os.getenv("SEFAZ_PERFIL_MIN_MS", "0"))
+PERFIL_DIR = os.getenv("SEFAZ_PERFIL_DIR", "perfis")
+PERFIL_MAX = int(os.getenv("SEFAZ_PERFIL_MAX", "50"))
+
+CABECALHO_PERFIL = "X-Perfil"
+
+_RE_ID_PERFIL = re.compile(r"^[0-9a-f]{32}$")
+
+# Um perfil por vez: no Python 3.12+ o cProfile usa sys.monitoring, que
+# só admite um profiler ativo no processo.
+_lock_profiler = threading.Lock()
+
+
+def perfil_habilitado() -> bool:
+    return bool(PERFIL_TOKEN) or PERFIL_TAXA > 0
+
+
+def token_valido(valor: Optional[str]) -> bool:
+    return bool(PERFIL_TOKEN) and bool(valor) and hmac.compare_digest(valor, PERFIL_TOKEN)
+
+
+@dataclass
+class SessaoPerfil:
+    """Perfil de uma requisição (preenchido pela rota, gravado pelo middleware)."""
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    stats: Optional[pstats.Stats] = None
+    ocupado: bool = False
+    profiler: Optional[cProfile.Profile] = None  # aberto até encerrar()
+
+    @property
+    def medindo(self) -> bool:
+        return self.profiler is not None or self.stats is not None
+
+    def encerrar(self) -> None:
+        """Fecha o perfil e libera o profiler do processo (idempotente)."""
+        profiler, self.profiler = self.profiler, None
+        if profiler is None:
+            return
+        try:
+            self.stats = pstats.Stats(profiler)
+        finally:
+            _lock_profiler.release()
+
+
+_sessao_atual: contextvars.ContextVar[Optional[SessaoPerfil]] = contextvars.ContextVar(
+    "sefaz_perfil", default=None
+)
+
+
+@contextmanager
+def perfilar_requisicao() -> Iterator[SessaoPerfil]:
+    """Marca a requisição em andamento para ser perfilada na rota."""
+    sessao = SessaoPerfil()
+    token = _sessao_atual.set(sessao)
+    try:
+        yield sessao
+    finally:
+        _sessao_atual.reset(token)
+
+
+def _reservar(sessao: SessaoPerfil) -> Optional[cProfile.Profile]:
+    if sessao.profiler is None and sessao.stats is None:
+        if _lock_profiler.acquire(blocking=False):
+            sessao.profiler = cProfile.Profile()
+        else:
+            sessao.ocupado = True
+    return sessao.profiler
+
+
+@contextmanager
+def _medir(sessao: SessaoPerfil) -> Iterator[None]:
+    profiler = _reservar(sessao)
+    if profiler is None:
+        yield
+        return
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+
+async def _corpo_medido(sessao: SessaoPerfil, corpo: AsyncIterable[Any]) -> AsyncIterator[Any]:
+    iterador = corpo.__aiter__()
+    try:
+        while True:
+            with _medir(sessao):
+                try:
+                    bloco = await iterador.__anext__()
+                except StopAsyncIteration:
+                    break
+            yield bloco
+    finally:
+        sessao.encerrar()
+
+
+def _encerrar_ou_seguir(sessao: SessaoPerfil, resposta: Any) -> Any:
+    """
+    StreamingResponse: o corpo é gerado depois que a rota retorna, então o
+    perfil continua aberto e mede cada bloco até o último. Nas demais
+    respostas ele fecha aqui. Se o cliente desistir no meio do corpo, o
+    middleware encerra o perfil.
+    """
+    if isinstance(resposta, StreamingResponse) and sessao.profiler is not None:
+        resposta.body_iterator = _corpo_medido(sessao, resposta.body_iterator)
+    else:
+        sessao.encerrar()
+    return resposta
+
+
+def perfilavel(endpoint):
+    """
+    Envolve a função da rota para ser perfilada quando a requisição foi
+    marcada. O perfil roda na mesma thread da rota (rotas síncronas vão
+    para o threadpool); em rotas async, inclui o que o event loop
+    intercalar durante os awaits. Em StreamingResponse, continua durante
+    o envio do corpo.
+    """
+    if getattr(endpoint, "_perfilavel", False):
+        return endpoint
+
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def envoltorio(*args, **kwargs):
+            sessao = _sessao_atual.get()
+            if sessao is None:
+                return await endpoint(*args, **kwargs)
+            with _medir(sessao):
+                resposta = await endpoint(*args, **kwargs)
+            return _encerrar_ou_seguir(sessao, resposta)
+    else:
+        @functools.wraps(endpoint)
+        def envoltorio(*args, **kwargs):
+            sessao = _sessao_atual.get()
+            if sessao is None:
+                return endpoint(*args, **kwargs)
+            with _medir(sessao):
+                resposta = endpoint(*args, **kwargs)
+            return _encerrar_ou_seguir(sessao, resposta)
+
+    envoltorio._perfilavel = True  # type: ignore[attr-defined]
+    return envoltorio
+
+
+class RotaPerfilavel(APIRoute):
+    """
+    APIRoute cujas rotas podem ser perfiladas. Usada como route_class do
+    app e dos APIRouter:
+
+        router = APIRouter(route_class=RotaPerfilavel)
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs: Any) -> None:
+        super().__init__(path, perfilavel(endpoint), **kwargs)
+
+
+# ----------------------------------------------------------------------
+# ARMAZENAMENTO
+# ----------------------------------------------------------------------
+
+@dataclass
+class InfoPerfil:
+    id: str
+    metodo: str
+    caminho: str
+    rota: Optional[str]
+    status: int
+    duracao_ms: float
+    criado_em: float
+    id_requisicao: Optional[str] = None
+
+
+def _caminho(id_perfil: str, extensao: str) -> str:
+    return os.path.join(PERFIL_DIR, f"{id_perfil}.{extensao}")
+
+
+def salvar_perfil(sessao: SessaoPerfil, info: InfoPerfil) -> None:
+    """Grava o perfil e descarta os mais antigos além de SEFAZ_PERFIL_MAX."""
+    os.makedirs(PERFIL_DIR, exist_ok=True)
+    sessao.stats.dump_stats(_caminho(info.id, "prof"))
+    with open(_caminho(info.id, "json"), "w", encoding="utf-8") as f:
+        json.dump(asdict(info), f, ensure_ascii=False)
+
+    for antigo in listar_perfis()[PERFIL_MAX:]:
+        for extensao in ("prof", "json"):
+            try:
+                os.remove(_caminho(antigo.id, extensao))
+            except OSError:
+                pass
+
+
+def listar_perfis() -> List[InfoPerfil]:
+    """Perfis gravados, do mais recente para o mais antigo."""
+    if not os.path.isdir(PERFIL_DIR):
+        return []
+    perfis: List[InfoPerfil] = []
+    for nome in os.listdir(PERFIL_DIR):
+        if not nome.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PERFIL_DIR, nome), encoding="utf-8") as f:
+                perfis.append(InfoPerfil(**json.load(f)))
+        except (OSError, ValueError, TypeError):
+            continue
+    perfis.sort(key=lambda p: p.criado_em, reverse=True)
+    return perfis
+
+
+# ----------------------------------------------------------------------
+# ROTAS DE ADMINISTRAÇÃO
+# ----------------------------------------------------------------------
+
+def _autorizar(token: Optional[str]) -> None:
+    if not PERFIL_TOKEN:
+        raise HTTPException(status_code=403, detail="Defina SEFAZ_PERFIL_TOKEN para acessar os perfis")
+    if not token_valido(token):
+        raise HTTPException(status_code=403, detail=f"Cabeçalho {CABECALHO_PERFIL} inválido")
+
+
+def _arquivo_perfil(id_perfil: str) -> str:
+    caminho = _caminho(id_perfil, "prof")
+    if not _RE_ID_PERFIL.match(id_perfil) or not os.path.isfile(caminho):
+        raise HTTPException(status_code=404, detail=f"Perfil não encontrado: {id_perfil}")
+    return caminho
+
+
+router = APIRouter(prefix="/admin/perfis", tags=["Admin"])
+
+
+@router.get("", summary="Listar perfis de requisição gravados")
+def listar(x_perfil: Optional[str] = Header(None)) -> List[Dict[str, Any]]:
+    _autorizar(x_perfil)
+    return [asdict(p) for p in listar_perfis()]
+
+
+@router.get(
+    "/{id_perfil}",
+    summary="Baixar perfil (.prof, formato pstats: snakeviz, python -m pstats)",
+    response_class=FileResponse,
+)
+def baixar(id_perfil: str, x_perfil: Optional[str] = Header(None)):
+    _autorizar(x_perfil)
+    return FileResponse(
+        _arquivo_perfil(id_perfil),
+        media_type="application/octet-stream",
+        filename=f"{id_perfil}.prof",
+    )
+
+
+@router.get(
+    "/{id_perfil}/resumo",
+    summary="Resumo em texto do perfil (funções mais custosas)",
+    response_class=PlainTextResponse,
+)
+def resumo(
+    id_perfil: str,
+    ordem: str = Query("cumulative", description="cumulative, tottime, calls..."),
+    limite: int = Query(40, ge=1, le=500),
+    x_perfil: Optional[str] = Header(None),
+) -> str:
+    _autorizar(x_perfil)
+    saida = StringIO()
+    stats = pstats.Stats(_arquivo_perfil(id_perfil), stream=saida)
+    try:
+        stats.sort_stats(ordem)
+    except KeyError:
+        raise HTTPException(status_code=400, detail=f"Ordem inválida: {ordem}")
+    stats.print_stats(limite)
+    return saida.getvalue()
@@ -0,0 +1,105 @@
+# sefaz_service/routers/retorno.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Any, Dict, Literal, Optional, Tuple
+
+from fastapi import HTTPException, Query, Request
+
+from sefaz_service.core.repositorio import RepositorioDocumentos
+from sefaz_service.core.resposta import texto_resposta
+
+ModoRetorno = Literal["completo", "minimo", "referencia"]
+
+
+@dataclass
+class OpcoesRetorno:
+    """
+    Como a rota devolve os XMLs intermediários (campos xml_*):
+
+    - completo: todos, como sempre foi (padrão);
+    - minimo: só os XMLs finais da rota (ex.: nfeProc/mdfeProc);
+    - referencia: grava os XMLs no repositório de documentos e devolve
+      os ids em `documentos` (baixados depois em GET /documentos/{id}).
+
+    `campos`, se informado, limita a resposta a esses campos.
+    """
+    modo: ModoRetorno = "completo"
+    campos: Optional[Tuple[str, ...]] = None
+    repositorio: Optional[RepositorioDocumentos] = None
+
+
+def opcoes_retorno(
+    request: Request,
+    retorno: ModoRetorno = Query(
+        "completo",
+        description="completo = todos os XMLs; minimo = só o XML final; "
+        "referencia = XMLs gravados no repositório, resposta traz os ids",
+    ),
+    fields: Optional[str] = Query(
+        None,
+        description="Campos da resposta separados por vírgula (ex.: status,motivo,nProt)",
+    ),
+) -> OpcoesRetorno:
+    """Dependência com as opções de retorno (?retorno=...&fields=...)."""
+    repositorio = getattr(request.app.state, "repositorio", None)
+    if retorno == "referencia" and repositorio is None:
+        raise HTTPException(
+            status_code=400,
+            detail="retorno=referencia indisponível: repositório de documentos não configurado",
+        )
+    campos = tuple(c.strip() for c in fields.split(",") if c.strip()) if fields else None
+    return OpcoesRetorno(modo=retorno, campos=campos or None, repositorio=repositorio)
+
+
+def _documento_ou_none(cnpj: Optional[str]) -> Optional[str]:
+    """CNPJ/CPF só com dígitos (11 ou 14); qualquer outra coisa vira None."""
+    digitos = "".join(c for c in (cnpj or "") if c.isascii() and c.isdigit())
+    return digitos if len(digitos) in (11, 14) else None
+
+
+def aplicar_retorno(
+    dados: Dict[str, Any],
+    opcoes: OpcoesRetorno,
+    *,
+    tipo: str,
+    finais: Tuple[str, ...] = (),
+    chave: Optional[str] = None,
+    cnpj: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Aplica as opções de retorno sobre o dicionário da resposta.
+
+    - tipo: prefixo do tipo no repositório (ex.: "nfe_envio" grava
+      "nfe_envio.xml_retorno", "nfe_envio.xml_assinado"...)
+    - finais: campos xml_* mantidos no modo minimo
+    - chave/cnpj: metadados gravados com os documentos (modo referencia);
+      o cnpj vem do cliente e vira pasta no repositório, então só passa
+      sem máscara e com 11 ou 14 dígitos (senão o documento fica sem cnpj)
+
+    Campos em bytes (resposta da SEFAZ como veio) são gravados como estão
+    e só viram texto se ficarem na resposta.
+    """
+    if opcoes.modo != "completo":
+        xmls = [k for k in dados if k.startswith("xml_")]
+        if opcoes.modo == "referencia":
+            cnpj = _documento_ou_none(cnpj)
+            documentos: Dict[str, str] = {}
+            for campo in xmls:
+                valor = dados.pop(campo)
+                if valor:
+                    documentos[campo] = opcoes.repositorio.salvar(
+                        valor, f"{tipo}.{campo}", chave=chave, cnpj=cnpj
+                    )
+            dados["documentos"] = documentos
+        else:
+            for campo in xmls:
+                if campo not in finais:
+                    del dados[campo]
+
+    if opcoes.campos is not None:
+        dados = {k: v for k, v in dados.items() if k in opcoes.campos}
+    for campo, valor in dados.items():
+        if isinstance(valor, bytes):
+            dados[campo] = texto_resposta(valor)
+    return dados
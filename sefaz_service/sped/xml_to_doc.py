@@ -1,26 +1,13 @@
 # sefaz_service/sped/xml_to_doc.py
 from __future__ import annotations
 
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
 
 from lxml import etree
 
-NFE_NS = "http://www.portalfiscal.inf.br/nfe"
-NSMAP = {"nfe": NFE_NS}
-
-
-def _get_text(elem: Optional[etree._Element], xpath: str, default: str = "") -> str:
-    """
-    Helper para pegar texto com XPath relativo, usando o namespace da NFe.
-    """
-    if elem is None:
-        return default
-    node = elem.find(xpath, NSMAP)
-    if node is not None and node.text:
-        return node.text.strip()
-    return default
+from sefaz_service.core.documento_nfe import DocumentoNFe, ler_nfe
 
 
 def _to_float(text: str | None) -> float:
@@ -158,81 +145,72 @@ class DocSped:
 # -------------------------------------------------------------------
 
 
-def xml_to_doc(xml_input: str) -> DocSped:
+def _parse_date(dt: str) -> Optional[str]:
+    if not dt:
+        return None
+    # tenta ISO direto (2024-01-01T12:00:00-03:00)
+    try:
+        return datetime.fromisoformat(dt.replace("Z", "+00:00")).isoformat()
+    except Exception:
+        # tenta AAAA-MM-DD
+        try:
+            return datetime.strptime(dt[:10], "%Y-%m-%d").date().isoformat()
+        except Exception:
+            return None
+
+
+def _pessoa(campos: Dict[str, str], ender: Dict[str, str]) -> Pessoa:
+    return Pessoa(
+        nome=campos.get("xNome", ""),
+        cnpj_cpf=campos.get("CNPJ") or campos.get("CPF", ""),
+        ie=campos.get("IE", ""),
+        im=campos.get("IM", ""),
+        cnae=campos.get("CNAE", ""),
+        endereco=ender.get("xLgr", ""),
+        numero=ender.get("nro", ""),
+        complemento=ender.get("xCpl", ""),
+        bairro=ender.get("xBairro", ""),
+        cidade=ender.get("xMun", ""),
+        cidade_ibge=ender.get("cMun", ""),
+        uf=ender.get("UF", ""),
+        cep=ender.get("CEP", ""),
+        pais=ender.get("xPais", ""),
+        telefone=ender.get("fone", ""),
+    )
+
+
+def xml_to_doc(xml_input: Union[str, bytes, DocumentoNFe]) -> DocSped:
     """
     Converte XML de NFe em DocSped.
     Suporta:
       - <nfeProc> (XML de NFe processada)
       - <NFe>
       - <infNFe>
+    Aceita também um DocumentoNFe já lido (sem novo parse).
     Se não for NFe, levanta ValueError por enquanto.
     """
-    if not xml_input or not xml_input.strip():
-        raise ValueError("XML vazio")
+    nfe = ler_nfe(xml_input)
 
-    try:
-        root = etree.fromstring(xml_input.encode("utf-8"))
-    except Exception as exc:
-        raise ValueError(f"XML inválido: {exc}") from exc
-
-    tag = etree.QName(root.tag).localname
-
-    # Localizar infNFe dependendo do root
-    if tag == "nfeProc":
-        inf_nfe = root.find(".//nfe:infNFe", NSMAP)
-    elif tag == "NFe":
-        inf_nfe = root.find("nfe:infNFe", NSMAP)
-        if inf_nfe is None:
-            # alguns layouts tem infNFe direto como filho com tag local
-            inf_nfe = root.find(".//nfe:infNFe", NSMAP)
-    elif tag == "infNFe":
-        inf_nfe = root
-    else:
+    tag = nfe.tag_raiz
+    if tag not in ("nfeProc", "NFe", "infNFe"):
         raise ValueError("Por enquanto só é suportado XML de NFe (nfeProc / NFe / infNFe).")
 
-    if inf_nfe is None:
-        raise ValueError("Tag <infNFe> não encontrada no XML.")
-
     doc = DocSped()
 
     # ------------------ Cabeçalho / Ide ------------------
-    # Chave (Id da infNFe)
-    id_attr = inf_nfe.get("Id") or inf_nfe.get("id")
-    if id_attr:
-        if id_attr.upper().startswith("NFE"):
-            doc.chave = id_attr[3:]
-        else:
-            doc.chave = id_attr
-
-    ide = inf_nfe.find("nfe:ide", NSMAP)
-    if ide is not None:
-        doc.numero = _get_text(ide, "nfe:nNF")
-        doc.serie = _get_text(ide, "nfe:serie")
-        doc.tipo_nfe = _get_text(ide, "nfe:tpNF")
-        doc.tipo_emissao = _get_text(ide, "nfe:tpEmis")
-        doc.natureza_operacao = _get_text(ide, "nfe:natOp")
-        doc.ambiente = _get_text(ide, "nfe:tpAmb")
-
-        dh_emi = _get_text(ide, "nfe:dhEmi")
-        d_emi = _get_text(ide, "nfe:dEmi")
-        dh_sai = _get_text(ide, "nfe:dhSaiEnt")
-        d_sai = _get_text(ide, "nfe:dSaiEnt")
-
-        def _parse_date(dt: str) -> Optional[str]:
-            if not dt:
-                return None
-            # tenta ISO direto (2024-01-01T12:00:00-03:00)
-            try:
-                return datetime.fromisoformat(dt.replace("Z", "+00:00")).isoformat()
-            except Exception:
-                # tenta AAAA-MM-DD
-                try:
-                    return datetime.strptime(dt[:10], "%Y-%m-%d").date().isoformat()
-                except Exception:
-                    return None
-
-        doc.data_emissao = _parse_date(dh_emi or d_emi)
-        doc.data_saida = _parse_date(dh_sai or d_sai) or doc.data_emissao
+    doc.chave = nfe.chave
+
+    ide = nfe.ide
+    if ide:
+        doc.numero = ide.get("nNF", "")
+        doc.serie = ide.get("serie", "")
+        doc.tipo_nfe = ide.get("tpNF", "")
+        doc.tipo_emissao = ide.get("tpEmis", "")
+        doc.natureza_operacao = ide.get("natOp", "")
+        doc.ambiente = ide.get("tpAmb", "")
+
+        doc.data_emissao = _parse_date(ide.get("dhEmi") or ide.get("dEmi", ""))
+        doc.data_saida = _parse_date(ide.get("dhSaiEnt") or ide.get("dSaiEnt", "")) or doc.data_emissao
 
     # Modelo fiscal vem dos 2 dígitos da chave ou da tag mod
     if doc.chave and len(doc.chave) == 44:
@@ -240,149 +218,104 @@ def xml_to_doc(xml_input: str) -> DocSped:
         if not doc.serie:
             doc.serie = doc.chave[22:25]
 
-    if not doc.mod_fis and ide is not None:
-        doc.mod_fis = _get_text(ide, "nfe:mod")
+    if not doc.mod_fis:
+        doc.mod_fis = ide.get("mod", "")
 
     # ------------------ Emitente ------------------
-    emit = inf_nfe.find("nfe:emit", NSMAP)
-    if emit is not None:
-        ender_emit = emit.find("nfe:enderEmit", NSMAP)
-        doc.emitente = Pessoa(
-            nome=_get_text(emit, "nfe:xNome"),
-            cnpj_cpf=_get_text(emit, "nfe:CNPJ") or _get_text(emit, "nfe:CPF"),
-            ie=_get_text(emit, "nfe:IE"),
-            im=_get_text(emit, "nfe:IM"),
-            cnae=_get_text(emit, "nfe:CNAE"),
-            endereco=_get_text(ender_emit, "nfe:xLgr"),
-            numero=_get_text(ender_emit, "nfe:nro"),
-            complemento=_get_text(ender_emit, "nfe:xCpl"),
-            bairro=_get_text(ender_emit, "nfe:xBairro"),
-            cidade=_get_text(ender_emit, "nfe:xMun"),
-            cidade_ibge=_get_text(ender_emit, "nfe:cMun"),
-            uf=_get_text(ender_emit, "nfe:UF"),
-            cep=_get_text(ender_emit, "nfe:CEP"),
-            pais=_get_text(ender_emit, "nfe:xPais"),
-            telefone=_get_text(ender_emit, "nfe:fone"),
-        )
+    if nfe.emit:
+        doc.emitente = _pessoa(nfe.emit, nfe.ender_emit)
 
     # ------------------ Destinatário ------------------
-    dest = inf_nfe.find("nfe:dest", NSMAP)
-    if dest is not None:
-        ender_dest = dest.find("nfe:enderDest", NSMAP)
-        doc.destinatario = Pessoa(
-            nome=_get_text(dest, "nfe:xNome"),
-            cnpj_cpf=_get_text(dest, "nfe:CNPJ") or _get_text(dest, "nfe:CPF"),
-            ie=_get_text(dest, "nfe:IE"),
-            endereco=_get_text(ender_dest, "nfe:xLgr"),
-            numero=_get_text(ender_dest, "nfe:nro"),
-            complemento=_get_text(ender_dest, "nfe:xCpl"),
-            bairro=_get_text(ender_dest, "nfe:xBairro"),
-            cidade=_get_text(ender_dest, "nfe:xMun"),
-            cidade_ibge=_get_text(ender_dest, "nfe:cMun"),
-            uf=_get_text(ender_dest, "nfe:UF"),
-            cep=_get_text(ender_dest, "nfe:CEP"),
-            pais=_get_text(ender_dest, "nfe:xPais"),
-            telefone=_get_text(ender_dest, "nfe:fone"),
-        )
+    if nfe.dest:
+        doc.destinatario = _pessoa(nfe.dest, nfe.ender_dest)
 
     # ------------------ InfAdicionais ------------------
-    inf_adic = inf_nfe.find("nfe:infAdic", NSMAP)
-    if inf_adic is not None:
-        doc.inf_adicionais = _get_text(inf_adic, "nfe:infCpl")
+    doc.inf_adicionais = nfe.inf_adic.get("infCpl", "")
 
     # ------------------ Totais ------------------
-    total = inf_nfe.find("nfe:total", NSMAP)
-    if total is not None:
-        icms_tot = total.find("nfe:ICMSTot", NSMAP)
-        if icms_tot is not None:
-            doc.totais = Totais(
-                icm_base=_to_float(_get_text(icms_tot, "nfe:vBC")),
-                icm_valor=_to_float(_get_text(icms_tot, "nfe:vICMS")),
-                sub_base=_to_float(_get_text(icms_tot, "nfe:vBCST")),
-                sub_valor=_to_float(_get_text(icms_tot, "nfe:vST")),
-                ipi_valor=_to_float(_get_text(icms_tot, "nfe:vIPI")),
-                ii_valor=_to_float(_get_text(icms_tot, "nfe:vII")),
-                pis_valor=_to_float(_get_text(icms_tot, "nfe:vPIS")),
-                cofins_valor=_to_float(_get_text(icms_tot, "nfe:vCOFINS")),
-                valor_produtos=_to_float(_get_text(icms_tot, "nfe:vProd")),
-                valor_seguro=_to_float(_get_text(icms_tot, "nfe:vSeg")),
-                valor_frete=_to_float(_get_text(icms_tot, "nfe:vFrete")),
-                valor_desconto=_to_float(_get_text(icms_tot, "nfe:vDesc")),
-                valor_outros=_to_float(_get_text(icms_tot, "nfe:vOutro")),
-                valor_nota=_to_float(_get_text(icms_tot, "nfe:vNF")),
-                valor_tributos=_to_float(_get_text(icms_tot, "nfe:vTotTrib")),
-            )
+    icms_tot = nfe.icms_tot
+    if icms_tot:
+        doc.totais = Totais(
+            icm_base=_to_float(icms_tot.get("vBC")),
+            icm_valor=_to_float(icms_tot.get("vICMS")),
+            sub_base=_to_float(icms_tot.get("vBCST")),
+            sub_valor=_to_float(icms_tot.get("vST")),
+            ipi_valor=_to_float(icms_tot.get("vIPI")),
+            ii_valor=_to_float(icms_tot.get("vII")),
+            pis_valor=_to_float(icms_tot.get("vPIS")),
+            cofins_valor=_to_float(icms_tot.get("vCOFINS")),
+            valor_produtos=_to_float(icms_tot.get("vProd")),
+            valor_seguro=_to_float(icms_tot.get("vSeg")),
+            valor_frete=_to_float(icms_tot.get("vFrete")),
+            valor_desconto=_to_float(icms_tot.get("vDesc")),
+            valor_outros=_to_float(icms_tot.get("vOutro")),
+            valor_nota=_to_float(icms_tot.get("vNF")),
+            valor_tributos=_to_float(icms_tot.get("vTotTrib")),
+        )
 
     # ------------------ Produtos ------------------
-    for det in inf_nfe.findall("nfe:det", NSMAP):
-        prod = det.find("nfe:prod", NSMAP)
-        if prod is None:
+    for item in nfe.itens:
+        prod = item.prod
+        if not prod:
             continue
 
-        p = Produto(
-            codigo=_get_text(prod, "nfe:cProd"),
-            nome=_get_text(prod, "nfe:xProd"),
-            cfop=_get_text(prod, "nfe:CFOP"),
-            ncm=_get_text(prod, "nfe:NCM"),
-            gtin=_get_text(prod, "nfe:cEAN"),
-            gtin_trib=_get_text(prod, "nfe:cEANTrib"),
-            cest=_get_text(prod, "nfe:CEST"),
-            unidade=_get_text(prod, "nfe:uCom"),
-            unid_trib=_get_text(prod, "nfe:uTrib"),
-            quantidade=_to_float(_get_text(prod, "nfe:qCom")),
-            quantidade_trib=_to_float(_get_text(prod, "nfe:qTrib")),
-            valor_unitario=_to_float(_get_text(prod, "nfe:vUnCom")),
-            valor_unit_trib=_to_float(_get_text(prod, "nfe:vUnTrib")),
-            valor_total=_to_float(_get_text(prod, "nfe:vProd")),
-            desconto=_to_float(_get_text(prod, "nfe:vDesc")),
+        doc.produtos.append(
+            Produto(
+                codigo=prod.get("cProd", ""),
+                nome=prod.get("xProd", ""),
+                cfop=prod.get("CFOP", ""),
+                ncm=prod.get("NCM", ""),
+                gtin=prod.get("cEAN", ""),
+                gtin_trib=prod.get("cEANTrib", ""),
+                cest=prod.get("CEST", ""),
+                unidade=prod.get("uCom", ""),
+                unid_trib=prod.get("uTrib", ""),
+                quantidade=_to_float(prod.get("qCom")),
+                quantidade_trib=_to_float(prod.get("qTrib")),
+                valor_unitario=_to_float(prod.get("vUnCom")),
+                valor_unit_trib=_to_float(prod.get("vUnTrib")),
+                valor_total=_to_float(prod.get("vProd")),
+                desconto=_to_float(prod.get("vDesc")),
+                inf_adicional=item.inf_ad_prod,
+            )
         )
 
-        # infAdProd
-        inf_ad_prod = det.find("nfe:infAdProd", NSMAP)
-        if inf_ad_prod is not None and inf_ad_prod.text:
-            p.inf_adicional = inf_ad_prod.text.strip()
-
-        doc.produtos.append(p)
-
     # ------------------ Duplicatas ------------------
-    cobr = inf_nfe.find("nfe:cobr", NSMAP)
-    if cobr is not None:
-        n_fat = _get_text(cobr, "nfe:fat/nfe:nFat")
-        for dup in cobr.findall("nfe:dup", NSMAP):
-            d = Duplicata(
+    n_fat = nfe.fat.get("nFat", "")
+    for dup in nfe.duplicatas:
+        doc.duplicatas.append(
+            Duplicata(
                 fatura=n_fat,
-                numero=_get_text(dup, "nfe:nDup"),
-                vencimento=_get_text(dup, "nfe:dVenc"),
-                valor=_to_float(_get_text(dup, "nfe:vDup")),
+                numero=dup.get("nDup", ""),
+                vencimento=dup.get("dVenc", ""),
+                valor=_to_float(dup.get("vDup")),
             )
-            doc.duplicatas.append(d)
+        )
 
     # ------------------ Pagamentos ------------------
-    for pag in inf_nfe.findall("nfe:pag", NSMAP):
-        det_pag = pag.find("nfe:detPag", NSMAP) or pag
-        pay = Pagamento(
-            tipo_pagamento=_get_text(det_pag, "nfe:tPag"),
-            valor_pagamento=_to_float(_get_text(det_pag, "nfe:vPag")),
-            integracao=_get_text(det_pag, "nfe:tpIntegra"),
-            cnpj_operadora=_get_text(det_pag, "nfe:CNPJ"),
-            bandeira=_get_text(det_pag, "nfe:tBand"),
-            autorizacao=_get_text(det_pag, "nfe:cAut"),
+    # um Pagamento por <pag>, com o primeiro <detPag> dele
+    for grupo in nfe.grupos_pagamento:
+        pag = grupo[0]
+        doc.pagamentos.append(
+            Pagamento(
+                tipo_pagamento=pag.get("tPag", ""),
+                valor_pagamento=_to_float(pag.get("vPag")),
+                integracao=pag.get("tpIntegra", ""),
+                cnpj_operadora=pag.get("CNPJ", ""),
+                bandeira=pag.get("tBand", ""),
+                autorizacao=pag.get("cAut", ""),
+            )
         )
-        doc.pagamentos.append(pay)
 
     # ------------------ Protocolo / Status / Assinatura ------------------
-    # Se for nfeProc, tenta pegar infProt
+    # Se for nfeProc, pega infProt
     if tag == "nfeProc":
-        inf_prot = root.find(".//nfe:infProt", NSMAP)
-        if inf_prot is not None:
-            doc.protocolo = _get_text(inf_prot, "nfe:nProt")
-            doc.status = _get_text(inf_prot, "nfe:cStat")
+        doc.protocolo = nfe.inf_prot.get("nProt", "")
+        doc.status = nfe.inf_prot.get("cStat", "")
 
     # Assinatura
-    # (Signature está em outro namespace, então usamos wildcard)
-    signature = root.find(".//{*}Signature")
-    if signature is not None:
-        doc.assinatura = etree.tostring(signature, encoding="unicode")
+    if nfe.assinatura is not None:
+        doc.assinatura = etree.tostring(nfe.assinatura, encoding="unicode")
 
     return doc
 
@@ -395,5 +328,18 @@ def xml_to_doc(xml_input: str) -> DocSped:
 def doc_sped_to_dict(doc: DocSped) -> dict:
     """
     Converte DocSped (dataclass) em dict pronto para JSON.
+
+    Mesmo resultado de dataclasses.asdict, mas sem a cópia recursiva
+    genérica: as dataclasses do DocSped só têm campos escalares (exceto
+    as listas/objetos aninhados tratados abaixo), então copiar o
+    __dict__ de cada uma basta. Em notas com milhares de itens é várias
+    vezes mais rápido.
     """
-    return asdict(doc)
+    d = dict(doc.__dict__)
+    d["emitente"] = dict(doc.emitente.__dict__)
+    d["destinatario"] = dict(doc.destinatario.__dict__)
+    d["produtos"] = [dict(p.__dict__) for p in doc.produtos]
+    d["totais"] = dict(doc.totais.__dict__)
+    d["pagamentos"] = [dict(p.__dict__) for p in doc.pagamentos]
+    d["duplicatas"] = [dict(p.__dict__) for p in doc.duplicatas]
+    return d
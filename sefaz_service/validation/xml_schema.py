@@ -7,6 +7,8 @@ from typing import Dict, List, Tuple
 
 from lxml import etree
 
+from sefaz_service.core.parser_xml import ler_xml, obter_parser
+
 
 # __file__ -> sefaz_service/validation/xml_schema.py
 ROOT_DIR = Path(__file__).resolve().parent.parent.parent
@@ -33,20 +35,19 @@ def _get_schema(tipo: str) -> etree.XMLSchema:
     if not xsd_path.exists():
         raise FileNotFoundError(f"Arquivo XSD não encontrado: {xsd_path}")
 
-    parser = etree.XMLParser(remove_blank_text=True)
     with xsd_path.open("rb") as f:
-        doc = etree.parse(f, parser)
+        doc = etree.parse(f, obter_parser("schema"))
 
     return etree.XMLSchema(doc)
 
 
 def validate_xml(xml_bytes: bytes, tipo: str = "nfe") -> Tuple[bool, List[str]]:
-    parser = etree.XMLParser(remove_blank_text=True)
-
     try:
-        xml_doc = etree.fromstring(xml_bytes, parser=parser)
+        xml_doc = ler_xml(xml_bytes, "schema")
     except etree.XMLSyntaxError as exc:
         return False, [f"Erro de sintaxe XML: {exc}"]
+    except ValueError as exc:
+        return False, [str(exc)]
 
     schema = _get_schema(tipo)
     ok = schema.validate(xml_doc)
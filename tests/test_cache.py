@@ -0,0 +1,159 @@
+# tests/test_cache.py
+from __future__ import annotations
+
+import pytest
+
+from sefaz_service.core.cache import CacheLRU, CacheTTL
+from sefaz_service.core.documento_nfe import FATOR_MEMORIA, ler_nfe_cache
+
+CHAVE = "35241012345678000199550010000000011123456780"
+XML = (
+    '<NFe xmlns="http://www.portalfiscal.inf.br/nfe">'
+    f'<infNFe Id="NFe{CHAVE}" versao="4.00"><ide><mod>55</mod><nNF>1</nNF></ide></infNFe>'
+    "</NFe>"
+)
+# tag <nNF> sem fechamento: só o parser com recover lê
+XML_MALFORMADO = XML.replace("<nNF>1</nNF>", "<nNF>1")
+
+
+def _contagem(cache) -> tuple:
+    m = cache.metricas()
+    return m["acertos"], m["faltas"]
+
+
+# ----------------------------------------------------------------------
+# CacheLRU
+# ----------------------------------------------------------------------
+
+
+def test_lru_conta_acertos_e_faltas():
+    cache = CacheLRU(limite_bytes=100)
+    assert cache.get("a") is None
+    cache.set("a", 1, peso=10)
+    assert cache.get("a") == 1
+    assert cache.get("a") == 1
+
+    m = cache.metricas()
+    assert (m["acertos"], m["faltas"]) == (2, 1)
+    assert m["taxa_acerto"] == pytest.approx(2 / 3)
+    assert (m["itens"], m["bytes"]) == (1, 10)
+
+
+def test_lru_get_qualquer_conta_uma_leitura():
+    cache = CacheLRU(limite_bytes=100)
+    assert cache.get_qualquer("a", "b", "c") is None
+    assert _contagem(cache) == (0, 1)
+
+    cache.set("c", 3, peso=1)
+    assert cache.get_qualquer("a", "b", "c") == 3
+    assert _contagem(cache) == (1, 1)
+
+
+def test_lru_descarta_o_usado_ha_mais_tempo():
+    cache = CacheLRU(limite_bytes=30)
+    for chave in "abc":
+        cache.set(chave, chave, peso=10)
+    cache.get("a")  # "b" passa a ser o mais antigo
+    cache.set("d", "d", peso=10)
+
+    assert cache.get("b") is None
+    assert [cache.get(c) for c in "acd"] == ["a", "c", "d"]
+    m = cache.metricas()
+    assert (m["descartes"], m["bytes"]) == (1, 30)
+
+
+def test_lru_regravar_nao_soma_o_peso_duas_vezes():
+    cache = CacheLRU(limite_bytes=100)
+    cache.set("a", 1, peso=40)
+    cache.set("a", 2, peso=50)
+    assert cache.metricas()["bytes"] == 50
+    assert cache.get("a") == 2
+
+
+def test_lru_entrada_maior_que_o_orcamento_nao_e_guardada():
+    cache = CacheLRU(limite_bytes=10)
+    cache.set("a", 1, peso=5)
+    cache.set("grande", 2, peso=11)
+
+    assert cache.get("grande") is None
+    assert cache.get("a") == 1
+    assert cache.metricas()["descartes"] == 0
+
+
+def test_lru_limpar_mantem_os_contadores():
+    cache = CacheLRU(limite_bytes=10)
+    cache.set("a", 1, peso=5)
+    cache.get("a")
+    cache.limpar()
+
+    assert cache.get("a") is None
+    m = cache.metricas()
+    assert (m["itens"], m["bytes"], m["acertos"], m["faltas"]) == (0, 0, 1, 1)
+
+
+# ----------------------------------------------------------------------
+# ler_nfe_cache
+# ----------------------------------------------------------------------
+
+
+def test_documento_lido_uma_vez_por_conteudo():
+    cache = CacheLRU(limite_bytes=1024 * 1024)
+    primeiro = ler_nfe_cache(XML, cache=cache)
+    segundo = ler_nfe_cache(XML.encode("utf-8"), cache=cache)
+
+    assert segundo is primeiro
+    assert primeiro.chave == CHAVE
+    assert _contagem(cache) == (1, 1)
+    assert cache.metricas()["bytes"] == len(XML) * FATOR_MEMORIA
+
+
+def test_recover_reaproveita_a_leitura_estrita():
+    cache = CacheLRU(limite_bytes=1024 * 1024)
+    estrito = ler_nfe_cache(XML, cache=cache)
+
+    assert ler_nfe_cache(XML, recover=True, cache=cache) is estrito
+    assert _contagem(cache) == (1, 1)
+    assert cache.metricas()["itens"] == 1
+
+
+def test_recover_conta_uma_falta_por_leitura():
+    cache = CacheLRU(limite_bytes=1024 * 1024)
+    doc = ler_nfe_cache(XML_MALFORMADO, recover=True, cache=cache)
+    assert doc.chave == CHAVE
+    assert _contagem(cache) == (0, 1)
+
+    assert ler_nfe_cache(XML_MALFORMADO, recover=True, cache=cache) is doc
+    assert _contagem(cache) == (1, 1)
+
+
+def test_xml_malformado_sem_recover():
+    cache = CacheLRU(limite_bytes=1024 * 1024)
+    with pytest.raises(ValueError):
+        ler_nfe_cache(XML_MALFORMADO, cache=cache)
+    assert _contagem(cache) == (0, 1)
+    assert cache.metricas()["itens"] == 0
+
+
+def test_orcamento_zero_desliga_o_cache():
+    cache = CacheLRU(limite_bytes=0)
+    primeiro = ler_nfe_cache(XML, cache=cache)
+
+    assert ler_nfe_cache(XML, cache=cache) is not primeiro
+    assert _contagem(cache) == (0, 2)
+
+
+# ----------------------------------------------------------------------
+# CacheTTL
+# ----------------------------------------------------------------------
+
+
+def test_ttl_conta_acertos_e_faltas(tmp_path):
+    cache = CacheTTL(str(tmp_path / "cache.db"), tabela="teste")
+    assert cache.get(("SP", "1")) is None
+    cache.set(("SP", "1"), {"cStat": 100}, ttl=60)
+    assert cache.get(("SP", "1")) == {"cStat": 100}
+
+    cache.set(("SP", "2"), {"cStat": 100}, ttl=-1)  # já vencido
+    assert cache.get(("SP", "2")) is None
+
+    assert _contagem(cache) == (1, 2)
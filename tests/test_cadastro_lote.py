@@ -0,0 +1,70 @@
+# tests/test_cadastro_lote.py
+from __future__ import annotations
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from sefaz_service.core.cache import CacheTTL
+from sefaz_service.nfe import cadastro as mod
+from sefaz_service.nfe.cadastro import CadastroConsulta, sefaz_consulta_cadastro_lote
+
+
+def _ret_cons_cad(documento: str, cstat: int = 111) -> bytes:
+    return (
+        '<retConsCad xmlns="http://www.portalfiscal.inf.br/nfe" versao="2.00"><infCons>'
+        f"<cStat>{cstat}</cStat><xMotivo>Consulta cadastro com uma ocorrencia</xMotivo>"
+        f"<UF>SP</UF><CNPJ>{documento}</CNPJ>"
+        f"<infCad><IE>123456789</IE><CNPJ>{documento}</CNPJ><UF>SP</UF><cSit>1</cSit></infCad>"
+        "</infCons></retConsCad>"
+    ).encode()
+
+
+class SefazFalsa:
+    def __init__(self) -> None:
+        self.enviados = []
+        self._lock = threading.Lock()
+
+    def __call__(self, endpoint, soap_xml, pfx_path, pfx_password):
+        texto = soap_xml.decode() if isinstance(soap_xml, bytes) else soap_xml
+        documento = texto.split("<CNPJ>", 1)[1].split("<", 1)[0]
+        with self._lock:
+            self.enviados.append(documento)
+        return SimpleNamespace(content=_ret_cons_cad(documento))
+
+
+@pytest.fixture
+def sefaz(monkeypatch):
+    falsa = SefazFalsa()
+    monkeypatch.setattr(mod, "enviar_soap_com_pfx", falsa)
+    return falsa
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CacheTTL(str(tmp_path / "cache.db"), tabela="cadastro")
+
+
+def _lote(documentos, cache):
+    consultas = [CadastroConsulta(uf="sp", tipo="cnpj", documento=d) for d in documentos]
+    return sefaz_consulta_cadastro_lote(consultas, "cert.pfx", "x", cache=cache)
+
+
+def test_lote_le_o_cache_uma_vez_por_documento(sefaz, cache):
+    res = _lote(["12345678000199", "12.345.678/0001-99", "99888777000166"], cache)
+
+    assert sorted(sefaz.enviados) == ["12345678000199", "99888777000166"]
+    assert [r.cStat for r in res] == [111, 111, 111]
+    assert [r.cache for r in res] == [False, False, False]
+    assert (cache.metricas()["acertos"], cache.metricas()["faltas"]) == (0, 2)
+
+
+def test_lote_grava_no_cache_e_reaproveita(sefaz, cache):
+    _lote(["12345678000199"], cache)
+    res = _lote(["12345678000199", "99888777000166"], cache)
+
+    assert sefaz.enviados == ["12345678000199", "99888777000166"]
+    assert [r.cache for r in res] == [True, False]
+    assert res[0].contribuintes[0]["IE"] == "123456789"
+    assert (cache.metricas()["acertos"], cache.metricas()["faltas"]) == (1, 2)
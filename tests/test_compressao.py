@@ -0,0 +1,194 @@
+# tests/test_compressao.py
+from __future__ import annotations
+
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from sefaz_api import compressao
+from sefaz_api.compressao import CompressaoMiddleware, negociar_codificacao
+
+brotli = pytest.importorskip("brotli")
+
+MINIMO = 200
+LIMITE = 4096
+
+GRANDE = {"itens": [{"chave": f"{n:044d}", "status": 100} for n in range(50)]}
+
+
+def _app() -> FastAPI:
+    app = FastAPI()
+    app.add_middleware(CompressaoMiddleware, minimo=MINIMO, limite_entrada=LIMITE)
+
+    @app.post("/eco")
+    async def eco(request: Request):
+        corpo = await request.body()
+        return {"tamanho": len(corpo), "inicio": corpo[:20].decode("utf-8", "replace")}
+
+    @app.get("/grande")
+    def grande():
+        return GRANDE
+
+    @app.get("/pequeno")
+    def pequeno():
+        return {"ok": True}
+
+    @app.get("/texto-binario")
+    def binario():
+        return PlainTextResponse("x" * 1000, media_type="application/octet-stream")
+
+    @app.get("/pdf")
+    def pdf():
+        return PlainTextResponse("x" * 1000, media_type="application/pdf")
+
+    @app.get("/ndjson")
+    def ndjson():
+        def linhas():
+            for item in GRANDE["itens"]:
+                yield json.dumps(item) + "\n"
+        return StreamingResponse(linhas(), media_type="application/x-ndjson")
+
+    return app
+
+
+@pytest.fixture(scope="module")
+def cliente():
+    return TestClient(_app())
+
+
+def _bruto(resposta) -> bytes:
+    """Corpo como veio do servidor, sem a descompactação automática do httpx."""
+    return b"".join(resposta.iter_raw())
+
+
+# ----------------------------------------------------------------------
+# NEGOCIAÇÃO
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.parametrize(
+    "accept, esperado",
+    [
+        ("", None),
+        ("identity", None),
+        ("gzip", "gzip"),
+        ("gzip, br", "br"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("x-gzip", "gzip"),
+        ("*", "br"),
+        ("br;q=0, gzip;q=0", None),
+        ("gzip;q=abc", None),
+    ],
+)
+def test_negociar_codificacao(accept, esperado):
+    assert negociar_codificacao(accept) == esperado
+
+
+def test_sem_brotli_negocia_so_gzip(monkeypatch):
+    monkeypatch.setattr(compressao, "brotli", None)
+    assert negociar_codificacao("br, gzip") == "gzip"
+    assert negociar_codificacao("br") is None
+
+
+# ----------------------------------------------------------------------
+# RESPOSTA
+# ----------------------------------------------------------------------
+
+
+def test_resposta_gzip(cliente):
+    with cliente.stream("GET", "/grande", headers={"Accept-Encoding": "gzip"}) as r:
+        bruto = _bruto(r)
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert int(r.headers["content-length"]) == len(bruto)
+    assert json.loads(gzip.decompress(bruto)) == GRANDE
+
+
+def test_resposta_brotli(cliente):
+    with cliente.stream("GET", "/grande", headers={"Accept-Encoding": "gzip, br"}) as r:
+        bruto = _bruto(r)
+    assert r.headers["content-encoding"] == "br"
+    assert json.loads(brotli.decompress(bruto)) == GRANDE
+
+
+def test_resposta_pequena_vai_sem_compressao(cliente):
+    r = cliente.get("/pequeno", headers={"Accept-Encoding": "gzip, br"})
+    assert "content-encoding" not in r.headers
+    assert r.headers["vary"] == "Accept-Encoding"
+    assert r.json() == {"ok": True}
+
+
+@pytest.mark.parametrize("rota", ["/texto-binario", "/pdf"])
+def test_tipo_nao_compressivel_vai_sem_compressao(cliente, rota):
+    r = cliente.get(rota, headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in r.headers
+    assert "vary" not in r.headers
+
+
+def test_sem_accept_encoding_vai_sem_compressao(cliente):
+    r = cliente.get("/grande", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert r.json() == GRANDE
+
+
+@pytest.mark.parametrize("codificacao", ["gzip", "br"])
+def test_streaming_compactado_bloco_a_bloco(cliente, codificacao):
+    with cliente.stream("GET", "/ndjson", headers={"Accept-Encoding": codificacao}) as r:
+        bruto = _bruto(r)
+    assert r.headers["content-encoding"] == codificacao
+    assert "content-length" not in r.headers
+    texto = gzip.decompress(bruto) if codificacao == "gzip" else brotli.decompress(bruto)
+    assert [json.loads(linha) for linha in texto.decode().splitlines()] == GRANDE["itens"]
+
+
+# ----------------------------------------------------------------------
+# CORPO DA REQUISIÇÃO
+# ----------------------------------------------------------------------
+
+
+def test_corpo_gzip_chega_descompactado(cliente):
+    corpo = b"<NFe>" + b"a" * 1000 + b"</NFe>"
+    r = cliente.post("/eco", content=gzip.compress(corpo), headers={"Content-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.json() == {"tamanho": len(corpo), "inicio": corpo[:20].decode()}
+
+
+def test_corpo_sem_content_encoding_passa_intacto(cliente):
+    r = cliente.post("/eco", content=b"<NFe/>")
+    assert r.json()["tamanho"] == 6
+
+
+def test_corpo_gzip_invalido_400(cliente):
+    r = cliente.post("/eco", content=b"isto nao e gzip", headers={"Content-Encoding": "gzip"})
+    assert r.status_code == 400
+    assert "gzip inválido" in r.json()["detail"]
+
+
+def test_corpo_gzip_truncado_400(cliente):
+    compactado = gzip.compress(b"a" * 1000)
+    r = cliente.post("/eco", content=compactado[:-8], headers={"Content-Encoding": "gzip"})
+    assert r.status_code == 400
+    assert "truncado" in r.json()["detail"]
+
+
+def test_corpo_acima_do_limite_413(cliente):
+    # gzip bomb: poucos bytes compactados, muito além do limite descompactado
+    bomba = gzip.compress(b"\0" * (LIMITE * 100))
+    assert len(bomba) < LIMITE
+    r = cliente.post("/eco", content=bomba, headers={"Content-Encoding": "gzip"})
+    assert r.status_code == 413
+
+
+def test_corpo_no_limite_aceito(cliente):
+    r = cliente.post("/eco", content=gzip.compress(b"a" * LIMITE), headers={"Content-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.json()["tamanho"] == LIMITE
+
+
+def test_content_encoding_nao_suportado_415(cliente):
+    r = cliente.post("/eco", content=b"...", headers={"Content-Encoding": "br"})
+    assert r.status_code == 415
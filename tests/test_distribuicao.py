@@ -0,0 +1,68 @@
+# tests/test_distribuicao.py
+from __future__ import annotations
+
+import base64
+import gzip
+
+from sefaz_service.core.repositorio import RepositorioDocumentos
+from sefaz_service.nfe.distribuicao import DistribuicaoResult, _processar_retorno
+
+CNPJ = "12345678000199"
+CHAVE = "35241012345678000199550010000000011123456780"
+
+
+def _doc_zip(xml: str, nsu: str) -> str:
+    conteudo = base64.b64encode(gzip.compress(xml.encode())).decode()
+    return f'<docZip NSU="{nsu}" schema="resNFe_v1.01">{conteudo}</docZip>'
+
+
+def _ret_dist(*docs: str, doctype: str = "", xmotivo: str = "Documento localizado") -> bytes:
+    return (
+        f"{doctype}"
+        '<retDistDFeInt xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.01">'
+        f"<tpAmb>1</tpAmb><cStat>138</cStat><xMotivo>{xmotivo}</xMotivo>"
+        "<ultNSU>000000000000002</ultNSU><maxNSU>000000000000002</maxNSU>"
+        f"<loteDistDFeInt>{''.join(docs)}</loteDistDFeInt>"
+        "</retDistDFeInt>"
+    ).encode()
+
+
+def _resultado() -> DistribuicaoResult:
+    return DistribuicaoResult(cnpj=CNPJ, consultas=1, ult_nsu="", max_nsu="", cStat=None, xMotivo=None)
+
+
+def test_grava_cada_doc_zip_com_a_chave(tmp_path):
+    repo = RepositorioDocumentos(str(tmp_path))
+    res_nfe = f'<resNFe xmlns="http://www.portalfiscal.inf.br/nfe"><chNFe>{CHAVE}</chNFe></resNFe>'
+    resultado = _resultado()
+
+    estado = _processar_retorno(
+        _ret_dist(_doc_zip(res_nfe, "1"), _doc_zip(res_nfe, "2")), CNPJ, repo, resultado
+    )
+
+    assert (resultado.cStat, resultado.xMotivo) == (138, "Documento localizado")
+    assert (estado.ult_nsu, estado.max_nsu) == ("000000000000002", "000000000000002")
+    assert len(resultado.documentos) == 2
+    assert repo.ler(resultado.documentos[0]) == res_nfe.encode()
+
+
+def test_entidades_do_retorno_nao_sao_expandidas(tmp_path):
+    segredo = tmp_path / "segredo.txt"
+    segredo.write_text("conteudo-local")
+    doctype = (
+        "<!DOCTYPE retDistDFeInt ["
+        '<!ENTITY interna "expandida">'
+        f'<!ENTITY externa SYSTEM "file://{segredo}">'
+        "]>"
+    )
+    resultado = _resultado()
+
+    _processar_retorno(
+        _ret_dist(doctype=doctype, xmotivo="&interna;&externa;"),
+        CNPJ,
+        RepositorioDocumentos(str(tmp_path / "docs")),
+        resultado,
+    )
+
+    assert "expandida" not in (resultado.xMotivo or "")
+    assert "conteudo-local" not in (resultado.xMotivo or "")
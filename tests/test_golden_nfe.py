@@ -0,0 +1,114 @@
+# tests/test_golden_nfe.py
+#
+# Saídas de referência (tests/golden) geradas com o código anterior ao
+# DocumentoNFe (commit "baseline"): DocSped, DANFE HTML e dados do e-mail
+# devem continuar idênticos para os mesmos XMLs.
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+
+import pytest
+
+from sefaz_service.core.documento_nfe import ler_nfe
+from sefaz_service.danfe.danfe_html import gerar_danfe_html, gerar_danfe_html_automatico
+from sefaz_service.danfe.nfce_html import nfce_xml_to_html
+from sefaz_service.sped.xml_to_doc import doc_sped_to_dict, xml_to_doc
+
+try:
+    from sefaz_service.nfe.email_nfe import parse_nfe_basic_info
+except OSError:  # email_nfe configura o pdfkit na importação e exige o wkhtmltopdf
+    parse_nfe_basic_info = None
+
+GOLDEN = Path(__file__).parent / "golden"
+
+# NF-e: duplicatas, um <pag> com dois <detPag> (cartão no segundo)
+NFE = "nfe_55_proc"
+# NFC-e: dois <pag>, vTroco, dois itens e QRCode
+NFCE = "nfce_65_proc"
+# <NFe> sem nfeProc (sem protocolo)
+NFE_SEM_PROC = "nfe_55_sem_proc"
+
+# código de barras e QRCode dependem da versão das bibliotecas de imagem
+_RE_IMAGEM = re.compile(r"data:image/png;base64,[A-Za-z0-9+/=]+")
+
+
+def _xml(nome: str) -> str:
+    return (GOLDEN / f"{nome}.xml").read_text(encoding="utf-8")
+
+
+def _json(nome: str, saida: str):
+    return json.loads((GOLDEN / f"{nome}.{saida}.json").read_text(encoding="utf-8"))
+
+
+def _html(nome: str) -> str:
+    return (GOLDEN / f"{nome}.danfe.html").read_text(encoding="utf-8")
+
+
+def _sem_imagens(html: str) -> str:
+    return _RE_IMAGEM.sub("data:image/png;base64,IMAGEM", html)
+
+
+def _normalizar(dados):
+    # mesma forma do arquivo de referência (tuplas viram listas, chaves ordenadas)
+    return json.loads(json.dumps(dados, ensure_ascii=False, sort_keys=True, default=str))
+
+
+# ----------------------------------------------------------------------
+# SPED
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("nome", [NFE, NFCE, NFE_SEM_PROC])
+def test_doc_sped_igual_a_referencia(nome):
+    assert _normalizar(doc_sped_to_dict(xml_to_doc(_xml(nome)))) == _json(nome, "sped")
+
+
+def test_um_pagamento_por_pag_com_o_primeiro_det_pag():
+    pagamentos = _json(NFCE, "sped")["pagamentos"]
+    assert [(p["tipo_pagamento"], p["valor_pagamento"]) for p in pagamentos] == [("01", 30.0), ("03", 10.0)]
+
+
+# ----------------------------------------------------------------------
+# DANFE
+# ----------------------------------------------------------------------
+
+
+def test_danfe_nfe_igual_a_referencia():
+    assert _sem_imagens(gerar_danfe_html(_xml(NFE))) == _html(NFE)
+
+
+def test_danfe_nfce_igual_a_referencia():
+    assert _sem_imagens(nfce_xml_to_html(_xml(NFCE))) == _html(NFCE)
+
+
+@pytest.mark.parametrize("nome", [NFE, NFCE])
+def test_danfe_automatico_escolhe_o_layout_do_modelo(nome):
+    assert _sem_imagens(gerar_danfe_html_automatico(_xml(nome))) == _html(nome)
+
+
+# ----------------------------------------------------------------------
+# E-MAIL
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.skipif(parse_nfe_basic_info is None, reason="wkhtmltopdf ausente (WKHTMLTOPDF_PATH)")
+@pytest.mark.parametrize("nome", [NFE, NFCE, NFE_SEM_PROC])
+def test_dados_do_email_iguais_a_referencia(nome):
+    assert _normalizar(parse_nfe_basic_info(_xml(nome).encode("utf-8"))) == _json(nome, "email")
+
+
+# ----------------------------------------------------------------------
+# UM PARSE PARA TODAS AS SAÍDAS
+# ----------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("nome", [NFE, NFCE])
+def test_documento_compartilhado_gera_as_mesmas_saidas(nome):
+    doc = ler_nfe(_xml(nome))
+
+    assert _normalizar(doc_sped_to_dict(xml_to_doc(doc))) == _json(nome, "sped")
+    assert _sem_imagens(gerar_danfe_html_automatico(doc)) == _html(nome)
+    if parse_nfe_basic_info is not None:
+        assert _normalizar(parse_nfe_basic_info(doc)) == _json(nome, "email")
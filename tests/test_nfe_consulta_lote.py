@@ -0,0 +1,127 @@
+# tests/test_nfe_consulta_lote.py
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from sefaz_service.core import nfe_consulta as mod
+from sefaz_service.core.cache import CacheTTL
+from sefaz_service.core.nfe_consulta import NFeConsultaResult, sefaz_nfe_consulta_lote
+
+
+CNPJ = "12345678000199"
+
+
+def _chave(cuf: str = "35", modelo: str = "55", n: int = 1) -> str:
+    # cUF(2) AAMM(4) CNPJ(14) mod(2) serie(3) nNF(9) tpEmis(1) cNF(8) cDV(1)
+    return f"{cuf}2410{CNPJ}{modelo}001{n:09d}1{n:08d}0"
+
+
+class SefazFalsa:
+    def __init__(self, cstat: int = 100) -> None:
+        self.cstat = cstat
+        self.consultadas = []
+        self._lock = threading.Lock()
+
+    def __call__(self, uf, chave, pfx_path, pfx_password, ambiente, versao) -> NFeConsultaResult:
+        with self._lock:
+            self.consultadas.append((uf, chave))
+        return NFeConsultaResult(
+            cStat=self.cstat, xMotivo=f"cStat {self.cstat}", xml_envio="<consSitNFe/>",
+            xml_retorno="<retConsSitNFe/>", chave=chave,
+        )
+
+
+@pytest.fixture
+def sefaz(monkeypatch):
+    falsa = SefazFalsa()
+    monkeypatch.setattr(mod, "_consulta_sefaz", falsa)
+    return falsa
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CacheTTL(str(tmp_path / "cache.db"), tabela="consulta")
+
+
+def _lote(chaves, cache=None):
+    res = list(sefaz_nfe_consulta_lote(chaves, "cert.pfx", "x", cache=cache))
+    return {r.chave: r for r in res}, res
+
+
+def test_chaves_sao_validas_antes_de_sair():
+    assert len(_chave()) == 44
+    assert mod.uf_modelo_da_chave(_chave()) == ("SP", "55")
+    assert mod.uf_modelo_da_chave(_chave(cuf="43", modelo="65")) == ("RS", "65")
+
+
+def test_consulta_cada_chave_uma_vez(sefaz):
+    chaves = [_chave(n=1), _chave(n=2), _chave(cuf="43", n=3), f" {_chave(n=1)} ", ""]
+    por_chave, res = _lote(chaves)
+
+    assert len(res) == 3
+    assert sorted(c for _, c in sefaz.consultadas) == sorted({_chave(n=1), _chave(n=2), _chave(cuf="43", n=3)})
+    assert ("RS", _chave(cuf="43", n=3)) in sefaz.consultadas
+    assert all(r.cStat == 100 and not r.cache for r in res)
+
+
+@pytest.mark.parametrize(
+    "chave, motivo",
+    [
+        ("123", "Chave de acesso inválida"),
+        ("x" * 44, "Chave de acesso inválida"),
+        (_chave(cuf="99"), "cUF inválido"),
+        (_chave(modelo="57"), "não é NF-e (55) nem NFC-e (65)"),
+        (_chave(modelo="65"), "NFC-e (modelo 65) não suportada"),
+    ],
+)
+def test_chave_invalida_ou_nfce_nao_vai_a_sefaz(sefaz, chave, motivo):
+    por_chave, res = _lote([chave, _chave(n=7)])
+
+    assert len(res) == 2
+    assert por_chave[chave].cStat is None
+    assert motivo in por_chave[chave].xMotivo
+    assert sefaz.consultadas == [("SP", _chave(n=7))]
+
+
+def test_segunda_consulta_vem_do_cache(sefaz, cache):
+    chaves = [_chave(n=1), _chave(n=2)]
+    _lote(chaves, cache)
+    assert len(sefaz.consultadas) == 2
+
+    por_chave, res = _lote(chaves + [_chave(n=3)], cache)
+
+    assert len(sefaz.consultadas) == 3
+    assert por_chave[_chave(n=1)].cache and por_chave[_chave(n=2)].cache
+    assert por_chave[_chave(n=1)].chave == _chave(n=1)
+    assert not por_chave[_chave(n=3)].cache
+    # o que está no cache sai antes do que vai à SEFAZ
+    assert [r.cache for r in res] == [True, True, False]
+    assert cache.metricas()["acertos"] == 2
+
+
+@pytest.mark.parametrize("cstat", [108, 109, 656, 999])
+def test_falha_momentanea_nao_vai_para_o_cache(sefaz, cache, cstat):
+    sefaz.cstat = cstat
+    _lote([_chave()], cache)
+    por_chave, _ = _lote([_chave()], cache)
+
+    assert len(sefaz.consultadas) == 2
+    assert not por_chave[_chave()].cache
+
+
+def test_chave_invalida_nao_consulta_o_cache(sefaz, cache):
+    _lote(["123", _chave(modelo="65")], cache)
+    assert cache.metricas()["acertos"] + cache.metricas()["faltas"] == 0
+
+
+def test_erro_na_consulta_vira_resultado(monkeypatch):
+    def falhar(*args):
+        raise ConnectionError("SEFAZ fora do ar")
+
+    monkeypatch.setattr(mod, "_consulta_sefaz", falhar)
+    por_chave, _ = _lote([_chave()])
+
+    assert por_chave[_chave()].cStat is None
+    assert "SEFAZ fora do ar" in por_chave[_chave()].xMotivo
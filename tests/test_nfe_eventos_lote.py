@@ -0,0 +1,205 @@
+# tests/test_nfe_eventos_lote.py
+from __future__ import annotations
+
+import threading
+
+import pytest
+from lxml import etree
+
+from sefaz_service.core import nfe_evento as mod
+from sefaz_service.core.nfe_evento import (
+    MAX_EVENTOS_LOTE,
+    NSMAP,
+    EventoPendente,
+    EventoRequest,
+    sefaz_enviar_eventos_lote,
+)
+from sefaz_service.core.resposta import ler_resposta
+
+CNPJ = "12345678000199"
+
+
+def _chave(n: int, cuf: str = "35") -> str:
+    return f"{cuf}2410{CNPJ}55001{n:09d}1{n:08d}0"
+
+
+def _pendente(n: int, uf: str = "SP", c_orgao: str = "35", n_seq: int = 1,
+              tp_evento: str = "110110", pfx: str = "cert.pfx") -> EventoPendente:
+    return EventoPendente(
+        req=EventoRequest(
+            tpAmb="2",
+            cOrgao=c_orgao,
+            CNPJ=CNPJ,
+            chNFe=_chave(n),
+            tpEvento=tp_evento,
+            nSeqEvento=n_seq,
+            xCorrecao="Correcao do endereco de entrega do destinatario",
+        ),
+        uf=uf,
+        pfx_path=pfx,
+        pfx_password="x",
+    )
+
+
+def assinar_falso(xml_evento: str, pfx_path: str, pfx_password: str) -> str:
+    return xml_evento.replace("</evento>", "<Signature/></evento>")
+
+
+class SefazFalsa:
+    """
+    Substitui _enviar_lote_assinado: responde 128 com um retEvento 135 por
+    evento, menos os de `omitir`; UFs em `falhar` levantam exceção.
+    """
+
+    def __init__(self) -> None:
+        self.lotes = []
+        self.omitir = set()
+        self.falhar = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, eventos_assinados, uf, ambiente, pfx_path, pfx_password):
+        eventos = [etree.fromstring(e.encode()) for e in eventos_assinados]
+        with self._lock:
+            self.lotes.append({
+                "uf": uf,
+                "ambiente": ambiente,
+                "pfx": pfx_path,
+                "cOrgao": {e.findtext("nfe:infEvento/nfe:cOrgao", namespaces=NSMAP) for e in eventos},
+                "chaves": [e.findtext("nfe:infEvento/nfe:chNFe", namespaces=NSMAP) for e in eventos],
+                "assinados": all("<Signature/>" in e for e in eventos_assinados),
+            })
+        if uf in self.falhar:
+            raise ConnectionError("SEFAZ fora do ar")
+
+        ret_eventos = []
+        for e in eventos:
+            inf = e.find("nfe:infEvento", NSMAP)
+            ch = inf.findtext("nfe:chNFe", namespaces=NSMAP)
+            if ch in self.omitir:
+                continue
+            ret_eventos.append(
+                '<retEvento versao="1.00"><infEvento>'
+                f"<tpAmb>2</tpAmb><cOrgao>{inf.findtext('nfe:cOrgao', namespaces=NSMAP)}</cOrgao>"
+                "<cStat>135</cStat><xMotivo>Evento registrado e vinculado a NF-e</xMotivo>"
+                f"<chNFe>{ch}</chNFe><tpEvento>{inf.findtext('nfe:tpEvento', namespaces=NSMAP)}</tpEvento>"
+                f"<nSeqEvento>{inf.findtext('nfe:nSeqEvento', namespaces=NSMAP)}</nSeqEvento>"
+                f"<nProt>1{ch[-14:]}</nProt>"
+                "</infEvento></retEvento>"
+            )
+        xml = (
+            '<retEnvEvento xmlns="http://www.portalfiscal.inf.br/nfe" versao="1.00">'
+            "<idLote>1</idLote><tpAmb>2</tpAmb><cOrgao>35</cOrgao>"
+            "<cStat>128</cStat><xMotivo>Lote de Evento Processado</xMotivo>"
+            + "".join(ret_eventos)
+            + "</retEnvEvento>"
+        )
+        return "<envEvento/>", ler_resposta(xml.encode(), "retEnvEvento", metricas=False)
+
+
+@pytest.fixture
+def sefaz(monkeypatch):
+    falsa = SefazFalsa()
+    monkeypatch.setattr(mod, "assinar_evento_xml", assinar_falso)
+    monkeypatch.setattr(mod, "_enviar_lote_assinado", falsa)
+    return falsa
+
+
+# ----------------------------------------------------------------------
+# LOTES
+# ----------------------------------------------------------------------
+
+
+def test_mais_de_20_eventos_viram_varios_lotes_na_ordem(sefaz):
+    pendentes = [_pendente(n) for n in range(1, 46)]
+
+    res = sefaz_enviar_eventos_lote(pendentes)
+
+    assert sorted(len(l["chaves"]) for l in sefaz.lotes) == [5, MAX_EVENTOS_LOTE, MAX_EVENTOS_LOTE]
+    assert all(l["assinados"] for l in sefaz.lotes)
+    assert len(res) == 45
+    for n, r in enumerate(res, start=1):
+        assert (r.cStat_lote, r.cStat_evento) == (128, 135)
+        assert r.nProt_evento == f"1{_chave(n)[-14:]}"
+        # xml_retorno é o retEvento do próprio evento
+        assert _chave(n) in r.xml_retorno and r.xml_retorno.count("<chNFe>") == 1
+        assert _chave(n) in r.xml_envio and "<Signature/>" in r.xml_assinado
+
+
+def test_ufs_e_orgaos_diferentes_vao_em_lotes_separados(sefaz):
+    pendentes = [
+        _pendente(1, uf="SP", c_orgao="35"),
+        _pendente(2, uf="RS", c_orgao="43"),
+        _pendente(3, uf="AN", c_orgao="91", tp_evento="210200"),
+        _pendente(4, uf="SP", c_orgao="35"),
+        _pendente(5, uf="AN", c_orgao="91", tp_evento="210210"),
+        _pendente(6, uf="SP", c_orgao="35", pfx="outro.pfx"),
+    ]
+
+    res = sefaz_enviar_eventos_lote(pendentes)
+
+    lotes = sorted((l["uf"], l["pfx"], tuple(l["cOrgao"]), sorted(l["chaves"])) for l in sefaz.lotes)
+    assert lotes == [
+        ("AN", "cert.pfx", ("91",), [_chave(3), _chave(5)]),
+        ("RS", "cert.pfx", ("43",), [_chave(2)]),
+        ("SP", "cert.pfx", ("35",), [_chave(1), _chave(4)]),
+        ("SP", "outro.pfx", ("35",), [_chave(6)]),
+    ]
+    assert [r.cStat_evento for r in res] == [135] * 6
+    assert all(l["ambiente"] == "2" for l in sefaz.lotes)
+
+
+# ----------------------------------------------------------------------
+# FALHAS
+# ----------------------------------------------------------------------
+
+
+def test_evento_repetido_nao_e_enviado(sefaz):
+    pendentes = [_pendente(1), _pendente(2), _pendente(1), _pendente(1, n_seq=2)]
+
+    res = sefaz_enviar_eventos_lote(pendentes)
+
+    assert sorted(c for l in sefaz.lotes for c in l["chaves"]) == sorted([_chave(1), _chave(2), _chave(1)])
+    assert res[2].cStat_lote is None
+    assert "item 0" in res[2].xMotivo_lote
+    # mesma chave com outro nSeqEvento não é repetido
+    assert [res[0].cStat_evento, res[1].cStat_evento, res[3].cStat_evento] == [135, 135, 135]
+
+
+def test_ret_evento_ausente_devolve_o_lote_inteiro(sefaz):
+    sefaz.omitir = {_chave(2)}
+
+    res = sefaz_enviar_eventos_lote([_pendente(1), _pendente(2), _pendente(3)])
+
+    assert res[1].cStat_lote == 128
+    assert (res[1].cStat_evento, res[1].xMotivo_evento, res[1].nProt_evento) == (None, None, None)
+    assert "<retEnvEvento" in res[1].xml_retorno and res[1].xml_retorno.count("<retEvento") == 2
+    assert [res[0].cStat_evento, res[2].cStat_evento] == [135, 135]
+
+
+def test_lote_que_falha_nao_afeta_os_outros(sefaz):
+    sefaz.falhar = {"RS"}
+    pendentes = [_pendente(1, uf="SP"), _pendente(2, uf="RS", c_orgao="43"), _pendente(3, uf="RS", c_orgao="43")]
+
+    res = sefaz_enviar_eventos_lote(pendentes)
+
+    assert res[0].cStat_evento == 135
+    for r in res[1:]:
+        assert r.cStat_lote is None and r.cStat_evento is None
+        assert r.xMotivo_lote == "Erro ao enviar lote de eventos: SEFAZ fora do ar"
+        # o evento assinado volta para o chamador poder reenviar
+        assert "<Signature/>" in r.xml_assinado
+
+
+def test_falha_na_assinatura_so_afeta_o_evento(sefaz, monkeypatch):
+    def assinar(xml_evento, pfx_path, pfx_password):
+        if _chave(2) in xml_evento:
+            raise ValueError("senha incorreta")
+        return assinar_falso(xml_evento, pfx_path, pfx_password)
+
+    monkeypatch.setattr(mod, "assinar_evento_xml", assinar)
+
+    res = sefaz_enviar_eventos_lote([_pendente(1), _pendente(2), _pendente(3)])
+
+    assert [c for l in sefaz.lotes for c in l["chaves"]] == [_chave(1), _chave(3)]
+    assert res[1].xMotivo_lote == "Erro ao assinar evento: senha incorreta"
+    assert [res[0].cStat_evento, res[2].cStat_evento] == [135, 135]
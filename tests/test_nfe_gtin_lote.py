@@ -0,0 +1,66 @@
+# tests/test_nfe_gtin_lote.py
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from sefaz_service.core import nfe_gtin as mod
+from sefaz_service.core.cache import CacheTTL
+from sefaz_service.core.nfe_gtin import CSTAT_GTIN_ENCONTRADO, GtinResult, sefaz_consulta_gtin_lote
+
+
+class SvrsFalsa:
+    def __init__(self, status: int = CSTAT_GTIN_ENCONTRADO) -> None:
+        self.status = status
+        self.consultados = []
+        self._lock = threading.Lock()
+
+    def __call__(self, gtin, pfx_path, pfx_password) -> GtinResult:
+        with self._lock:
+            self.consultados.append(gtin)
+        return GtinResult(
+            status=self.status, motivo=f"cStat {self.status}", xml_envio="<consGTIN/>",
+            xml_retorno="<retConsGTIN/>", gtin=gtin,
+        )
+
+
+@pytest.fixture
+def svrs(monkeypatch):
+    falsa = SvrsFalsa()
+    monkeypatch.setattr(mod, "_consulta_gtin_sefaz", falsa)
+    return falsa
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return CacheTTL(str(tmp_path / "cache.db"), tabela="gtin")
+
+
+def _lote(gtins, cache):
+    return {r.gtin: r for r in sefaz_consulta_gtin_lote(gtins, "cert.pfx", "x", cache=cache)}
+
+
+def test_lote_le_o_cache_uma_vez_por_gtin(svrs, cache):
+    res = _lote(["7891000100103", " 7891000100103 ", "7891000053508"], cache)
+
+    assert sorted(svrs.consultados) == ["7891000053508", "7891000100103"]
+    assert all(r.status == CSTAT_GTIN_ENCONTRADO and not r.cache for r in res.values())
+    assert (cache.metricas()["acertos"], cache.metricas()["faltas"]) == (0, 2)
+
+
+def test_lote_grava_no_cache_e_reaproveita(svrs, cache):
+    _lote(["7891000100103"], cache)
+    res = _lote(["7891000100103", "7891000053508"], cache)
+
+    assert svrs.consultados == ["7891000100103", "7891000053508"]
+    assert res["7891000100103"].cache and not res["7891000053508"].cache
+    assert (cache.metricas()["acertos"], cache.metricas()["faltas"]) == (1, 2)
+
+
+def test_falha_momentanea_nao_vai_para_o_cache(svrs, cache):
+    svrs.status = 656
+    _lote(["7891000100103"], cache)
+    _lote(["7891000100103"], cache)
+
+    assert len(svrs.consultados) == 2
@@ -0,0 +1,188 @@
+# tests/test_numeracao.py
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from sefaz_service.core.nfe_inutilizacao import InutilizacaoResponse, montar_proc_inut_nfe
+from sefaz_service.core.repositorio import RepositorioDocumentos
+from sefaz_service.nfe.numeracao import (
+    ConjuntoIntervalos,
+    executar_plano_inutilizacao,
+    faixas_inutilizadas_do_repositorio,
+    numeros_emitidos_do_repositorio,
+    planejar_inutilizacao,
+    salvar_inutilizacao,
+)
+
+CNPJ = "12345678000199"
+NFE_NS = "http://www.portalfiscal.inf.br/nfe"
+
+
+def _faixas(plano):
+    return [(f.nNFIni, f.nNFFin) for f in plano.faixas]
+
+
+# ----------------------------------------------------------------------
+# ConjuntoIntervalos
+# ----------------------------------------------------------------------
+
+
+def test_adicionar_une_vizinhos_que_encostam():
+    c = ConjuntoIntervalos()
+    for n in (5, 3, 4, 10, 1):
+        c.adicionar(n)
+    assert list(c) == [(1, 1), (3, 5), (10, 10)]
+
+    c.adicionar(2)
+    assert list(c) == [(1, 5), (10, 10)]
+
+
+def test_adicionar_intervalo_que_cobre_varios():
+    c = ConjuntoIntervalos()
+    for a, b in ((1, 2), (5, 6), (9, 9), (20, 30)):
+        c.adicionar(a, b)
+    c.adicionar(3, 19)
+    assert list(c) == [(1, 30)]
+    assert len(c) == 1
+
+
+def test_adicionar_sobreposto_e_repetido():
+    c = ConjuntoIntervalos()
+    c.adicionar(10, 20)
+    c.adicionar(15, 25)
+    c.adicionar(12)
+    c.adicionar(10, 20)
+    assert list(c) == [(10, 25)]
+    assert c.minimo() == 10 and c.maximo() == 25
+    assert c.contem(10) and c.contem(25) and not c.contem(9) and not c.contem(26)
+
+
+def test_adicionar_intervalo_invertido():
+    with pytest.raises(ValueError):
+        ConjuntoIntervalos().adicionar(5, 4)
+
+
+def test_lacunas():
+    c = ConjuntoIntervalos()
+    for a, b in ((3, 5), (8, 8), (12, 15)):
+        c.adicionar(a, b)
+
+    assert list(c.lacunas(1, 20)) == [(1, 2), (6, 7), (9, 11), (16, 20)]
+    assert list(c.lacunas(4, 13)) == [(6, 7), (9, 11)]
+    assert list(c.lacunas(3, 5)) == []
+    assert list(ConjuntoIntervalos().lacunas(1, 3)) == [(1, 3)]
+
+
+def test_lacunas_confere_com_forca_bruta():
+    aleatorio = random.Random(42)
+    for _ in range(50):
+        c = ConjuntoIntervalos()
+        usados = set()
+        for _ in range(aleatorio.randint(0, 15)):
+            a = aleatorio.randint(1, 60)
+            b = a + aleatorio.randint(0, 5)
+            c.adicionar(a, b)
+            usados.update(range(a, b + 1))
+        ini = aleatorio.randint(1, 40)
+        fim = ini + aleatorio.randint(0, 40)
+
+        livres = [n for n in range(ini, fim + 1) if n not in usados]
+        assert [n for a, b in c.lacunas(ini, fim) for n in range(a, b + 1)] == livres
+        assert all(c.contem(n) == (n in usados) for n in range(0, 80))
+
+
+# ----------------------------------------------------------------------
+# planejar_inutilizacao
+# ----------------------------------------------------------------------
+
+
+def test_plano_entre_o_menor_e_o_maior_emitido():
+    plano = planejar_inutilizacao([7, 1, 2, 5, 2, 10], CNPJ, "55", "1", "2024")
+
+    assert _faixas(plano) == [(3, 4), (6, 6), (8, 9)]
+    assert plano.emitidos == 6
+    assert (plano.faixa_ini, plano.faixa_fim) == (1, 10)
+    assert plano.total_inutilizar == 5
+    assert (plano.cnpj, plano.modelo, plano.serie, plano.ano) == (CNPJ, "55", "001", "24")
+
+
+def test_plano_desconta_faixas_ja_inutilizadas():
+    plano = planejar_inutilizacao(
+        [1, 10], CNPJ, "55", "1", "24", inutilizados=[(2, 4), (8, 8)]
+    )
+    assert _faixas(plano) == [(5, 7), (9, 9)]
+
+
+def test_plano_com_inicio_e_fim():
+    plano = planejar_inutilizacao([5], CNPJ, "65", "2", "24", inicio=1, fim=8)
+    assert _faixas(plano) == [(1, 4), (6, 8)]
+
+
+def test_plano_quebra_faixas_grandes():
+    plano = planejar_inutilizacao([1, 12], CNPJ, "55", "1", "24", max_por_faixa=4)
+    assert _faixas(plano) == [(2, 5), (6, 9), (10, 11)]
+
+
+def test_plano_sem_emitidos_e_vazio():
+    plano = planejar_inutilizacao([], CNPJ, "55", "1", "24")
+    assert plano.faixas == [] and plano.faixa_ini is None
+
+
+@pytest.mark.parametrize("numero", [0, 1_000_000_000])
+def test_plano_rejeita_numero_fora_do_intervalo(numero):
+    with pytest.raises(ValueError):
+        planejar_inutilizacao([numero], CNPJ, "55", "1", "24")
+
+
+def test_dry_run_nao_envia():
+    plano = planejar_inutilizacao([1, 4], CNPJ, "55", "1", "24")
+    res = executar_plano_inutilizacao(plano, "SP", "2", "Quebra de sequencia", "cert.pfx", "x")
+    assert [(r.faixa.nNFIni, r.faixa.nNFFin, r.enviado) for r in res] == [(2, 3, False)]
+
+
+# ----------------------------------------------------------------------
+# REPOSITÓRIO
+# ----------------------------------------------------------------------
+
+
+def _inutilizacao_homologada(ini: int, fim: int) -> InutilizacaoResponse:
+    id_inut = f"ID3524{CNPJ}55001{ini:09d}{fim:09d}"
+    inut = (
+        f'<inutNFe xmlns="{NFE_NS}" versao="4.00"><infInut Id="{id_inut}">'
+        f"<xJust>Quebra de sequencia</xJust></infInut></inutNFe>"
+    )
+    ret = (
+        f'<retInutNFe xmlns="{NFE_NS}" versao="4.00"><infInut>'
+        f"<cStat>102</cStat><nProt>135240000000001</nProt></infInut></retInutNFe>"
+    )
+    return InutilizacaoResponse(
+        cStat="102", xMotivo="Inutilizacao de numero homologado", nProt="135240000000001",
+        raw_xml=ret, xml_assinado=inut, xml_proc=montar_proc_inut_nfe(inut, ret),
+    )
+
+
+def test_inutilizacao_gravada_entra_nos_proximos_planos(tmp_path):
+    repo = RepositorioDocumentos(str(tmp_path / "docs"))
+    for n in (1, 2, 9):
+        chave = f"352410{CNPJ}55001{n:09d}1{n:08d}0"
+        repo.salvar("<nfeProc/>", "nfeProc", chave=chave, cnpj=CNPJ)
+
+    assert salvar_inutilizacao(repo, _inutilizacao_homologada(3, 5)) is not None
+    assert list(faixas_inutilizadas_do_repositorio(repo, CNPJ, "55", "1", "2024")) == [(3, 5)]
+
+    plano = planejar_inutilizacao(
+        numeros_emitidos_do_repositorio(repo, CNPJ, "55", "1", "2024"),
+        CNPJ, "55", "1", "2024",
+        inutilizados=faixas_inutilizadas_do_repositorio(repo, CNPJ, "55", "1", "2024"),
+    )
+    assert _faixas(plano) == [(6, 8)]
+
+
+def test_inutilizacao_nao_homologada_nao_e_gravada(tmp_path):
+    repo = RepositorioDocumentos(str(tmp_path / "docs"))
+    resp = _inutilizacao_homologada(3, 5)
+    resp.cStat = "241"
+    assert salvar_inutilizacao(repo, resp) is None
+    assert list(faixas_inutilizadas_do_repositorio(repo, CNPJ, "55", "1", "24")) == []
@@ -0,0 +1,438 @@
+# tests/test_outbox.py
+from __future__ import annotations
+
+import json
+import sqlite3
+import time
+from dataclasses import asdict
+from typing import Tuple
+
+import pytest
+import requests
+from cryptography.fernet import Fernet
+
+from sefaz_service.core.nfe_autorizado import NFeAutorizadoResult
+from sefaz_service.core.nfe_consulta import NFeConsultaResult
+from sefaz_service.nfe import outbox as mod
+from sefaz_service.nfe.outbox import (
+    CAMPO_CONSULTAR_ANTES,
+    STATUS_AGUARDANDO_RECIBO,
+    STATUS_CONCLUIDO,
+    STATUS_FALHA,
+    STATUS_PROCESSANDO,
+    TIPO_AUTORIZACAO,
+    TIPO_EVENTO,
+    ErroTransitorio,
+    NFeOutbox,
+    enfileirar_autorizacao,
+)
+from sefaz_service.nfe.recibo import AgendadorRecibos, ReciboResultado
+from sefaz_service.nfe.workflow import AutorizarNFeResult
+
+CHAVE = "35241012345678000199550010000000011123456780"
+XML_NFE = f'<NFe xmlns="http://www.portalfiscal.inf.br/nfe"><infNFe Id="NFe{CHAVE}"/></NFe>'
+
+
+class HandlerFalso:
+    """Handler que falha com as exceções da lista e depois conclui."""
+
+    def __init__(self, *falhas: BaseException) -> None:
+        self.falhas = list(falhas)
+        self.payloads = []
+
+    def __call__(self, payload):
+        self.payloads.append(dict(payload))
+        if self.falhas:
+            raise self.falhas.pop(0)
+        return {"ok": True}
+
+
+def _outbox(tmp_path, handler, **kwargs) -> NFeOutbox:
+    kwargs.setdefault("workers", 1)
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_max", 0.05)
+    return NFeOutbox(
+        db_path=str(tmp_path / "outbox.db"),
+        handlers={TIPO_AUTORIZACAO: handler, TIPO_EVENTO: handler},
+        **kwargs,
+    )
+
+
+def _rodar(outbox: NFeOutbox, job_id: str):
+    outbox.iniciar()
+    try:
+        return outbox.aguardar(job_id, timeout=10)
+    finally:
+        outbox.parar()
+
+
+def _payload_gravado(outbox: NFeOutbox, job_id: str) -> str:
+    conn = sqlite3.connect(outbox.db_path)
+    try:
+        return conn.execute("SELECT payload FROM outbox_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _simular_queda(outbox: NFeOutbox) -> None:
+    """Reserva o próximo job (fica 'processando') e não executa."""
+    with outbox._cond:
+        job = outbox._reservar_proximo()
+    assert job is not None and job.status == STATUS_PROCESSANDO
+
+
+# ----------------------------------------------------------------------
+# REPROCESSAMENTO
+# ----------------------------------------------------------------------
+
+
+def test_falha_transitoria_e_reprocessada_ate_concluir(tmp_path):
+    handler = HandlerFalso(ErroTransitorio("656"), ErroTransitorio("108"))
+    outbox = _outbox(tmp_path, handler)
+    job_id = outbox.enfileirar(TIPO_EVENTO, "sp", {"uf": "SP"})
+
+    job = _rodar(outbox, job_id)
+
+    assert job.status == STATUS_CONCLUIDO
+    assert job.tentativas == 3
+    assert job.resultado == {"ok": True}
+    assert job.uf == "SP"
+
+
+def test_falha_definitiva_apos_max_tentativas(tmp_path):
+    handler = HandlerFalso(*(ErroTransitorio(f"falha {i}") for i in range(5)))
+    outbox = _outbox(tmp_path, handler, max_tentativas=3)
+    job_id = outbox.enfileirar(TIPO_EVENTO, "SP", {"uf": "SP"})
+
+    job = _rodar(outbox, job_id)
+
+    assert job.status == STATUS_FALHA
+    assert job.tentativas == 3
+    assert job.erro == "falha 2"
+
+
+def test_backoff_respeita_o_teto(tmp_path):
+    outbox = _outbox(tmp_path, HandlerFalso(), backoff_base=2.0, backoff_max=10.0)
+    for tentativas in range(1, 12):
+        assert 0 <= outbox._calcular_backoff(tentativas) <= min(10.0, 2.0 * 2 ** (tentativas - 1))
+
+
+@pytest.mark.parametrize(
+    "erro, consulta",
+    [
+        (requests.exceptions.ReadTimeout("sem resposta"), True),
+        (RuntimeError("resposta inválida"), True),
+        (requests.exceptions.ConnectTimeout("sem conexão"), False),
+        (ErroTransitorio("108"), False),
+    ],
+)
+def test_autorizacao_so_consulta_a_chave_se_pode_ter_chegado(tmp_path, erro, consulta):
+    handler = HandlerFalso(erro)
+    outbox = _outbox(tmp_path, handler)
+    job_id = outbox.enfileirar(TIPO_AUTORIZACAO, "SP", {"uf": "SP", "xml_nfe": XML_NFE})
+
+    job = _rodar(outbox, job_id)
+
+    assert job.status == STATUS_CONCLUIDO
+    assert CAMPO_CONSULTAR_ANTES not in handler.payloads[0]
+    assert bool(handler.payloads[1].get(CAMPO_CONSULTAR_ANTES)) is consulta
+
+
+# ----------------------------------------------------------------------
+# RECUPERAÇÃO APÓS QUEDA
+# ----------------------------------------------------------------------
+
+
+def test_job_processando_volta_para_a_fila_apos_queda(tmp_path):
+    caiu = _outbox(tmp_path, HandlerFalso())
+    job_id = caiu.enfileirar(TIPO_EVENTO, "SP", {"uf": "SP"})
+    _simular_queda(caiu)
+
+    handler = HandlerFalso()
+    job = _rodar(_outbox(tmp_path, handler), job_id)
+
+    assert job.status == STATUS_CONCLUIDO
+    assert job.tentativas == 2
+    assert len(handler.payloads) == 1
+    assert CAMPO_CONSULTAR_ANTES not in handler.payloads[0]
+
+
+def test_autorizacao_interrompida_consulta_a_chave_antes_de_reenviar(tmp_path):
+    caiu = _outbox(tmp_path, HandlerFalso())
+    job_id = caiu.enfileirar(TIPO_AUTORIZACAO, "SP", {"uf": "SP", "xml_nfe": XML_NFE})
+    _simular_queda(caiu)
+
+    handler = HandlerFalso()
+    job = _rodar(_outbox(tmp_path, handler), job_id)
+
+    assert job.status == STATUS_CONCLUIDO
+    assert handler.payloads[0][CAMPO_CONSULTAR_ANTES] is True
+
+
+# ----------------------------------------------------------------------
+# CONSULTA ANTES DO REENVIO (handler padrão)
+# ----------------------------------------------------------------------
+
+
+@pytest.fixture
+def sefaz_falsa(monkeypatch):
+    chamadas = {"consulta": 0, "autorizar": 0}
+    estado = {"cStat": 100}
+
+    def consulta(**kwargs):
+        chamadas["consulta"] += 1
+        assert kwargs["chave"] == CHAVE
+        return NFeConsultaResult(
+            cStat=estado["cStat"], xMotivo="motivo", xml_envio="", xml_retorno="<retConsSitNFe/>"
+        )
+
+    def autorizar(**kwargs):
+        chamadas["autorizar"] += 1
+        return mod.AutorizarNFeResult(
+            autorizado=True, status=100, motivo="Autorizado", xml_original=kwargs["xml_nfe"],
+            xml_assinado="", xml_envi_nfe="", xml_retorno="", xml_nfe_proc="<nfeProc/>",
+            xml_protocolo="",
+        )
+
+    monkeypatch.setattr(mod, "sefaz_nfe_consulta", consulta)
+    monkeypatch.setattr(mod, "autorizar_nfe", autorizar)
+    monkeypatch.setattr(mod, "assinar_nfe_xml", lambda xml, *a: xml)
+    monkeypatch.setattr(
+        mod,
+        "sefaz_nfe_gera_autorizado",
+        lambda **k: NFeAutorizadoResult(True, 100, "Autorizado", "<nfeProc/>", "<protNFe/>"),
+    )
+    return chamadas, estado
+
+
+def _payload_autorizacao(**extra):
+    return {
+        "xml_nfe": XML_NFE, "uf": "SP", "pfx_path": "cert.pfx", "pfx_password": "x",
+        CAMPO_CONSULTAR_ANTES: True, **extra,
+    }
+
+
+def test_ja_autorizada_nao_e_reenviada(sefaz_falsa):
+    chamadas, _ = sefaz_falsa
+    res = mod._executar_autorizacao(_payload_autorizacao())
+
+    assert chamadas == {"consulta": 1, "autorizar": 0}
+    assert res["status"] == 100
+    assert res["xml_nfe_proc"] == "<nfeProc/>"
+
+
+def test_nao_consta_na_base_reenvia(sefaz_falsa):
+    chamadas, estado = sefaz_falsa
+    estado["cStat"] = 217
+    res = mod._executar_autorizacao(_payload_autorizacao())
+
+    assert chamadas == {"consulta": 1, "autorizar": 1}
+    assert res["status"] == 100
+
+
+def test_consulta_sem_resposta_conclusiva_adia_o_reenvio(sefaz_falsa):
+    chamadas, estado = sefaz_falsa
+    estado["cStat"] = 656
+    with pytest.raises(ErroTransitorio):
+        mod._executar_autorizacao(_payload_autorizacao())
+    assert chamadas["autorizar"] == 0
+
+
+def test_sem_marca_nao_consulta(sefaz_falsa):
+    chamadas, _ = sefaz_falsa
+    mod._executar_autorizacao(_payload_autorizacao(**{CAMPO_CONSULTAR_ANTES: False}))
+    assert chamadas == {"consulta": 0, "autorizar": 1}
+
+
+# ----------------------------------------------------------------------
+# SENHA DO CERTIFICADO
+# ----------------------------------------------------------------------
+
+
+def test_senha_cifrada_no_banco_e_apagada_no_fim(tmp_path):
+    handler = HandlerFalso()
+    outbox = _outbox(tmp_path, handler, chave_cifra=Fernet.generate_key().decode())
+    job_id = enfileirar_autorizacao(outbox, XML_NFE, "SP", "cert.pfx", "s3nh4-secreta")
+
+    gravado = _payload_gravado(outbox, job_id)
+    assert "s3nh4-secreta" not in gravado
+    assert "pfx_senha_cifrada" in json.loads(gravado)
+
+    job = _rodar(outbox, job_id)
+
+    assert job.status == STATUS_CONCLUIDO
+    assert handler.payloads[0]["pfx_password"] == "s3nh4-secreta"
+    assert "pfx_senha_cifrada" not in json.loads(_payload_gravado(outbox, job_id))
+
+
+def test_certificado_registrado_grava_so_o_nome(tmp_path):
+    handler = HandlerFalso()
+    outbox = _outbox(tmp_path, handler, certificados={"padrao": ("cert.pfx", "s3nh4")})
+    job_id = enfileirar_autorizacao(outbox, XML_NFE, "SP", "cert.pfx", "s3nh4")
+
+    gravado = json.loads(_payload_gravado(outbox, job_id))
+    assert gravado["certificado"] == "padrao"
+    assert "s3nh4" not in json.dumps(gravado)
+
+    _rodar(outbox, job_id)
+    assert handler.payloads[0]["pfx_path"] == "cert.pfx"
+    assert handler.payloads[0]["pfx_password"] == "s3nh4"
+
+
+def test_senha_que_nao_decifra_falha_sem_novas_tentativas(tmp_path):
+    antes = _outbox(tmp_path, HandlerFalso(), chave_cifra=Fernet.generate_key().decode())
+    job_id = enfileirar_autorizacao(antes, XML_NFE, "SP", "cert.pfx", "s3nh4")
+
+    # reinício com outra chave (ou sem SEFAZ_OUTBOX_CHAVE)
+    handler = HandlerFalso()
+    job = _rodar(_outbox(tmp_path, handler, chave_cifra=Fernet.generate_key().decode()), job_id)
+
+    assert job.status == STATUS_FALHA
+    assert job.tentativas == 1
+    assert handler.payloads == []
+
+
+# ----------------------------------------------------------------------
+# LOTE ASSÍNCRONO (RECIBO)
+# ----------------------------------------------------------------------
+
+
+N_REC = "351000000000001"
+
+
+def _handler_com_recibo(payload):
+    return asdict(
+        AutorizarNFeResult(
+            autorizado=False,
+            status=103,
+            motivo="Lote recebido com sucesso",
+            xml_original=payload["xml_nfe"],
+            xml_assinado=payload["xml_nfe"],
+            xml_envi_nfe="<enviNFe/>",
+            xml_retorno="<retEnviNFe/>",
+            xml_nfe_proc=None,
+            xml_protocolo="",
+            nRec=N_REC,
+            tMed=1,
+        )
+    )
+
+
+def _esperar_status(outbox: NFeOutbox, job_id: str, status: str, timeout: float = 10.0):
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        job = outbox.consultar(job_id)
+        if job.status == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job não chegou a {status}: {outbox.consultar(job_id)}")
+
+
+def _autorizacao_aguardando_recibo(tmp_path, recibos) -> Tuple[NFeOutbox, str]:
+    outbox = _outbox(tmp_path, _handler_com_recibo, recibos=recibos)
+    job_id = enfileirar_autorizacao(outbox, XML_NFE, "SP", "cert.pfx", "s3nh4")
+    outbox.iniciar()
+    try:
+        _esperar_status(outbox, job_id, STATUS_AGUARDANDO_RECIBO)
+    finally:
+        outbox.parar()
+    return outbox, job_id
+
+
+def test_lote_assincrono_so_conclui_com_o_recibo(tmp_path):
+    recibos = AgendadorRecibos()
+    outbox, job_id = _autorizacao_aguardando_recibo(tmp_path, recibos)
+
+    job = outbox.consultar(job_id)
+    assert job.resultado["nRec"] == N_REC
+    assert recibos.pendentes() == [N_REC]
+    # a senha continua cifrada no banco até o recibo responder
+    assert "pfx_senha_cifrada" in json.loads(_payload_gravado(outbox, job_id))
+
+    recibos._concluir(
+        ReciboResultado(
+            n_rec=N_REC,
+            cStat=104,
+            xMotivo="Lote processado",
+            xml_retorno="<retConsReciNFe/>",
+            autorizacoes={
+                CHAVE: NFeAutorizadoResult(
+                    autorizado=True,
+                    status=100,
+                    motivo="Autorizado o uso da NF-e",
+                    xml_nfe_proc="<nfeProc/>",
+                    xml_protocolo_ajustado="<protNFe/>",
+                )
+            },
+        )
+    )
+
+    job = outbox.consultar(job_id)
+    assert job.status == STATUS_CONCLUIDO
+    assert job.resultado["autorizado"] is True
+    assert job.resultado["status"] == 100
+    assert job.resultado["xml_nfe_proc"] == "<nfeProc/>"
+    assert job.resultado["xml_retorno"] == "<retConsReciNFe/>"
+    assert "pfx_senha_cifrada" not in json.loads(_payload_gravado(outbox, job_id))
+
+
+def test_recibo_abandonado_falha_o_job(tmp_path):
+    recibos = AgendadorRecibos()
+    outbox, job_id = _autorizacao_aguardando_recibo(tmp_path, recibos)
+
+    recibos._concluir(
+        ReciboResultado(n_rec=N_REC, cStat=None, xMotivo=None, xml_retorno="", erro="sem resposta")
+    )
+
+    job = outbox.consultar(job_id)
+    assert job.status == STATUS_FALHA
+    assert job.erro == "sem resposta"
+
+
+def test_recibo_pendente_e_registrado_de_novo_na_inicializacao(tmp_path):
+    chave_cifra = Fernet.generate_key().decode()
+    antes = _outbox(tmp_path, _handler_com_recibo, recibos=AgendadorRecibos(), chave_cifra=chave_cifra)
+    job_id = enfileirar_autorizacao(antes, XML_NFE, "SP", "cert.pfx", "s3nh4")
+    antes.iniciar()
+    try:
+        _esperar_status(antes, job_id, STATUS_AGUARDANDO_RECIBO)
+    finally:
+        antes.parar()
+
+    # processo reiniciado: agendador vazio
+    recibos = AgendadorRecibos()
+    depois = _outbox(tmp_path, _handler_com_recibo, recibos=recibos, chave_cifra=chave_cifra)
+    depois.iniciar()
+    depois.parar()
+
+    assert recibos.pendentes() == [N_REC]
+    pendente = recibos._pendentes[N_REC]
+    assert pendente.pfx_password == "s3nh4"
+    assert list(pendente.nfes_assinadas) == [CHAVE]
+
+
+# ----------------------------------------------------------------------
+# WORKER
+# ----------------------------------------------------------------------
+
+
+def test_worker_sobrevive_a_erro_fora_do_handler(tmp_path, monkeypatch):
+    outbox = _outbox(tmp_path, HandlerFalso())
+    executar = outbox._executar
+    chamadas = []
+
+    def executar_falhando_uma_vez(job):
+        chamadas.append(job.id)
+        if len(chamadas) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        executar(job)
+
+    monkeypatch.setattr(outbox, "_executar", executar_falhando_uma_vez)
+    primeiro = outbox.enfileirar(TIPO_EVENTO, "SP", {"uf": "SP"})
+    segundo = outbox.enfileirar(TIPO_EVENTO, "SP", {"uf": "SP"})
+
+    job = _rodar(outbox, segundo)
+
+    assert job.status == STATUS_CONCLUIDO
+    # o primeiro fica 'processando' até a próxima inicialização
+    assert outbox.consultar(primeiro).status == STATUS_PROCESSANDO
@@ -0,0 +1,102 @@
+# tests/test_rate_limit.py
+from __future__ import annotations
+
+import pytest
+
+from sefaz_service.core import rate_limit
+from sefaz_service.core.rate_limit import (
+    PAUSA_656,
+    LimiteServico,
+    LimitadorSefaz,
+    TokenBucket,
+)
+
+URL = "https://nfe.example/ws"
+CNPJ = "12345678000199"
+SERVICO = "NFeConsultaProtocolo4"
+
+
+class RelogioFalso:
+    """Substitui time.monotonic/time.sleep; sleep só avança o relógio."""
+
+    def __init__(self) -> None:
+        self.agora = 1000.0
+        self.sonos = []
+        self.ao_dormir = None
+
+    def monotonic(self) -> float:
+        return self.agora
+
+    def sleep(self, segundos: float) -> None:
+        self.sonos.append(segundos)
+        self.agora += segundos
+        if self.ao_dormir:
+            acao, self.ao_dormir = self.ao_dormir, None
+            acao()
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    r = RelogioFalso()
+    monkeypatch.setattr(rate_limit, "time", r)
+    return r
+
+
+# ----------------------------------------------------------------------
+# TokenBucket.pausar
+# ----------------------------------------------------------------------
+
+
+def test_656_durante_a_pausa_nao_agrava(relogio):
+    b = TokenBucket(taxa=4.0, capacidade=4)
+    assert b.pausar() == PAUSA_656
+    assert b.taxa == 2.0
+
+    # respostas de requisições que já estavam em voo
+    relogio.agora += 1
+    assert b.pausar() == pytest.approx(PAUSA_656 - 1)
+    assert b.pausar() == pytest.approx(PAUSA_656 - 1)
+    assert b.taxa == 2.0
+    assert b.pausado_por == pytest.approx(PAUSA_656 - 1)
+
+
+def test_656_depois_da_pausa_dobra(relogio):
+    b = TokenBucket(taxa=4.0, capacidade=4)
+    b.pausar()
+    relogio.agora += PAUSA_656
+    assert b.pausar() == 2 * PAUSA_656
+    assert b.taxa == 1.0
+
+
+def test_sucesso_zera_escalada(relogio):
+    b = TokenBucket(taxa=4.0, capacidade=4)
+    b.pausar()
+    relogio.agora += PAUSA_656
+    b.sucesso()
+    assert b.pausar() == PAUSA_656
+
+
+# ----------------------------------------------------------------------
+# LimitadorSefaz.aguardar
+# ----------------------------------------------------------------------
+
+
+def test_aguardar_respeita_pausa_que_comecou_durante_o_sono(relogio):
+    lim = LimitadorSefaz(limites={SERVICO: LimiteServico(taxa=1.0, capacidade=1)})
+    assert lim.aguardar(URL, CNPJ, SERVICO) == 0.0
+
+    # a segunda requisição dorme 1s; nesse meio tempo chega um 656
+    relogio.ao_dormir = lambda: lim.registrar_cstat(URL, CNPJ, SERVICO, 656)
+    inicio = relogio.agora
+    espera = lim.aguardar(URL, CNPJ, SERVICO)
+
+    assert relogio.agora - inicio == pytest.approx(1.0 + PAUSA_656)
+    assert espera == pytest.approx(1.0 + PAUSA_656)
+    assert relogio.sonos == [pytest.approx(1.0), pytest.approx(PAUSA_656)]
+
+
+def test_aguardar_sem_pausa_dorme_uma_vez(relogio):
+    lim = LimitadorSefaz(limites={SERVICO: LimiteServico(taxa=2.0, capacidade=1)})
+    lim.aguardar(URL, CNPJ, SERVICO)
+    assert lim.aguardar(URL, CNPJ, SERVICO) == pytest.approx(0.5)
+    assert relogio.sonos == [pytest.approx(0.5)]
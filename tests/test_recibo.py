@@ -0,0 +1,245 @@
+# tests/test_recibo.py
+from __future__ import annotations
+
+import logging
+
+import pytest
+
+from sefaz_service.core.nfe_autorizado import NFeAutorizadoResult
+from sefaz_service.core.nfe_ret_autorizacao import NFeRetAutorizacaoResult
+from sefaz_service.nfe import recibo as mod
+from sefaz_service.nfe.recibo import AgendadorRecibos
+
+CHAVE = "35241012345678000199550010000000011123456780"
+XML_ASSINADO = f'<NFe xmlns="http://www.portalfiscal.inf.br/nfe"><infNFe Id="NFe{CHAVE}"/></NFe>'
+
+
+class SefazFalsa:
+    """Responde às consultas de recibo com os cStat da lista, em ordem."""
+
+    def __init__(self, *respostas) -> None:
+        self.respostas = list(respostas)
+        self.consultados = []
+
+    def __call__(self, **kwargs) -> NFeRetAutorizacaoResult:
+        self.consultados.append(kwargs["n_rec"])
+        resposta = self.respostas.pop(0)
+        if isinstance(resposta, BaseException):
+            raise resposta
+        cstat, tmed = resposta if isinstance(resposta, tuple) else (resposta, None)
+        protocolos = {CHAVE: "<protNFe/>"} if cstat == 104 else {}
+        return NFeRetAutorizacaoResult(
+            cStat=cstat, xMotivo=f"cStat {cstat}", xml_envio="", xml_retorno="<retConsReciNFe/>",
+            tMed=tmed, protocolos=protocolos,
+        )
+
+
+@pytest.fixture
+def sefaz(monkeypatch):
+    falsa = SefazFalsa()
+    monkeypatch.setattr(mod, "sefaz_nfe_ret_autorizacao", falsa)
+    monkeypatch.setattr(
+        mod,
+        "sefaz_nfe_gera_autorizado",
+        lambda **k: NFeAutorizadoResult(True, 100, "Autorizado", "<nfeProc/>", k["xml_protocolo"]),
+    )
+    return falsa
+
+
+def _agendador(**kwargs) -> AgendadorRecibos:
+    kwargs.setdefault("intervalo_minimo", 1.0)
+    kwargs.setdefault("intervalo_maximo", 10.0)
+    kwargs.setdefault("fator_backoff", 2.0)
+    kwargs.setdefault("espaco_endpoint", 0)
+    return AgendadorRecibos(**kwargs)
+
+
+def _registrar(agendador: AgendadorRecibos, n_rec: str, t_med=None) -> None:
+    agendador.registrar(n_rec, "SP", "2", "cert.pfx", "x", [XML_ASSINADO], t_med=t_med)
+
+
+def _vencer(agendador: AgendadorRecibos) -> None:
+    """Antecipa as consultas agendadas (sem mexer nas pausas de endpoint)."""
+    for recibo in agendador._pendentes.values():
+        recibo.proxima_consulta = 0.0
+
+
+def _pendente(agendador: AgendadorRecibos, n_rec: str):
+    return agendador._pendentes[n_rec]
+
+
+# ----------------------------------------------------------------------
+# BACKOFF
+# ----------------------------------------------------------------------
+
+
+def test_primeira_consulta_respeita_o_tmed():
+    agendador = _agendador()
+    _registrar(agendador, "1", t_med=5)
+    assert _pendente(agendador, "1").intervalo == 5.0
+
+    _registrar(agendador, "2", t_med=0)
+    assert _pendente(agendador, "2").intervalo == 1.0
+
+
+def test_lote_em_processamento_aumenta_o_intervalo_ate_o_maximo(sefaz):
+    sefaz.respostas = [105, 105, 105, 105, 105]
+    agendador = _agendador()
+    _registrar(agendador, "1")
+
+    intervalos = []
+    for _ in range(5):
+        _vencer(agendador)
+        agendador.processar_uma_vez()
+        intervalos.append(_pendente(agendador, "1").intervalo)
+
+    assert intervalos == [2.0, 4.0, 8.0, 10.0, 10.0]
+    assert agendador.pendentes() == ["1"]
+
+
+def test_tmed_maior_que_o_backoff_prevalece(sefaz):
+    sefaz.respostas = [(105, 7)]
+    agendador = _agendador()
+    _registrar(agendador, "1")
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    assert _pendente(agendador, "1").intervalo == 7.0
+
+
+def test_falha_de_rede_reagenda_com_backoff(sefaz):
+    sefaz.respostas = [ConnectionError("reset")]
+    agendador = _agendador()
+    _registrar(agendador, "1")
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    assert _pendente(agendador, "1").intervalo == 2.0
+
+
+def test_excesso_de_tentativas_abandona_o_recibo(sefaz):
+    sefaz.respostas = [105, 105]
+    agendador = _agendador(max_tentativas=2)
+    _registrar(agendador, "1")
+    for _ in range(2):
+        _vencer(agendador)
+        agendador.processar_uma_vez()
+
+    assert agendador.pendentes() == []
+    assert "2 consultas" in agendador.resultado("1").erro
+
+
+# ----------------------------------------------------------------------
+# PAUSA POR CONSUMO INDEVIDO (656)
+# ----------------------------------------------------------------------
+
+
+def test_consumo_indevido_pausa_o_endpoint_inteiro(sefaz):
+    sefaz.respostas = [656]
+    agendador = _agendador(pausa_consumo_indevido=60.0)
+    _registrar(agendador, "1")
+    _registrar(agendador, "2")  # mesmo endpoint (SP)
+    _vencer(agendador)
+
+    agendador.processar_uma_vez()
+
+    # o segundo recibo não é consultado na mesma passada
+    assert len(sefaz.consultados) == 1
+    primeiro = _pendente(agendador, sefaz.consultados[0])
+    assert primeiro.tentativas == 0  # 656 não conta como tentativa
+    assert primeiro.intervalo == 10.0  # limitado a intervalo_maximo
+
+    # nem nas passadas seguintes enquanto durar a pausa
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+    assert len(sefaz.consultados) == 1
+    assert sorted(agendador.pendentes()) == ["1", "2"]
+
+
+def test_endpoint_volta_a_ser_consultado_depois_da_pausa(sefaz):
+    sefaz.respostas = [656, 104, 104]
+    agendador = _agendador(pausa_consumo_indevido=60.0)
+    _registrar(agendador, "1")
+    _registrar(agendador, "2")
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    agendador._endpoint_pausado_ate.clear()  # a pausa venceu
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    assert len(sefaz.consultados) == 3
+    assert agendador.pendentes() == []
+
+
+@pytest.mark.parametrize("cstat", [108, 109])
+def test_servico_paralisado_pausa_pelo_intervalo_maximo(sefaz, cstat):
+    sefaz.respostas = [cstat]
+    agendador = _agendador()
+    _registrar(agendador, "1")
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    assert _pendente(agendador, "1").intervalo == 10.0
+    assert agendador._endpoint_pausado_ate
+
+
+# ----------------------------------------------------------------------
+# CONCLUSÃO
+# ----------------------------------------------------------------------
+
+
+def test_lote_processado_monta_o_nfeproc(sefaz):
+    sefaz.respostas = [104]
+    concluidos = []
+    agendador = _agendador(ao_concluir=concluidos.append)
+    _registrar(agendador, "1")
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    res = agendador.resultado("1")
+    assert agendador.pendentes() == []
+    assert res.cStat == 104
+    assert res.autorizacoes[CHAVE].xml_nfe_proc == "<nfeProc/>"
+    assert concluidos == [res]
+
+
+def test_falha_no_ao_concluir_e_registrada_no_log(sefaz, caplog):
+    sefaz.respostas = [104]
+
+    def ao_concluir(resultado):
+        raise RuntimeError("webhook fora do ar")
+
+    agendador = _agendador(ao_concluir=ao_concluir)
+    _registrar(agendador, "1")
+    _vencer(agendador)
+    with caplog.at_level(logging.ERROR, logger=mod.__name__):
+        agendador.processar_uma_vez()
+
+    assert agendador.resultado("1").cStat == 104
+    assert "ao_concluir" in caplog.text
+
+
+def test_resultados_limitados_por_quantidade(sefaz):
+    sefaz.respostas = [104, 104, 104]
+    agendador = _agendador(max_resultados=2)
+    for n_rec in ("1", "2", "3"):
+        _registrar(agendador, n_rec)
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    # sai o mais antigo
+    assert agendador.resultado(sefaz.consultados[0]) is None
+    assert agendador.resultado(sefaz.consultados[1]) is not None
+    assert agendador.resultado(sefaz.consultados[2]) is not None
+
+
+def test_resultados_vencidos_sao_descartados(sefaz):
+    sefaz.respostas = [104]
+    agendador = _agendador(ttl_resultado=0.0)
+    _registrar(agendador, "1")
+    _vencer(agendador)
+    agendador.processar_uma_vez()
+
+    assert agendador.pendentes() == []
+    assert agendador.resultado("1") is None
@@ -0,0 +1,69 @@
+# tests/test_retorno.py
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from sefaz_service.core.repositorio import RepositorioDocumentos
+from sefaz_service.routers.retorno import OpcoesRetorno, aplicar_retorno
+
+
+@pytest.fixture
+def repositorio(tmp_path):
+    return RepositorioDocumentos(str(tmp_path / "docs"))
+
+
+def _gravar(repositorio, cnpj):
+    dados = aplicar_retorno(
+        {"status": 102, "xml_retorno": "<retInutNFe/>"},
+        OpcoesRetorno(modo="referencia", repositorio=repositorio),
+        tipo="nfe_inutilizacao",
+        cnpj=cnpj,
+    )
+    return repositorio.obter(dados["documentos"]["xml_retorno"])
+
+
+def test_cnpj_com_mascara_vira_so_digitos(repositorio):
+    doc = _gravar(repositorio, "12.345.678/0001-90")
+    assert doc.cnpj == "12345678000190"
+    assert os.path.relpath(doc.caminho, repositorio.base_dir).split(os.sep)[0] == "12345678000190"
+
+
+@pytest.mark.parametrize("cnpj", ["../../x", "123", "1" * 15, "", None])
+def test_cnpj_invalido_nao_vira_pasta(repositorio, cnpj):
+    doc = _gravar(repositorio, cnpj)
+    assert doc.cnpj is None
+    caminho = os.path.realpath(doc.caminho)
+    assert caminho.startswith(os.path.realpath(repositorio.base_dir) + os.sep)
+    assert os.path.relpath(caminho, os.path.realpath(repositorio.base_dir)).split(os.sep)[0] == "_"
+
+
+def test_modo_minimo_mantem_so_os_finais():
+    dados = aplicar_retorno(
+        {"status": 100, "xml_retorno": "<r/>", "xml_nfe_proc": "<p/>"},
+        OpcoesRetorno(modo="minimo"),
+        tipo="nfe_envio",
+        finais=("xml_nfe_proc",),
+    )
+    assert dados == {"status": 100, "xml_nfe_proc": "<p/>"}
+
+
+@pytest.mark.parametrize("cnpj", ["../x", "12.345.678/0001-90", "１２３"])
+def test_repositorio_rejeita_cnpj_que_nao_e_so_digitos(repositorio, cnpj):
+    with pytest.raises(ValueError):
+        repositorio.salvar("<a/>", "teste", cnpj=cnpj)
+
+
+def test_bytes_viram_texto_so_na_resposta(repositorio):
+    completo = aplicar_retorno(
+        {"status": 100, "xml_retorno": "<r>ção</r>".encode()}, OpcoesRetorno(), tipo="mdfe_envio"
+    )
+    assert completo == {"status": 100, "xml_retorno": "<r>ção</r>"}
+
+    referencia = aplicar_retorno(
+        {"status": 100, "xml_retorno": b"<r/>"},
+        OpcoesRetorno(modo="referencia", repositorio=repositorio),
+        tipo="mdfe_envio",
+    )
+    assert referencia["documentos"]["xml_retorno"]
@@ -0,0 +1,60 @@
+# tests/test_sessao.py
+from __future__ import annotations
+
+import os
+
+import pytest
+
+from sefaz_service.core import sessao as mod
+from sefaz_service.core.sessao import sessao_com_pfx
+
+
+@pytest.fixture
+def pfx(tmp_path, monkeypatch):
+    monkeypatch.setattr(mod, "_sessoes", {})
+    monkeypatch.setattr(mod, "_arquivos_pem", [])
+    monkeypatch.setattr(mod, "_load_pfx", lambda caminho, senha: (b"chave", b"certificado"))
+    caminho = tmp_path / "cert.pfx"
+    caminho.write_bytes(b"pfx")
+    yield str(caminho)
+    mod._remover_arquivos_pem()
+
+
+def _trocar_arquivo(caminho: str) -> None:
+    mtime = os.path.getmtime(caminho)
+    os.utime(caminho, (mtime + 10, mtime + 10))
+
+
+def test_mesma_chave_reaproveita_a_sessao(pfx):
+    assert sessao_com_pfx(pfx, "s3nh4") is sessao_com_pfx(pfx, "s3nh4")
+    assert len(mod._arquivos_pem) == 2
+
+
+@pytest.mark.parametrize("mudanca", ["arquivo", "senha"])
+def test_pfx_trocado_descarta_a_sessao_anterior(pfx, mudanca):
+    antiga = sessao_com_pfx(pfx, "s3nh4")
+    pem_antigos = list(antiga.cert)
+
+    senha = "s3nh4"
+    if mudanca == "arquivo":
+        _trocar_arquivo(pfx)
+    else:
+        senha = "outra"
+    nova = sessao_com_pfx(pfx, senha)
+
+    assert nova is not antiga
+    assert list(mod._sessoes.values()) == [nova]
+    assert not any(os.path.exists(p) for p in pem_antigos)
+    assert mod._arquivos_pem == list(nova.cert)
+    assert all(os.path.exists(p) for p in nova.cert)
+
+
+def test_outro_pfx_nao_descarta(pfx, tmp_path):
+    outro = tmp_path / "outro.pfx"
+    outro.write_bytes(b"pfx")
+
+    primeira = sessao_com_pfx(pfx, "s3nh4")
+    sessao_com_pfx(str(outro), "s3nh4")
+
+    assert len(mod._sessoes) == 2
+    assert all(os.path.exists(p) for p in primeira.cert)